@@ -5,12 +5,15 @@ This library provides tools for parsing and validating both standard G-Code file
 and Binary G-Code (BGCode) files used by modern 3D printers. It supports:
 
 - Basic G-Code parsing and command extraction
+- Fast G-Code writing, from parsed commands
 - G-Code validation with configurable rules
 - Binary G-Code (BGCode) parsing with support for:
   - Multiple compression types (None, Deflate, Heatshrink)
   - Various G-code encodings (MeatPack)
   - Metadata blocks (file, printer, print, slicer)
   - Thumbnail extraction
+- Binary G-Code (BGCode) writing, with the same options
+- Streaming conversion between BGCode and text G-Code
 """
 
 # Basic G-Code Parser Components
@@ -20,9 +23,16 @@ from .gcode.command import (
     GcodeCommand,
     ThumbnailCommand,
 )  # G-Code command representation
+from .gcode.writer import GCodeWriter  # G-Code command serialization
+from .gcode.comment_handlers import (
+    CommentHandlerRegistry,
+    default_comment_handlers,
+)  # Handlers for special comment blocks
 
 # G-Code Validation Components
 from .gcode.validator import GCodeValidator  # G-Code validation engine
+from .gcode.errors import ErrorCode, ParseErrors  # Errors recorded as codes
+from .profiling import ParseStats  # Time spent in each stage of parsing
 
 # Binary G-Code (BGCode) Components
 from .bgcode.parser import (
@@ -49,7 +59,13 @@ from .bgcode.parser import (
     PrintMetadataBlock,  # Print settings
     SlicerMetadataBlock,  # Slicer settings
     ThumbnailBlock,  # Thumbnail image
+    RawBlock,  # A block that hasn't been decoded
 )
+from .bgcode.writer import BasicBGCodeWriter  # BGCode writer
+from .bgcode.convert import (
+    bgcode_to_gcode,
+    gcode_to_bgcode,
+)  # BGCode <-> text G-Code conversion
 
 __version__ = "0.1.0"
 
@@ -59,11 +75,19 @@ __all__ = [
     "GCodeParser",  # High-level G-Code parsing
     "GcodeCommand",  # G-Code command representation
     "ThumbnailCommand",  # Thumbnail command representation
+    "GCodeWriter",  # G-Code command serialization
+    "CommentHandlerRegistry",  # Handlers for special comment blocks
+    "default_comment_handlers",  # The registry parsers use by default
     # Validator
     "GCodeValidator",  # G-Code validation engine
-    "GCodeValidatorRules",  # Validation rule definitions
+    "ErrorCode",  # Kinds of parse error
+    "ParseErrors",  # Parse errors recorded as codes and line numbers
+    "ParseStats",  # Time spent in each stage of parsing
     # Binary G-Code Parser
     "BasicBGCodeParser",  # Core BGCode parser
+    "BasicBGCodeWriter",  # BGCode writer
+    "bgcode_to_gcode",  # BGCode to text G-Code
+    "gcode_to_bgcode",  # Text G-Code to BGCode
     "BlockType",  # Types of blocks in BGCode files
     "CompressionType",  # Supported compression methods
     "ChecksumType",  # Supported checksum methods
@@ -82,4 +106,5 @@ __all__ = [
     "SlicerMetadataBlock",  # Slicer settings
     "ThumbnailParameter",  # Thumbnail block parameters
     "ThumbnailBlock",  # Thumbnail image
+    "RawBlock",  # A block that hasn't been decoded
 ]
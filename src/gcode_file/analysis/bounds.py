@@ -0,0 +1,500 @@
+"""Check that G-code stays within the printer's print volume.
+
+Every move is checked against the bed shape and maximum print height from the
+slicer settings:
+
+- Extrusions must be over the bed, and between Z=0 and the maximum print height.
+- Travel moves must be within the bed's bounding box, grown by a margin, and
+  below the maximum print height.
+
+Moves in the printer's own start and end G-code (";TYPE:Custom") are not
+checked, as they often purge or park outside the printable area on purpose.
+They are still included in the extents.
+
+check_bounds_lines() works on lines of G-code text, in constant memory. Each
+chunk of lines is scanned as an array of bytes with NumPy, so no commands are
+created. check_bounds_columns() checks commands that are already in columns,
+all at once.
+"""
+
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from gcode_file.gcode.arcs import ARC_COMMANDS, DEFAULT_TOLERANCE, Arcs
+from gcode_file.gcode.scan import chunk_lines, scan_columns
+from gcode_file.gcode.state import (
+    AXES,
+    COLUMN_FIELDS,
+    MOVE_COMMANDS,
+    CommandColumns,
+    track_columns,
+)
+
+# The features that are not checked.
+IGNORED_FEATURES = ("Custom",)
+
+# Moves within this distance (in mm) of the edge of the volume are inside it.
+_EPSILON = 1e-6
+
+_DEFAULT_CHUNK_SIZE = 16 * 1024
+
+# The commands that move, or change how moves are interpreted.
+_TRACKED_COMMANDS = (*MOVE_COMMANDS, "G28", "G90", "G91", "G92", "M82", "M83")
+_MODE_COMMANDS = ("G90", "G91", "M82", "M83")
+
+_NEWLINE = ord("\n")
+
+_TYPE_COMMENT = re.compile(rb"\n;TYPE:([^\r\n]*)")
+
+
+@dataclass
+class PrintVolume:
+    """
+    The volume a printer can print in.
+
+    Attributes:
+        bed_shape (List[Tuple[float, float]]): The corners of the bed, as a polygon.
+        max_height (float): The maximum print height, or infinity if unknown.
+    """
+
+    bed_shape: List[Tuple[float, float]]
+    max_height: float = math.inf
+
+    @staticmethod
+    def from_settings(settings: Dict[str, str]) -> "PrintVolume":
+        """
+        Creates the volume from PrusaSlicer settings, e.g a file's slicer_settings.
+
+        Args:
+            settings (Dict[str, str]): The settings, with "bed_shape"
+                                       (e.g "0x0,250x0,250x210,0x210") and
+                                       optionally "max_print_height".
+
+        Returns:
+            PrintVolume: The volume.
+
+        Raises:
+            ValueError: If the bed shape is missing or invalid.
+        """
+        bed_shape = settings.get("bed_shape")
+        if not bed_shape:
+            raise ValueError("The settings do not include a bed_shape")
+
+        try:
+            corners = [
+                tuple(float(value) for value in corner.split("x"))
+                for corner in bed_shape.split(",")
+            ]
+        except ValueError as e:
+            raise ValueError(f"Invalid bed_shape: {bed_shape}") from e
+        if len(corners) < 3 or any(len(corner) != 2 for corner in corners):
+            raise ValueError(f"Invalid bed_shape: {bed_shape}")
+
+        max_height = float(settings.get("max_print_height") or math.inf)
+        return PrintVolume(corners, max_height)
+
+    def contains(self, points: np.ndarray) -> np.ndarray:
+        """
+        Returns which points are over the bed, and between Z=0 and the maximum height.
+
+        Args:
+            points (np.ndarray): The X, Y and Z of each point.
+        """
+        polygon = np.array(self.bed_shape)
+        x, y, z = points[:, 0], points[:, 1], points[:, 2]
+        inside = (z >= -_EPSILON) & (z <= self.max_height + _EPSILON)
+        inside &= self._in_box(points, 0.0)
+
+        if not _is_rectangle(polygon):
+            inside &= _in_polygon(x, y, polygon)
+        return inside
+
+    def contains_travel(self, points: np.ndarray, margin: float) -> np.ndarray:
+        """
+        Returns which points are within the bed's bounding box grown by the
+        margin, and below the maximum height.
+
+        Args:
+            points (np.ndarray): The X, Y and Z of each point.
+            margin (float): How far outside the bed travel moves may go, in mm.
+        """
+        return self._in_box(points, margin) & (
+            points[:, 2] <= self.max_height + _EPSILON
+        )
+
+    def _in_box(self, points: np.ndarray, margin: float) -> np.ndarray:
+        polygon = np.array(self.bed_shape)
+        low = polygon.min(axis=0) - margin - _EPSILON
+        high = polygon.max(axis=0) + margin + _EPSILON
+        return np.all((points[:, :2] >= low) & (points[:, :2] <= high), axis=1)
+
+
+@dataclass
+class Extents:
+    """
+    The smallest and largest X, Y and Z reached by a set of moves.
+
+    Attributes:
+        minimum (List[float]): The smallest X, Y and Z, or infinity if there were no moves.
+        maximum (List[float]): The largest X, Y and Z, or -infinity if there were no moves.
+    """
+
+    minimum: List[float] = field(default_factory=lambda: [math.inf] * 3)
+    maximum: List[float] = field(default_factory=lambda: [-math.inf] * 3)
+
+    @property
+    def empty(self) -> bool:
+        """True if there were no moves."""
+        return self.minimum[0] == math.inf
+
+    def update(self, points: np.ndarray):
+        """Grows the extents to include the X, Y and Z of the points."""
+        if len(points):
+            self.minimum = np.minimum(self.minimum, points.min(axis=0)).tolist()
+            self.maximum = np.maximum(self.maximum, points.max(axis=0)).tolist()
+
+    def __str__(self) -> str:
+        if self.empty:
+            return "(empty)"
+        return ", ".join(
+            f"{axis}={low:g}..{high:g}"
+            for axis, low, high in zip("XYZ", self.minimum, self.maximum)
+        )
+
+
+@dataclass
+class BoundsViolation:
+    """
+    The first move outside the print volume.
+
+    Attributes:
+        line (int, optional): The line number, starting at 1, when checking lines.
+        index (int, optional): The index of the command, when checking columns.
+        extruding (bool): True if the move was an extrusion, False for a travel move.
+        position (Tuple[float, float, float]): The point outside the volume.
+    """
+
+    line: Optional[int]
+    index: Optional[int]
+    extruding: bool
+    position: Tuple[float, float, float]
+
+    def __str__(self) -> str:
+        where = (
+            f"line {self.line}" if self.line is not None else f"command {self.index}"
+        )
+        kind = "Extrusion" if self.extruding else "Travel move"
+        x, y, z = self.position
+        return f"{kind} outside the print volume on {where}, at X{x:g} Y{y:g} Z{z:g}"
+
+
+@dataclass
+class BoundsReport:
+    """
+    The result of a bounds check.
+
+    Attributes:
+        extrusion (Extents): The extents of all extrusions.
+        travel (Extents): The extents of all travel moves.
+        violation (BoundsViolation, optional): The first move outside the
+                                               volume, or None if there were none.
+    """
+
+    extrusion: Extents = field(default_factory=Extents)
+    travel: Extents = field(default_factory=Extents)
+    violation: Optional[BoundsViolation] = None
+
+    @property
+    def ok(self) -> bool:
+        """True if every move was inside the print volume."""
+        return self.violation is None
+
+
+@dataclass
+class _Moves:
+    """
+    A batch of moves to check.
+
+    Attributes:
+        labels (np.ndarray): The line number or command index of each move.
+        starts (np.ndarray): The X, Y and Z at the start of each move.
+        ends (np.ndarray): The X, Y and Z at the end of each move.
+        extruding (np.ndarray): True for extrusions.
+        checked (np.ndarray): False for moves that are not checked.
+        arcs (Arcs): The arcs, for the moves in arc_rows.
+        arc_rows (np.ndarray): The index of each arc in the moves.
+    """
+
+    labels: np.ndarray
+    starts: np.ndarray
+    ends: np.ndarray
+    extruding: np.ndarray
+    checked: np.ndarray
+    arcs: Arcs
+    arc_rows: np.ndarray
+
+    @staticmethod
+    def from_columns(
+        columns: CommandColumns, labels: np.ndarray, checked: np.ndarray
+    ) -> Tuple["_Moves", np.ndarray]:
+        """Finds the moves in the columns, and returns them with the final position."""
+        state = track_columns(columns)
+        positions = state.positions
+        starts = np.vstack((np.zeros((1, len(AXES))), positions))[:-1]
+
+        is_arc = np.isin(columns.codes, ARC_COMMANDS)
+        is_move = np.isin(columns.codes, MOVE_COMMANDS)
+        moved = np.any(starts[:, :3] != positions[:, :3], axis=1) | is_arc
+        rows = np.flatnonzero(is_move & moved & (labels >= 0))
+
+        arc_rows = np.flatnonzero(is_arc[rows])
+        arc_commands = rows[arc_rows]
+        arcs = Arcs.from_columns(
+            CommandColumns(columns.codes[arc_commands], columns.values[arc_commands]),
+            starts[arc_commands],
+            positions[arc_commands],
+        )
+
+        moves = _Moves(
+            labels=labels[rows],
+            starts=starts[rows, :3],
+            ends=positions[rows, :3],
+            extruding=state.e_delta[rows] > 0,
+            checked=checked[rows],
+            arcs=arcs,
+            arc_rows=arc_rows,
+        )
+        final = positions[-1] if len(positions) else np.zeros(len(AXES))
+        return moves, final
+
+
+def check_bounds_lines(
+    lines: Iterable[str],
+    volume: PrintVolume,
+    travel_margin: float = 0.0,
+    chunk_size: int = _DEFAULT_CHUNK_SIZE,
+) -> BoundsReport:
+    """
+    Checks lines of G-code text against the print volume.
+
+    The lines are read in chunks. Each chunk is scanned as an array of bytes
+    for the moves and the commands that change how moves are interpreted
+    (G0-G3, G28, G90, G91, G92, M82 and M83), without creating any commands,
+    so this is much faster than parsing. Memory use is limited to a chunk.
+
+    Args:
+        lines (Iterable[str]): The lines, e.g a text file, or a file's lines.
+        volume (PrintVolume): The print volume.
+        travel_margin (float, optional): How far outside the bed's bounding box
+                                         travel moves may go, in mm. Defaults to 0.
+        chunk_size (int, optional): How many lines to check at once.
+
+    Returns:
+        BoundsReport: The extents, and the first line with a move outside the volume.
+    """
+    report = BoundsReport()
+    position = np.zeros(len(AXES))
+    relative = relative_e = False
+    checked = True
+    first_line = 1
+
+    for line_count, data in chunk_lines(lines, chunk_size):
+        line_index, columns, command_checked, checked = _scan_chunk(data, checked)
+
+        # Start from where the last chunk ended.
+        codes = ["G91" if relative else "G90", "M83" if relative_e else "M82", "G92"]
+        start = np.full((len(codes), len(COLUMN_FIELDS)), np.nan)
+        start[-1, : len(AXES)] = position
+        columns = CommandColumns(
+            np.concatenate((codes, columns.codes)), np.vstack((start, columns.values))
+        )
+        labels = np.concatenate((np.full(len(codes), -1), first_line + line_index))
+        command_checked = np.concatenate((np.zeros(len(codes), bool), command_checked))
+
+        moves, position = _Moves.from_columns(columns, labels, command_checked)
+        _check_moves(report, moves, volume, travel_margin, by_line=True)
+
+        relative, relative_e = _final_modes(columns.codes, relative, relative_e)
+        first_line += line_count
+
+    return report
+
+
+def check_bounds_columns(
+    columns: CommandColumns,
+    volume: PrintVolume,
+    travel_margin: float = 0.0,
+    ignored: Optional[np.ndarray] = None,
+) -> BoundsReport:
+    """
+    Checks commands in columns against the print volume, all at once.
+
+    Args:
+        columns (CommandColumns): The commands.
+        volume (PrintVolume): The print volume.
+        travel_margin (float, optional): How far outside the bed's bounding box
+                                         travel moves may go, in mm. Defaults to 0.
+        ignored (np.ndarray, optional): True for commands that shouldn't be
+            checked, such as the printer's start G-code. The columns don't
+            include comments, so this can't be worked out from ";TYPE:".
+
+    Returns:
+        BoundsReport: The extents, and the index of the first command with a
+                      move outside the volume.
+    """
+    count = len(columns)
+    checked = np.ones(count, dtype=bool)
+    if ignored is not None:
+        checked = ~np.asarray(ignored, dtype=bool)
+
+    moves, _ = _Moves.from_columns(columns, np.arange(count), checked)
+    report = BoundsReport()
+    _check_moves(report, moves, volume, travel_margin, by_line=False)
+    return report
+
+
+def _check_moves(
+    report: BoundsReport,
+    moves: _Moves,
+    volume: PrintVolume,
+    travel_margin: float,
+    by_line: bool,
+):
+    """Checks a batch of moves, and adds the results to the report."""
+    labels, starts, ends = moves.labels, moves.starts, moves.ends
+    extruding, checked = moves.extruding, moves.checked
+
+    # Arcs can bulge past their start and end, so check the points along them.
+    if len(moves.arc_rows):
+        points, counts = moves.arcs.linearize(DEFAULT_TOLERANCE)
+
+        repeats = np.ones(len(labels), dtype=np.int64)
+        repeats[moves.arc_rows] = counts
+        is_arc = np.zeros(len(labels), dtype=bool)
+        is_arc[moves.arc_rows] = True
+        rows = np.repeat(np.arange(len(labels)), repeats)
+        ends = ends[rows]
+        ends[np.repeat(is_arc, repeats)] = points[:, :3]
+        labels, extruding, checked = labels[rows], extruding[rows], checked[rows]
+        # The first segment of each move starts at the move's start, and the
+        # rest at the end of the segment before them.
+        first = np.concatenate(([True], rows[1:] != rows[:-1]))
+        starts = np.where(first[:, None], starts[rows], np.roll(ends, 1, axis=0))
+
+    points = np.concatenate((starts, ends))
+    point_extruding = np.concatenate((extruding, extruding))
+    report.extrusion.update(points[point_extruding])
+    report.travel.update(points[~point_extruding])
+
+    if report.violation is not None:
+        return
+
+    inside = np.where(
+        point_extruding,
+        volume.contains(points),
+        volume.contains_travel(points, travel_margin),
+    )
+    outside = ~inside & np.concatenate((checked, checked))
+    if not outside.any():
+        return
+
+    # The first move with either end outside the volume.
+    count = len(labels)
+    move = int(np.argmax(outside[:count] | outside[count:]))
+    point = move if outside[move] else move + count
+    label = int(labels[move])
+    report.violation = BoundsViolation(
+        line=label if by_line else None,
+        index=None if by_line else label,
+        extruding=bool(extruding[move]),
+        position=tuple(float(value) for value in points[point]),
+    )
+
+
+def _scan_chunk(
+    data: bytes, checked: bool
+) -> Tuple[np.ndarray, CommandColumns, np.ndarray, bool]:
+    """
+    Finds the tracked commands in lines of G-code, and reads their fields.
+
+    Args:
+        data (bytes): The lines, each ending with a newline.
+        checked (bool): Whether moves before the first ";TYPE:" are checked.
+
+    Returns:
+        Tuple[np.ndarray, CommandColumns, np.ndarray, bool]: The line of each
+            command (starting at 0), the commands, whether each command is
+            checked, and whether moves after the last line are checked.
+    """
+    command_lines, columns = scan_columns(data, _TRACKED_COMMANDS)
+    command_checked, checked = _type_states(data, command_lines, checked)
+    return command_lines, columns, command_checked, checked
+
+
+def _type_states(
+    data: bytes, lines: np.ndarray, checked: bool
+) -> Tuple[np.ndarray, bool]:
+    """
+    Returns whether each of the lines is checked, from the ";TYPE:" comments
+    before it, and whether lines after the end of the data are checked.
+    """
+    newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == _NEWLINE)
+    type_lines = []
+    states = [checked]
+    # The newline makes the first line like the others. It also means each
+    # match starts at the position of its line in the data.
+    for match in _TYPE_COMMENT.finditer(b"\n" + data):
+        type_lines.append(match.start())
+        feature = match.group(1).decode("utf-8", "replace").strip()
+        states.append(feature not in IGNORED_FEATURES)
+
+    type_lines = np.searchsorted(newlines, type_lines)
+    index = np.searchsorted(type_lines, lines, side="right")
+    return np.array(states)[index], states[-1]
+
+
+def _final_modes(
+    codes: np.ndarray, relative: bool, relative_e: bool
+) -> Tuple[bool, bool]:
+    """Returns whether XYZ and E are relative after the commands."""
+    modes = codes[np.isin(codes, _MODE_COMMANDS)]
+    xyz_modes = modes[np.isin(modes, ("G90", "G91"))]
+    if len(xyz_modes):
+        relative = xyz_modes[-1] == "G91"
+    if len(modes):
+        relative_e = modes[-1] in ("G91", "M83")
+    return relative, relative_e
+
+
+def _is_rectangle(polygon: np.ndarray) -> bool:
+    """Returns True if the polygon is an axis aligned rectangle."""
+    return (
+        len(polygon) == 4
+        and len(np.unique(polygon[:, 0])) == 2
+        and len(np.unique(polygon[:, 1])) == 2
+    )
+
+
+def _in_polygon(x: np.ndarray, y: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    """Returns which points are inside the polygon, or on its edge."""
+    inside = np.zeros(len(x), dtype=bool)
+    on_edge = np.zeros(len(x), dtype=bool)
+
+    for (x0, y0), (x1, y1) in zip(polygon, np.roll(polygon, -1, axis=0)):
+        # Count the edges crossed by a ray from each point towards +X.
+        crosses = (y0 > y) != (y1 > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crossing_x = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        inside ^= crosses & (x < crossing_x)
+
+        # Points on the edge, where the ray test could go either way.
+        dx, dy = x1 - x0, y1 - y0
+        length_squared = dx * dx + dy * dy or 1.0
+        t = np.clip(((x - x0) * dx + (y - y0) * dy) / length_squared, 0.0, 1.0)
+        on_edge |= np.hypot(x - (x0 + t * dx), y - (y0 + t * dy)) <= _EPSILON
+
+    return inside | on_edge
@@ -0,0 +1,333 @@
+"""Compare two G-code files layer by layer.
+
+A text diff of two large G-code files is slow, and mostly noise: a re-slice
+with one setting changed has different comments, and often moves on only a
+few layers. Instead:
+
+1. Both files are split into layers (see scan_layers()), plus the start
+   G-code before the first layer. If either has no layer change comments
+   (e.g MEATPACK bgcode, which removes comments), both are split where Z
+   increases.
+2. Each layer is normalized, by removing comments, whitespace and progress
+   reports (M73), so text and bgcode files (MeatPacked without spaces, or not)
+   compare equal. Each normalized layer is hashed.
+3. The lists of hashes are aligned, as a sequence diff, so a layer that is
+   added or removed doesn't make every later layer look changed. Layers with
+   the same hash in both files, but not aligned, have moved.
+4. Only the changed layers are diffed line by line.
+
+The slicer settings of the files are compared too::
+
+    with open_file("old.bgcode") as old, open_file("new.gcode") as new:
+        print(diff_files(old, new))
+
+or from the command line::
+
+    python -m gcode_file.analysis.diff old.bgcode new.gcode
+"""
+
+import difflib
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from gcode_file.gcode.layers import has_layer_markers, scan_layers
+
+# Commands that are left out of the comparison. The progress reports change
+# whenever the estimated print time does, on every layer.
+IGNORED_COMMANDS = ("M73",)
+DEFAULT_CONTEXT = 3
+
+_COMMENT = re.compile(rb";[^\n]*")
+_WHITESPACE = re.compile(rb"[ \t\r]+")
+_BLANK_LINES = re.compile(rb"\n{2,}")
+
+
+@dataclass
+class LayerDiff:
+    """
+    The differences in one layer that changed.
+
+    Attributes:
+        old_layer (int): The index of the layer in the old file. The start
+            G-code, before the first layer, is -1.
+        new_layer (int): The index of the layer in the new file.
+        z (float, optional): The Z height of the layer in the new file.
+        lines (List[str]): A unified diff of the layer's normalized lines.
+    """
+
+    old_layer: int
+    new_layer: int
+    z: Optional[float]
+    lines: List[str]
+
+
+@dataclass
+class GcodeDiff:
+    """
+    The differences between two G-code files.
+
+    Layer indexes are -1 for the start G-code, before the first layer.
+
+    Attributes:
+        old_layers (int): The number of layers in the old file.
+        new_layers (int): The number of layers in the new file.
+        changed (List[LayerDiff]): The layers that changed.
+        added (List[int]): The new file's layers that aren't in the old file.
+        removed (List[int]): The old file's layers that aren't in the new file.
+        moved (List[Tuple[int, int]]): The old and new index of each layer that
+            is the same in both files, but in a different place.
+        settings (Dict[str, Tuple[Optional[str], Optional[str]]]): The old and
+            new value of each slicer setting that changed, with None for a
+            setting that one file doesn't have.
+    """
+
+    old_layers: int
+    new_layers: int
+    changed: List[LayerDiff] = field(default_factory=list)
+    added: List[int] = field(default_factory=list)
+    removed: List[int] = field(default_factory=list)
+    moved: List[Tuple[int, int]] = field(default_factory=list)
+    settings: Dict[str, Tuple[Optional[str], Optional[str]]] = field(
+        default_factory=dict
+    )
+
+    @property
+    def identical(self) -> bool:
+        """True if the files have the same G-code and settings."""
+        return not (
+            self.changed or self.added or self.removed or self.moved or self.settings
+        )
+
+    def __str__(self) -> str:
+        lines = [f"Layers: {self.old_layers} -> {self.new_layers}"]
+        for key, (old, new) in self.settings.items():
+            lines.append(f"Setting {key}: {old!r} -> {new!r}")
+        for index in self.removed:
+            lines.append(f"Removed {_layer_name(index)}")
+        for index in self.added:
+            lines.append(f"Added {_layer_name(index)}")
+        for old, new in self.moved:
+            lines.append(f"Moved {_layer_name(old)} to {new}")
+        for layer in self.changed:
+            name = _layer_name(layer.new_layer)
+            if layer.old_layer != layer.new_layer:
+                name += f" (was {layer.old_layer})"
+            if layer.z is not None:
+                name += f" at Z={layer.z}"
+            lines.append(f"Changed {name}:")
+            lines.extend(layer.lines)
+        if self.identical:
+            lines.append("No differences")
+        return "\n".join(lines)
+
+
+class _Section:
+    """A layer, or the start G-code, normalized and hashed."""
+
+    def __init__(self, index: int, z: Optional[float], data: bytes, ignored: bytes):
+        self.index = index
+        self.z = z
+        data = _COMMENT.sub(b"", data)
+        data = _WHITESPACE.sub(b"", data)
+        if ignored:
+            data = re.sub(ignored, b"", data)
+        self.data = _BLANK_LINES.sub(b"\n", data).strip(b"\n")
+        self.hash = hashlib.sha1(self.data).digest()
+
+    def lines(self) -> List[str]:
+        return self.data.decode("utf-8").splitlines()
+
+
+def _sections(data: bytes, ignored: bytes, use_markers: bool) -> List[_Section]:
+    """The start G-code and the layers of G-code text."""
+    layers = scan_layers(data, use_markers=use_markers)
+    first = layers[0].start if layers else len(data)
+    sections = [_Section(-1, None, data[:first], ignored)]
+    sections.extend(
+        _Section(layer.index, layer.z, data[layer.start : layer.end], ignored)
+        for layer in layers
+    )
+    return sections
+
+
+def diff_gcode(
+    old: bytes,
+    new: bytes,
+    context: int = DEFAULT_CONTEXT,
+    ignored_commands: Iterable[str] = IGNORED_COMMANDS,
+) -> GcodeDiff:
+    """
+    Compares two G-code texts, layer by layer.
+
+    Args:
+        old (bytes): The old G-code text.
+        new (bytes): The new G-code text.
+        context (int, optional): The number of unchanged lines around each
+            change in the line diffs.
+        ignored_commands (Iterable[str], optional): Commands to leave out of
+            the comparison.
+
+    Returns:
+        GcodeDiff: The differences. The settings are not compared.
+    """
+    ignored = _ignored_pattern(ignored_commands)
+    # Both are split the same way, as the markers and the Z moves can put a
+    # layer's first few lines (such as a retract) in different layers.
+    use_markers = has_layer_markers(old) and has_layer_markers(new)
+    old_sections = _sections(old, ignored, use_markers)
+    new_sections = _sections(new, ignored, use_markers)
+    result = GcodeDiff(len(old_sections) - 1, len(new_sections) - 1)
+
+    matcher = difflib.SequenceMatcher(
+        None,
+        [section.hash for section in old_sections],
+        [section.hash for section in new_sections],
+        autojunk=False,
+    )
+    removed: List[_Section] = []
+    added: List[_Section] = []
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        olds = old_sections[old_start:old_end]
+        news = new_sections[new_start:new_end]
+        if tag == "replace":
+            # Layers replaced one for one are changed, and any others are
+            # added or removed.
+            count = min(len(olds), len(news))
+            for old_section, new_section in zip(olds[:count], news[:count]):
+                result.changed.append(_diff_section(old_section, new_section, context))
+            olds, news = olds[count:], news[count:]
+        removed.extend(olds)
+        added.extend(news)
+
+    # A layer that was removed in one place and added in another has moved.
+    added_by_hash: Dict[bytes, List[_Section]] = {}
+    for section in added:
+        added_by_hash.setdefault(section.hash, []).append(section)
+    for section in removed:
+        matches = added_by_hash.get(section.hash)
+        if matches:
+            result.moved.append((section.index, matches.pop(0).index))
+        else:
+            result.removed.append(section.index)
+    moved_to = {new for _, new in result.moved}
+    result.added = [section.index for section in added if section.index not in moved_to]
+    return result
+
+
+def diff_files(
+    old,
+    new,
+    context: int = DEFAULT_CONTEXT,
+    ignored_commands: Iterable[str] = IGNORED_COMMANDS,
+) -> GcodeDiff:
+    """
+    Compares two G-code files, layer by layer, and their slicer settings.
+
+    Either file can be text G-code or bgcode.
+
+    Args:
+        old (GcodeFileBase): The old file, e.g from open_file().
+        new (GcodeFileBase): The new file.
+        context (int, optional): See diff_gcode().
+        ignored_commands (Iterable[str], optional): See diff_gcode().
+
+    Returns:
+        GcodeDiff: The differences.
+    """
+    result = diff_gcode(
+        "".join(old.lines).encode("utf-8"),
+        "".join(new.lines).encode("utf-8"),
+        context,
+        ignored_commands,
+    )
+    result.settings = diff_settings(old.slicer_settings, new.slicer_settings)
+    return result
+
+
+def diff_settings(
+    old: Dict[str, str], new: Dict[str, str]
+) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """
+    Compares two dicts of slicer settings.
+
+    Args:
+        old (Dict[str, str]): The old settings.
+        new (Dict[str, str]): The new settings.
+
+    Returns:
+        Dict[str, Tuple[Optional[str], Optional[str]]]: The old and new value
+            of each setting that changed, sorted by name, with None for a
+            setting that is missing.
+    """
+    return {
+        key: (old.get(key), new.get(key))
+        for key in sorted(old.keys() | new.keys())
+        if old.get(key) != new.get(key)
+    }
+
+
+def _diff_section(old: _Section, new: _Section, context: int) -> LayerDiff:
+    lines = difflib.unified_diff(
+        old.lines(),
+        new.lines(),
+        _layer_name(old.index),
+        _layer_name(new.index),
+        n=context,
+        lineterm="",
+    )
+    return LayerDiff(old.index, new.index, new.z, list(lines))
+
+
+def _ignored_pattern(commands: Iterable[str]) -> bytes:
+    """A pattern matching the lines of the commands, once whitespace is removed."""
+    names = b"|".join(re.escape(command.encode("ascii")) for command in commands)
+    if not names:
+        return b""
+    return rb"(?m)^(?:" + names + rb")(?![\d.])[^\n]*"
+
+
+def _layer_name(index: int) -> str:
+    return "start G-code" if index < 0 else f"layer {index}"
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    """
+    Compares two G-code or bgcode files, and prints the differences.
+
+    Exits with status 1 if the files differ, like diff.
+    """
+    import argparse
+    import sys
+
+    from gcode_file.file import open_file
+
+    parser = argparse.ArgumentParser(
+        description="Compare two G-code or bgcode files layer by layer"
+    )
+    parser.add_argument("old", help="The old file")
+    parser.add_argument("new", help="The new file")
+    parser.add_argument(
+        "--context",
+        type=int,
+        default=DEFAULT_CONTEXT,
+        help="Unchanged lines to show around each change",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        with open_file(args.old, strict_mode=False) as old:
+            with open_file(args.new, strict_mode=False) as new:
+                result = diff_files(old, new, args.context)
+    except ValueError as e:
+        print(f"Error comparing {args.old} and {args.new}: {e}", file=sys.stderr)
+        sys.exit(2)
+    print(result)
+    sys.exit(0 if result.identical else 1)
+
+
+if __name__ == "__main__":
+    main()
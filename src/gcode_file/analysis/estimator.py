@@ -0,0 +1,590 @@
+"""Kinematic print time estimation.
+
+The estimator models the printer's motion planner. Each move is a segment that
+accelerates from its entry speed up to its nominal feedrate, cruises, and then
+decelerates to its exit speed (a trapezoidal velocity profile). The speed at
+each junction between segments is limited by the change in direction, using
+either classic per-axis jerk or junction deviation.
+
+All of the planning is done with NumPy over arrays of segments. The forward and
+backward passes of the planner are min-plus recurrences, of the form
+
+    v[i+1]^2 = min(limit[i+1], v[i]^2 + 2 * a[i] * length[i])
+
+which can be solved in closed form with a cumulative sum and a cumulative
+minimum, rather than a Python loop.
+
+estimate_print_time() takes parsed commands, and estimate_print_time_columns()
+commands already in columns. estimate_print_time_lines() takes lines of G-code
+text, which are scanned for the few commands that affect the estimate without
+being parsed, so it's much faster for whole files.
+"""
+
+import re
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from gcode_file.gcode.arcs import DEFAULT_TOLERANCE, linearize_moves
+from gcode_file.gcode.scan import chunk_lines, scan_columns
+from gcode_file.gcode.state import (
+    AXES,
+    COLUMN_FIELDS,
+    MOVE_COMMANDS,
+    CommandColumns,
+    track_columns,
+)
+
+if TYPE_CHECKING:
+    from gcode_file.file import GcodeFileBase
+
+
+@dataclass
+class MachineLimits:
+    """
+    The motion limits of a printer.
+
+    Attributes:
+        max_feedrate (Tuple[float, ...]): Maximum speed per axis (X, Y, Z, E) in mm/s.
+        max_acceleration (Tuple[float, ...]): Maximum acceleration per axis in mm/s^2.
+        max_jerk (Tuple[float, ...]): Maximum instantaneous speed change per axis in mm/s.
+        acceleration (float): Acceleration for printing moves in mm/s^2 (M204 P).
+        retract_acceleration (float): Acceleration for extruder only moves in mm/s^2 (M204 R).
+        travel_acceleration (float): Acceleration for travel moves in mm/s^2 (M204 T).
+        junction_deviation (float, optional): If set, junction speeds are limited
+            using junction deviation (in mm) rather than jerk.
+    """
+
+    max_feedrate: Tuple[float, float, float, float] = (200.0, 200.0, 12.0, 120.0)
+    max_acceleration: Tuple[float, float, float, float] = (
+        1000.0,
+        1000.0,
+        200.0,
+        5000.0,
+    )
+    max_jerk: Tuple[float, float, float, float] = (8.0, 8.0, 0.4, 5.0)
+    acceleration: float = 1250.0
+    retract_acceleration: float = 1250.0
+    travel_acceleration: float = 1250.0
+    junction_deviation: Optional[float] = None
+
+    @staticmethod
+    def from_settings(settings: Dict[str, str], mode: int = 0) -> "MachineLimits":
+        """
+        Creates limits from PrusaSlicer settings, such as a file's slicer_settings.
+
+        Settings that are missing use the defaults.
+
+        Args:
+            settings (Dict[str, str]): The settings, e.g {"machine_max_feedrate_x": "400,140"}.
+            mode (int, optional): Which value to use from multi-valued settings.
+                                  PrusaSlicer uses 0 for normal and 1 for silent mode.
+
+        Returns:
+            MachineLimits: The limits.
+        """
+        limits = MachineLimits()
+
+        def value(key: str, default: float) -> float:
+            if not settings.get(key):
+                return default
+            values = settings[key].split(",")
+            return float(values[min(mode, len(values) - 1)])
+
+        def axes(prefix: str, defaults: Tuple[float, ...]) -> Tuple[float, ...]:
+            return tuple(
+                value(f"{prefix}_{axis.lower()}", default)
+                for axis, default in zip(AXES, defaults)
+            )
+
+        return replace(
+            limits,
+            max_feedrate=axes("machine_max_feedrate", limits.max_feedrate),
+            max_acceleration=axes("machine_max_acceleration", limits.max_acceleration),
+            max_jerk=axes("machine_max_jerk", limits.max_jerk),
+            acceleration=value(
+                "machine_max_acceleration_extruding", limits.acceleration
+            ),
+            retract_acceleration=value(
+                "machine_max_acceleration_retracting", limits.retract_acceleration
+            ),
+            travel_acceleration=value(
+                "machine_max_acceleration_travel", limits.travel_acceleration
+            ),
+        )
+
+    def _row(self) -> Tuple[float, ...]:
+        """Flattens the limits into one row of the per-segment limits table."""
+        return (
+            *self.max_feedrate,
+            *self.max_acceleration,
+            *self.max_jerk,
+            self.acceleration,
+            self.retract_acceleration,
+            self.travel_acceleration,
+        )
+
+
+# The commands that change the limits.
+_LIMIT_COMMANDS = ("M201", "M203", "M204", "M205")
+
+_DEFAULT_CHUNK_SIZE = 16 * 1024
+
+# The commands that affect the estimate. Any other command takes no time.
+_ESTIMATED_COMMANDS = (
+    *MOVE_COMMANDS,
+    "G4",
+    "G28",
+    "G90",
+    "G91",
+    "G92",
+    "M82",
+    "M83",
+    *_LIMIT_COMMANDS,
+    "T",
+)
+
+# Column offsets into the limits table built from MachineLimits._row()
+_FEEDRATE = slice(0, 4)
+_ACCELERATION = slice(4, 8)
+_JERK = slice(8, 12)
+_PRINT_ACCELERATION = 12
+_RETRACT_ACCELERATION = 13
+_TRAVEL_ACCELERATION = 14
+
+
+@dataclass
+class PrintTimeEstimate:
+    """
+    The result of a print time estimate.
+
+    Attributes:
+        seconds (float): The total estimated time, in seconds.
+        move_seconds (float): The time spent moving.
+        dwell_seconds (float): The time spent in dwells (G4).
+        tool_change_seconds (float): The time spent changing tools.
+        segment_count (int): The number of move segments planned.
+        tool_changes (int): The number of times the active tool changed.
+        slicer_seconds (float, optional): The slicer's own estimate, if known.
+    """
+
+    seconds: float
+    move_seconds: float
+    dwell_seconds: float
+    tool_change_seconds: float
+    segment_count: int
+    tool_changes: int
+    slicer_seconds: Optional[float] = None
+
+    def __str__(self) -> str:
+        result = f"{format_duration(self.seconds)}"
+        if self.slicer_seconds is not None:
+            result += f" (slicer: {format_duration(self.slicer_seconds)})"
+        return result
+
+
+@dataclass
+class _Segments:
+    """The moves from a command stream, as arrays ready to be planned."""
+
+    # The change in X, Y, Z and E of each move.
+    deltas: np.ndarray
+    # The requested feedrate of each move, in mm/s.
+    feedrates: np.ndarray
+    # The limits that apply to each move, one MachineLimits._row() per move.
+    limits: np.ndarray
+    dwell_seconds: float = 0.0
+    tool_changes: int = 0
+
+
+def estimate_print_time(
+    commands: Iterable[Any],
+    limits: Optional[MachineLimits] = None,
+    tool_change_seconds: float = 0.0,
+    arc_tolerance: float = DEFAULT_TOLERANCE,
+) -> PrintTimeEstimate:
+    """
+    Estimates how long the commands take to print.
+
+    Modal state (G90/G91, M82/M83, G92 and the feedrate) is tracked while
+    walking the commands, and limit changes in the G-code (M201, M203, M204 and
+    M205) apply from the point they appear. Non-move commands, other than G4
+    and tool changes, are assumed to take no time.
+
+    Args:
+        commands (Iterable): The commands, e.g from GCodeParser.parse_stream(). Anything
+                             that isn't a GcodeCommand (such as a ThumbnailCommand) is ignored.
+        limits (MachineLimits, optional): The printer's limits. Defaults to MachineLimits().
+        tool_change_seconds (float, optional): Time added each time the active tool
+            changes, e.g for a MMU to unload and load filament. Defaults to 0.
+        arc_tolerance (float, optional): The chord tolerance used to split G2/G3
+                                         arcs into segments, in mm.
+
+    Returns:
+        PrintTimeEstimate: The estimate.
+    """
+    return estimate_print_time_columns(
+        CommandColumns.from_commands(commands),
+        limits,
+        tool_change_seconds,
+        arc_tolerance,
+    )
+
+
+def estimate_print_time_lines(
+    lines: Iterable[str],
+    limits: Optional[MachineLimits] = None,
+    tool_change_seconds: float = 0.0,
+    arc_tolerance: float = DEFAULT_TOLERANCE,
+    chunk_size: int = _DEFAULT_CHUNK_SIZE,
+) -> PrintTimeEstimate:
+    """
+    Estimates how long lines of G-code text take to print.
+
+    The lines are scanned for the commands that affect the estimate, a chunk
+    at a time, without parsing them, so this is much faster than
+    estimate_print_time(). The result is the same.
+
+    Args:
+        lines (Iterable[str]): The lines, e.g a text file, or a file's lines.
+        limits (MachineLimits, optional): The printer's limits. Defaults to MachineLimits().
+        tool_change_seconds (float, optional): Time added each time the active tool
+            changes. Defaults to 0.
+        arc_tolerance (float, optional): The chord tolerance used to split G2/G3
+                                         arcs into segments, in mm.
+        chunk_size (int, optional): How many lines to scan at once.
+
+    Returns:
+        PrintTimeEstimate: The estimate.
+    """
+    codes = [np.array([], dtype=str)]
+    values = [np.zeros((0, len(COLUMN_FIELDS)))]
+    for _, data in chunk_lines(lines, chunk_size):
+        columns = scan_columns(data, _ESTIMATED_COMMANDS)[1]
+        codes.append(columns.codes)
+        values.append(columns.values)
+    columns = CommandColumns(np.concatenate(codes), np.vstack(values))
+    return estimate_print_time_columns(
+        columns, limits, tool_change_seconds, arc_tolerance
+    )
+
+
+def estimate_print_time_columns(
+    columns: CommandColumns,
+    limits: Optional[MachineLimits] = None,
+    tool_change_seconds: float = 0.0,
+    arc_tolerance: float = DEFAULT_TOLERANCE,
+) -> PrintTimeEstimate:
+    """
+    Estimates how long commands that are already in columns take to print.
+
+    Args:
+        columns (CommandColumns): The commands.
+        limits (MachineLimits, optional): The printer's limits. Defaults to MachineLimits().
+        tool_change_seconds (float, optional): Time added each time the active tool
+            changes. Defaults to 0.
+        arc_tolerance (float, optional): The chord tolerance used to split G2/G3
+                                         arcs into segments, in mm.
+
+    Returns:
+        PrintTimeEstimate: The estimate.
+    """
+    limits = limits or MachineLimits()
+    segments = _collect_segments(columns, limits, arc_tolerance)
+    move_seconds = _plan(segments, limits.junction_deviation)
+    tool_change_total = segments.tool_changes * tool_change_seconds
+
+    return PrintTimeEstimate(
+        seconds=move_seconds + segments.dwell_seconds + tool_change_total,
+        move_seconds=move_seconds,
+        dwell_seconds=segments.dwell_seconds,
+        tool_change_seconds=tool_change_total,
+        segment_count=len(segments.deltas),
+        tool_changes=segments.tool_changes,
+    )
+
+
+def estimate_file_print_time(file: "GcodeFileBase", mode: int = 0) -> PrintTimeEstimate:
+    """
+    Estimates the print time of a G-code or binary G-code file.
+
+    The machine limits are taken from the slicer settings (and overridden by
+    any limits set in the G-code). The slicer's own estimate, from the print
+    metadata, is included in the result for comparison.
+
+    Args:
+        file (GcodeFileBase): The file.
+        mode (int, optional): 0 for the printer's normal mode, 1 for silent mode.
+
+    Returns:
+        PrintTimeEstimate: The estimate.
+    """
+    settings = file.slicer_settings
+    limits = MachineLimits.from_settings(settings, mode)
+
+    # A single extruder multi-material printer (e.g a MMU) unloads and loads
+    # filament on every tool change.
+    tool_change_seconds = 0.0
+    if settings.get("single_extruder_multi_material") == "1":
+        tool_change_seconds = sum(
+            float(settings.get(key, "0").split(",")[0] or 0)
+            for key in ("filament_load_time", "filament_unload_time")
+        )
+
+    estimate = estimate_print_time_lines(file.lines, limits, tool_change_seconds)
+
+    mode_name = "silent" if mode else "normal"
+    estimate.slicer_seconds = parse_duration(
+        file.print_metadata.get(f"estimated printing time ({mode_name} mode)")
+    )
+    return estimate
+
+
+def _collect_segments(
+    columns: CommandColumns, limits: MachineLimits, arc_tolerance: float
+) -> _Segments:
+    """Tracks the modal state through the commands, and collects each move."""
+    state = track_columns(columns)
+    codes = columns.codes
+
+    # Arcs are planned as the line segments they're split into, like firmware does.
+    positions, rows = linearize_moves(columns, state.positions, arc_tolerance)
+    previous = np.vstack((np.zeros((1, len(AXES))), positions))[:-1]
+    deltas = positions - previous
+
+    is_move = np.isin(codes, MOVE_COMMANDS)
+    moves = is_move[rows] & np.any(deltas != 0, axis=1)
+
+    # Limit changes in the G-code apply to the moves after them. Each limit
+    # command sets some columns of a table of limits to pick from, and the
+    # columns it doesn't set carry over from the row before.
+    is_limit = np.isin(codes, _LIMIT_COMMANDS)
+    limit_table = _limit_table(limits, codes[is_limit], columns.values[is_limit])
+    limit_indexes = np.cumsum(is_limit)[rows][moves]
+
+    # Until a feedrate is set, moves run at the axis limits.
+    feedrates = np.where(np.isnan(state.feedrate), np.inf, state.feedrate / 60.0)
+
+    is_dwell = codes == "G4"
+    dwells = np.nan_to_num(columns.values[is_dwell])
+    dwell_seconds = float(
+        np.sum(dwells[:, COLUMN_FIELDS.index("P")]) / 1000.0
+        + np.sum(dwells[:, COLUMN_FIELDS.index("S")])
+    )
+
+    # A tool change is a T<n> for a different tool than the one already active.
+    is_tool = np.char.startswith(codes, "T")
+    previous_tool = np.concatenate(([-1], state.tool[:-1]))
+    changed = is_tool & (previous_tool >= 0) & (previous_tool != state.tool)
+
+    return _Segments(
+        deltas=deltas[moves],
+        feedrates=feedrates[rows][moves],
+        limits=limit_table[limit_indexes],
+        dwell_seconds=dwell_seconds,
+        tool_changes=int(np.count_nonzero(changed)),
+    )
+
+
+def _limit_table(
+    limits: MachineLimits, codes: np.ndarray, values: np.ndarray
+) -> np.ndarray:
+    """
+    Returns the limits before the M201/M203/M204/M205 commands, and after each
+    one, as rows of MachineLimits._row().
+    """
+    table = np.full((len(codes) + 1, len(limits._row())), np.nan)
+    table[0] = limits._row()
+    changes = table[1:]
+    axes = values[:, : len(AXES)]
+
+    for code, columns in (
+        ("M201", _ACCELERATION),
+        ("M203", _FEEDRATE),
+        ("M205", _JERK),
+    ):
+        changes[codes == code, columns] = axes[codes == code]
+
+    # M204 S sets both the print and travel acceleration, unless P or T is given.
+    # M205 S and T are minimum feedrates, which we don't model.
+    is_m204 = codes == "M204"
+    p, r, s, t = (values[is_m204, COLUMN_FIELDS.index(name)] for name in "PRST")
+    changes[is_m204, _PRINT_ACCELERATION] = np.where(np.isnan(p), s, p)
+    changes[is_m204, _RETRACT_ACCELERATION] = r
+    changes[is_m204, _TRAVEL_ACCELERATION] = np.where(np.isnan(t), s, t)
+
+    rows = np.arange(len(table))[:, np.newaxis]
+    last_set = np.maximum.accumulate(np.where(np.isnan(table), 0, rows), axis=0)
+    return np.take_along_axis(table, last_set, axis=0)
+
+
+def _plan(segments: _Segments, junction_deviation: Optional[float]) -> float:
+    """Plans the segments and returns the total time spent moving, in seconds."""
+    if not len(segments.deltas):
+        return 0.0
+
+    deltas = segments.deltas
+    requested = segments.feedrates
+    table = segments.limits
+
+    # Moves in XYZ are as long as their path, extruder only moves as long as the E move.
+    lengths = np.sqrt(np.einsum("ij,ij->i", deltas[:, :3], deltas[:, :3]))
+    extruder_only = lengths == 0
+    lengths = np.where(extruder_only, np.abs(deltas[:, 3]), lengths)
+
+    # The fraction of the move's speed (or acceleration) that each axis sees.
+    ratios = np.abs(deltas) / lengths[:, None]
+    axis_feedrate = _axis_limit(table[:, _FEEDRATE], ratios)
+    axis_acceleration = _axis_limit(table[:, _ACCELERATION], ratios)
+
+    speeds = np.minimum(requested, axis_feedrate)
+
+    extruding = deltas[:, 3] > 0
+    accelerations = np.where(
+        extruder_only,
+        table[:, _RETRACT_ACCELERATION],
+        np.where(
+            extruding, table[:, _PRINT_ACCELERATION], table[:, _TRAVEL_ACCELERATION]
+        ),
+    )
+    # Guard against a zero acceleration (e.g "M204 T0"), which would never finish.
+    accelerations = np.maximum(np.minimum(accelerations, axis_acceleration), 1.0)
+
+    # Direction of each move (including E), used to limit the junction speeds.
+    directions = deltas / lengths[:, None]
+    junction_limits = _junction_limits(
+        directions, accelerations, table[:, _JERK], junction_deviation
+    )
+
+    # The squared speed limit at each junction. Junction i is the start of
+    # segment i, and junction N is the end of the last segment.
+    count = len(lengths)
+    speed_squared = speeds * speeds
+    limits = np.empty(count + 1)
+    limits[0] = min(junction_limits[0], speed_squared[0])
+    limits[1:-1] = np.minimum(
+        junction_limits[1:], np.minimum(speed_squared[:-1], speed_squared[1:])
+    )
+    limits[-1] = 0.0
+
+    # How much each segment can change its squared speed: v1^2 = v0^2 + 2 * a * d
+    reachable = 2 * accelerations * lengths
+    cumulative = np.concatenate(([0.0], np.cumsum(reachable)))
+
+    # Forward pass (acceleration), then backward pass (deceleration).
+    forward = cumulative + np.minimum.accumulate(limits - cumulative)
+    backward = np.minimum.accumulate((forward + cumulative)[::-1])[::-1] - cumulative
+    junctions = np.maximum(backward, 0.0)
+
+    entry = junctions[:-1]
+    exit = junctions[1:]
+
+    # Trapezoidal profile: accelerate to the peak speed, cruise, and decelerate.
+    peak_squared = np.minimum(speed_squared, (reachable + entry + exit) / 2)
+    peak = np.sqrt(peak_squared)
+    cruise = np.maximum(
+        lengths - (2 * peak_squared - entry - exit) / (2 * accelerations), 0.0
+    )
+    times = (
+        (peak - np.sqrt(entry)) / accelerations
+        + (peak - np.sqrt(exit)) / accelerations
+        + cruise / peak
+    )
+
+    return float(np.sum(times))
+
+
+def _axis_limit(limits: np.ndarray, ratios: np.ndarray) -> np.ndarray:
+    """
+    Returns the largest value each segment can have, so that no axis exceeds its limit.
+
+    Args:
+        limits (np.ndarray): The per-axis limits, one row per segment.
+        ratios (np.ndarray): The fraction of the value each axis sees, one row per segment.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        per_axis = np.where(ratios > 0, limits / ratios, np.inf)
+    return np.min(per_axis, axis=1)
+
+
+def _junction_limits(
+    directions: np.ndarray,
+    accelerations: np.ndarray,
+    jerk: np.ndarray,
+    junction_deviation: Optional[float],
+) -> np.ndarray:
+    """
+    Returns the maximum squared speed at the start of each segment.
+
+    The first entry is the speed the first segment can start at from rest.
+    """
+    count = len(directions)
+    limits = np.empty(count)
+
+    if junction_deviation is not None:
+        # Marlin's junction deviation, over the XYZ direction.
+        unit = directions[:, :3]
+        norms = np.linalg.norm(unit, axis=1)
+        norms[norms == 0] = 1.0
+        unit = unit / norms[:, None]
+
+        cos_theta = -np.einsum("ij,ij->i", unit[:-1], unit[1:])
+        cos_theta = np.clip(cos_theta, -1.0, 1.0)
+        sin_theta_d2 = np.sqrt(0.5 * (1.0 - cos_theta))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            limits[1:] = np.where(
+                # A straight line doesn't need to slow down at all.
+                sin_theta_d2 > 0.999999,
+                np.inf,
+                accelerations[1:]
+                * junction_deviation
+                * sin_theta_d2
+                / (1.0 - sin_theta_d2),
+            )
+        limits[0] = 0.0
+        return limits
+
+    # Classic jerk: the speed change of each axis across the junction must be
+    # less than that axis' jerk limit.
+    limits[1:] = _axis_limit(jerk[1:], np.abs(directions[1:] - directions[:-1]))
+    limits[:1] = _axis_limit(jerk[:1], np.abs(directions[:1]))
+
+    return limits * limits
+
+
+def parse_duration(text: Optional[str]) -> Optional[float]:
+    """
+    Parses a PrusaSlicer duration, such as "2h 33m 40s" or "1d 2h 3m 4s".
+
+    Args:
+        text (str, optional): The duration.
+
+    Returns:
+        Optional[float]: The duration in seconds, or None if it can't be parsed.
+    """
+    if not text:
+        return None
+
+    parts = re.findall(r"(\d+(?:\.\d+)?)\s*([dhms])", text)
+    if not parts:
+        return None
+
+    scale = {"d": 86400, "h": 3600, "m": 60, "s": 1}
+    return sum(float(value) * scale[unit] for value, unit in parts)
+
+
+def format_duration(seconds: float) -> str:
+    """Formats a duration like PrusaSlicer does, e.g "2h 33m 40s"."""
+    seconds = int(round(seconds))
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+
+    if days:
+        return f"{days}d {hours}h {minutes}m {seconds}s"
+    if hours:
+        return f"{hours}h {minutes}m {seconds}s"
+    if minutes:
+        return f"{minutes}m {seconds}s"
+    return f"{seconds}s"
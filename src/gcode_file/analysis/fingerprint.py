@@ -0,0 +1,211 @@
+"""Fingerprint the toolpath of G-code, ignoring how it is written.
+
+Two files that move and heat the printer the same way have the same
+fingerprint, even if their comments, formatting or thumbnails differ, or one
+is text and the other bgcode with any compression or encoding. This finds
+files that have been sliced again with the same settings, so work done on one
+(such as a print time estimate) can be reused for the other.
+
+The commands are resolved into a normalized stream of records, which is
+hashed in one streaming pass:
+
+- Moves, as the absolute X, Y and Z they end at (in microns), how far they
+  move the extruder, and the feedrate. Whether they were written with G90 or
+  G91, M82 or M83, or with axes that don't change, makes no difference, and
+  moves that don't move are left out.
+- Arcs, which also include their centre or radius.
+- Temperatures set for the hotend, bed and chamber (M104, M109, M140, M190,
+  M141 and M191).
+- Tool changes.
+
+Everything else, such as progress (M73), messages and fan speeds, is ignored.
+
+The records are also hashed per layer, so files that share only some layers
+can be compared. A layer starts at each extruding move at a new height, or
+at the move to that height before it.
+"""
+
+import hashlib
+import struct
+from dataclasses import dataclass
+from typing import Any, Iterable, List, Optional, Tuple
+
+from gcode_file.gcode.command import GcodeCommand
+from gcode_file.gcode.state import MOVE_COMMANDS, StateTracker
+
+# The commands that set a temperature, and are part of the fingerprint.
+TEMPERATURE_COMMANDS = ("M104", "M109", "M140", "M190", "M141", "M191")
+
+# Positions and arc centres are rounded to microns, and E to the resolution
+# PrusaSlicer writes it with.
+_POSITION_SCALE = 1000
+_E_SCALE = 100000
+
+_MOVE = struct.Struct("<B5q")
+_ARC = struct.Struct("<B8q")
+_TEMPERATURE = struct.Struct("<B2q")
+_TOOL = struct.Struct("<Bq")
+_RECORD_TYPES = {"G0": 0, "G1": 0, "G2": 1, "G3": 2, "T": 3}
+
+
+@dataclass(frozen=True)
+class Fingerprint:
+    """
+    The fingerprint of a toolpath.
+
+    Attributes:
+        digest (str): The hash of the whole toolpath, as hex.
+        layers (Tuple[str, ...]): The hash of each layer, as hex.
+        records (int): The number of moves, temperatures and tool changes hashed.
+    """
+
+    digest: str
+    layers: Tuple[str, ...]
+    records: int
+
+    def matching_layers(self, other: "Fingerprint") -> List[int]:
+        """
+        Finds the layers that are the same in both toolpaths.
+
+        Args:
+            other (Fingerprint): The fingerprint to compare with.
+
+        Returns:
+            List[int]: The index of each layer that's the same in both.
+        """
+        return [
+            index
+            for index, (layer, other_layer) in enumerate(zip(self.layers, other.layers))
+            if layer == other_layer
+        ]
+
+    def similarity(self, other: "Fingerprint") -> float:
+        """
+        Returns the fraction of layers that are the same in both toolpaths.
+
+        Args:
+            other (Fingerprint): The fingerprint to compare with.
+
+        Returns:
+            float: From 0 (no layers match) to 1 (the same toolpath).
+        """
+        if self.digest == other.digest:
+            return 1.0
+        count = max(len(self.layers), len(other.layers))
+        return len(self.matching_layers(other)) / count if count else 0.0
+
+
+def fingerprint_commands(commands: Iterable[Any]) -> Fingerprint:
+    """
+    Fingerprints a stream of commands.
+
+    Args:
+        commands (Iterable[Any]): The commands, e.g from GCodeParser.parse_stream().
+            Anything that isn't a GcodeCommand, such as a thumbnail, is ignored,
+            as are comments.
+
+    Returns:
+        Fingerprint: The fingerprint.
+    """
+    tracker = StateTracker()
+    update = tracker.update
+    layers: List[str] = []
+    layer = hashlib.sha256()
+    layer_z: Optional[int] = None
+    # The records since the last move to a new height. They belong to the next
+    # layer if it starts at that height, and the current layer otherwise.
+    pending: List[bytes] = []
+    records = 0
+    # The rounded X, Y and Z, to leave out moves that don't move.
+    last: Tuple[int, int, int] = (0, 0, 0)
+
+    for command in commands:
+        if not isinstance(command, GcodeCommand):
+            continue
+        code = command.command
+        if code in MOVE_COMMANDS:
+            state = update(command)
+            x = round(state.x * _POSITION_SCALE)
+            y = round(state.y * _POSITION_SCALE)
+            z = round(state.z * _POSITION_SCALE)
+            e = round(state.e_delta * _E_SCALE)
+            record_type = _RECORD_TYPES[code]
+            if record_type == 0 and e == 0 and (x, y, z) == last:
+                continue
+            if z != last[2]:
+                layer.update(b"".join(pending))
+                pending.clear()
+            last = (x, y, z)
+
+            if e > 0 and z != layer_z:
+                if layer_z is not None:
+                    layers.append(layer.hexdigest())
+                    layer = hashlib.sha256()
+                layer_z = z
+
+            feedrate = round(state.feedrate or 0)
+            if record_type == 0:
+                pending.append(_MOVE.pack(record_type, x, y, z, e, feedrate))
+            else:
+                fields = command.fields
+                pending.append(
+                    _ARC.pack(
+                        record_type,
+                        x,
+                        y,
+                        z,
+                        e,
+                        feedrate,
+                        _scaled(fields.get("I")),
+                        _scaled(fields.get("J")),
+                        _scaled(fields.get("R")),
+                    )
+                )
+            records += 1
+        elif code in TEMPERATURE_COMMANDS:
+            fields = command.fields
+            temperature = fields.get("S", fields.get("R"))
+            if not _is_number(temperature):
+                continue
+            tool = -1
+            if code in ("M104", "M109"):
+                tool = fields.get("T", tracker.tool)
+                tool = tool if _is_number(tool) else -1
+            # The record type is the command's index, after the others.
+            record_type = 4 + TEMPERATURE_COMMANDS.index(code)
+            pending.append(
+                _TEMPERATURE.pack(record_type, tool, round(temperature * 10))
+            )
+            records += 1
+        elif code.startswith("T"):
+            previous = tracker.tool
+            update(command)
+            if tracker.tool is not None and tracker.tool != previous:
+                pending.append(_TOOL.pack(_RECORD_TYPES["T"], tracker.tool))
+                records += 1
+        else:
+            update(command)
+            if code in ("G28", "G92"):
+                # The position changes without a move, e.g when homing.
+                position = tracker.position
+                last = (
+                    round(position[0] * _POSITION_SCALE),
+                    round(position[1] * _POSITION_SCALE),
+                    round(position[2] * _POSITION_SCALE),
+                )
+
+    layer.update(b"".join(pending))
+    layers.append(layer.hexdigest())
+    digest = hashlib.sha256("".join(layers).encode("ascii")).hexdigest()
+    return Fingerprint(digest, tuple(layers), records)
+
+
+def _scaled(value: Any) -> int:
+    """An arc's I, J or R, rounded, or a value that no rounded number has if missing."""
+    if not _is_number(value):
+        return -(2**63)
+    return round(value * _POSITION_SCALE)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
@@ -0,0 +1,430 @@
+"""A spatial index over toolpath segments, for region and nearest segment queries.
+
+The index is a uniform grid over the XY bounds of the toolpath, shared by every
+layer. Each segment is listed in every cell that its bounding box overlaps, on
+its own layer. The lists are stored sorted by (layer, cell), with only the
+cells that have segments, so the index is compact for sparse layers.
+
+Segments that would be listed in many cells, such as long travel moves, are
+listed once, in an overflow list for their layer, which is always searched.
+
+The index can be written next to the file it was built from, so it doesn't
+need to be rebuilt for later queries. It is stored as a NumPy .npz archive.
+"""
+
+import math
+from dataclasses import dataclass
+from typing import BinaryIO, Optional, Tuple, Union
+
+import numpy as np
+
+from gcode_file.analysis.toolpath import FIELDS, Toolpath
+
+_VERSION = 1
+
+# The default cell size aims for about this many segments in a cell.
+_SEGMENTS_PER_CELL = 2
+# Segments that would be in more cells than this go in the overflow list.
+_MAX_CELLS_PER_SEGMENT = 16
+# The largest number of cells along each axis.
+_MAX_GRID_SIZE = 1024
+
+
+@dataclass
+class SpatialIndex:
+    """
+    A uniform grid over the segments of each layer.
+
+    Attributes:
+        segments (np.ndarray): The x0, y0, x1 and y1 of each segment, as float32.
+        layers (np.ndarray): The layer of each segment.
+        extruding (np.ndarray): True for segments that extrude.
+        commands (np.ndarray): The index of the command each segment came
+                               from, or -1 if unknown.
+        origin (np.ndarray): The X and Y of the corner of the grid.
+        cell_size (float): The width and height of each cell, in mm.
+        shape (Tuple[int, int]): The number of cells along X and Y.
+        keys (np.ndarray): The sorted keys of the cells with segments, see _key().
+        offsets (np.ndarray): Where each key's segments start in entries, with
+                              the number of entries at the end.
+        entries (np.ndarray): The segments in each cell.
+    """
+
+    segments: np.ndarray
+    layers: np.ndarray
+    extruding: np.ndarray
+    commands: np.ndarray
+    origin: np.ndarray
+    cell_size: float
+    shape: Tuple[int, int]
+    keys: np.ndarray
+    offsets: np.ndarray
+    entries: np.ndarray
+
+    @staticmethod
+    def from_toolpath(
+        toolpath: Toolpath, cell_size: Optional[float] = None
+    ) -> "SpatialIndex":
+        """
+        Builds the index for a toolpath.
+
+        Args:
+            toolpath (Toolpath): The toolpath, e.g from extract_toolpath().
+            cell_size (float, optional): The size of the grid cells, in mm.
+                Defaults to a size that puts a few segments in each cell.
+
+        Returns:
+            SpatialIndex: The index.
+
+        Raises:
+            ValueError: If the cell size is not positive.
+        """
+        segments = toolpath.segments
+        counts = np.diff(np.append(toolpath.layer_starts, len(segments)))
+        layers = np.repeat(np.arange(toolpath.layer_count), counts)
+        commands = toolpath.commands
+        if commands is None:
+            commands = np.full(len(segments), -1)
+
+        return SpatialIndex.build(
+            segments[:, [0, 1, 3, 4]],
+            layers,
+            segments[:, FIELDS.index("feature")] != 0,
+            commands,
+            cell_size,
+        )
+
+    @staticmethod
+    def build(
+        segments: np.ndarray,
+        layers: np.ndarray,
+        extruding: np.ndarray,
+        commands: np.ndarray,
+        cell_size: Optional[float] = None,
+    ) -> "SpatialIndex":
+        """
+        Builds the index for segments.
+
+        Args:
+            segments (np.ndarray): The x0, y0, x1 and y1 of each segment.
+            layers (np.ndarray): The layer of each segment.
+            extruding (np.ndarray): True for segments that extrude.
+            commands (np.ndarray): The command of each segment, or -1.
+            cell_size (float, optional): The size of the grid cells, in mm.
+                Defaults to a size that puts a few segments in each cell.
+
+        Returns:
+            SpatialIndex: The index.
+
+        Raises:
+            ValueError: If the cell size is not positive.
+        """
+        segments = np.asarray(segments, dtype=np.float32).reshape(-1, 4)
+        layers = np.asarray(layers, dtype=np.int64)
+        low = np.minimum(segments[:, 0:2], segments[:, 2:4]).astype(np.float64)
+        high = np.maximum(segments[:, 0:2], segments[:, 2:4]).astype(np.float64)
+
+        if len(segments):
+            origin = low.min(axis=0)
+            extent = high.max(axis=0) - origin
+        else:
+            origin = extent = np.zeros(2)
+
+        if cell_size is None:
+            cell_size = _default_cell_size(extent, len(segments), layers)
+        if cell_size <= 0:
+            raise ValueError(f"cell_size must be positive, not {cell_size}")
+        # Keep the grid to a reasonable size, whatever the cell size.
+        cell_size = max(cell_size, float(extent.max()) / _MAX_GRID_SIZE)
+        shape = tuple(int(size) for size in np.floor(extent / cell_size) + 1)
+
+        index = SpatialIndex(
+            segments=segments,
+            layers=layers,
+            extruding=np.asarray(extruding, dtype=bool),
+            commands=np.asarray(commands, dtype=np.int64),
+            origin=origin,
+            cell_size=float(cell_size),
+            shape=shape,
+            keys=np.zeros(0, dtype=np.int64),
+            offsets=np.zeros(1, dtype=np.int64),
+            entries=np.zeros(0, dtype=np.int64),
+        )
+
+        # List each segment in every cell its bounding box overlaps.
+        first = index._cells(low)
+        last = index._cells(high)
+        spans = last - first + 1
+        cell_counts = spans[:, 0] * spans[:, 1]
+        overflow = cell_counts > _MAX_CELLS_PER_SEGMENT
+        cell_counts[overflow] = 1
+
+        rows = np.repeat(np.arange(len(segments)), cell_counts)
+        offset = np.arange(len(rows)) - np.repeat(
+            np.cumsum(cell_counts) - cell_counts, cell_counts
+        )
+        x = first[rows, 0] + offset % spans[rows, 0]
+        y = first[rows, 1] + offset // spans[rows, 0]
+        cells = np.where(overflow[rows], index._overflow_cell, y * shape[0] + x)
+        keys = index._key(layers[rows], cells)
+
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        index.entries = rows[order]
+        index.keys, starts = np.unique(keys, return_index=True)
+        index.offsets = np.append(starts, len(keys)).astype(np.int64)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    def query(
+        self,
+        x_min: float,
+        y_min: float,
+        x_max: float,
+        y_max: float,
+        first_layer: int = 0,
+        last_layer: Optional[int] = None,
+        extruding_only: bool = False,
+    ) -> np.ndarray:
+        """
+        Finds the segments that pass through a rectangle.
+
+        Args:
+            x_min (float): The left edge of the rectangle.
+            y_min (float): The front edge of the rectangle.
+            x_max (float): The right edge of the rectangle.
+            y_max (float): The back edge of the rectangle.
+            first_layer (int, optional): The first layer to search. Defaults to 0.
+            last_layer (int, optional): The last layer to search, inclusive.
+                                        Defaults to the last layer.
+            extruding_only (bool, optional): Only find segments that extrude.
+
+        Returns:
+            np.ndarray: The sorted indexes of the segments. Use commands[] to
+                        find the commands they came from.
+        """
+        if last_layer is None:
+            last_layer = self.layer_count - 1
+        layers = np.arange(max(first_layer, 0), last_layer + 1)
+        if not len(layers) or not len(self) or x_min > x_max or y_min > y_max:
+            return np.zeros(0, dtype=np.int64)
+
+        first = self._cells(np.array([[x_min, y_min]]))[0]
+        last = self._cells(np.array([[x_max, y_max]]))[0]
+        x, y = np.meshgrid(
+            np.arange(first[0], last[0] + 1), np.arange(first[1], last[1] + 1)
+        )
+        cells = np.append((y * self.shape[0] + x).ravel(), self._overflow_cell)
+
+        rows = self._candidates(layers, cells)
+        if extruding_only:
+            rows = rows[self.extruding[rows]]
+        inside = _intersects_rectangle(self.segments[rows], x_min, y_min, x_max, y_max)
+        return rows[inside]
+
+    def nearest(
+        self, x: float, y: float, layer: int, extruding_only: bool = False
+    ) -> Optional[Tuple[int, float]]:
+        """
+        Finds the segment on a layer that is closest to a point.
+
+        The cells are searched in rings around the point, until the closest
+        segment found is closer than any segment in the next ring can be.
+
+        Args:
+            x (float): The X of the point.
+            y (float): The Y of the point.
+            layer (int): The layer to search.
+            extruding_only (bool, optional): Only find segments that extrude.
+
+        Returns:
+            Optional[Tuple[int, float]]: The index of the closest segment and its
+                distance from the point, or None if the layer has no segments.
+        """
+        layers = np.array([layer])
+        layer_keys = self._key(layers, np.array([0, self._overflow_cell + 1]))
+        if np.diff(np.searchsorted(self.keys, layer_keys))[0] == 0:
+            return None
+
+        centre = self._cells(np.array([[x, y]]))[0]
+        best: Optional[Tuple[int, float]] = None
+
+        cells = np.array([self._overflow_cell])
+        for ring in range(max(self.shape) + 1):
+            if ring:
+                x_cells, y_cells = _ring(centre, ring, self.shape)
+                cells = y_cells * self.shape[0] + x_cells
+            else:
+                cells = np.append(cells, centre[1] * self.shape[0] + centre[0])
+
+            rows = self._candidates(layers, cells)
+            if extruding_only:
+                rows = rows[self.extruding[rows]]
+            if len(rows):
+                distances = _distance_to_segments(x, y, self.segments[rows])
+                closest = int(np.argmin(distances))
+                if best is None or distances[closest] < best[1]:
+                    best = (int(rows[closest]), float(distances[closest]))
+
+            # Segments in the next ring are at least this far from the point.
+            if best is not None and best[1] <= ring * self.cell_size:
+                break
+
+        return best
+
+    @property
+    def layer_count(self) -> int:
+        return int(self.layers.max()) + 1 if len(self.layers) else 0
+
+    def write(self, file: Union[BinaryIO, str]):
+        """
+        Writes the index, e.g next to the G-code file it was built from.
+
+        Args:
+            file (Union[BinaryIO, str]): A path, or a binary stream to write to.
+        """
+        np.savez(
+            file,
+            version=_VERSION,
+            segments=self.segments,
+            layers=self.layers,
+            extruding=self.extruding,
+            commands=self.commands,
+            origin=self.origin,
+            cell_size=self.cell_size,
+            shape=self.shape,
+            keys=self.keys,
+            offsets=self.offsets,
+            entries=self.entries,
+        )
+
+    @staticmethod
+    def read(file: Union[BinaryIO, str]) -> "SpatialIndex":
+        """
+        Reads an index written by write().
+
+        Args:
+            file (Union[BinaryIO, str]): A path, or a binary stream to read from.
+
+        Returns:
+            SpatialIndex: The index.
+
+        Raises:
+            ValueError: If the file is not an index, or is a version we can't read.
+        """
+        try:
+            with np.load(file) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (OSError, ValueError) as e:
+            raise ValueError("Invalid spatial index") from e
+
+        version = arrays.pop("version", None)
+        if version is None:
+            raise ValueError("Invalid spatial index")
+        if int(version) != _VERSION:
+            raise ValueError(f"Unsupported spatial index version: {int(version)}")
+
+        arrays["cell_size"] = float(arrays["cell_size"])
+        arrays["shape"] = tuple(int(size) for size in arrays["shape"])
+        return SpatialIndex(**arrays)
+
+    @property
+    def _overflow_cell(self) -> int:
+        return self.shape[0] * self.shape[1]
+
+    def _key(self, layers: np.ndarray, cells: np.ndarray) -> np.ndarray:
+        """Returns the key of each cell on a layer, which orders cells by layer."""
+        return layers * (self._overflow_cell + 1) + cells
+
+    def _cells(self, points: np.ndarray) -> np.ndarray:
+        """Returns the X and Y of the cell of each point, clamped to the grid."""
+        cells = np.floor((points - self.origin) / self.cell_size)
+        cells = np.nan_to_num(cells, nan=0.0, posinf=0.0, neginf=0.0)
+        return np.clip(cells, 0, np.array(self.shape) - 1).astype(np.int64)
+
+    def _candidates(self, layers: np.ndarray, cells: np.ndarray) -> np.ndarray:
+        """Returns the segments listed in any of the cells, on any of the layers."""
+        keys = self._key(layers[:, None], cells[None, :]).ravel()
+        found = np.searchsorted(self.keys, keys)
+        exists = found < len(self.keys)
+        exists[exists] = self.keys[found[exists]] == keys[exists]
+        found = found[exists]
+        if not len(found):
+            return np.zeros(0, dtype=np.int64)
+
+        starts = self.offsets[found]
+        counts = self.offsets[found + 1] - starts
+        positions = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        positions += np.arange(counts.sum())
+        return np.unique(self.entries[positions])
+
+
+def _default_cell_size(extent: np.ndarray, count: int, layers: np.ndarray) -> float:
+    """Returns a cell size that puts about _SEGMENTS_PER_CELL segments in a cell."""
+    layer_count = len(np.unique(layers)) if len(layers) else 1
+    per_layer = max(count / layer_count, 1.0)
+    area = float(extent[0] * extent[1])
+    if area <= 0:
+        # The segments are all on a line or a point.
+        return max(float(extent.max()) / per_layer * _SEGMENTS_PER_CELL, 1.0)
+    return math.sqrt(area * _SEGMENTS_PER_CELL / per_layer)
+
+
+def _ring(
+    centre: np.ndarray, ring: int, shape: Tuple[int, int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the X and Y of the cells in the grid that are ring cells from centre."""
+    steps = np.arange(-ring, ring + 1)
+    x = np.concatenate(
+        (steps, steps, np.full(len(steps) - 2, -ring), np.full(len(steps) - 2, ring))
+    )
+    y = np.concatenate(
+        (
+            np.full(len(steps), -ring),
+            np.full(len(steps), ring),
+            steps[1:-1],
+            steps[1:-1],
+        )
+    )
+    x, y = x + centre[0], y + centre[1]
+    inside = (x >= 0) & (x < shape[0]) & (y >= 0) & (y < shape[1])
+    return x[inside], y[inside]
+
+
+def _intersects_rectangle(
+    segments: np.ndarray, x_min: float, y_min: float, x_max: float, y_max: float
+) -> np.ndarray:
+    """Returns which segments pass through the rectangle, by clipping them to it."""
+    start = segments[:, 0:2].astype(np.float64)
+    direction = segments[:, 2:4].astype(np.float64) - start
+
+    enter = np.zeros(len(segments))
+    leave = np.ones(len(segments))
+    inside = np.ones(len(segments), dtype=bool)
+    for axis, low, high in ((0, x_min, x_max), (1, y_min, y_max)):
+        d = direction[:, axis]
+        parallel = d == 0
+        inside &= ~parallel | ((start[:, axis] >= low) & (start[:, axis] <= high))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_low = (low - start[:, axis]) / d
+            t_high = (high - start[:, axis]) / d
+        near = np.where(parallel, -np.inf, np.minimum(t_low, t_high))
+        far = np.where(parallel, np.inf, np.maximum(t_low, t_high))
+        enter = np.maximum(enter, near)
+        leave = np.minimum(leave, far)
+
+    return inside & (enter <= leave)
+
+
+def _distance_to_segments(x: float, y: float, segments: np.ndarray) -> np.ndarray:
+    """Returns the distance of the point from each segment."""
+    start = segments[:, 0:2].astype(np.float64)
+    direction = segments[:, 2:4].astype(np.float64) - start
+    point = np.array([x, y]) - start
+    length_squared = np.einsum("ij,ij->i", direction, direction)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.einsum("ij,ij->i", point, direction) / length_squared
+    t = np.clip(np.nan_to_num(t), 0.0, 1.0)
+    return np.linalg.norm(point - t[:, None] * direction, axis=1)
@@ -0,0 +1,404 @@
+"""Toolpath geometry, for previews.
+
+extract_toolpath() turns G-code into a flat array of line segments, one row of
+float32 values per segment:
+
+    x0, y0, z0, x1, y1, z1, width, tool, feature
+
+Extrusions and travel moves are both included, and arcs are split into
+straight segments. The feature is an index into Toolpath.features, from the
+slicer's ";TYPE:" comments, with 0 for travel moves. The width comes from
+PrusaSlicer's ";WIDTH:" comments, and is 0 for travel moves or when it isn't
+known.
+
+The toolpath can be written in a simple binary format that a browser can use
+without parsing (all values little-endian):
+
+    magic           4 bytes, b"GCTP"
+    version         uint32, currently 1
+    segment_count   uint32
+    layer_count     uint32
+    metadata_size   uint32, the size of the metadata in bytes
+    metadata        UTF-8 JSON, {"fields": [...], "features": [...]},
+                    padded with spaces to a multiple of 4 bytes
+    segments        float32[segment_count * 9]
+    layer_starts    uint32[layer_count], the first segment of each layer
+
+The segments start on a 4 byte boundary, so a Float32Array can be created
+directly over the file's ArrayBuffer.
+"""
+
+import json
+import struct
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Iterable, List, Optional, Union
+
+import numpy as np
+
+from gcode_file.gcode.arcs import DEFAULT_TOLERANCE, linearize_moves
+from gcode_file.gcode.command import GcodeCommand
+from gcode_file.gcode.state import MOVE_COMMANDS, CommandColumns, track_columns
+
+# The columns of Toolpath.segments.
+FIELDS = ("x0", "y0", "z0", "x1", "y1", "z1", "width", "tool", "feature")
+
+TRAVEL = "Travel"
+
+_MAGIC = b"GCTP"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIIII")
+
+# Points closer than this to a merged segment count as being on it, so
+# collinear segments are merged even with rounding errors.
+_EPSILON = 1e-9
+
+
+@dataclass
+class Toolpath:
+    """
+    The segments of a toolpath.
+
+    Attributes:
+        segments (np.ndarray): A contiguous (N, 9) float32 array, with the columns in FIELDS.
+        layer_starts (np.ndarray): The index of the first segment of each layer.
+        features (List[str]): The feature names, indexed by the feature column.
+        commands (np.ndarray, optional): The index of the command each segment
+            came from, in the commands it was extracted from, or None if
+            unknown. Merged segments have the index of their first command.
+            This is not part of the binary format.
+    """
+
+    segments: np.ndarray
+    layer_starts: np.ndarray
+    features: List[str]
+    commands: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    @property
+    def layer_count(self) -> int:
+        return len(self.layer_starts)
+
+    def layer(self, index: int) -> np.ndarray:
+        """Returns the segments of a layer."""
+        end = (
+            self.layer_starts[index + 1]
+            if index + 1 < len(self.layer_starts)
+            else len(self.segments)
+        )
+        return self.segments[self.layer_starts[index] : end]
+
+    def to_bytes(self) -> bytes:
+        """Returns the toolpath in the binary format described in the module docs."""
+        metadata = json.dumps({"fields": FIELDS, "features": self.features}).encode()
+        metadata += b" " * (-len(metadata) % 4)
+
+        header = _HEADER.pack(
+            _MAGIC, _VERSION, len(self.segments), len(self.layer_starts), len(metadata)
+        )
+        return b"".join(
+            (
+                header,
+                metadata,
+                self.segments.astype("<f4", copy=False).tobytes(),
+                self.layer_starts.astype("<u4", copy=False).tobytes(),
+            )
+        )
+
+    def write(self, file: Union[BinaryIO, str]):
+        """
+        Writes the toolpath in the binary format.
+
+        Args:
+            file (Union[BinaryIO, str]): A path, or a binary stream to write to.
+        """
+        if isinstance(file, str):
+            with open(file, "wb") as stream:
+                stream.write(self.to_bytes())
+        else:
+            file.write(self.to_bytes())
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "Toolpath":
+        """
+        Reads a toolpath from the binary format. The arrays share the data's memory.
+
+        Args:
+            data (bytes): The binary toolpath, e.g from to_bytes().
+
+        Returns:
+            Toolpath: The toolpath.
+
+        Raises:
+            ValueError: If the data is not a toolpath, or is a version we can't read.
+        """
+        if len(data) < _HEADER.size:
+            raise ValueError("Toolpath data is too short")
+
+        magic, version, count, layer_count, metadata_size = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError(f"Invalid toolpath magic: {magic!r}")
+        if version != _VERSION:
+            raise ValueError(f"Unsupported toolpath version: {version}")
+
+        offset = _HEADER.size
+        metadata = json.loads(data[offset : offset + metadata_size])
+        offset += metadata_size
+
+        segments = np.frombuffer(
+            data, dtype="<f4", count=count * len(FIELDS), offset=offset
+        ).reshape(count, len(FIELDS))
+        offset += segments.nbytes
+        layer_starts = np.frombuffer(
+            data, dtype="<u4", count=layer_count, offset=offset
+        )
+
+        return Toolpath(segments, layer_starts, metadata["features"])
+
+    @staticmethod
+    def read(file: Union[BinaryIO, str]) -> "Toolpath":
+        """
+        Reads a toolpath written by write().
+
+        Args:
+            file (Union[BinaryIO, str]): A path, or a binary stream to read from.
+
+        Returns:
+            Toolpath: The toolpath.
+        """
+        if isinstance(file, str):
+            with open(file, "rb") as stream:
+                return Toolpath.from_bytes(stream.read())
+        return Toolpath.from_bytes(file.read())
+
+
+def extract_toolpath(
+    commands: Iterable[Any],
+    tolerance: Optional[float] = None,
+    layer_step: int = 1,
+    arc_tolerance: float = DEFAULT_TOLERANCE,
+) -> Toolpath:
+    """
+    Extracts the segments of every move.
+
+    Args:
+        commands (Iterable): The commands, e.g a file's commands. Anything that
+                             isn't a GcodeCommand is skipped.
+        tolerance (float, optional): If set, consecutive segments with the same
+            width, tool and feature are merged, as long as no point of the
+            original path is further than this (in mm) from the merged segment.
+            0 merges only collinear segments. Defaults to None, which keeps every segment.
+        layer_step (int, optional): Only keep every Nth layer, starting with the
+                                    first. Defaults to 1, which keeps every layer.
+        arc_tolerance (float, optional): The chord tolerance used to split G2/G3
+                                         arcs into segments, in mm.
+
+    Returns:
+        Toolpath: The toolpath.
+
+    Raises:
+        ValueError: If layer_step is less than 1, or tolerance is negative.
+    """
+    if layer_step < 1:
+        raise ValueError(f"layer_step must be at least 1, not {layer_step}")
+    if tolerance is not None and tolerance < 0:
+        raise ValueError(f"tolerance must not be negative, not {tolerance}")
+
+    # Keep the index of each command, counting any that aren't GcodeCommands.
+    indexes, gcode_commands = [], []
+    for index, command in enumerate(commands):
+        if isinstance(command, GcodeCommand):
+            indexes.append(index)
+            gcode_commands.append(command)
+    commands = gcode_commands
+    columns = CommandColumns.from_commands(commands)
+    state = track_columns(columns)
+
+    features = [TRAVEL]
+    feature, width, layer = _comment_state(commands, features)
+
+    positions = state.positions
+    starts = np.vstack((np.zeros((1, 4)), positions))[:-1]
+    is_move = np.isin(columns.codes, MOVE_COMMANDS)
+    moved = is_move & np.any(starts[:, :3] != positions[:, :3], axis=1)
+    extruding = moved & (state.e_delta > 0)
+
+    if layer is None:
+        # There are no layer markers, so use the Z of the extrusions.
+        layer = _layers_from_z(positions[:, 2], extruding)
+
+    if np.any(extruding & (feature < 0)):
+        # Extrusions before the first ";TYPE:" comment have no known feature.
+        feature = np.where(feature < 0, len(features), feature)
+        features.append("Unknown")
+
+    # Split arcs into segments, and find the command of each segment.
+    points, rows = linearize_moves(columns, positions, arc_tolerance)
+    starts = np.vstack((np.zeros((1, 4)), points))[:-1]
+    kept = moved[rows] & np.any(starts[:, :3] != points[:, :3], axis=1)
+    rows = rows[kept]
+
+    segments = np.empty((len(rows), len(FIELDS)), dtype=np.float32)
+    segments[:, 0:3] = starts[kept, :3]
+    segments[:, 3:6] = points[kept, :3]
+    segments[:, 6] = np.where(extruding, width, 0.0)[rows]
+    segments[:, 7] = np.maximum(state.tool, 0)[rows]
+    segments[:, 8] = np.where(extruding, feature, 0)[rows]
+    segment_layers = layer[rows]
+
+    if layer_step > 1:
+        sampled = segment_layers % layer_step == 0
+        segments = segments[sampled]
+        segment_layers = segment_layers[sampled]
+        rows = rows[sampled]
+
+    if tolerance is not None:
+        segments, segment_layers, rows = _merge_segments(
+            segments, segment_layers, rows, tolerance
+        )
+
+    layer_changes = np.flatnonzero(np.diff(segment_layers)) + 1
+    layer_starts = np.concatenate(([0], layer_changes)) if len(segments) else []
+
+    return Toolpath(
+        np.ascontiguousarray(segments),
+        np.array(layer_starts, dtype=np.uint32),
+        features,
+        np.array(indexes, dtype=np.int64)[rows],
+    )
+
+
+def _comment_state(commands: List[GcodeCommand], features: List[str]):
+    """
+    Returns the feature, width and layer of each command, from the slicer's comments.
+
+    New feature names are added to features. The feature is -1 before the first
+    ";TYPE:" comment, and the layers are None if there are no layer markers.
+    """
+    feature_rows: List[int] = []
+    feature_values: List[int] = []
+    width_rows: List[int] = []
+    width_values: List[float] = []
+    layer_rows: List[int] = []
+
+    for row, command in enumerate(commands):
+        comment = command.comment
+        if not comment or command.command:
+            continue
+        if comment.startswith("TYPE:"):
+            name = comment[5:].strip()
+            if name not in features:
+                features.append(name)
+            feature_rows.append(row)
+            feature_values.append(features.index(name))
+        elif comment.startswith("WIDTH:"):
+            try:
+                width_values.append(float(comment[6:]))
+            except ValueError:
+                continue
+            width_rows.append(row)
+        elif comment == "LAYER_CHANGE" or comment.startswith("LAYER:"):
+            layer_rows.append(row)
+
+    rows = np.arange(len(commands))
+
+    def fill(set_rows: List[int], values: List[float], initial: float) -> np.ndarray:
+        """Returns the value from the last row in set_rows, at every row."""
+        last = np.searchsorted(set_rows, rows, side="right") - 1
+        return np.where(last >= 0, np.append(values, initial)[last], initial)
+
+    feature = fill(feature_rows, feature_values, -1).astype(np.int64)
+    width = fill(width_rows, width_values, 0.0)
+
+    layer = None
+    if layer_rows:
+        # Commands before the first marker (the start G-code) are in the first layer.
+        layer = np.maximum(np.searchsorted(layer_rows, rows, side="right") - 1, 0)
+
+    return feature, width, layer
+
+
+def _layers_from_z(z: np.ndarray, extruding: np.ndarray) -> np.ndarray:
+    """
+    Returns the layer of each command, counting each new Z printed at as a layer.
+
+    Other commands are in the layer of the next extrusion, so Z-hops and the
+    travel to the start of a layer aren't counted as layers of their own.
+    """
+    extrusion_rows = np.flatnonzero(extruding)
+    if not len(extrusion_rows):
+        return np.zeros(len(z), dtype=np.int64)
+    extrusion_z = np.round(z[extrusion_rows], 6)
+    extrusion_layers = np.searchsorted(np.unique(extrusion_z), extrusion_z)
+
+    next_extrusion = np.searchsorted(extrusion_rows, np.arange(len(z)))
+    return extrusion_layers[np.minimum(next_extrusion, len(extrusion_rows) - 1)]
+
+
+def _merge_segments(
+    segments: np.ndarray, layers: np.ndarray, rows: np.ndarray, tolerance: float
+):
+    """
+    Merges runs of connected segments that stay within tolerance of a straight line.
+
+    Each pass merges pairs of neighbouring segments. Every merged segment keeps
+    a bound on how far the original path can be from it: the larger bound of
+    the two segments, plus the distance of the removed point from the merged
+    segment. Pairs are only merged while that bound is within the tolerance.
+    Neighbouring pairs are merged in alternate passes, so each pass can be done
+    with array operations.
+    """
+    errors = np.zeros(len(segments))
+    tolerance += _EPSILON
+
+    while len(segments) > 1:
+        previous, current = segments[:-1], segments[1:]
+        joinable = (
+            np.all(previous[:, 3:6] == current[:, 0:3], axis=1)
+            & np.all(previous[:, 6:9] == current[:, 6:9], axis=1)
+            & (layers[:-1] == layers[1:])
+        )
+
+        start = previous[:, 0:3].astype(np.float64)
+        middle = previous[:, 3:6].astype(np.float64)
+        end = current[:, 3:6].astype(np.float64)
+        bounds = np.maximum(errors[:-1], errors[1:]) + _distance_to_segment(
+            middle, start, end
+        )
+        mergeable = joinable & (bounds <= tolerance)
+        if not mergeable.any():
+            break
+
+        # Within each run of mergeable junctions, only merge every other one,
+        # so no segment is part of two merges.
+        indexes = np.arange(len(mergeable))
+        run_starts = mergeable & ~np.concatenate(([False], mergeable[:-1]))
+        run_position = indexes - np.maximum.accumulate(np.where(run_starts, indexes, 0))
+        junctions = np.flatnonzero(mergeable & (run_position % 2 == 0))
+
+        segments = segments.copy()
+        segments[junctions, 3:6] = segments[junctions + 1, 3:6]
+        errors[junctions] = bounds[junctions]
+
+        keep = np.ones(len(segments), dtype=bool)
+        keep[junctions + 1] = False
+        segments = segments[keep]
+        layers = layers[keep]
+        rows = rows[keep]
+        errors = errors[keep]
+
+    return segments, layers, rows
+
+
+def _distance_to_segment(
+    point: np.ndarray, start: np.ndarray, end: np.ndarray
+) -> np.ndarray:
+    """Returns the distance of each point from the segment from start to end."""
+    direction = end - start
+    length_squared = np.einsum("ij,ij->i", direction, direction)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.einsum("ij,ij->i", point - start, direction) / length_squared
+    t = np.clip(np.nan_to_num(t), 0.0, 1.0)
+    closest = start + t[:, None] * direction
+    return np.linalg.norm(point - closest, axis=1)
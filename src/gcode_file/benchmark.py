@@ -0,0 +1,406 @@
+"""Measure how fast files are read, to find and stop performance regressions.
+
+run_benchmarks() measures each G-code and bgcode file on every stage of
+reading it:
+
+- open: opening the file, which reads and decompresses a bgcode file's blocks.
+- commands: parsing every command, as file.commands does.
+- parse_lines: parsing the G-code text, without validating it.
+- validate: validating the parsed commands.
+- meatpack_encode and meatpack_decode: MeatPacking the G-code text, and back.
+- deflate, heatshrink_11_4 and heatshrink_12_4: decoding G-code blocks with
+  each compression.
+- peak_memory: the most memory allocated while opening the file and parsing
+  its commands, as traced by tracemalloc.
+
+Each is measured several times, keeping the best, as the others are slowed by
+whatever else the machine is doing. The results can be saved as JSON, and
+compared with a baseline saved earlier on the same machine, to find the ones
+that got worse by more than a tolerance::
+
+    python -m gcode_file.benchmark tests/fixtures --output baseline.json
+    python -m gcode_file.benchmark tests/fixtures --baseline baseline.json
+
+The exit status is 1 if any got worse, so it can be run by CI.
+"""
+
+import io
+import json
+import math
+import os
+import platform
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from gcode_file.bgcode.meatpack import compress_block, decompress_block
+from gcode_file.bgcode.parser import CompressionType, GCodeEncoding
+from gcode_file.bgcode.tuner import benchmark_codecs, read_gcode_blocks
+from gcode_file.file import open_file
+from gcode_file.gcode.basic_parser import BasicGCodeParser
+from gcode_file.gcode.validator import NoValidator
+from gcode_file.gcode.validator_rules import default_validator
+
+DEFAULT_REPEAT = 3
+# How much worse a result can be than the baseline, as a fraction of it.
+DEFAULT_TOLERANCE = 0.1
+# The shortest time to measure, in seconds.
+MIN_SECONDS = 0.05
+# The files that are measured, when given a directory.
+EXTENSIONS = (".gcode", ".bgcode")
+
+_MB = 1e6
+_COMPRESSIONS = {
+    "deflate": CompressionType.DEFLATE,
+    "heatshrink_11_4": CompressionType.HEATSHRINK_11_4,
+    "heatshrink_12_4": CompressionType.HEATSHRINK_12_4,
+}
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    A measurement of a file.
+
+    Attributes:
+        benchmark (str): What was measured, e.g "parse_lines".
+        file (str): The name of the file measured.
+        value (float): The measurement.
+        unit (str): The measurement's unit, e.g "lines/s".
+        higher_is_better (bool): True for a speed, False for a time or size.
+    """
+
+    benchmark: str
+    file: str
+    value: float
+    unit: str
+    higher_is_better: bool = True
+
+    @property
+    def key(self) -> str:
+        """The benchmark and file, which identify the result in a baseline."""
+        return f"{self.file}:{self.benchmark}"
+
+    def __str__(self) -> str:
+        return f"{self.file:<40} {self.benchmark:<16} {self.value:>12.3f} {self.unit}"
+
+
+@dataclass
+class Regression:
+    """
+    A result that is worse than its baseline.
+
+    Attributes:
+        result (BenchmarkResult): The new result.
+        baseline (float): The baseline's value.
+    """
+
+    result: BenchmarkResult
+    baseline: float
+
+    @property
+    def change(self) -> float:
+        """How much the value changed, as a fraction of the baseline."""
+        return (self.result.value - self.baseline) / self.baseline
+
+    def __str__(self) -> str:
+        result = self.result
+        return (
+            f"{result.file}:{result.benchmark} {self.baseline:.3f} -> "
+            f"{result.value:.3f} {result.unit} ({self.change:+.1%})"
+        )
+
+
+def find_files(paths: Iterable[str]) -> List[str]:
+    """
+    Find the files to measure.
+
+    Args:
+        paths (Iterable[str]): Files, or directories of files with one of
+            EXTENSIONS.
+
+    Returns:
+        List[str]: The files, with each directory's in name order.
+    """
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for name in sorted(os.listdir(path)):
+            if name.endswith(EXTENSIONS):
+                files.append(os.path.join(path, name))
+    return files
+
+
+def _best(function: Callable[[], object], repeat: int) -> float:
+    """
+    Returns the fastest time of repeat measurements of function, in seconds.
+
+    Quick functions are called several times in each measurement, so that it
+    takes at least MIN_SECONDS, as shorter times are too noisy to compare.
+    """
+
+    def measure(number: int) -> float:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        return (time.perf_counter() - start) / number
+
+    best = measure(1)
+    if best >= MIN_SECONDS:
+        # The first call is one of the measurements.
+        repeat -= 1
+        number = 1
+    else:
+        number = math.ceil(MIN_SECONDS / max(best, 1e-9))
+        best = float("inf")
+    for _ in range(repeat):
+        best = min(best, measure(number))
+    return max(best, 1e-9)
+
+
+def _iterate_commands(path: str):
+    with open_file(path, strict_mode=False) as file:
+        for _ in file.commands:
+            pass
+
+
+def _peak_memory(path: str) -> int:
+    """Returns the most memory allocated while parsing a file, in bytes."""
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.start()
+    try:
+        _iterate_commands(path)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+
+def benchmark_file(path: str, repeat: int = DEFAULT_REPEAT) -> List[BenchmarkResult]:
+    """
+    Measure every benchmark on a file.
+
+    Args:
+        path (str): The G-code or bgcode file.
+        repeat (int, optional): How many times to measure each, keeping the best.
+
+    Returns:
+        List[BenchmarkResult]: The measurements.
+
+    Raises:
+        ValueError: If repeat is not positive, or the file can't be read.
+    """
+    if repeat < 1:
+        raise ValueError(f"repeat must be positive, not {repeat}")
+
+    name = os.path.basename(path)
+    results = []
+
+    def add(benchmark: str, value: float, unit: str, higher_is_better: bool = True):
+        results.append(BenchmarkResult(benchmark, name, value, unit, higher_is_better))
+
+    def open_only():
+        with open_file(path, strict_mode=False):
+            pass
+
+    add("open", _best(open_only, repeat) * 1e3, "ms", higher_is_better=False)
+
+    with open_file(path, strict_mode=False) as file:
+        count = sum(1 for _ in file.commands)
+    seconds = _best(lambda: _iterate_commands(path), repeat)
+    add("commands", count / seconds, "commands/s")
+
+    with open(path, "rb") as stream:
+        blocks = list(read_gcode_blocks(stream))
+    text = "".join(blocks)
+    size = len(text.encode("utf-8"))
+
+    parser = BasicGCodeParser(NoValidator(), strict_mode=False)
+    commands = list(parser.parse_stream(io.StringIO(text)))
+    seconds = _best(lambda: list(parser.parse_stream(io.StringIO(text))), repeat)
+    add("parse_lines", text.count("\n") / seconds, "lines/s")
+
+    check = default_validator.check
+    seconds = _best(lambda: [check(command) for command in commands], repeat)
+    add("validate", len(commands) / seconds, "commands/s")
+
+    seconds = _best(lambda: [compress_block(block) for block in blocks], repeat)
+    add("meatpack_encode", size / seconds / _MB, "MB/s")
+    packed = [compress_block(block) for block in blocks]
+    seconds = _best(lambda: [decompress_block(data) for data in packed], repeat)
+    add("meatpack_decode", size / seconds / _MB, "MB/s")
+
+    if blocks:
+        codecs = benchmark_codecs(
+            blocks, _COMPRESSIONS.values(), [GCodeEncoding.NONE], repeat
+        )
+        for benchmark, codec in zip(_COMPRESSIONS, codecs):
+            add(benchmark, codec.throughput / _MB, "MB/s")
+
+    add("peak_memory", _peak_memory(path) / _MB, "MB", higher_is_better=False)
+    return results
+
+
+def run_benchmarks(
+    paths: Iterable[str], repeat: int = DEFAULT_REPEAT
+) -> List[BenchmarkResult]:
+    """
+    Measure every benchmark on files.
+
+    Args:
+        paths (Iterable[str]): Files, or directories of files (see find_files()).
+        repeat (int, optional): How many times to measure each, keeping the best.
+
+    Returns:
+        List[BenchmarkResult]: The measurements of each file, in order.
+
+    Raises:
+        ValueError: If repeat is not positive, or a file can't be read.
+    """
+    results = []
+    for path in find_files(paths):
+        results.extend(benchmark_file(path, repeat))
+    return results
+
+
+def save_results(results: Sequence[BenchmarkResult], path: str):
+    """
+    Save results as JSON, e.g to compare later results with.
+
+    Args:
+        results (Sequence[BenchmarkResult]): The results.
+        path (str): The file to write.
+    """
+    data = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": [asdict(result) for result in results],
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+
+def load_results(path: str) -> List[BenchmarkResult]:
+    """
+    Load results saved by save_results().
+
+    Args:
+        path (str): The file to read.
+
+    Returns:
+        List[BenchmarkResult]: The results.
+
+    Raises:
+        ValueError: If the file isn't saved results.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    try:
+        return [BenchmarkResult(**result) for result in data["results"]]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"{path} isn't saved benchmark results: {e}") from e
+
+
+def compare_results(
+    results: Iterable[BenchmarkResult],
+    baseline: Iterable[BenchmarkResult],
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> List[Regression]:
+    """
+    Find the results that are worse than the baseline by more than a tolerance.
+
+    Results that aren't in the baseline are ignored.
+
+    Args:
+        results (Iterable[BenchmarkResult]): The new results.
+        baseline (Iterable[BenchmarkResult]): The results to compare them to.
+        tolerance (float, optional): How much worse a result can be, as a
+            fraction of the baseline, e.g 0.1 for 10%.
+
+    Returns:
+        List[Regression]: The results that got worse, in order.
+
+    Raises:
+        ValueError: If the tolerance is negative.
+    """
+    if tolerance < 0:
+        raise ValueError(f"tolerance can't be negative, not {tolerance}")
+
+    baseline_values: Dict[str, float] = {
+        result.key: result.value for result in baseline
+    }
+    regressions = []
+    for result in results:
+        value = baseline_values.get(result.key)
+        if not value:
+            continue
+        if result.higher_is_better:
+            worse = result.value < value * (1 - tolerance)
+        else:
+            worse = result.value > value * (1 + tolerance)
+        if worse:
+            regressions.append(Regression(result, value))
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    """
+    Measures files, and compares the results with a baseline.
+    """
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description="Measure how fast G-code and bgcode files are read"
+    )
+    parser.add_argument(
+        "paths", nargs="+", help="The files, or directories of files, to measure"
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=DEFAULT_REPEAT,
+        help="How many times to measure each, keeping the best",
+    )
+    parser.add_argument("--output", help="Save the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with results saved earlier")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="How much worse than the baseline a result can be, e.g 0.1 for 10%%",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        baseline = load_results(args.baseline) if args.baseline else None
+        results = []
+        for path in find_files(args.paths):
+            for result in benchmark_file(path, args.repeat):
+                print(result)
+                results.append(result)
+        if args.output:
+            save_results(results, args.output)
+        regressions = (
+            compare_results(results, baseline, args.tolerance) if baseline else []
+        )
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if regressions:
+        print(f"\n{len(regressions)} worse than {args.baseline}:")
+        for regression in regressions:
+            print(regression)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,464 @@
+"""Converts between Binary G-code (bgcode) and text G-code files.
+
+Both conversions stream, so their memory use doesn't grow with the size of
+the file, and both work on pipes as well as files:
+
+- bgcode_to_gcode() decodes one block at a time, writing the thumbnails and
+  slicer config as the comments PrusaSlicer writes in text G-code files.
+- gcode_to_bgcode() reads the text a line at a time, and encodes the G-code in
+  fixed size blocks as they fill. The slicer config is at the end of a text
+  file, but its metadata blocks go before the G-code in a bgcode file, so the
+  encoded G-code blocks are held in a temporary file (on disk once large)
+  until the end of the text is reached.
+
+These can also be run from the command line, e.g::
+
+    python -m gcode_file.bgcode.convert to-gcode input.bgcode output.gcode
+    python -m gcode_file.bgcode.convert to-bgcode - - < input.gcode > output.bgcode
+"""
+
+import base64
+import io
+import re
+import shutil
+import tempfile
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from gcode_file.bgcode.parser import (
+    BasicBGCodeParser,
+    BlockType,
+    ChecksumType,
+    CompressionType,
+    FileMetadataBlock,
+    GCodeBlock,
+    GCodeEncoding,
+    PrinterMetadataBlock,
+    PrintMetadataBlock,
+    SlicerMetadataBlock,
+    ThumbnailBlock,
+    ThumbnailFormat,
+    ThumbnailParameter,
+)
+from gcode_file.bgcode.writer import (
+    DEFAULT_BLOCK_SIZE,
+    BasicBGCodeWriter,
+    split_blocks,
+)
+from gcode_file.gcode.command import PrusaSlicerConfigCommand
+from gcode_file.gcode.writer import format_thumbnail
+
+# The slicer config keys PrusaSlicer copies into the printer metadata.
+PRINTER_METADATA_KEYS = (
+    "printer_model",
+    "filament_type",
+    "filament_abrasive",
+    "nozzle_diameter",
+    "nozzle_high_flow",
+    "bed_temperature",
+    "brim_width",
+    "fill_density",
+    "layer_height",
+    "temperature",
+    "ironing",
+    "support_material",
+    "extruder_colour",
+)
+
+# The print statistics PrusaSlicer also copies into the printer metadata.
+PRINTER_METADATA_STATISTICS = (
+    "filament used [mm]",
+    "filament used [g]",
+    "filament cost",
+    "filament used [cm3]",
+    "total filament used for wipe tower [g]",
+    "estimated printing time (normal mode)",
+    "estimated printing time (silent mode)",
+)
+
+_GENERATED_BY = "; generated by "
+_CONFIG_BEGIN = "; prusaslicer_config = begin"
+_CONFIG_END = "; prusaslicer_config = end"
+_MAX_LAYER_Z = "; max_layer_z = "
+_OBJECTS_INFO = "objects_info"
+
+_THUMBNAIL_BEGIN = re.compile(r";\s*thumbnail(?:_(\w+))?\s+begin\s+(\d+)x(\d+)\s+\d+")
+
+# The buffer size of the temporary file, before it moves to disk.
+_SPOOL_SIZE = 8 * 1024 * 1024
+
+
+def bgcode_to_gcode(source: BinaryIO, output: BinaryIO):
+    """
+    Convert a bgcode file to text G-code, one block at a time.
+
+    The text is laid out the same as PrusaSlicer's text G-code: the producer
+    and thumbnails first, then the G-code, then the print statistics and the
+    prusaslicer_config block.
+
+    Args:
+        source (BinaryIO): The bgcode file, read from start to end without seeking.
+        output (BinaryIO): Where to write the G-code, as UTF-8.
+
+    Raises:
+        ValueError: If the input is not a valid bgcode file.
+    """
+
+    def write(text: str):
+        output.write(text.encode("utf-8"))
+
+    printer_metadata: Dict[str, str] = {}
+    print_metadata: Dict[str, str] = {}
+    slicer_metadata: Dict[str, str] = {}
+
+    for block in BasicBGCodeParser().parse_stream(source):
+        if isinstance(block, GCodeBlock):
+            write(block.data())
+        elif isinstance(block, ThumbnailBlock):
+            write(_format_thumbnail(block.parameters, block.data))
+        elif isinstance(block, FileMetadataBlock):
+            producer = block.data.get("Producer")
+            if producer is not None:
+                produced_on = block.data.get("Produced on")
+                write(
+                    f"{_GENERATED_BY}{producer}"
+                    + (f" on {produced_on}" if produced_on else "")
+                    + "\n\n"
+                )
+        elif isinstance(block, PrinterMetadataBlock):
+            printer_metadata.update(block.data)
+        elif isinstance(block, PrintMetadataBlock):
+            print_metadata.update(block.data)
+        elif isinstance(block, SlicerMetadataBlock):
+            slicer_metadata.update(block.data)
+
+    # The metadata was read before the G-code, but is written after it.
+    if _OBJECTS_INFO in printer_metadata:
+        write(f"; {_OBJECTS_INFO} = {printer_metadata[_OBJECTS_INFO]}\n")
+    write("".join(f"; {key} = {value}\n" for key, value in print_metadata.items()))
+    if slicer_metadata:
+        write(f"\n{_CONFIG_BEGIN}\n")
+        write("".join(f"; {key} = {value}\n" for key, value in slicer_metadata.items()))
+        write(f"{_CONFIG_END}\n")
+
+
+def gcode_to_bgcode(
+    source: BinaryIO,
+    output: BinaryIO,
+    checksum_type: ChecksumType = ChecksumType.CRC32,
+    gcode_compression: CompressionType = CompressionType.HEATSHRINK_12_4,
+    gcode_encoding: GCodeEncoding = GCodeEncoding.MEATPACK_COMMENTS,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    processes: Optional[int] = None,
+):
+    """
+    Convert a text G-code file to bgcode, a line at a time.
+
+    The "generated by" comment, thumbnails, print statistics and
+    prusaslicer_config block are moved into metadata and thumbnail blocks, the
+    same as PrusaSlicer does. The rest of the text is the G-code.
+
+    Args:
+        source (BinaryIO): The text G-code file, read from start to end without seeking.
+        output (BinaryIO): Where to write the bgcode file.
+        checksum_type (ChecksumType, optional): See BasicBGCodeWriter.
+        gcode_compression (CompressionType, optional): See BasicBGCodeWriter.
+        gcode_encoding (GCodeEncoding, optional): See BasicBGCodeWriter.
+        block_size (int, optional): See BasicBGCodeWriter.
+        processes (int, optional): See BasicBGCodeWriter.
+
+    Raises:
+        ValueError: If a thumbnail or the prusaslicer_config block is malformed.
+    """
+    text = io.TextIOWrapper(source, encoding="utf-8", newline="")
+    try:
+        lines_to_bgcode(
+            text,
+            output,
+            checksum_type=checksum_type,
+            gcode_compression=gcode_compression,
+            gcode_encoding=gcode_encoding,
+            block_size=block_size,
+            processes=processes,
+        )
+    finally:
+        # Stop the wrapper from closing the source when it's garbage collected.
+        text.detach()
+
+
+def lines_to_bgcode(lines: Iterable[str], output: BinaryIO, **kwargs):
+    """
+    Write lines of text G-code as bgcode, as gcode_to_bgcode() does.
+
+    Args:
+        lines (Iterable[str]): The lines of text G-code, each ending with a newline.
+        output (BinaryIO): Where to write the bgcode file.
+        **kwargs: BasicBGCodeWriter options, such as gcode_compression.
+
+    Raises:
+        ValueError: If a thumbnail or the prusaslicer_config block is malformed.
+    """
+    scanner = _TextScanner()
+    with tempfile.SpooledTemporaryFile(_SPOOL_SIZE) as spool:
+        gcode_writer = BasicBGCodeWriter(spool, **kwargs)
+        gcode_writer.write_file_header()
+        header_size = spool.tell()
+        gcode_writer.write_gcode(scanner.scan(lines))
+
+        writer = BasicBGCodeWriter(output, **kwargs)
+        writer.write_file_header()
+        if scanner.file_metadata:
+            writer.write_metadata(BlockType.FILE_METADATA, scanner.file_metadata)
+        writer.write_metadata(BlockType.PRINTER_METADATA, scanner.printer_metadata())
+        for parameters, data in scanner.thumbnails:
+            writer.write_thumbnail(parameters, data)
+        if scanner.print_metadata:
+            writer.write_metadata(BlockType.PRINT_METADATA, scanner.print_metadata)
+        if scanner.slicer_metadata:
+            writer.write_metadata(BlockType.SLICER_METADATA, scanner.slicer_metadata)
+
+        spool.seek(header_size)
+        shutil.copyfileobj(spool, output)
+
+
+def gcode_blocks(
+    lines: Iterable[str], block_size: int = DEFAULT_BLOCK_SIZE
+) -> Iterator[str]:
+    """
+    Split lines of text G-code into the G-code of each block, as
+    gcode_to_bgcode() writes them. The thumbnails and metadata are left out,
+    as they aren't stored in G-code blocks.
+
+    Args:
+        lines (Iterable[str]): The lines of text G-code, each ending with a newline.
+        block_size (int, optional): The size of the blocks, in characters.
+
+    Yields:
+        str: The G-code text of each block.
+
+    Raises:
+        ValueError: If a thumbnail or the prusaslicer_config block is malformed.
+    """
+    return split_blocks(_TextScanner().scan(lines), block_size)
+
+
+class _TextScanner:
+    """
+    Separates the metadata and thumbnails in text G-code from the G-code.
+
+    scan() yields the lines of G-code, and fills in the attributes as the
+    metadata is found.
+    """
+
+    def __init__(self):
+        self.file_metadata: Dict[str, str] = {}
+        self.print_metadata: Dict[str, str] = {}
+        self.slicer_metadata: Dict[str, str] = {}
+        self.thumbnails: List[Tuple[ThumbnailParameter, bytes]] = []
+        self.objects_info: Optional[str] = None
+        self.max_layer_z: Optional[str] = None
+
+    def printer_metadata(self) -> Dict[str, str]:
+        """The printer metadata, from the slicer config and print statistics."""
+        metadata = {
+            key: self.slicer_metadata[key]
+            for key in PRINTER_METADATA_KEYS
+            if key in self.slicer_metadata
+        }
+        if self.max_layer_z is not None:
+            # PrusaSlicer writes this with two decimal places in the metadata.
+            try:
+                metadata["max_layer_z"] = f"{float(self.max_layer_z):.2f}"
+            except ValueError:
+                metadata["max_layer_z"] = self.max_layer_z
+        if self.objects_info is not None:
+            metadata[_OBJECTS_INFO] = self.objects_info
+        for key in PRINTER_METADATA_STATISTICS:
+            if key in self.print_metadata:
+                metadata[key] = self.print_metadata[key]
+        return metadata
+
+    def scan(self, lines: Iterable[str]) -> Iterator[str]:
+        """
+        Yield the lines that are G-code.
+
+        The print statistics are "; key = value" comments just before the
+        config block, which look the same as other comments, so runs of them
+        are held back until it's known what follows them.
+
+        The blank and ";" lines PrusaSlicer writes around the thumbnails are
+        dropped, until the G-code starts.
+        """
+        lines = iter(lines)
+        pending: List[str] = []
+        pending_blank = False
+        started = False
+
+        for line in lines:
+            stripped = line.strip()
+            if stripped.startswith(";"):
+                # Comments may not have a space after the ";", e.g as
+                # GCodeWriter writes them.
+                stripped = "; " + stripped[1:].lstrip()
+
+            if not started and line.rstrip("\r\n") in ("", ";"):
+                continue
+
+            if stripped.startswith(_GENERATED_BY.strip()) and not self.file_metadata:
+                self._read_generated_by(stripped)
+                continue
+
+            match = _THUMBNAIL_BEGIN.match(stripped)
+            if match:
+                yield from pending
+                pending, pending_blank = [], False
+                self.thumbnails.append(_read_thumbnail(match, lines))
+                continue
+
+            if stripped == _CONFIG_BEGIN:
+                self._read_statistics(pending)
+                pending, pending_blank = [], False
+                self._read_config(lines)
+                continue
+
+            started = True
+            if stripped.startswith(_MAX_LAYER_Z):
+                self.max_layer_z = stripped[len(_MAX_LAYER_Z) :]
+
+            if stripped.startswith(";") and " = " in stripped:
+                if pending_blank:
+                    yield from pending
+                    pending, pending_blank = [], False
+                pending.append(line)
+            elif not stripped and pending:
+                pending.append(line)
+                pending_blank = True
+            else:
+                yield from pending
+                pending, pending_blank = [], False
+                yield line
+
+        yield from pending
+
+    def _read_generated_by(self, line: str):
+        """Read e.g "; generated by PrusaSlicer 2.9.2 on 2025-05-03 at 20:49:01 UTC"."""
+        producer, separator, produced_on = (
+            line[len(_GENERATED_BY.strip()) :].strip().partition(" on ")
+        )
+        self.file_metadata["Producer"] = producer
+        if separator:
+            self.file_metadata["Produced on"] = produced_on
+
+    def _read_statistics(self, lines: List[str]):
+        """Read the print statistics, which end just before the config block."""
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            key, value = PrusaSlicerConfigCommand.parse_config_line(line[1:])
+            if key == _OBJECTS_INFO:
+                self.objects_info = value
+            else:
+                self.print_metadata[key] = value
+
+    def _read_config(self, lines: Iterator[str]):
+        """Read the rest of the prusaslicer_config block."""
+        for line in lines:
+            line = line.strip()
+            if line == _CONFIG_END:
+                return
+            if not line.startswith(";"):
+                raise ValueError(f"Invalid prusaslicer_config line: {line}")
+            key, value = PrusaSlicerConfigCommand.parse_config_line(line[1:])
+            self.slicer_metadata[key] = value
+
+        raise ValueError("Did not find end of prusaslicer_config block")
+
+
+def _read_thumbnail(
+    match: "re.Match[str]", lines: Iterator[str]
+) -> Tuple[ThumbnailParameter, bytes]:
+    """Read the rest of a thumbnail block, returning its parameters and image."""
+    format_name = match.group(1) or "PNG"
+    try:
+        format = ThumbnailFormat[format_name.upper()]
+    except KeyError:
+        raise ValueError(f"Unsupported thumbnail format: {format_name}") from None
+    parameters = ThumbnailParameter(format, int(match.group(2)), int(match.group(3)))
+
+    end = f"thumbnail{'_' + match.group(1) if match.group(1) else ''} end"
+    encoded = []
+    for line in lines:
+        line = line.strip()
+        if not line.startswith(";"):
+            raise ValueError("Thumbnail block not correctly ended")
+        line = line[1:].strip()
+        if line == end:
+            return parameters, base64.b64decode("".join(encoded))
+        encoded.append(line)
+
+    raise ValueError("Did not find end of thumbnail block")
+
+
+def _format_thumbnail(parameters: ThumbnailParameter, data: bytes) -> str:
+    """Format a thumbnail as PrusaSlicer's comments, with the lines around it."""
+    format = ThumbnailFormat(parameters.format)
+    comments = format_thumbnail(format.name, parameters.width, parameters.height, data)
+    return f"\n;\n{comments};\n"
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Converts between bgcode and text G-code files. "-" reads stdin or writes stdout.
+    """
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description="Convert between Binary G-code (bgcode) and text G-code"
+    )
+    parser.add_argument(
+        "direction",
+        choices=["to-gcode", "to-bgcode"],
+        help="to-gcode converts bgcode to text, to-bgcode converts text to bgcode",
+    )
+    parser.add_argument("input", help='The file to convert, or "-" for stdin')
+    parser.add_argument("output", help='The file to write, or "-" for stdout')
+    parser.add_argument(
+        "--compression",
+        choices=[compression.name for compression in CompressionType],
+        default=CompressionType.HEATSHRINK_12_4.name,
+        help="How to compress G-code blocks (to-bgcode only)",
+    )
+    parser.add_argument(
+        "--encoding",
+        choices=[encoding.name for encoding in GCodeEncoding],
+        default=GCodeEncoding.MEATPACK_COMMENTS.name,
+        help="How to encode G-code blocks (to-bgcode only)",
+    )
+    args = parser.parse_args(argv)
+
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        if args.direction == "to-gcode":
+            bgcode_to_gcode(source, output)
+        else:
+            gcode_to_bgcode(
+                source,
+                output,
+                gcode_compression=CompressionType[args.compression],
+                gcode_encoding=GCodeEncoding[args.encoding],
+            )
+        output.flush()
+    except ValueError as e:
+        print(f"Error converting {args.input}: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        if output is not sys.stdout.buffer:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
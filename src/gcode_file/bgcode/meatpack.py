@@ -43,7 +43,12 @@ Related:
 * https://purisa.me/blog/meat-pack-algorithm/
 """
 
-from typing import Optional, Union
+import time
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+from gcode_file.profiling import ParseStats
 
 # Command bytes for controlling the compression state
 _ENABLE_PACKING = 0xFB  # Enable 4-bit packing mode
@@ -79,6 +84,31 @@ _CHAR_TO_CODE = {
 # Reverse lookup table for converting codes back to characters
 _CODE_TO_CHAR = {v: k for k, v in _CHAR_TO_CODE.items()}
 
+# The start of every G-code block: enable packing, and omit spaces.
+_PACKED_BLOCK_START = [0xFF, 0xFF, _ENABLE_PACKING, 0xFF, 0xFF, _ENABLE_NO_SPACE]
+
+# The characters removed before a comment, as bytes.strip() does.
+_WHITESPACE = np.zeros(256, dtype=bool)
+_WHITESPACE[list(b" \t\r\x0b\x0c")] = True
+
+# The character of each code, when spaces are kept and when they're omitted.
+# The signal code has no character.
+_CHARS = np.zeros(16, dtype=np.uint8)
+_CHARS[list(_CODE_TO_CHAR)] = [ord(char) for char in _CODE_TO_CHAR.values()]
+_CHARS[_CHAR_TO_CODE[" "]] = ord(" ")
+_NO_SPACE_CHARS = _CHARS.copy()
+_NO_SPACE_CHARS[_CHAR_TO_CODE["E"]] = ord("E")
+_PAIR_CHARS = np.concatenate((_CHARS, _NO_SPACE_CHARS))
+
+# How many rounds _token_starts() corrects its guess, before pointer jumping.
+_MAX_ROUNDS = 16
+
+# The code of every byte when spaces are omitted, so 0x0B is 'E'.
+_NO_SPACE_CODES = np.full(256, _SIGNAL_CODE, dtype=np.uint8)
+for _char, _code in _CHAR_TO_CODE.items():
+    if _char != " ":
+        _NO_SPACE_CODES[ord(_char)] = _code
+
 
 class _GCodeCharIterator:
     """Iterator for G-code characters that handles filtering based on settings.
@@ -267,25 +297,68 @@ class MeatPacker:
             >>> len(compressed) < len("G1 X100 Y200".encode('ascii'))
             True
         """
+        packed = self.pack(data)
+        return self.start() + packed + self.end()
+
+    def start(self) -> bytes:
+        """Return the command sequences that enable packing on the receiver.
+
+        Together with pack() and end(), this packs a stream incrementally,
+        such as lines sent to a printer one at a time.
+
+        Returns:
+            The command sequences, to send before the packed data.
+        """
+        if self._omit_spaces:
+            return bytes([0xFF, 0xFF, _ENABLE_PACKING, 0xFF, 0xFF, _ENABLE_NO_SPACE])
+        return bytes([0xFF, 0xFF, _ENABLE_PACKING])
+
+    def pack(self, data: Union[str, bytes]) -> bytes:
+        """Pack data, without any command sequences.
+
+        Characters are packed in pairs, so each call should be whole lines.
+        A line with an odd number of characters is followed by an empty line.
+
+        Args:
+            data: Input data as string or bytes.
+
+        Returns:
+            The packed data.
+
+        Raises:
+            TypeError: If the input is neither string nor bytes
+        """
         if not isinstance(data, (str, bytes)):
             raise TypeError(
                 f"Input data must be string or bytes, got {type(data).__name__}"
             )
-
         self._buffer.clear()
+        self._pack_data(data)
+        return bytes(self._buffer)
 
-        # Add enable packing command
-        self._buffer.extend([0xFF, 0xFF, _ENABLE_PACKING])
+    def unpacked(self, data: Union[str, bytes]) -> bytes:
+        """Return data to send as it is, between packed data.
 
-        # Signal if spaces will be omitted
-        if self._omit_spaces:
-            self._buffer.extend([0xFF, 0xFF, _ENABLE_NO_SPACE])
+        Packing is disabled while it's received, so every character is kept,
+        such as the spaces in a string when spaces are omitted.
 
-        self._pack_data(data)
+        Args:
+            data: Input data as string or bytes.
 
-        # Add reset command at the end
-        self._buffer.extend([0xFF, 0xFF, _RESET_ALL])
-        return bytes(self._buffer)
+        Returns:
+            The data, between the command sequences that disable and enable packing.
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        return (
+            bytes([0xFF, 0xFF, _DISABLE_PACKING])
+            + data
+            + bytes([0xFF, 0xFF, _ENABLE_PACKING])
+        )
+
+    def end(self) -> bytes:
+        """Return the command sequence that resets the receiver, after the packed data."""
+        return bytes([0xFF, 0xFF, _RESET_ALL])
 
     def flush(self):
         """Flush the internal buffer."""
@@ -309,11 +382,20 @@ class MeatUnpacker:
         >>> decompressed = decompress(compressed)
     """
 
-    def __init__(self):
-        """Initialize a new MeatUnpacker instance."""
+    def __init__(self, stats: Optional[ParseStats] = None):
+        """Initialize a new MeatUnpacker instance.
+
+        Args:
+            stats: If given, the time spent unpacking, and the bytes unpacked,
+                   are added to its meatpack stage.
+        """
+        self.stats = stats
         self._buffer = bytearray()
         self._packing = False
         self._omit_spaces = False
+        # The end of the previous data, when it stopped part way through a
+        # command sequence or packed byte.
+        self._pending = b""
 
     def _code_to_char(self, code: int) -> str:
         """Convert a 4-bit code to its character."""
@@ -331,6 +413,10 @@ class MeatUnpacker:
         3. Signal codes for unpacked characters
         4. Case-insensitive handling of G, E, and X characters
 
+        The data can be split anywhere, e.g as it's received from a serial
+        port. The end of a piece that can't be unpacked yet is unpacked with
+        the next piece.
+
         Args:
             data: Compressed data as bytes. Must be valid MeatPack compressed
                  data including command sequences.
@@ -346,11 +432,27 @@ class MeatUnpacker:
             >>> print(decompressed.decode('ascii'))
             'G1 X100'
         """
+        if self.stats is None:
+            return self._decompress(data)
+        start = time.perf_counter()
+        result = self._decompress(data)
+        self.stats.meatpack.add(time.perf_counter() - start, bytes=len(data))
+        return result
+
+    def _decompress(self, data: bytes) -> bytes:
         result = bytearray()
         i = 0
+        if self._pending:
+            data = self._pending + data
+            self._pending = b""
 
         while i < len(data):
             # Check for command sequence
+            if data[i] == 0xFF and i + 2 >= len(data):
+                if i + 1 == len(data) or data[i + 1] == 0xFF:
+                    # It continues in the next data.
+                    self._pending = bytes(data[i:])
+                    break
             if i + 2 < len(data) and data[i] == 0xFF and data[i + 1] == 0xFF:
                 cmd = data[i + 2]
                 if cmd == _ENABLE_PACKING:
@@ -379,6 +481,10 @@ class MeatUnpacker:
             # Extract the two 4-bit codes
             code1 = packed & 0x0F
             code2 = (packed >> 4) & 0x0F
+            if i + (code1 == _SIGNAL_CODE) + (code2 == _SIGNAL_CODE) > len(data):
+                # Its unpacked characters are in the next data.
+                self._pending = bytes(data[i - 1 :])
+                break
 
             # Handle first character
             if code1 == _SIGNAL_CODE:
@@ -444,7 +550,7 @@ def compress(
     return packer.compress(data)
 
 
-def decompress(data: bytes) -> bytes:
+def decompress(data: bytes, stats: Optional[ParseStats] = None) -> bytes:
     """Decompress MeatPack compressed data.
 
     This is a convenience function that creates a MeatUnpacker instance and
@@ -454,6 +560,7 @@ def decompress(data: bytes) -> bytes:
     Args:
         data: Compressed data as bytes. Must be valid MeatPack compressed
               data including command sequences.
+        stats: If given, the time spent unpacking is added to it.
 
     Returns:
         Decompressed data as bytes.
@@ -464,5 +571,275 @@ def decompress(data: bytes) -> bytes:
         >>> print(decompressed.decode('ascii'))
         'G1 X100 Y200'
     """
-    unpacker = MeatUnpacker()
+    unpacker = MeatUnpacker(stats)
     return unpacker.decompress(data)
+
+
+def compress_block(data: Union[str, bytes], keep_comments: bool = True) -> bytes:
+    """Compress the G-code of a binary G-code block, as PrusaSlicer does.
+
+    Unlike compress(), this keeps everything except the spaces in G commands
+    (e.g "G1X10Y20"), and before comments, which the firmware doesn't need:
+
+    - Spaces are only removed from lines starting with G, without strings, so
+      'E' can be packed. Other spaces are kept, as unpacked characters.
+    - Comment lines are written with packing disabled, which is smaller than
+      packing them, as most of their characters can't be packed.
+    - Case is kept.
+
+    Each block is compressed separately, and starts by enabling packing.
+
+    Args:
+        data: The G-code, as a string or UTF-8 bytes.
+        keep_comments: If False, comments are removed, as for the MEATPACK
+                       encoding. Defaults to True, for MEATPACK_COMMENTS.
+
+    Returns:
+        Compressed data as bytes.
+
+    Raises:
+        TypeError: If the input is neither string nor bytes
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if not isinstance(data, bytes):
+        raise TypeError(
+            f"Input data must be string or bytes, got {type(data).__name__}"
+        )
+
+    chars = np.frombuffer(data, dtype=np.uint8)
+    if not len(chars):
+        return bytes(_PACKED_BLOCK_START)
+
+    # The line of each character, with each newline on the line it ends.
+    newlines = chars == ord("\n")
+    lines = np.cumsum(newlines) - newlines
+    line_count = int(lines[-1]) + 1
+    line_starts = np.flatnonzero(np.concatenate(([True], newlines[:-1])))
+
+    # Comments run from the first ';' on a line to the end of the line.
+    semicolons = np.cumsum(chars == ord(";"))
+    before_line = semicolons[line_starts] - (chars[line_starts] == ord(";"))
+    comment = (semicolons > before_line[lines]) & ~newlines
+    command = ~comment & ~newlines
+    has_comment = np.bincount(lines[comment], minlength=line_count) > 0
+
+    whitespace = _WHITESPACE[chars]
+    solid = np.flatnonzero(command & ~whitespace)
+    comment_line = has_comment & (np.bincount(lines[solid], minlength=line_count) == 0)
+
+    # The whitespace between a command and its comment is removed.
+    last_solid = np.full(line_count, -1)
+    is_last = np.diff(np.append(lines[solid], -1)) != 0
+    last_solid[lines[solid][is_last]] = solid[is_last]
+    positions = np.arange(len(chars))
+    remove = command & whitespace & has_comment[lines]
+    remove &= positions > last_solid[lines]
+
+    # So are the spaces in G commands, unless they have strings.
+    quoted = np.bincount(lines[command & (chars == ord('"'))], minlength=line_count)
+    g_line = (chars[line_starts] == ord("G")) & (quoted == 0)
+    remove |= command & (chars == ord(" ")) & g_line[lines]
+    remove &= ~comment_line[lines]
+
+    if keep_comments:
+        unpacked = comment | comment_line[lines]
+    else:
+        unpacked = np.zeros(len(chars), dtype=bool)
+        remove |= comment | comment_line[lines]
+
+    kept = ~remove
+    chars = chars[kept]
+    unpacked = unpacked[kept]
+    if len(chars):
+        # Characters are packed in pairs, so the last of an odd number is
+        # written unpacked.
+        starts, lengths = _runs(unpacked)
+        odd = ~unpacked[starts] & (lengths % 2 == 1)
+        unpacked[(starts + lengths - 1)[odd]] = True
+
+    return bytes(_PACKED_BLOCK_START) + _pack(chars, unpacked)
+
+
+def decompress_block(data: bytes, stats: Optional[ParseStats] = None) -> bytes:
+    """Decompress the G-code of a binary G-code block, all at once.
+
+    This gives the same result as decompress(), but unpacks the whole block
+    with NumPy, rather than a byte at a time, so it's many times faster.
+
+    Command sequences (0xFF 0xFF and the command) are found first, as 0xFF
+    can't be an unpacked character. Which bytes start a packed pair, rather
+    than being the unpacked characters that follow one, depends on every
+    pair before it, but only through the two bytes before it, which is
+    resolved for all bytes together in a few rounds.
+
+    Args:
+        data: The compressed G-code, starting with the block's command
+              sequences.
+        stats: If given, the time spent unpacking is added to it.
+
+    Returns:
+        Decompressed data as bytes.
+    """
+    if stats is None:
+        return _unpack_block(data)
+    start = time.perf_counter()
+    result = _unpack_block(data)
+    stats.meatpack.add(time.perf_counter() - start, bytes=len(data))
+    return result
+
+
+def _unpack_block(data: bytes) -> bytes:
+    raw = np.frombuffer(data, dtype=np.uint8)
+    count = len(raw)
+
+    # Command sequences, which can't overlap.
+    is_ff = raw == 0xFF
+    starts = np.flatnonzero(is_ff[:-2] & is_ff[1:-1])
+    starts = starts[(starts == 0) | ~is_ff[starts - 1]]
+    commands = raw[starts + 2]
+
+    def mode(on: int, off: Tuple[int, ...]) -> np.ndarray:
+        """Whether each byte is after a command that turns the mode on, not off."""
+        changes = np.flatnonzero(np.isin(commands, (on, *off)))
+        ends = np.minimum(starts[changes] + 3, count)
+        is_on = np.concatenate(([False], commands[changes] == on))
+        return np.repeat(is_on, np.diff(ends, prepend=0, append=count))
+
+    packing = mode(_ENABLE_PACKING, (_DISABLE_PACKING, _RESET_ALL))
+    omit_spaces = mode(_ENABLE_NO_SPACE, (_DISABLE_NO_SPACE, _RESET_ALL))
+
+    # How many bytes each byte's command, pair or character would take, if it
+    # started one.
+    low = raw & 0x0F
+    high = raw >> 4
+    low_signal = low == _SIGNAL_CODE
+    high_signal = high == _SIGNAL_CODE
+    spans = 1 + (packing & low_signal).view(np.int8)
+    spans += (packing & high_signal).view(np.int8)
+    spans[starts] = 3
+    # A command sequence cut short at the end is left out too.
+    if count and raw[-1] == 0xFF:
+        spans[-1] = 2
+        if count > 1 and raw[-2] == 0xFF:
+            spans[-2] = 3
+
+    tokens = _token_starts(spans)
+    # A pair whose unpacked characters are missing is left out, as decompress() does.
+    tokens = tokens[tokens + spans[tokens] <= count]
+
+    # Commands have no characters, characters one, and pairs two.
+    is_command = np.zeros(count, dtype=bool)
+    is_command[starts] = True
+    is_pair = packing[tokens] & ~is_command[tokens]
+    sizes = (~is_command[tokens]).view(np.int8) + is_pair.view(np.int8)
+    offsets = np.cumsum(sizes, dtype=np.int32)
+    result = np.empty(int(offsets[-1]) if len(offsets) else 0, dtype=np.uint8)
+    offsets -= sizes
+    is_single = sizes == 1
+    result[offsets[is_single]] = raw[tokens[is_single]]
+
+    # Each character of a pair is either a code, or the next unpacked character.
+    pairs = tokens[is_pair]
+    at = offsets[is_pair]
+    # The characters of codes when spaces are omitted are in the second half.
+    half = omit_spaces[pairs].view(np.uint8) << 4
+    following = np.minimum(pairs + 1, count - 1)
+    pair_low_signal = low_signal[pairs]
+    result[at] = np.where(
+        pair_low_signal, raw[following], _PAIR_CHARS[low[pairs] | half]
+    )
+    second = np.minimum(following + pair_low_signal, count - 1)
+    result[at + 1] = np.where(
+        high_signal[pairs], raw[second], _PAIR_CHARS[high[pairs] | half]
+    )
+    return result.tobytes()
+
+
+def _token_starts(spans: np.ndarray) -> np.ndarray:
+    """Returns the bytes reached from the first, by skipping each byte's span.
+
+    Each byte spans at most 3 bytes, so whether a byte is reached depends only
+    on the 2 before it. Assuming every byte is reached, and correcting that
+    until nothing changes, takes as many rounds as the longest run of bytes
+    that would span the next one, which is a few for G-code. Longer runs are
+    found by pointer jumping instead.
+    """
+    count = len(spans)
+    skips_one = spans[:-1] >= 2
+    skips_two = spans[:-2] >= 3
+    reached = np.ones(count, dtype=bool)
+    for _ in range(_MAX_ROUNDS):
+        skipped = np.zeros(count, dtype=bool)
+        skipped[1:] = reached[:-1] & skips_one
+        skipped[2:] |= reached[:-2] & skips_two
+        if np.array_equal(reached, ~skipped):
+            return np.flatnonzero(reached)
+        reached = ~skipped
+
+    # Every 2**k-th byte reached is found by jumping 2**k bytes at a time,
+    # from every 2**(k+1)-th.
+    ends = np.minimum(np.arange(count, dtype=np.int32) + spans, count)
+    jumps = [np.append(ends, count).astype(np.int32)]
+    while (1 << len(jumps)) < count:
+        jumps.append(jumps[-1][jumps[-1]])
+    tokens = [0]
+    while tokens[-1] < count:
+        tokens.append(int(jumps[-1][tokens[-1]]))
+    tokens = np.array(tokens)
+    for jump in reversed(jumps[:-1]):
+        tokens = np.column_stack((tokens, jump[tokens])).ravel()
+    return tokens[tokens < count]
+
+
+def _runs(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns where each run of equal values starts, and its length."""
+    starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    return starts, np.diff(np.append(starts, len(values)))
+
+
+def _pack(chars: np.ndarray, unpacked: np.ndarray) -> bytes:
+    """Packs the characters, with spaces omitted, except those marked unpacked.
+
+    Every run of characters to pack must have an even length.
+    """
+    count = len(chars)
+    if not count:
+        return b""
+    packed = ~unpacked
+    codes = _NO_SPACE_CODES[chars]
+    escaped = packed & (codes == _SIGNAL_CODE)
+    first = packed & ((np.cumsum(packed) - packed) % 2 == 0)
+
+    # Runs of unpacked characters are between commands to disable and enable
+    # packing, except at the end.
+    starts, lengths = _runs(unpacked)
+    starts, lengths = starts[unpacked[starts]], lengths[unpacked[starts]]
+    disable = np.zeros(count, dtype=bool)
+    disable[starts] = True
+    enable = np.zeros(count, dtype=bool)
+    ends = starts + lengths - 1
+    enable[ends[ends < count - 1]] = True
+
+    # Each pair of packed characters is a byte of codes, then any characters
+    # that couldn't be packed. The pair's first character has the byte.
+    sizes = first.astype(np.int64) + escaped + unpacked + 3 * disable + 3 * enable
+    offsets = np.cumsum(sizes) - sizes
+    result = np.empty(int(sizes.sum()), dtype=np.uint8)
+
+    at = offsets[disable]
+    result[at] = result[at + 1] = 0xFF
+    result[at + 2] = _DISABLE_PACKING
+    positions = offsets + 3 * disable
+    result[positions[unpacked]] = chars[unpacked]
+    at = positions[enable] + 1
+    result[at] = result[at + 1] = 0xFF
+    result[at + 2] = _ENABLE_PACKING
+
+    pairs = np.flatnonzero(first)
+    result[offsets[pairs]] = codes[pairs] | (codes[pairs + 1] << 4)
+    escaped_first = pairs[escaped[pairs]]
+    result[offsets[escaped_first] + 1] = chars[escaped_first]
+    escaped_second = pairs[escaped[pairs + 1]] + 1
+    result[offsets[escaped_second]] = chars[escaped_second]
+    return result.tobytes()
@@ -1,14 +1,16 @@
 import io
 import struct
+import time
 from typing import List, BinaryIO, Iterator, Dict, Optional
 from dataclasses import dataclass
 from enum import IntEnum
 import zlib
 from abc import ABC
-from gcode_file.bgcode.meatpack import decompress
+from gcode_file.bgcode.meatpack import decompress_block
 from gcode_file.gcode.basic_parser import BasicGCodeParser
 import heatshrink2
 from gcode_file.gcode.command import GcodeCommand
+from gcode_file.profiling import ParseStats
 
 
 class BlockType(IntEnum):
@@ -136,34 +138,52 @@ class GCodeBlock(Block):
     """Represents a G-code block."""
 
     def __init__(
-        self, header: BlockHeader, parameters: GCodeParameter, raw_data: bytes
+        self,
+        header: BlockHeader,
+        parameters: GCodeParameter,
+        raw_data: bytes,
+        stats: Optional[ParseStats] = None,
     ):
         super().__init__(header)
         self.parameters = parameters
         self.raw_data = raw_data
+        # Where to add the time spent decoding the data, if anywhere.
+        self.stats = stats
 
     def data(self) -> str:
         """Returns the G-code data as a string, decompressing if necessary."""
-
-        if self.parameters.encoding == GCodeEncoding.NONE:
-            return self.raw_data.decode("utf-8")
-
-        if (
-            self.parameters.encoding == GCodeEncoding.MEATPACK
-            or self.parameters.encoding == GCodeEncoding.MEATPACK_COMMENTS
+        stats = self.stats
+        data = self.raw_data
+        if self.parameters.encoding in (
+            GCodeEncoding.MEATPACK,
+            GCodeEncoding.MEATPACK_COMMENTS,
         ):
-            return decompress(self.raw_data).decode("utf-8")
-
-        raise ValueError(f"Unsupported encoding {self.parameters.encoding}")
-
-    def commands(self) -> List[GcodeCommand]:
+            data = decompress_block(data, stats)
+        elif self.parameters.encoding != GCodeEncoding.NONE:
+            raise ValueError(f"Unsupported encoding {self.parameters.encoding}")
+
+        if stats is None:
+            return data.decode("utf-8")
+        start = time.perf_counter()
+        text = data.decode("utf-8")
+        stats.decode.add(time.perf_counter() - start, bytes=len(data))
+        stats.report()
+        return text
+
+    def commands(
+        self, parser: Optional[BasicGCodeParser] = None
+    ) -> Iterator[GcodeCommand]:
         """
-        Parse the G-code data and return a list of GcodeCommand objects.
+        Parse the G-code data and return the GcodeCommand objects.
+
+        Args:
+            parser (BasicGCodeParser, optional): The parser to use. Defaults to BasicGCodeParser().
 
         Returns:
-            List[GcodeCommand]: A list of parsed GcodeCommand objects.
+            Iterator[GcodeCommand]: The parsed GcodeCommand objects.
         """
-        return BasicGCodeParser().parse_stream(self.data())
+        parser = parser or BasicGCodeParser()
+        return parser.parse_stream(io.StringIO(self.data()))
 
     def __str__(self) -> str:
         if self.parameters.encoding == GCodeEncoding.NONE:
@@ -259,12 +279,51 @@ class ThumbnailBlock(Block):
         )
 
 
+# The size of the parameters of each block type, in bytes.
+_PARAMETER_SIZES = {BlockType.THUMBNAIL: 6}
+_DEFAULT_PARAMETER_SIZE = 2
+
+
+@dataclass
+class RawBlock:
+    """
+    A block as it is stored in a file, still compressed and encoded, so it
+    can be copied to another file without decoding it.
+
+    Attributes:
+        header (BlockHeader): The block's header.
+        data (bytes): The block's header, parameters and data, without the checksum.
+    """
+
+    header: BlockHeader
+    data: bytes
+
+    @property
+    def type(self) -> BlockType:
+        return self.header.type
+
+    def parse(self) -> Block:
+        """Decompresses and parses the block."""
+        parent = FileHeader(
+            self.header.parent.magic, self.header.parent.version, ChecksumType.NONE
+        )
+        return BasicBGCodeParser()._parse_block(io.BytesIO(self.data), parent)
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__}({self.header}, size={len(self.data)} bytes)"
+
+
 class BasicBGCodeParser:
-    def __init__(self):
+    def __init__(self, stats: Optional[ParseStats] = None):
         """
         Initialize the BasicBGCodeParser.
+
+        Args:
+            stats (ParseStats, optional): If given, the time spent reading and
+                decompressing blocks is added to it, and to the G-code blocks'
+                stats when they're decoded.
         """
-        pass
+        self.stats = stats
 
     def _parse_metadata_parameters(
         self, file: BinaryIO, header: BlockHeader
@@ -376,6 +435,8 @@ class BasicBGCodeParser:
         Raises:
             ValueError: If the block data is invalid or decompression fails.
         """
+        stats = self.stats
+        start = time.perf_counter() if stats is not None else 0.0
         data = file.read(header.compressed_size)
         if len(data) != header.compressed_size:
             raise ValueError("Invalid block data: too short")
@@ -385,8 +446,20 @@ class BasicBGCodeParser:
             # TODO: Implement CRC32 verification
 
         if header.compression == CompressionType.NONE:
+            if stats is not None:
+                stats.read.add(time.perf_counter() - start, bytes=len(data))
             return data
 
+        if stats is None:
+            return self._decompress(data, header)
+        read = time.perf_counter()
+        stats.read.add(read - start, bytes=len(data))
+        decompressed = self._decompress(data, header)
+        stats.decompress.add(time.perf_counter() - read, bytes=len(data))
+        return decompressed
+
+    def _decompress(self, data: bytes, header: BlockHeader) -> bytes:
+        """Decompresses a block's data."""
         if header.compression == CompressionType.DEFLATE:
             return zlib.decompress(data)
 
@@ -430,6 +503,51 @@ class BasicBGCodeParser:
         except Exception as e:
             raise ValueError(f"Error parsing bgcode: {e}") from e
 
+        if self.stats is not None:
+            self.stats.report()
+
+    def parse_raw_stream(self, stream: BinaryIO) -> Iterator[RawBlock]:
+        """
+        Read the blocks of a bgcode stream, without decompressing or parsing them.
+
+        The checksums are skipped, not verified.
+
+        Args:
+            stream (BinaryIO): A binary stream to read.
+
+        Yields:
+            RawBlock: Each block, as it is stored.
+
+        Raises:
+            ValueError: If the stream contains invalid data.
+        """
+        try:
+            file_header = self._parse_file_header(stream)
+
+            while True:
+                header = self._parse_block_header(stream, file_header)
+                if header is None:
+                    break
+
+                data = struct.pack(
+                    "<HHI", header.type, header.compression, header.uncompressed_size
+                )
+                if header.compression != CompressionType.NONE:
+                    data += struct.pack("<I", header.compressed_size)
+                size = (
+                    _PARAMETER_SIZES.get(header.type, _DEFAULT_PARAMETER_SIZE)
+                    + header.compressed_size
+                )
+                content = stream.read(size)
+                if len(content) != size:
+                    raise ValueError("Invalid block data: too short")
+                if file_header.checksum_type == ChecksumType.CRC32:
+                    stream.read(4)
+                yield RawBlock(header, data + content)
+
+        except Exception as e:
+            raise ValueError(f"Error parsing bgcode: {e}") from e
+
     def _parse_file_header(self, file: BinaryIO) -> FileHeader:
         """
         Parse the file header from a binary file.
@@ -490,7 +608,7 @@ class BasicBGCodeParser:
         if block_header.type == BlockType.GCODE:
             parameters = self._parse_gcode_parameters(stream, block_header)
             data = self._read_block(stream, block_header)
-            return GCodeBlock(block_header, parameters, data)
+            return GCodeBlock(block_header, parameters, data, self.stats)
 
         if block_header.type == BlockType.THUMBNAIL:
             parameters = self._parse_thumbnail_parameters(stream, block_header)
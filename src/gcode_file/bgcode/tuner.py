@@ -0,0 +1,371 @@
+"""Choose the G-code block compression and encoding for a printer.
+
+Smaller blocks upload faster, but the printer has to decode every block while
+printing, and Heatshrink and MeatPack decode at very different speeds on a
+printer's CPU. benchmark_codecs() measures each CompressionType and
+GCodeEncoding combination on a sample of a file's G-code blocks: the size of
+the encoded blocks, and how fast this library decodes them. recommend_codec()
+then picks the best one for an Objective, and the chosen codec can be applied
+to a file with apply_codec().
+
+Decode times are measured on this machine, so are only useful for comparing
+codecs with each other. Objective.TIME scales them by decode_factor, the number
+of times slower the printer decodes than this machine.
+
+This can also be run from the command line, e.g::
+
+    python -m gcode_file.bgcode.tuner input.bgcode --objective time --apply output.bgcode
+"""
+
+import io
+import itertools
+import random
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Sequence
+
+from gcode_file.bgcode.convert import gcode_blocks, gcode_to_bgcode
+from gcode_file.bgcode.parser import (
+    BasicBGCodeParser,
+    CompressionType,
+    GCodeBlock,
+    GCodeEncoding,
+    is_bgcode_file,
+)
+from gcode_file.bgcode.writer import DEFAULT_BLOCK_SIZE, BasicBGCodeWriter
+
+DEFAULT_SAMPLES = 8
+DEFAULT_REPEAT = 3
+# About the speed of uploading to a printer over Wi-Fi, in bytes per second.
+DEFAULT_BANDWIDTH = 500_000
+# How many times slower a printer decodes than a desktop CPU.
+DEFAULT_DECODE_FACTOR = 20.0
+
+
+class Objective(Enum):
+    """What recommend_codec() chooses the best codec for."""
+
+    SIZE = "size"  # The smallest file.
+    DECODE = "decode"  # The fastest to decode.
+    TIME = "time"  # The shortest upload plus decode time.
+
+
+@dataclass
+class CodecBenchmark:
+    """
+    The measurements of a codec on sampled G-code blocks.
+
+    Attributes:
+        compression (CompressionType): How the blocks are compressed.
+        encoding (GCodeEncoding): How the blocks are encoded before compressing.
+        gcode_size (int): The size of the sampled G-code text, in bytes.
+        size (int): The size of the encoded blocks, including block headers, in bytes.
+        decode_seconds (float): The fastest time to decode all the blocks.
+    """
+
+    compression: CompressionType
+    encoding: GCodeEncoding
+    gcode_size: int
+    size: int
+    decode_seconds: float
+
+    @property
+    def ratio(self) -> float:
+        """The G-code size divided by the encoded size."""
+        return self.gcode_size / self.size
+
+    @property
+    def throughput(self) -> float:
+        """The G-code decoded per second, in bytes."""
+        return self.gcode_size / max(self.decode_seconds, 1e-9)
+
+    @property
+    def keeps_comments(self) -> bool:
+        """True unless the encoding removes comments, so the G-code changes."""
+        return self.encoding != GCodeEncoding.MEATPACK
+
+    def __str__(self) -> str:
+        return (
+            f"{self.compression.name:<16} {self.encoding.name:<18} "
+            f"ratio={self.ratio:5.2f} "
+            f"decode={self.throughput / 1e6:7.1f} MB/s"
+        )
+
+
+def read_gcode_blocks(
+    stream: BinaryIO, block_size: int = DEFAULT_BLOCK_SIZE
+) -> Iterator[str]:
+    """
+    Read the G-code of a bgcode or text G-code file, a block at a time.
+
+    The thumbnails and metadata of a text file are skipped, as they're not
+    stored in G-code blocks in a bgcode file.
+
+    Args:
+        stream (BinaryIO): A seekable binary stream of the file.
+        block_size (int, optional): The size of the blocks of a text file.
+
+    Yields:
+        str: The G-code text of each block.
+    """
+    if is_bgcode_file(stream):
+        for block in BasicBGCodeParser().parse_stream(stream):
+            if isinstance(block, GCodeBlock):
+                yield block.data()
+        return
+
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    try:
+        yield from gcode_blocks(text, block_size)
+    finally:
+        # Stop the wrapper from closing the stream when it's garbage collected.
+        text.detach()
+
+
+def sample_blocks(
+    blocks: Iterable[str], count: int = DEFAULT_SAMPLES, seed: int = 0
+) -> List[str]:
+    """
+    Choose blocks at random, keeping only the chosen ones in memory.
+
+    Args:
+        blocks (Iterable[str]): The G-code blocks, e.g from read_gcode_blocks().
+        count (int, optional): The number of blocks to choose.
+        seed (int, optional): The random seed, so the same blocks are chosen each time.
+
+    Returns:
+        List[str]: The chosen blocks, in file order. All of them if there are
+                   no more than count.
+
+    Raises:
+        ValueError: If count is not positive.
+    """
+    if count < 1:
+        raise ValueError(f"count must be positive, not {count}")
+
+    # Reservoir sampling, so the number of blocks doesn't need to be known.
+    rng = random.Random(seed)
+    chosen: List[tuple] = []
+    for index, block in enumerate(blocks):
+        if index < count:
+            chosen.append((index, block))
+            continue
+        replace = rng.randint(0, index)
+        if replace < count:
+            chosen[replace] = (index, block)
+
+    return [block for _, block in sorted(chosen, key=lambda item: item[0])]
+
+
+def benchmark_codecs(
+    blocks: Sequence[str],
+    compressions: Iterable[CompressionType] = tuple(CompressionType),
+    encodings: Iterable[GCodeEncoding] = tuple(GCodeEncoding),
+    repeat: int = DEFAULT_REPEAT,
+) -> List[CodecBenchmark]:
+    """
+    Measure each combination of compression and encoding on G-code blocks.
+
+    Each block is encoded with BasicBGCodeWriter, and decoded with
+    BasicBGCodeParser and GCodeBlock.data(), the same as when reading a file.
+
+    Args:
+        blocks (Sequence[str]): The G-code of each block, e.g from sample_blocks().
+        compressions (Iterable[CompressionType], optional): The compressions to
+            measure. Defaults to all of them.
+        encodings (Iterable[GCodeEncoding], optional): The encodings to measure.
+            Defaults to all of them.
+        repeat (int, optional): How many times to decode, keeping the fastest.
+
+    Returns:
+        List[CodecBenchmark]: The measurements of each combination.
+
+    Raises:
+        ValueError: If there are no blocks, or repeat is not positive.
+    """
+    if not blocks:
+        raise ValueError("There are no G-code blocks to measure")
+    if repeat < 1:
+        raise ValueError(f"repeat must be positive, not {repeat}")
+
+    gcode_size = sum(len(block.encode("utf-8")) for block in blocks)
+    results = []
+    for compression, encoding in itertools.product(compressions, encodings):
+        stream = io.BytesIO()
+        writer = BasicBGCodeWriter(
+            stream,
+            gcode_compression=compression,
+            gcode_encoding=encoding,
+            block_size=max(len(block) for block in blocks) + 1,
+            processes=1,
+        )
+        writer.write_file_header()
+        header_size = stream.tell()
+        for block in blocks:
+            writer.write_gcode(block)
+        data = stream.getvalue()
+
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for block in BasicBGCodeParser().parse_stream(io.BytesIO(data)):
+                block.data()
+            best = min(best, time.perf_counter() - start)
+
+        results.append(
+            CodecBenchmark(
+                CompressionType(compression),
+                GCodeEncoding(encoding),
+                gcode_size,
+                len(data) - header_size,
+                best,
+            )
+        )
+
+    return results
+
+
+def recommend_codec(
+    results: Iterable[CodecBenchmark],
+    objective: Objective = Objective.TIME,
+    keep_comments: bool = True,
+    min_throughput: Optional[float] = None,
+    bandwidth: float = DEFAULT_BANDWIDTH,
+    decode_factor: float = DEFAULT_DECODE_FACTOR,
+) -> CodecBenchmark:
+    """
+    Choose the best codec for an objective.
+
+    Args:
+        results (Iterable[CodecBenchmark]): The measurements, from benchmark_codecs().
+        objective (Objective, optional): What to choose the codec for.
+        keep_comments (bool, optional): Only choose encodings that keep comments.
+        min_throughput (float, optional): Only choose codecs that decode at
+            least this many bytes of G-code per second.
+        bandwidth (float, optional): The upload speed in bytes per second, for
+            Objective.TIME.
+        decode_factor (float, optional): How many times slower the printer
+            decodes than this machine, for Objective.TIME.
+
+    Returns:
+        CodecBenchmark: The best codec. Ties are broken by the smaller size.
+
+    Raises:
+        ValueError: If no codec meets the requirements.
+    """
+    objective = Objective(objective)
+    candidates = [
+        result
+        for result in results
+        if (result.keeps_comments or not keep_comments)
+        and (min_throughput is None or result.throughput >= min_throughput)
+    ]
+    if not candidates:
+        raise ValueError("No codec meets the requirements")
+
+    if objective == Objective.SIZE:
+        return min(candidates, key=lambda result: (result.size, result.decode_seconds))
+    if objective == Objective.DECODE:
+        return min(candidates, key=lambda result: (result.decode_seconds, result.size))
+    return min(
+        candidates,
+        key=lambda result: (
+            result.size / bandwidth + result.decode_seconds * decode_factor,
+            result.size,
+        ),
+    )
+
+
+def apply_codec(source: BinaryIO, output: BinaryIO, codec: CodecBenchmark, **kwargs):
+    """
+    Write a bgcode or text G-code file as bgcode, with the codec's G-code blocks.
+
+    Args:
+        source (BinaryIO): A seekable binary stream of the file.
+        output (BinaryIO): Where to write the bgcode file.
+        codec (CodecBenchmark): The codec, e.g from recommend_codec().
+        **kwargs: Other BasicBGCodeWriter options, such as block_size.
+    """
+    options = dict(
+        gcode_compression=codec.compression, gcode_encoding=codec.encoding, **kwargs
+    )
+    if is_bgcode_file(source):
+        writer = BasicBGCodeWriter(output, **options)
+        writer.write_blocks(BasicBGCodeParser().parse_stream(source))
+    else:
+        gcode_to_bgcode(source, output, **options)
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Measures each codec on a file, and prints them with the recommendation.
+    """
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description="Choose the compression and encoding of G-code blocks"
+    )
+    parser.add_argument("file", help="The bgcode or text G-code file to sample")
+    parser.add_argument(
+        "--objective",
+        choices=[objective.value for objective in Objective],
+        default=Objective.TIME.value,
+        help="What to choose the codec for",
+    )
+    parser.add_argument(
+        "--samples", type=int, default=DEFAULT_SAMPLES, help="Blocks to sample"
+    )
+    parser.add_argument(
+        "--bandwidth",
+        type=float,
+        default=DEFAULT_BANDWIDTH,
+        help="Upload speed in bytes per second",
+    )
+    parser.add_argument(
+        "--decode-factor",
+        type=float,
+        default=DEFAULT_DECODE_FACTOR,
+        help="How many times slower the printer decodes than this machine",
+    )
+    parser.add_argument(
+        "--min-throughput",
+        type=float,
+        help="The slowest decode speed allowed, in bytes per second",
+    )
+    parser.add_argument(
+        "--allow-removing-comments",
+        action="store_true",
+        help="Also consider MEATPACK, which removes comments",
+    )
+    parser.add_argument("--apply", metavar="OUTPUT", help="Write the file as bgcode")
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.file, "rb") as file:
+            blocks = sample_blocks(read_gcode_blocks(file), args.samples)
+        results = benchmark_codecs(blocks)
+        for result in results:
+            print(result)
+
+        best = recommend_codec(
+            results,
+            Objective(args.objective),
+            keep_comments=not args.allow_removing_comments,
+            min_throughput=args.min_throughput,
+            bandwidth=args.bandwidth,
+            decode_factor=args.decode_factor,
+        )
+        print(f"\nRecommended: {best}")
+
+        if args.apply:
+            with open(args.file, "rb") as source, open(args.apply, "wb") as output:
+                apply_codec(source, output, best)
+    except ValueError as e:
+        print(f"Error tuning {args.file}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""Writes Binary G-code (bgcode) files.
+
+This is the inverse of BasicBGCodeParser. A file is a file header, followed by
+blocks in this order: file metadata, printer metadata, thumbnails, print
+metadata, slicer metadata, and then the G-code.
+
+G-code is split into blocks of about block_size bytes, at line ends. Encoding
+and compressing a block is independent of the other blocks, so large files are
+encoded in a process pool, and written in order as they finish.
+"""
+
+import itertools
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import BinaryIO, Deque, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+import heatshrink2
+
+from gcode_file.bgcode.meatpack import compress_block
+from gcode_file.bgcode.parser import (
+    Block,
+    BlockType,
+    ChecksumType,
+    CompressionType,
+    EncodingType,
+    GCodeBlock,
+    GCodeEncoding,
+    MetadataBlock,
+    RawBlock,
+    ThumbnailBlock,
+    ThumbnailParameter,
+)
+
+# PrusaSlicer's G-code blocks are about this size, before encoding.
+DEFAULT_BLOCK_SIZE = 65536
+
+# The compression PrusaSlicer uses for each metadata block.
+DEFAULT_METADATA_COMPRESSION = {
+    BlockType.FILE_METADATA: CompressionType.NONE,
+    BlockType.PRINTER_METADATA: CompressionType.NONE,
+    BlockType.PRINT_METADATA: CompressionType.DEFLATE,
+    BlockType.SLICER_METADATA: CompressionType.DEFLATE,
+}
+
+_METADATA_TYPES = tuple(DEFAULT_METADATA_COMPRESSION)
+
+
+class BasicBGCodeWriter:
+    def __init__(
+        self,
+        stream: BinaryIO,
+        checksum_type: ChecksumType = ChecksumType.CRC32,
+        gcode_compression: CompressionType = CompressionType.HEATSHRINK_12_4,
+        gcode_encoding: GCodeEncoding = GCodeEncoding.MEATPACK_COMMENTS,
+        block_size: int = DEFAULT_BLOCK_SIZE,
+        processes: Optional[int] = None,
+    ):
+        """
+        Initialize the BasicBGCodeWriter. The defaults are the same as PrusaSlicer's.
+
+        Args:
+            stream (BinaryIO): A binary stream to write to.
+            checksum_type (ChecksumType, optional): The checksum of each block.
+            gcode_compression (CompressionType, optional): How G-code blocks are compressed.
+            gcode_encoding (GCodeEncoding, optional): How G-code is encoded before
+                compressing. MEATPACK removes comments, and both MeatPack
+                encodings remove the spaces in G commands.
+            block_size (int, optional): The size of the G-code in each block, in bytes.
+            processes (int, optional): The number of processes to encode G-code
+                blocks in. Defaults to the number of CPUs. With 1, or when
+                there is only one block, no processes are started.
+
+        Raises:
+            ValueError: If the block size or number of processes is not positive.
+        """
+        if block_size < 1:
+            raise ValueError(f"block_size must be positive, not {block_size}")
+        if processes is not None and processes < 1:
+            raise ValueError(f"processes must be positive, not {processes}")
+
+        self.stream = stream
+        self.checksum_type = ChecksumType(checksum_type)
+        self.gcode_compression = CompressionType(gcode_compression)
+        self.gcode_encoding = GCodeEncoding(gcode_encoding)
+        self.block_size = block_size
+        self.processes = processes or os.cpu_count() or 1
+        self._header_written = False
+
+    def write_file_header(self):
+        """
+        Write the file header. It's written by the first block, if not before.
+        """
+        if self._header_written:
+            raise ValueError("The file header has already been written")
+        self.stream.write(b"GCDE" + struct.pack("<IH", 1, self.checksum_type))
+        self._header_written = True
+
+    def write_metadata(
+        self,
+        block_type: BlockType,
+        data: Dict[str, str],
+        compression: Optional[CompressionType] = None,
+    ):
+        """
+        Write a metadata block, encoded as INI.
+
+        Args:
+            block_type (BlockType): The type of metadata, e.g BlockType.PRINTER_METADATA.
+            data (Dict[str, str]): The metadata as key-value pairs.
+            compression (CompressionType, optional): How to compress the block.
+                Defaults to DEFAULT_METADATA_COMPRESSION for the type.
+
+        Raises:
+            ValueError: If the block type is not metadata, or a key or value can't
+                        be written as INI.
+        """
+        block_type = BlockType(block_type)
+        if block_type not in _METADATA_TYPES:
+            raise ValueError(f"Not a metadata block type: {block_type}")
+        if compression is None:
+            compression = DEFAULT_METADATA_COMPRESSION[block_type]
+
+        lines = []
+        for key, value in data.items():
+            key, value = str(key), str(value)
+            if "=" in key or "\n" in key + value or key.strip() != key or not key:
+                raise ValueError(f"Invalid metadata: {key!r}={value!r}")
+            lines.append(f"{key}={value}\n")
+
+        content = "".join(lines).encode("utf-8")
+        self._write_block(
+            block_type,
+            CompressionType(compression),
+            struct.pack("<H", EncodingType.INI),
+            _compress(content, compression),
+            len(content),
+        )
+
+    def write_thumbnail(
+        self,
+        parameters: ThumbnailParameter,
+        data: bytes,
+        compression: CompressionType = CompressionType.NONE,
+    ):
+        """
+        Write a thumbnail block.
+
+        Args:
+            parameters (ThumbnailParameter): The format and size of the image.
+            data (bytes): The image, e.g a PNG file.
+            compression (CompressionType, optional): How to compress the block.
+                Defaults to none, as the images are already compressed.
+        """
+        self._write_block(
+            BlockType.THUMBNAIL,
+            CompressionType(compression),
+            struct.pack("<HHH", parameters.format, parameters.width, parameters.height),
+            _compress(data, compression),
+            len(data),
+        )
+
+    def write_gcode(self, gcode: Union[str, Iterable[str]]):
+        """
+        Write G-code, as blocks of about block_size bytes.
+
+        Args:
+            gcode (Union[str, Iterable[str]]): The G-code, or pieces of it, such as
+                lines with their line ends, e.g from a file opened in text mode.
+        """
+        texts = split_blocks(gcode, self.block_size)
+        parameters = struct.pack("<H", self.gcode_encoding)
+
+        for content, size in _encode_blocks(
+            texts, self.gcode_encoding, self.gcode_compression, self.processes
+        ):
+            self._write_block(
+                BlockType.GCODE, self.gcode_compression, parameters, content, size
+            )
+
+    def write_blocks(self, blocks: Iterable[Block]):
+        """
+        Write blocks, e.g from BasicBGCodeParser.parse_stream().
+
+        Metadata and thumbnail blocks keep their compression. The G-code in
+        consecutive G-code blocks is written again with this writer's block
+        size, encoding and compression.
+
+        Args:
+            blocks (Iterable[Block]): The blocks.
+
+        Raises:
+            ValueError: If a block is of an unsupported type.
+        """
+        for is_gcode, group in itertools.groupby(
+            blocks, lambda block: isinstance(block, GCodeBlock)
+        ):
+            if is_gcode:
+                self.write_gcode(block.data() for block in group)
+                continue
+
+            for block in group:
+                if isinstance(block, MetadataBlock):
+                    self.write_metadata(
+                        block.type, block.data, block.header.compression
+                    )
+                elif isinstance(block, ThumbnailBlock):
+                    self.write_thumbnail(
+                        block.parameters, block.data, block.header.compression
+                    )
+                else:
+                    raise ValueError(f"Unsupported block: {block}")
+
+    def write_raw_block(self, block: RawBlock):
+        """
+        Write a block as it is, without decoding it, e.g from
+        BasicBGCodeParser.parse_raw_stream(). Only its checksum is written
+        again, with this writer's checksum type.
+
+        Args:
+            block (RawBlock): The block.
+        """
+        if not self._header_written:
+            self.write_file_header()
+        self.stream.write(block.data)
+        if self.checksum_type == ChecksumType.CRC32:
+            self.stream.write(struct.pack("<I", zlib.crc32(block.data)))
+
+    def _write_block(
+        self,
+        block_type: BlockType,
+        compression: CompressionType,
+        parameters: bytes,
+        content: bytes,
+        uncompressed_size: int,
+    ):
+        """Write a block, with its header and checksum."""
+        if not self._header_written:
+            self.write_file_header()
+        if uncompressed_size > 0xFFFFFFFF:
+            raise ValueError(f"Block is too large: {uncompressed_size} bytes")
+
+        header = struct.pack("<HHI", block_type, compression, uncompressed_size)
+        if compression != CompressionType.NONE:
+            header += struct.pack("<I", len(content))
+
+        self.stream.write(header)
+        self.stream.write(parameters)
+        self.stream.write(content)
+        if self.checksum_type == ChecksumType.CRC32:
+            checksum = zlib.crc32(content, zlib.crc32(parameters, zlib.crc32(header)))
+            self.stream.write(struct.pack("<I", checksum))
+
+
+def _compress(data: bytes, compression: CompressionType) -> bytes:
+    """Compress a block's data. The inverse of BasicBGCodeParser._read_block()."""
+    if compression == CompressionType.NONE:
+        return data
+
+    if compression == CompressionType.DEFLATE:
+        return zlib.compress(data)
+
+    if compression == CompressionType.HEATSHRINK_11_4:
+        return heatshrink2.compress(data, window_sz2=11, lookahead_sz2=4)
+
+    if compression == CompressionType.HEATSHRINK_12_4:
+        return heatshrink2.compress(data, window_sz2=12, lookahead_sz2=4)
+
+    raise ValueError(f"Unsupported block compression type: {compression}")
+
+
+def _encode_gcode(
+    text: str, encoding: GCodeEncoding, compression: CompressionType
+) -> Tuple[bytes, int]:
+    """Encode and compress the G-code of a block, returning it and its encoded size."""
+    if encoding == GCodeEncoding.NONE:
+        data = text.encode("utf-8")
+    elif encoding == GCodeEncoding.MEATPACK:
+        data = compress_block(text, keep_comments=False)
+    elif encoding == GCodeEncoding.MEATPACK_COMMENTS:
+        data = compress_block(text, keep_comments=True)
+    else:
+        raise ValueError(f"Unsupported encoding {encoding}")
+
+    return _compress(data, compression), len(data)
+
+
+def _encode_blocks(
+    texts: Iterator[str],
+    encoding: GCodeEncoding,
+    compression: CompressionType,
+    processes: int,
+) -> Iterator[Tuple[bytes, int]]:
+    """Encode blocks in order, in a process pool if there is more than one."""
+    first = list(itertools.islice(texts, 2))
+    if processes == 1 or len(first) < 2:
+        for text in itertools.chain(first, texts):
+            yield _encode_gcode(text, encoding, compression)
+        return
+
+    with ProcessPoolExecutor(processes) as executor:
+        # Only a few blocks are queued at a time, so the G-code is never all
+        # in memory at once.
+        pending: Deque[Future] = deque()
+        for text in itertools.chain(first, texts):
+            if len(pending) >= 2 * processes:
+                yield pending.popleft().result()
+            pending.append(executor.submit(_encode_gcode, text, encoding, compression))
+        while pending:
+            yield pending.popleft().result()
+
+
+def split_blocks(gcode: Union[str, Iterable[str]], block_size: int) -> Iterator[str]:
+    """
+    Split G-code into pieces of about block_size, ending at the end of a line,
+    as BasicBGCodeWriter.write_gcode() writes them into G-code blocks.
+
+    Args:
+        gcode (Union[str, Iterable[str]]): The G-code, or pieces of it, such as lines.
+        block_size (int): The size of the pieces, in characters. A line longer
+                          than that is a piece of its own.
+
+    Yields:
+        str: Each piece of G-code.
+    """
+    if isinstance(gcode, str):
+        gcode = (gcode,)
+
+    parts = []
+    size = 0
+    for text in gcode:
+        parts.append(text)
+        size += len(text)
+        if size < block_size:
+            continue
+
+        pending = "".join(parts)
+        start = 0
+        while len(pending) - start >= block_size:
+            end = pending.rfind("\n", start, start + block_size) + 1
+            if end == 0:
+                # A line longer than a block, so it's a block of its own.
+                end = pending.find("\n", start + block_size) + 1
+                if end == 0:
+                    break
+            yield pending[start:end]
+            start = end
+        parts = [pending[start:]]
+        size = len(parts[0])
+
+    if size:
+        yield "".join(parts)
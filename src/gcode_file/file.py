@@ -1,9 +1,15 @@
 import io
 import itertools
 import os
-from typing import BinaryIO, Iterable, List, Union
+from typing import TYPE_CHECKING, BinaryIO, Iterable, Iterator, List, Optional, Union
+from gcode_file.gcode.basic_parser import BasicGCodeParser
 from gcode_file.gcode.command import GcodeCommand
+from gcode_file.gcode.layers import Layer, scan_layers
 from gcode_file.gcode.parser import GCodeParser
+from gcode_file.gcode.slicer_config import (
+    read_print_metadata,
+    read_prusaslicer_config,
+)
 from gcode_file.bgcode.parser import (
     BasicBGCodeParser,
     FileMetadataBlock,
@@ -16,8 +22,63 @@ from gcode_file.bgcode.parser import (
 )
 from gcode_file.types import Thumbnail
 
+if TYPE_CHECKING:
+    from gcode_file.analysis.bounds import BoundsReport
+    from gcode_file.analysis.estimator import PrintTimeEstimate
+    from gcode_file.analysis.fingerprint import Fingerprint
+    from gcode_file.analysis.spatial import SpatialIndex
+    from gcode_file.analysis.toolpath import Toolpath
+
 
 class GcodeFileBase:
+    def __init__(self, file: Union[BinaryIO, str], strict_mode: bool = True):
+        """
+        Initialize a G-code file instance.
+
+        Args:
+            file (BinaryIO | str): file can be a path to a file (a string), a file-like object or a path-like object.
+            strict_mode (bool, optional): If True, invalid G-code commands raise ValueError. If False, validation
+                                          errors are stored in the command's error field. Defaults to True.
+
+        Raises:
+            TypeError: If the provided file is neither a string/path nor a file-like object.
+        """
+
+        if isinstance(file, (str, bytes, os.PathLike)):
+            self.file = open(file, "rb")
+            self.file_owned = True
+        elif hasattr(file, "read"):
+            self.file = file
+            self.file_owned = False
+        else:
+            raise TypeError("filename must be a str or bytes object, or a file")
+
+        self.strict_mode = strict_mode
+
+    def __enter__(self):
+        """
+        Enter the runtime context related to this object.
+
+        Returns:
+            GcodeFileBase: The instance itself.
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        Exit the runtime context related to this object.
+
+        Closes the file if it is owned by this instance.
+
+        Args:
+            exc_type (type): The exception type.
+            exc_value (Exception): The exception value.
+            traceback (Traceback): The traceback object.
+        """
+        if self.file and self.file_owned:
+            self.file.close()
+            self.file = None
+
     @property
     def file_metadata(self) -> dict:
         """Generic metadata, such as producer (software), etc."""
@@ -48,56 +109,126 @@ class GcodeFileBase:
         """G-code commands."""
         raise NotImplementedError("This method should be implemented by subclasses.")
 
+    @property
+    def lines(self) -> Iterable[str]:
+        """The lines of G-code text, without parsing them."""
+        raise NotImplementedError("This method should be implemented by subclasses.")
 
-class BGcodeFile(GcodeFileBase):
-    def __init__(self, file: Union[BinaryIO, str]):
+    @property
+    def layers(self) -> List[Layer]:
+        """The G-code split into layers. Each layer's commands are parsed when it is iterated."""
+        raise NotImplementedError("This method should be implemented by subclasses.")
+
+    def estimate_print_time(self, mode: int = 0) -> "PrintTimeEstimate":
         """
-        Initialize a BGcodeFile instance.
+        Estimates the print time by simulating the printer's motion planner.
+
+        The machine limits are taken from the slicer settings (and overridden by
+        any limits set in the G-code). The slicer's own estimate, from the print
+        metadata, is included in the result for comparison. The G-code is
+        scanned for the commands that affect the estimate without being parsed.
 
         Args:
-            file (BinaryIO | str): file can be a path to a file (a string), a file-like object or a path-like object.
+            mode (int, optional): 0 for the printer's normal mode, 1 for silent mode.
 
-        Raises:
-            TypeError: If the provided file is neither a string/path nor a file-like object.
+        Returns:
+            PrintTimeEstimate: The estimate.
         """
+        from gcode_file.analysis.estimator import estimate_file_print_time
 
-        if isinstance(file, (str, bytes, os.PathLike)):
-            self.file = open(file, "rb")
-            self.file_owned = True
-        elif hasattr(file, "read"):
-            self.file = file
-            self.file_owned = False
-        else:
-            raise TypeError("filename must be a str or bytes object, or a file")
+        return estimate_file_print_time(self, mode)
 
-        # Read the entire file into memory. In future we may want to
-        # implement a streaming/seeking parser.
-        self.parser = BasicBGCodeParser()
-        self.blocks = self.parser.parse_stream(self.file)
+    def toolpath(
+        self, tolerance: Optional[float] = None, layer_step: int = 1
+    ) -> "Toolpath":
+        """
+        Extracts the toolpath geometry, e.g for a preview.
 
-    def __enter__(self):
+        Args:
+            tolerance (float, optional): If set, merge segments that stay within
+                                         this distance (in mm) of a straight line.
+            layer_step (int, optional): Only include every Nth layer. Defaults to 1.
+
+        Returns:
+            Toolpath: The segments of every extrusion and travel move.
         """
-        Enter the runtime context related to this object.
+        from gcode_file.analysis.toolpath import extract_toolpath
+
+        return extract_toolpath(self.commands, tolerance, layer_step)
+
+    def spatial_index(self, cell_size: Optional[float] = None) -> "SpatialIndex":
+        """
+        Builds a spatial index of the toolpath, for finding the segments in a
+        region or nearest to a point. Write it with SpatialIndex.write() to
+        avoid building it again.
+
+        Args:
+            cell_size (float, optional): The size of the grid cells, in mm.
 
         Returns:
-            BGcodeFile: The instance itself.
+            SpatialIndex: The index. Its commands are indexes into self.commands.
         """
-        return self
+        from gcode_file.analysis.spatial import SpatialIndex
 
-    def __exit__(self, exc_type, exc_value, traceback):
+        return SpatialIndex.from_toolpath(self.toolpath(), cell_size)
+
+    def check_bounds(self, travel_margin: float = 0.0) -> "BoundsReport":
         """
-        Exit the runtime context related to this object.
+        Checks that every move is inside the print volume from the slicer settings.
 
-        Closes the file if it is owned by this instance.
+        The G-code is scanned for moves without being parsed into commands.
 
         Args:
-            exc_type (type): The exception type.
-            exc_value (Exception): The exception value.
-            traceback (Traceback): The traceback object.
+            travel_margin (float, optional): How far outside the bed's bounding box
+                                             travel moves may go, in mm. Defaults to 0.
+
+        Returns:
+            BoundsReport: The extents, and the first line with a move outside the volume.
+
+        Raises:
+            ValueError: If the slicer settings don't include the bed shape.
         """
-        if self.file and self.file_owned:
-            self.file.close()
-            self.file = None
+        from gcode_file.analysis.bounds import PrintVolume, check_bounds_lines
+
+        volume = PrintVolume.from_settings(self.slicer_settings)
+        return check_bounds_lines(self.lines, volume, travel_margin)
+
+    def fingerprint(self) -> "Fingerprint":
+        """
+        Fingerprints the toolpath, ignoring comments and formatting.
+
+        The G-code of bgcode files is decoded first, so the fingerprint is the
+        same whatever the compression and encoding, and the same as the text
+        G-code of the file.
+
+        Returns:
+            Fingerprint: The hash of the whole toolpath, and of each layer.
+        """
+        from gcode_file.analysis.fingerprint import fingerprint_commands
+
+        return fingerprint_commands(self.commands)
+
+
+class BGcodeFile(GcodeFileBase):
+    def __init__(self, file: Union[BinaryIO, str], strict_mode: bool = True):
+        """
+        Initialize a BGcodeFile instance.
+
+        Args:
+            file (BinaryIO | str): file can be a path to a file (a string), a file-like object or a path-like object.
+            strict_mode (bool, optional): See GcodeFileBase.
+
+        Raises:
+            TypeError: If the provided file is neither a string/path nor a file-like object.
+        """
+        super().__init__(file, strict_mode=strict_mode)
+
+        # Read the entire file into memory. In future we may want to
+        # implement a streaming/seeking parser.
+        self.parser = BasicBGCodeParser()
+        self.gcode_parser = BasicGCodeParser(strict_mode=strict_mode)
+        self.blocks = list(self.parser.parse_stream(self.file))
+        self._layers = None
 
     @property
     def file_metadata(self) -> dict:
@@ -149,7 +280,7 @@ class BGcodeFile(GcodeFileBase):
                 format=block.parameters.format,
                 width=block.parameters.width,
                 height=block.parameters.height,
-                data=block.image_data,
+                data=block.data,
             )
             for block in self.blocks
             if isinstance(block, ThumbnailBlock)
@@ -161,12 +292,50 @@ class BGcodeFile(GcodeFileBase):
         gcode_blocks = [block for block in self.blocks if isinstance(block, GCodeBlock)]
         # TODO I'm not sure why there are multiple GCodeBlocks
         # in a single file. For now, we merge them.
-        return itertools.chain.from_iterable(block.commands for block in gcode_blocks)
+        return itertools.chain.from_iterable(
+            block.commands(self.gcode_parser) for block in gcode_blocks
+        )
+
+    @property
+    def lines(self) -> Iterator[str]:
+        """The lines of G-code text. The G-code blocks are decoded one at a time."""
+        for block in self.blocks:
+            if isinstance(block, GCodeBlock):
+                yield from io.StringIO(block.data())
+
+    @property
+    def layers(self) -> List[Layer]:
+        """The G-code split into layers. Each layer's commands are parsed when it is iterated.
+
+        The G-code blocks are decompressed and decoded, but not parsed.
+        """
+        if self._layers is None:
+            data = "".join(
+                block.data() for block in self.blocks if isinstance(block, GCodeBlock)
+            ).encode("utf-8")
+            self._layers = scan_layers(data, self.gcode_parser)
+        return self._layers
 
 
 class GcodeFile(GcodeFileBase):
-    def __init__(self, file_path: str):
-        self.parser = GCodeParser()
+    def __init__(self, file: Union[BinaryIO, str], strict_mode: bool = True):
+        """
+        Initialize a GcodeFile instance.
+
+        Args:
+            file (BinaryIO | str): file can be a path to a file (a string), a file-like object or a path-like object.
+                                   File-like objects must be opened in binary mode.
+            strict_mode (bool, optional): See GcodeFileBase.
+
+        Raises:
+            TypeError: If the provided file is neither a string/path nor a file-like object.
+        """
+        super().__init__(file, strict_mode=strict_mode)
+
+        self.parser = GCodeParser(strict_mode=strict_mode)
+        self._slicer_settings = None
+        self._print_metadata = None
+        self._layers = None
 
     @property
     def file_metadata(self) -> dict:
@@ -185,31 +354,74 @@ class GcodeFile(GcodeFileBase):
 
     @property
     def print_metadata(self) -> dict:
-        """Print metadata, such as print time or material consumed, etc.."""
-        raise NotImplementedError("This method should be implemented by subclasses.")
+        """Print metadata, such as print time or material consumed, etc..
+
+        This is read from the comments just before the prusaslicer_config block at
+        the end of the file, without reading or parsing the rest of the file.
+        """
+        if self._print_metadata is None:
+            self._print_metadata = read_print_metadata(self.file)
+        return self._print_metadata
 
     @property
     def slicer_settings(self) -> dict:
-        """Metadata produced and consumed by the software generating the G-code file."""
-        raise NotImplementedError("This method should be implemented by subclasses.")
+        """Metadata produced and consumed by the software generating the G-code file.
+
+        This is read from the prusaslicer_config block at the end of the file,
+        without reading or parsing the rest of the file.
+        """
+        if self._slicer_settings is None:
+            self._slicer_settings = read_prusaslicer_config(self.file)
+        return self._slicer_settings
 
     @property
-    def commands(self) -> List[str]:
+    def commands(self) -> Iterable[GcodeCommand]:
         """G-code commands."""
-        raise NotImplementedError("This method should be implemented by subclasses.")
+        return self._parse_commands()
 
+    def _parse_commands(self) -> Iterator[GcodeCommand]:
+        yield from self.parser.parse_stream(self.lines)
 
-def open_file(file_path: str) -> GcodeFileBase:
+    @property
+    def lines(self) -> Iterator[str]:
+        """The lines of G-code text."""
+        self.file.seek(0)
+        text = io.TextIOWrapper(self.file, encoding="utf-8")
+        try:
+            yield from text
+        finally:
+            # Stop the wrapper from closing our file when it's garbage collected.
+            text.detach()
+
+    @property
+    def layers(self) -> List[Layer]:
+        """The G-code split into layers. Each layer's commands are parsed when it is iterated.
+
+        The file is read into memory and scanned for layer changes, but not parsed.
+        """
+        if self._layers is None:
+            self.file.seek(0)
+            self._layers = scan_layers(self.file.read(), self.parser)
+        return self._layers
+
+
+def open_file(file_path: str, strict_mode: bool = True) -> GcodeFileBase:
     with open(file_path, "rb") as stream:
-        return open_stream(stream)
+        bgcode = is_bgcode_file(stream)
+
+    # Let the file class open (and own) the file, so it stays open after we return.
+    if bgcode:
+        return BGcodeFile(file_path, strict_mode=strict_mode)
+    else:
+        return GcodeFile(file_path, strict_mode=strict_mode)
 
 
-def open_stream(stream: BinaryIO) -> GcodeFileBase:
+def open_stream(stream: BinaryIO, strict_mode: bool = True) -> GcodeFileBase:
     # Wrap in a BufferedReader, so is_bgcode_file can read the first
     # few bytes, and seek back.
     stream = io.BufferedReader(stream)
 
     if is_bgcode_file(stream):
-        return BGcodeFile(stream)
+        return BGcodeFile(stream, strict_mode=strict_mode)
     else:
-        return GcodeFile(stream)
+        return GcodeFile(stream, strict_mode=strict_mode)
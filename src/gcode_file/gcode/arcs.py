@@ -0,0 +1,529 @@
+"""Turn G2/G3 arcs into straight line segments, and straight segments into arcs.
+
+Arcs are handled in bulk, as arrays with one entry per arc, in the XY plane
+(G17). Z and E change linearly along the arc, so helical arcs are supported.
+An arc is given either by its centre, relative to the start (I and J), or by
+its radius (R, negative for the longer of the two possible arcs).
+
+Each arc is split into equal segments, using as few segments as possible
+while keeping the chord error (the largest distance between a segment and
+the arc) within the tolerance.
+
+Going the other way, fit_arcs() finds runs of segments that are within the
+tolerance of an arc, and fit_arc_moves() replaces runs of G1 moves with G2/G3
+moves. Slicers write curves as many short G1 moves, and one arc is fewer
+bytes to send and fewer moves for the printer to plan.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from gcode_file.gcode.command import GcodeCommand
+from gcode_file.gcode.state import (
+    COLUMN_FIELDS,
+    CommandColumns,
+    track_columns,
+)
+
+# The default chord tolerance, in mm. This is finer than printers usually
+# segment arcs, so the segments follow the arc closely.
+DEFAULT_TOLERANCE = 0.01
+
+ARC_COMMANDS = ("G2", "G3")
+
+# The fewest segments replaced by an arc. Two segments always fit a circle
+# through their three points, so they aren't evidence of a curve.
+DEFAULT_MIN_SEGMENTS = 3
+# Larger arcs are nearly straight, and some firmware handles them badly.
+DEFAULT_MAX_RADIUS = 1000.0
+# How much the Z and E per mm can differ between segments of one arc, as a
+# fraction. An arc moves Z and E evenly along its length.
+RATE_TOLERANCE = 0.05
+# The smallest turn between segments, as the sine of its angle. Straighter
+# segments are left as they are.
+_MIN_TURN = 1e-9
+# The fields a G1 can have to be part of an arc.
+_FIT_FIELDS = frozenset("XYEF")
+
+
+@dataclass
+class Arcs:
+    """
+    A batch of arcs in the XY plane.
+
+    Attributes:
+        start (np.ndarray): The X, Y, Z and E position at the start of each arc.
+        end (np.ndarray): The position at the end of each arc.
+        centre (np.ndarray): The X and Y of the centre of each arc.
+        radius (np.ndarray): The radius of each arc.
+        start_angle (np.ndarray): The angle of the start point from the centre, in radians.
+        sweep (np.ndarray): The signed angle swept, in radians. Negative for
+                            clockwise (G2) arcs. Arcs with an impossible radius
+                            have a sweep of 0, and are treated as straight lines.
+    """
+
+    start: np.ndarray
+    end: np.ndarray
+    centre: np.ndarray
+    radius: np.ndarray
+    start_angle: np.ndarray
+    sweep: np.ndarray
+
+    @staticmethod
+    def from_fields(
+        start: np.ndarray,
+        end: np.ndarray,
+        i: np.ndarray,
+        j: np.ndarray,
+        r: np.ndarray,
+        clockwise: np.ndarray,
+    ) -> "Arcs":
+        """
+        Creates arcs from the fields of G2/G3 commands.
+
+        Args:
+            start (np.ndarray): The X, Y, Z and E position at the start of each arc.
+            end (np.ndarray): The position at the end of each arc.
+            i (np.ndarray): The I of each arc, NaN if missing.
+            j (np.ndarray): The J of each arc, NaN if missing.
+            r (np.ndarray): The R of each arc, NaN if the arc uses I and J.
+            clockwise (np.ndarray): True for G2 arcs, False for G3.
+
+        Returns:
+            Arcs: The arcs.
+        """
+        start = np.asarray(start, dtype=np.float64)
+        end = np.asarray(end, dtype=np.float64)
+        r = np.asarray(r, dtype=np.float64)
+        direction = np.where(clockwise, -1.0, 1.0)
+
+        start_x, start_y = start[:, 0], start[:, 1]
+        dx, dy = end[:, 0] - start_x, end[:, 1] - start_y
+        chord = np.hypot(dx, dy)
+
+        # The R form. The centre is on the perpendicular bisector of the chord,
+        # to the right of the chord for a short clockwise arc.
+        has_radius = ~np.isnan(r)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            half_chord = chord / 2
+            offset = np.sqrt(np.maximum(r * r - half_chord * half_chord, 0.0))
+            offset *= -direction * np.sign(r) / chord
+            r_sweep = 2 * np.arcsin(np.minimum(half_chord / np.abs(r), 1.0))
+        # A negative R means the longer of the two possible arcs.
+        r_sweep = np.where(r < 0, 2 * np.pi - r_sweep, r_sweep)
+        # Arcs that can't be drawn with the radius are treated as straight lines.
+        r_sweep[has_radius & ((chord == 0) | (half_chord > np.abs(r)))] = 0.0
+
+        centre_x = np.where(
+            has_radius, start_x + dx / 2 + offset * dy, start_x + np.nan_to_num(i)
+        )
+        centre_y = np.where(
+            has_radius, start_y + dy / 2 - offset * dx, start_y + np.nan_to_num(j)
+        )
+        centre_x = np.nan_to_num(centre_x)
+        centre_y = np.nan_to_num(centre_y)
+        radius = np.where(
+            has_radius, np.abs(r), np.hypot(start_x - centre_x, start_y - centre_y)
+        )
+
+        start_angle = np.arctan2(start_y - centre_y, start_x - centre_x)
+        end_angle = np.arctan2(end[:, 1] - centre_y, end[:, 0] - centre_x)
+        sweep = ((end_angle - start_angle) * direction) % (2 * np.pi)
+        # Start and end are the same point, so this is a full circle.
+        sweep[sweep == 0] = 2 * np.pi
+
+        sweep = np.where(has_radius, r_sweep, sweep) * direction
+        centre = np.stack((centre_x, centre_y), axis=1)
+
+        return Arcs(start, end, centre, radius, start_angle, sweep)
+
+    @staticmethod
+    def from_columns(
+        columns: CommandColumns, start: np.ndarray, end: np.ndarray
+    ) -> "Arcs":
+        """
+        Creates arcs from rows of CommandColumns.
+
+        Args:
+            columns (CommandColumns): The G2/G3 commands.
+            start (np.ndarray): The position before each command, e.g from track_columns().
+            end (np.ndarray): The position after each command.
+
+        Returns:
+            Arcs: The arcs.
+        """
+        values = columns.values
+        return Arcs.from_fields(
+            start,
+            end,
+            values[:, COLUMN_FIELDS.index("I")],
+            values[:, COLUMN_FIELDS.index("J")],
+            values[:, COLUMN_FIELDS.index("R")],
+            columns.codes == "G2",
+        )
+
+    def __len__(self) -> int:
+        return len(self.sweep)
+
+    @property
+    def straight(self) -> np.ndarray:
+        """True for arcs that are treated as straight lines."""
+        return self.sweep == 0
+
+    def lengths(self) -> np.ndarray:
+        """Returns the length of the path of each arc, including any change in Z."""
+        chord = np.hypot(*(self.end[:, :2] - self.start[:, :2]).T)
+        xy_length = np.where(self.straight, chord, self.radius * np.abs(self.sweep))
+        return np.hypot(xy_length, self.end[:, 2] - self.start[:, 2])
+
+    def segment_counts(self, tolerance: float = DEFAULT_TOLERANCE) -> np.ndarray:
+        """
+        Returns how many line segments each arc needs to stay within the tolerance.
+
+        Args:
+            tolerance (float, optional): The largest allowed distance between a
+                                         segment and the arc, in mm.
+
+        Raises:
+            ValueError: If the tolerance is not positive.
+        """
+        if tolerance <= 0:
+            raise ValueError(f"tolerance must be positive, not {tolerance}")
+
+        # A chord spanning an angle a is r * (1 - cos(a / 2)) from the arc.
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cosine = np.clip(1 - tolerance / self.radius, -1.0, 1.0)
+            max_angle = 2 * np.arccos(cosine)
+            counts = np.ceil(np.abs(self.sweep) / max_angle)
+        counts = np.nan_to_num(counts, nan=1.0, posinf=1.0)
+        return np.maximum(counts, 1).astype(np.int64)
+
+    def linearize(
+        self, tolerance: float = DEFAULT_TOLERANCE
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Splits the arcs into line segments.
+
+        Args:
+            tolerance (float, optional): The largest allowed distance between a
+                                         segment and the arc, in mm.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The X, Y, Z and E of the end of every
+                segment, for all the arcs in order, and the number of segments of
+                each arc. Each arc's first segment starts at the arc's start, and
+                its last segment ends exactly at the arc's end.
+        """
+        counts = self.segment_counts(tolerance)
+        arc = np.repeat(np.arange(len(counts)), counts)
+        first = np.cumsum(counts) - counts
+        fraction = (np.arange(len(arc)) - first[arc] + 1) / counts[arc]
+
+        angle = self.start_angle[arc] + self.sweep[arc] * fraction
+        points = self.start[arc] + (self.end[arc] - self.start[arc]) * fraction[:, None]
+        curved = ~self.straight[arc]
+        points[curved, 0] = (self.centre[arc, 0] + self.radius[arc] * np.cos(angle))[
+            curved
+        ]
+        points[curved, 1] = (self.centre[arc, 1] + self.radius[arc] * np.sin(angle))[
+            curved
+        ]
+
+        # Avoid rounding errors at the end of each arc.
+        last = first + counts - 1
+        points[last] = self.end
+
+        return points, counts
+
+
+def linearize_moves(
+    columns: CommandColumns,
+    positions: np.ndarray,
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Replaces the position after each arc with the points along the arc.
+
+    This lets code that handles straight moves also handle arcs: each arc
+    becomes several rows, one for the end of each of its segments.
+
+    Args:
+        columns (CommandColumns): The commands.
+        positions (np.ndarray): The position after each command, from track_columns().
+        tolerance (float, optional): The chord tolerance, in mm.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The positions, with extra rows for arcs,
+            and the index of the command each row came from.
+    """
+    is_arc = np.isin(columns.codes, ARC_COMMANDS)
+    rows = np.arange(len(positions))
+    if not is_arc.any():
+        return positions, rows
+
+    starts = np.vstack((np.zeros((1, positions.shape[1])), positions))[:-1]
+    arc_columns = CommandColumns(columns.codes[is_arc], columns.values[is_arc])
+    arcs = Arcs.from_columns(arc_columns, starts[is_arc], positions[is_arc])
+    points, counts = arcs.linearize(tolerance)
+
+    repeats = np.ones(len(positions), dtype=np.int64)
+    repeats[is_arc] = counts
+    rows = np.repeat(rows, repeats)
+
+    expanded = positions[rows]
+    expanded[np.repeat(is_arc, repeats)] = points
+    return expanded, rows
+
+
+def fit_arcs(
+    points: np.ndarray,
+    joinable: Optional[np.ndarray] = None,
+    tolerance: float = DEFAULT_TOLERANCE,
+    min_segments: int = DEFAULT_MIN_SEGMENTS,
+    max_radius: float = DEFAULT_MAX_RADIUS,
+) -> Tuple[np.ndarray, np.ndarray, Arcs]:
+    """
+    Finds arcs that can replace runs of segments along a path.
+
+    The turn between each pair of segments, and their Z and E per mm, are
+    worked out for the whole path at once, to find the runs of segments that
+    curve the same way. Each run is then checked against the circle through
+    its first, middle and last points, and split at the point furthest from
+    the circle until the pieces fit.
+
+    Args:
+        points (np.ndarray): The X, Y, Z and E of each point along the path,
+            so segment k goes from points[k] to points[k + 1].
+        joinable (np.ndarray, optional): Whether each segment can be in the
+            same arc as the next. Defaults to all of them.
+        tolerance (float, optional): The largest allowed distance between the
+            segments and the arc, in mm.
+        min_segments (int, optional): The fewest segments an arc can replace.
+        max_radius (float, optional): The largest radius of an arc, in mm.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, Arcs]: The index of the first and last
+            point of each arc, in order along the path, and the arcs. Each arc
+            starts and ends exactly at its first and last points.
+
+    Raises:
+        ValueError: If the tolerance is not positive, or min_segments is less than 2.
+    """
+    if tolerance <= 0:
+        raise ValueError(f"tolerance must be positive, not {tolerance}")
+    if min_segments < 2:
+        raise ValueError(f"min_segments must be at least 2, not {min_segments}")
+
+    points = np.asarray(points, dtype=np.float64)
+    steps = np.diff(points, axis=0)
+    lengths = np.hypot(steps[:, 0], steps[:, 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = steps[:, 2:] / lengths[:, None]
+        cross = steps[:-1, 0] * steps[1:, 1] - steps[:-1, 1] * steps[1:, 0]
+        sine = cross / (lengths[:-1] * lengths[1:])
+        same_rate = np.all(
+            np.abs(rates[:-1] - rates[1:])
+            <= RATE_TOLERANCE * np.maximum(np.abs(rates[:-1]), np.abs(rates[1:]))
+            + 1e-12,
+            axis=1,
+        )
+
+    # The direction each pair of segments turns, or 0 if they can't be joined.
+    turn = np.where(np.abs(sine) > _MIN_TURN, np.sign(sine), 0.0)
+    turn[~same_rate | (lengths[:-1] == 0) | (lengths[1:] == 0)] = 0.0
+    if joinable is not None:
+        turn[~np.asarray(joinable, dtype=bool)[: len(turn)]] = 0.0
+
+    # Runs of pairs turning the same way, as [first, last) pair indices.
+    changes = np.flatnonzero(np.diff(turn) != 0) + 1
+    run_starts = np.concatenate(([0], changes)).astype(np.int64)[: len(turn)]
+    run_ends = np.append(run_starts[1:], len(turn))
+    keep = turn[run_starts] != 0
+
+    first: List[int] = []
+    last: List[int] = []
+    centres: List[np.ndarray] = []
+    # Runs turning opposite ways share a segment, which goes to the first run.
+    next_point = 0
+    for start, end in zip(run_starts[keep], run_ends[keep]):
+        # Pairs start to end - 1 join segments start to end, so points start to end + 1.
+        pending = [(max(int(start), next_point), int(end) + 1)]
+        next_point = int(end) + 1
+        while pending:
+            a, b = pending.pop()
+            if b - a < min_segments:
+                continue
+            centre, worst = _fit_circle(points[a : b + 1, :2], tolerance, max_radius)
+            if centre is not None:
+                first.append(a)
+                last.append(b)
+                centres.append(centre)
+            else:
+                # Later pieces are popped last, so the arcs stay in order.
+                pending.append((a + worst, b))
+                pending.append((a, a + worst))
+
+    first_array = np.array(first, dtype=np.int64)
+    last_array = np.array(last, dtype=np.int64)
+    order = np.argsort(first_array, kind="stable")
+    first_array, last_array = first_array[order], last_array[order]
+    centre = np.array(centres, dtype=np.float64).reshape(-1, 2)[order]
+
+    start = points[first_array]
+    end = points[last_array]
+    clockwise = turn[first_array] < 0
+    arcs = Arcs.from_fields(
+        start,
+        end,
+        centre[:, 0] - start[:, 0],
+        centre[:, 1] - start[:, 1],
+        np.full(len(first_array), np.nan),
+        clockwise,
+    )
+    return first_array, last_array, arcs
+
+
+def _fit_circle(
+    points: np.ndarray, tolerance: float, max_radius: float
+) -> Tuple[Optional[np.ndarray], int]:
+    """
+    Fits a circle through the first, middle and last of the XY points.
+
+    Returns the centre, or None and the index of the point to split at if
+    the points or the segments between them are too far from the circle.
+    """
+    middle = len(points) // 2
+    origin = points[0]
+    b = points[middle] - origin
+    c = points[-1] - origin
+    d = 2 * (b[0] * c[1] - b[1] * c[0])
+    if d == 0:
+        return None, middle
+    b2 = b @ b
+    c2 = c @ c
+    centre = origin + np.array(
+        [(c[1] * b2 - b[1] * c2) / d, (b[0] * c2 - c[0] * b2) / d]
+    )
+    radius = np.hypot(*(origin - centre))
+    if radius > max_radius:
+        return None, middle
+
+    error = np.abs(np.hypot(*(points - centre).T) - radius)
+    midpoints = (points[:-1] + points[1:]) / 2
+    midpoint_error = np.abs(np.hypot(*(midpoints - centre).T) - radius)
+
+    # The points must go round the circle one way, less than a full turn.
+    angles = np.arctan2(points[:, 1] - centre[1], points[:, 0] - centre[0])
+    steps = (np.diff(angles) + np.pi) % (2 * np.pi) - np.pi
+    one_way = np.all(steps > 0) or np.all(steps < 0)
+    if (
+        one_way
+        and abs(steps.sum()) < 2 * np.pi
+        and error.max() <= tolerance
+        and midpoint_error.max() <= tolerance
+    ):
+        return centre, 0
+
+    # Split at the interior point furthest from the circle, counting the
+    # segments either side of it.
+    interior = np.maximum(
+        error[1:-1], np.maximum(midpoint_error[:-1], midpoint_error[1:])
+    )
+    worst = int(np.argmax(interior)) + 1 if one_way else middle
+    return None, worst
+
+
+def fit_arc_moves(
+    commands: Iterable[Any],
+    tolerance: float = DEFAULT_TOLERANCE,
+    min_segments: int = DEFAULT_MIN_SEGMENTS,
+    max_radius: float = DEFAULT_MAX_RADIUS,
+) -> List[Any]:
+    """
+    Replaces runs of G1 moves that follow an arc with G2/G3 moves.
+
+    Only consecutive G1 moves in the XY plane, with nothing but X, Y, E and F
+    fields, no comment and the same feedrate, are joined. Each arc extrudes
+    as much as the moves it replaces, and ends exactly where they did, with
+    its centre given by I and J.
+
+    Args:
+        commands (Iterable[Any]): The commands, e.g from GCodeParser.parse_stream().
+            Anything that isn't a GcodeCommand is kept, and breaks up arcs.
+        tolerance (float, optional): The largest allowed distance between the
+            moves and the arc, in mm.
+        min_segments (int, optional): The fewest moves an arc can replace.
+        max_radius (float, optional): The largest radius of an arc, in mm.
+
+    Returns:
+        List[Any]: The commands, with arcs in place of the moves they replace.
+
+    Raises:
+        ValueError: If the tolerance is not positive, or min_segments is less than 2.
+    """
+    commands = list(commands)
+    # The position of each GcodeCommand in commands.
+    indices = [
+        index
+        for index, command in enumerate(commands)
+        if isinstance(command, GcodeCommand)
+    ]
+    columns = CommandColumns.from_commands(commands[index] for index in indices)
+    state = track_columns(columns)
+
+    fittable = np.array([_fittable(commands[index]) for index in indices], dtype=bool)
+    # Rows that aren't consecutive in commands have something else between them.
+    consecutive = np.diff(np.array(indices, dtype=np.int64)) == 1
+    joinable = (
+        fittable[:-1]
+        & fittable[1:]
+        & consecutive
+        & (state.feedrate[:-1] == state.feedrate[1:])
+    )
+
+    points = np.vstack((np.zeros((1, state.positions.shape[1])), state.positions))
+    first, last, arcs = fit_arcs(points, joinable, tolerance, min_segments, max_radius)
+    if not len(first):
+        return commands
+
+    result: List[Any] = []
+    done = 0
+    for arc, (a, b) in enumerate(zip(first.tolist(), last.tolist())):
+        # Point a is the start of row a, so the arc replaces rows a to b - 1.
+        start, end = indices[a], indices[b - 1]
+        result.extend(commands[done:start])
+        done = end + 1
+
+        fields = {}
+        if state.absolute[a]:
+            fields["X"], fields["Y"] = float(points[b, 0]), float(points[b, 1])
+        else:
+            fields["X"] = float(points[b, 0] - points[a, 0])
+            fields["Y"] = float(points[b, 1] - points[a, 1])
+        fields["I"] = float(arcs.centre[arc, 0] - points[a, 0])
+        fields["J"] = float(arcs.centre[arc, 1] - points[a, 1])
+        if points[b, 3] != points[a, 3]:
+            fields["E"] = float(
+                points[b, 3] if state.absolute_e[a] else points[b, 3] - points[a, 3]
+            )
+        feedrate = commands[start].fields.get("F")
+        if feedrate is not None:
+            fields["F"] = feedrate
+        code = "G2" if arcs.sweep[arc] < 0 else "G3"
+        result.append(GcodeCommand(code, fields))
+    result.extend(commands[done:])
+    return result
+
+
+def _fittable(command: GcodeCommand) -> bool:
+    """Whether the command is a G1 in the XY plane that can be part of an arc."""
+    fields = command.fields
+    return (
+        command.command == "G1"
+        and command.comment is None
+        and ("X" in fields or "Y" in fields)
+        and _FIT_FIELDS.issuperset(fields)
+        and all(type(value) in (int, float) for value in fields.values())
+    )
@@ -1,12 +1,35 @@
 import re
-from typing import Iterator, Optional, TextIO
+import time
+from typing import Iterator, Optional, TextIO, Tuple
 
+from gcode_file.gcode.checksum import checksum
 from gcode_file.gcode.command import GcodeCommand
+from gcode_file.gcode.errors import Error, ErrorCode, ParseErrors, format_error
 from gcode_file.gcode.validator_rules import default_validator
+from gcode_file.profiling import ParseStats
+
+# A command, e.g G1, M104, M569.2
+_COMMAND = re.compile(r"([A-Za-z])(\d+(?:\.\d+)?)")
+# A field, e.g X10, E-.5, P"MK4", P "MK4", or flags without values: a letter, or
+# axis letters, e.g the X of "G28 X" or the XY of "G28 XY".
+_FIELD = re.compile(
+    r'(?<![A-Za-z])(?:([A-Z])([-+]?[0-9]*\.?[0-9]+|\s*"[^"]*")'
+    r'|([XYZEABCUVW]+|[A-Z])(?![A-Za-z0-9.+\-"]))'
+)
+
+# A line as a host sends it, e.g "N123 G1 X10*81". The checksum is of
+# everything before the "*".
+_NUMBERED_LINE = re.compile(r"(?:N(\d+)\s*)?(.*?)(?:\s*\*(\d+))?", re.DOTALL)
 
 
 class BasicGCodeParser:
-    def __init__(self, validator=None, strict_mode: bool = True):
+    def __init__(
+        self,
+        validator=None,
+        strict_mode: bool = True,
+        strip_line_numbers: bool = True,
+        stats: Optional[ParseStats] = None,
+    ):
         """
         Initialize the BasicGCodeParser with a validator. If no validator is provided, use the default_validator.
 
@@ -14,14 +37,24 @@ class BasicGCodeParser:
             validator (callable, optional): A validator function to validate G-code commands. Defaults to default_validator.
             strict_mode (bool, optional): If True, validation errors will raise ValueError. If False, validation errors
                                         will be stored in the command's error field. Defaults to True.
+            strip_line_numbers (bool, optional): If True, the "N" line numbers of lines such as "N123 G1 X10*81" are
+                                        removed after their checksums are verified. If False, they're kept in the
+                                        command's line_number field. Defaults to True.
+            stats (ParseStats, optional): If given, the time spent reading, tokenizing and
+                                        validating lines is added to it. Defaults to None.
         """
         self.validator = validator or default_validator
         self.strict_mode = strict_mode
+        self.strip_line_numbers = strip_line_numbers
+        self.stats = stats
 
     def parse_line(self, line: str) -> Optional[GcodeCommand]:
         """
         Parse a single line of G-code and optionally validate it.
 
+        Lines may have a line number and checksum, as a host sends them to a
+        printer, e.g "N123 G1 X10*81". The checksum is verified.
+
         Args:
             line (str): A single line of G-code to parse.
             validate (bool): Whether to validate the parsed command.
@@ -31,11 +64,37 @@ class BasicGCodeParser:
                                      or None if the line is empty or a comment.
 
         Raises:
-            ValueError: If the line contains an invalid command or unknown fields.
+            ValueError: If the line contains an invalid command or unknown fields,
+                        or its checksum is wrong.
+        """
+        if self.stats is None:
+            command, error = self._parse(line)
+        else:
+            command, error = self._parse_profiled(line)
+        if error is None:
+            return command
+
+        code, args = error
+        cause = args[0] if code == ErrorCode.RULE else None
+        if command is None:
+            # The line can't be parsed.
+            raise ValueError(format_error(code, args)) from cause
+        if self.strict_mode:
+            raise ValueError(f"'{command}': {format_error(code, args)}") from cause
+        command.error = format_error(code, args)
+        return command
+
+    def _parse(self, line: str) -> Tuple[Optional[GcodeCommand], Optional[Error]]:
+        """
+        Parse a single line of G-code, returning any error rather than raising it.
+
+        Returns:
+            Tuple[Optional[GcodeCommand], Optional[Error]]: The command, or None
+                if the line is empty or can't be parsed, and the error if any.
         """
         line = line.strip()
         if not line:
-            return None
+            return None, None
 
         # Split the line into command and comment parts
         # TODO There is a bug here, due to Strings may contain ;
@@ -43,13 +102,31 @@ class BasicGCodeParser:
         command_part = parts[0].strip()
         comment = parts[1].strip() if len(parts) > 1 else None
 
+        line_number = None
+        error = None
+        # The line is kept as it was, unless it's numbered, as the number is
+        # replaced whenever it's sent or written again.
+        text: Optional[str] = line
+        if command_part[:1] == "N" or "*" in command_part:
+            command_part, line_number, error = _split_line_number(command_part)
+            text = None
+            if self.strip_line_numbers:
+                line_number = None
+
         if not command_part:
-            return GcodeCommand(command="", fields={}, comment=comment)
+            command = GcodeCommand(
+                command="",
+                fields={},
+                comment=comment,
+                line_number=line_number,
+                text=text,
+            )
+            return command, error
 
         # Match the command (e.g., G1, M104, M569.2)
-        match = re.match(r"([A-Za-z])(\d+(?:\.\d+)?)", command_part)
+        match = _COMMAND.match(command_part)
         if not match:
-            raise ValueError(f"Invalid G-code command: {command_part}")
+            return None, (ErrorCode.INVALID_COMMAND, (command_part,))
 
         command_type, command_number = match.groups()
         command_type = command_type.upper()
@@ -58,48 +135,105 @@ class BasicGCodeParser:
 
         # Extract fields starting after the command
         fields = {}
-        for field, value in re.findall(
-            r'(?<![A-Za-z])([A-Z])([-+]?[0-9]*\.?[0-9]+|"[^"]*")', fields_part
-        ):
+        for field, value, flags in _FIELD.findall(fields_part):
+            if flags:
+                # Fields without values are flags.
+                for flag in flags:
+                    if flag in fields:
+                        return None, (ErrorCode.DUPLICATE_FIELD, (flag,))
+                    fields[flag] = True
+                continue
             if field in fields:
-                raise ValueError(f"Duplicate field '{field}'")
-            if value == "":
-                # If the field is present but has no value, treat it as a flag
-                fields[field] = True
-            elif value.startswith('"') and value.endswith('"'):
-                # Handle string values
-                fields[field] = value[1:-1]  # Remove quotes
+                return None, (ErrorCode.DUPLICATE_FIELD, (field,))
+            if value.endswith('"'):
+                # Handle string values, e.g P"MK4" or P "MK4"
+                fields[field] = value.lstrip()[1:-1]  # Remove quotes
             elif "." in value:
                 fields[field] = float(value)
             else:
                 fields[field] = int(value)
 
         command = GcodeCommand(
-            command=f"{command_type}{command_number}", fields=fields, comment=comment
+            command=f"{command_type}{command_number}",
+            fields=fields,
+            comment=comment,
+            line_number=line_number,
+            text=text,
         )
+        # A corrupted line's command can't be trusted, so that error wins.
+        if error is None:
+            error = self._check(command)
+        return command, error
+
+    def _parse_profiled(
+        self, line: str
+    ) -> Tuple[Optional[GcodeCommand], Optional[Error]]:
+        """Parses a line, adding the time spent to the tokenize stage."""
+        stats = self.stats
+        validated = stats.validate.seconds
+        start = time.perf_counter()
+        result = self._parse(line)
+        elapsed = time.perf_counter() - start
+        # Validating is a stage of its own.
+        elapsed -= stats.validate.seconds - validated
+        stats.tokenize.add(elapsed, bytes=len(line), lines=1)
+        return result
+
+    def _check(self, command: GcodeCommand) -> Optional[Error]:
+        """Validates a command, returning the error rather than raising it."""
+        stats = self.stats
+        # A validator given the same stats adds its own time.
+        if stats is None or getattr(self.validator, "stats", None) is stats:
+            return self._check_command(command)
+        start = time.perf_counter()
+        error = self._check_command(command)
+        stats.validate.add(time.perf_counter() - start, lines=1)
+        return error
+
+    def _check_command(self, command: GcodeCommand) -> Optional[Error]:
+        check = getattr(self.validator, "check", None)
+        if check is not None:
+            return check(command)
         try:
             self.validator.validate(command)
-        # Catch all error, and re-raise it with the command for better debugging
         except Exception as e:
-            if self.strict_mode:
-                raise ValueError(f"'{command}': {e}") from e
-            command.error = str(e)
-
-        return command
+            return ErrorCode.RULE, (e,)
+        return None
 
-    def parse_stream(self, stream: TextIO) -> Iterator[GcodeCommand]:
+    def parse_stream(
+        self, stream: TextIO, errors: Optional[ParseErrors] = None
+    ) -> Iterator[GcodeCommand]:
         """
         Parse a stream of G-code line by line.
 
         Args:
             stream (TextIO): A text stream (e.g., file-like object or StringIO) to parse.
+            errors (ParseErrors, optional): If given, errors are recorded in it, as
+                codes and line numbers, rather than raised or stored in the
+                commands' error fields. Lines that can't be parsed, or whose
+                checksums are wrong, are skipped, and parsing carries on after them.
 
         Yields:
             GcodeCommand: Parsed G-code command objects one at a time.
 
         Raises:
-            ValueError: If a line contains an invalid command or unknown fields.
+            ValueError: If a line contains an invalid command or unknown fields,
+                        unless errors is given.
         """
+        yield from self._parse_lines(stream, errors)
+        if self.stats is not None:
+            self.stats.report()
+
+    def _parse_lines(
+        self, stream: TextIO, errors: Optional[ParseErrors]
+    ) -> Iterator[GcodeCommand]:
+        """Parses a stream, as parse_stream() does, without reporting the stats."""
+        if self.stats is not None:
+            stream = self._read_profiled(stream)
+        if errors is not None:
+            yield from self._parse_stream_recovering(stream, errors)
+            return
+
         for line_number, line in enumerate(stream, start=1):
             try:
                 command = self.parse_line(line)
@@ -107,3 +241,54 @@ class BasicGCodeParser:
                     yield command
             except Exception as e:
                 raise ValueError(f"Error on line {line_number}: {e}") from e
+
+    def _parse_stream_recovering(
+        self, stream: TextIO, errors: ParseErrors
+    ) -> Iterator[GcodeCommand]:
+        parse = self._parse if self.stats is None else self._parse_profiled
+        add_error = errors.add
+        for line_number, line in enumerate(stream, start=1):
+            command, error = parse(line)
+            if error is not None:
+                add_error(error[0], line_number, error[1])
+                if error[0] == ErrorCode.CHECKSUM:
+                    # The line was corrupted, so its command can't be trusted.
+                    continue
+            if command:
+                yield command
+
+    def _read_profiled(self, stream: TextIO) -> Iterator[str]:
+        """Yields the stream's lines, adding the time spent to the read stage."""
+        read = self.stats.read
+        lines = iter(stream)
+        while True:
+            start = time.perf_counter()
+            line = next(lines, None)
+            if line is None:
+                return
+            read.add(time.perf_counter() - start, bytes=len(line), lines=1)
+            yield line
+
+
+def _split_line_number(text: str) -> Tuple[str, Optional[int], Optional[Error]]:
+    """
+    Splits the line number and checksum from a line, and verifies the checksum.
+
+    Args:
+        text (str): The line, without a comment, e.g "N123 G1 X10*81".
+
+    Returns:
+        Tuple[str, Optional[int], Optional[Error]]: The rest of the line (e.g
+            "G1 X10"), the line number if any, and an error if the checksum is
+            wrong.
+    """
+    match = _NUMBERED_LINE.fullmatch(text)
+    number, rest, expected = match.groups()
+    line_number = None if number is None else int(number)
+    if expected is None:
+        return rest, line_number, None
+
+    actual = checksum(text[: text.rindex("*")])
+    if int(expected) != actual:
+        return rest, line_number, (ErrorCode.CHECKSUM, (expected, actual))
+    return rest, line_number, None
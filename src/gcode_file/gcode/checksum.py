@@ -0,0 +1,43 @@
+"""Line numbers and checksums, as hosts send G-code to Marlin-style firmware.
+
+Each line is sent with a line number and a checksum, so the firmware can
+detect a corrupted or lost line and ask for it again::
+
+    N123 G1 X10*81
+
+The checksum is the XOR of every byte before the "*".
+"""
+
+from functools import reduce
+from operator import xor
+from typing import Union
+
+
+def checksum(data: Union[str, bytes]) -> int:
+    """
+    Computes the XOR of the bytes of a line.
+
+    Args:
+        data (Union[str, bytes]): The line, without the "*" and checksum.
+
+    Returns:
+        int: The checksum, from 0 to 255.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return reduce(xor, data, 0)
+
+
+def number_line(number: int, line: str) -> str:
+    """
+    Adds a line number and checksum to a line.
+
+    Args:
+        number (int): The line number.
+        line (str): The line, without a comment or line end.
+
+    Returns:
+        str: The line as it is sent, e.g "N123 G1 X10*81", without a line end.
+    """
+    numbered = f"N{number} {line}"
+    return f"{numbered}*{checksum(numbered)}"
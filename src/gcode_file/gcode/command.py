@@ -1,5 +1,4 @@
 import base64
-import io
 import re
 from typing import Any, Dict, Generator, Optional
 
@@ -16,6 +15,14 @@ class GcodeCommand:
         values may be one of int, float, str, or bool.
         error (str, optional): If present, contains a validation error message.
         comment (str, optional): If present, contains the comment from the line.
+        line_number (int, optional): If present, the line's "N" line number,
+        as a host sends it to a printer.
+        text (str, optional): The line as it was read, e.g "M115 U6.2.4+8909",
+        without surrounding whitespace. It keeps what the fields can't, so
+        commands that aren't changed can be written as they were. None for
+        commands that weren't read from text, and lines with a line number.
+        Change a copy of a command, rather than the command, or the text
+        won't match its fields.
     """
 
     def __init__(
@@ -24,11 +31,15 @@ class GcodeCommand:
         fields: Dict[str, Any],
         comment: Optional[str] = None,
         error: Optional[str] = None,
+        line_number: Optional[int] = None,
+        text: Optional[str] = None,
     ):
         self.command = command
         self.fields = fields
         self.comment = comment
         self.error = error
+        self.line_number = line_number
+        self.text = text
 
     def _field_repr(self, key: str, value: Any) -> str:
         """
@@ -49,9 +60,9 @@ class GcodeCommand:
             return f"{key}{value}"
 
         if isinstance(value, str):
-            raise NotImplementedError("String fields are not yet supported.")
+            return f'{key}"{value}"'
 
-        return ValueError(f"Unsupported field type: {type(value)} for key: {key}")
+        raise ValueError(f"Unsupported field type: {type(value)} for key: {key}")
 
     def __repr__(self):
         """
@@ -122,7 +133,9 @@ class ThumbnailCommand:
         height = int(match.group(3))
         size = int(match.group(4))
 
-        output_stream = io.BytesIO()
+        # The base64 is split across lines at any length, not only at
+        # multiples of 4 characters, so it's decoded once it's all read.
+        encoded = []
 
         end = f"thumbnail{'_' + format if format else ''} end"
 
@@ -132,12 +145,16 @@ class ThumbnailCommand:
 
             if command.comment.startswith(end):
                 # TODO We can be strict/paranoid here, and check a few things
-                # * Is the output_stream actually the format, width, and height we expect?
+                # * Is the content actually the format, width, and height we expect?
                 return ThumbnailCommand(
-                    output_stream.getvalue(), format or "PNG", width, height, size
+                    base64.b64decode("".join(encoded)),
+                    format or "PNG",
+                    width,
+                    height,
+                    size,
                 )
 
-            output_stream.write(base64.b64decode(command.comment + "=="))
+            encoded.append(command.comment.strip())
 
         raise ValueError("Did not find thumbnail block end")
 
@@ -150,10 +167,20 @@ class PrusaSlicerConfigCommand:
 
     @staticmethod
     def from_stream(
-        stream: Generator[GcodeCommand, Any, None],
+        start: GcodeCommand, stream: Generator[GcodeCommand, Any, None]
     ) -> "PrusaSlicerConfigCommand":
         """
         Create a PrusaSlicerConfigCommand by consuming a prusaslicer_config block from the stream.
+
+        Args:
+            start (GcodeCommand): The command that started the block (with "prusaslicer_config = begin")
+            stream (Generator[GcodeCommand, Any, None]): The stream of G-code commands to consume from
+
+        Returns:
+            PrusaSlicerConfigCommand: A single command containing the whole config
+
+        Raises:
+            ValueError: If a non-comment command is encountered before the end of the block
         """
         config = {}
 
@@ -177,5 +204,9 @@ class PrusaSlicerConfigCommand:
         # Split the comment into key-value pairs, e.g
         #   arc_fitting = emit_center
         #   before_layer_gcode = ;BEFORE_LAYER_CHANGE\nG92 E0.0\n;[layer_z]\n\n
-        key, value = comment.split(" = ")
-        return key, value
+        #   bed_custom_model =
+        # Keys never contain "=", but values (such as G-code templates) may.
+        key, separator, value = comment.partition("=")
+        if not separator:
+            raise ValueError(f"Invalid prusaslicer_config line: {comment}")
+        return key.strip(), value.strip()
@@ -0,0 +1,107 @@
+import re
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from gcode_file.gcode.command import (
+    GcodeCommand,
+    PrusaSlicerConfigCommand,
+    ThumbnailCommand,
+)
+
+# A handler consumes a block of comments, starting at the given command, and
+# returns the single object that replaces the block in the parsed stream.
+CommentHandler = Callable[[GcodeCommand, Iterator[GcodeCommand]], Any]
+
+
+class CommentHandlerRegistry:
+    class _Entry:
+        """
+        A registered comment handler.
+
+        Attributes:
+            handler (CommentHandler): Called with the first command of the block
+                                      and the remaining command stream.
+            match (callable, optional): Called with the comment text, after the
+                                        prefix has matched, to confirm the comment
+                                        starts a block. If None, every comment with
+                                        the prefix is handled.
+        """
+
+        def __init__(self, handler: CommentHandler, match=None):
+            self.handler = handler
+            self.match = match
+
+    def __init__(self):
+        self.handlers: Dict[str, List[CommentHandlerRegistry._Entry]] = {}
+
+        # The distinct prefix lengths, longest first. Looking up a comment only
+        # costs one dict lookup per length, no matter how many handlers exist.
+        self._prefix_lengths: List[int] = []
+
+    def register_handler(
+        self,
+        prefix: str,
+        handler: CommentHandler,
+        match: Optional[Callable[[str], Any]] = None,
+    ):
+        """
+        Registers a handler for comments starting with a prefix.
+
+        Args:
+            prefix (str): The start of the comment text (without the leading ";"
+                          and whitespace), e.g "thumbnail" or "LAYER:".
+            handler (CommentHandler): Consumes the block and returns the object to yield.
+            match (callable, optional): A further check on the comment text, only
+                                        run for comments that start with the prefix.
+        """
+        if not isinstance(prefix, str) or not prefix:
+            raise TypeError(f"Prefix {prefix!r} must be a non-empty string")
+        if not callable(handler):
+            raise TypeError(f"Handler {handler} must be a callable")
+        if match is not None and not callable(match):
+            raise TypeError(f"Match {match} must be a callable")
+
+        self.handlers.setdefault(prefix, []).append(self._Entry(handler, match))
+
+        if len(prefix) not in self._prefix_lengths:
+            self._prefix_lengths.append(len(prefix))
+            self._prefix_lengths.sort(reverse=True)
+
+    def find_handler(self, comment: str) -> Optional[CommentHandler]:
+        """
+        Finds the handler for a comment, if any.
+
+        Longer prefixes are tried first, and handlers sharing a prefix are tried
+        in the order they were registered.
+
+        Args:
+            comment (str): The comment text.
+
+        Returns:
+            Optional[CommentHandler]: The handler, or None if no handler applies.
+        """
+        for length in self._prefix_lengths:
+            entries = self.handlers.get(comment[:length])
+            if entries is None:
+                continue
+            for entry in entries:
+                if entry.match is None or entry.match(comment):
+                    return entry.handler
+        return None
+
+
+# The comment handler registry, with the blocks PrusaSlicer writes.
+default_comment_handlers = CommentHandlerRegistry()
+
+# "thumbnail begin 16x16 500" or "thumbnail_QOI begin 16x16 500"
+default_comment_handlers.register_handler(
+    "thumbnail",
+    ThumbnailCommand.from_stream,
+    match=re.compile(r"thumbnail(?:_\w+)?\s+begin").match,
+)
+
+# "prusaslicer_config = begin"
+default_comment_handlers.register_handler(
+    "prusaslicer_config",
+    PrusaSlicerConfigCommand.from_stream,
+    match=lambda comment: comment == "prusaslicer_config = begin",
+)
@@ -0,0 +1,152 @@
+"""Parse errors, recorded as codes rather than strings.
+
+Uploads are often full of firmware-specific commands that the validator
+doesn't know. Building a message (and raising an exception) for each of them
+costs more than parsing the line, so ParseErrors records each error as a code,
+a line number, and the values the message needs, and formats the message
+only when it's read::
+
+    errors = ParseErrors()
+    commands = list(BasicGCodeParser().parse_stream(stream, errors))
+    print(errors.counts())
+    for message in errors.messages():
+        print(message)
+"""
+
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Any, Dict, Iterator, List, Tuple
+
+
+class ErrorCode(IntEnum):
+    """The kinds of error found while parsing a line."""
+
+    # The line doesn't start with a command, so is skipped.
+    INVALID_COMMAND = 1
+    # A field appears twice, so the line is skipped.
+    DUPLICATE_FIELD = 2
+    # The validator doesn't know the command.
+    UNSUPPORTED_COMMAND = 3
+    # The validator doesn't know one of the command's fields.
+    UNSUPPORTED_FIELD = 4
+    # A field's value is the wrong type.
+    FIELD_TYPE = 5
+    # One of the command's rules failed, e.g a required field is missing.
+    RULE = 6
+    # The line's "*" checksum is wrong.
+    CHECKSUM = 7
+
+
+# An error, as its code and the values of its message.
+Error = Tuple[ErrorCode, Tuple[Any, ...]]
+
+
+def _type_name(expected_type: Any) -> str:
+    if isinstance(expected_type, tuple):
+        return " or ".join(t.__name__ for t in expected_type)
+    return expected_type.__name__
+
+
+def format_error(code: ErrorCode, args: Tuple[Any, ...]) -> str:
+    """
+    Formats the message of an error.
+
+    Args:
+        code (ErrorCode): The kind of error.
+        args (Tuple[Any, ...]): The values of its message.
+
+    Returns:
+        str: The message, as raised in strict mode.
+    """
+    if code == ErrorCode.INVALID_COMMAND:
+        return f"Invalid G-code command: {args[0]}"
+    if code == ErrorCode.DUPLICATE_FIELD:
+        return f"Duplicate field '{args[0]}'"
+    if code == ErrorCode.UNSUPPORTED_COMMAND:
+        return f"{args[0]} is an unsupported command"
+    if code == ErrorCode.UNSUPPORTED_FIELD:
+        return f"{args[0]} has unsupported field: {args[1]}"
+    if code == ErrorCode.FIELD_TYPE:
+        command, field, expected_type, value = args
+        return (
+            f"{command} field {field} must be of type {_type_name(expected_type)} "
+            f"found {value}"
+        )
+    if code == ErrorCode.RULE:
+        return str(args[0])
+    if code == ErrorCode.CHECKSUM:
+        return f"Checksum mismatch: *{args[0]}, but it's {args[1]}"
+    raise ValueError(f"Unknown error code: {code}")
+
+
+@dataclass(frozen=True)
+class ParseError:
+    """
+    An error found while parsing.
+
+    Attributes:
+        line_number (int): The line it was found on, from 1.
+        code (ErrorCode): The kind of error.
+        args (Tuple[Any, ...]): The values of its message.
+    """
+
+    line_number: int
+    code: ErrorCode
+    args: Tuple[Any, ...]
+
+    @property
+    def message(self) -> str:
+        return format_error(self.code, self.args)
+
+    def __str__(self) -> str:
+        return f"Error on line {self.line_number}: {self.message}"
+
+
+class ParseErrors:
+    """
+    The errors found while parsing a stream, in order.
+
+    The codes and line numbers are kept in compact arrays, and the messages
+    are formatted only when they're read.
+    """
+
+    def __init__(self):
+        self.codes = array("B")
+        self.line_numbers = array("L")
+        self._args: List[Tuple[Any, ...]] = []
+
+    def add(self, code: ErrorCode, line_number: int, args: Tuple[Any, ...]):
+        """
+        Records an error.
+
+        Args:
+            code (ErrorCode): The kind of error.
+            line_number (int): The line it was found on.
+            args (Tuple[Any, ...]): The values of its message.
+        """
+        self.codes.append(code)
+        self.line_numbers.append(line_number)
+        self._args.append(args)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index: int) -> ParseError:
+        return ParseError(
+            self.line_numbers[index], ErrorCode(self.codes[index]), self._args[index]
+        )
+
+    def __iter__(self) -> Iterator[ParseError]:
+        for index in range(len(self.codes)):
+            yield self[index]
+
+    def counts(self) -> Dict[ErrorCode, int]:
+        """Returns the number of errors of each kind."""
+        return {ErrorCode(code): count for code, count in Counter(self.codes).items()}
+
+    def messages(self) -> Iterator[str]:
+        """Yields the message of each error, e.g "Error on line 3: ..."."""
+        for error in self:
+            yield str(error)
@@ -0,0 +1,208 @@
+"""Split G-code into layers, without parsing it.
+
+The G-code text is scanned with byte-level regular expressions to find where
+each layer starts. Slicer layer markers are used when present:
+
+    ;LAYER_CHANGE       (PrusaSlicer, OrcaSlicer, followed by ";Z:0.2")
+    ;LAYER:3            (Cura)
+
+Otherwise a new layer is started whenever the nozzle moves up to a new Z and
+then extrudes, so Z-hops during travel moves are not counted as layers. This
+fallback assumes absolute positioning (G90).
+
+Each Layer only records its byte and line range. The commands in a layer are
+parsed when the layer is iterated, so looking at a few layers does not pay for
+parsing the whole file.
+"""
+
+import io
+import re
+from functools import cached_property
+from typing import Iterator, List, Optional, Tuple
+
+from gcode_file.gcode.basic_parser import BasicGCodeParser
+from gcode_file.gcode.command import GcodeCommand
+
+_LAYER_MARKER = re.compile(rb"^;(?:LAYER_CHANGE|LAYER:-?\d+)[ \t]*\r?$", re.MULTILINE)
+_Z_MARKER = re.compile(rb";Z:([-+]?\d*\.?\d+)")
+# Binary G-code is often MeatPacked without spaces, e.g "G1X10Y20E.5", so moves
+# are matched by the G number not being followed by another digit (as in G28).
+_Z_MOVE = re.compile(rb"^G[0-3](?![\d.])[^;\n]*?Z([-+]?\d*\.?\d+)", re.MULTILINE)
+_MOVE = re.compile(rb"^G[0-3](?![\d.])", re.MULTILINE)
+_EXTRUDING_MOVE = re.compile(
+    rb"^G[1-3](?![\d.])[^;\n]*?[XY][^;\n]*?E(?!-)", re.MULTILINE
+)
+
+# Z values closer than this are considered to be the same layer.
+_Z_EPSILON = 1e-6
+
+
+class Layer:
+    """
+    A single layer of a G-code file.
+
+    Attributes:
+        index (int): The index of the layer, starting at 0.
+        z (float, optional): The Z height of the layer, or None if unknown.
+        height (float, optional): The difference in Z from the previous layer.
+        start (int): The byte offset of the start of the layer.
+        end (int): The byte offset just past the end of the layer.
+        first_line (int): The line number of the first line, starting at 1.
+        line_count (int): The number of lines in the layer.
+    """
+
+    def __init__(
+        self,
+        index: int,
+        z: Optional[float],
+        height: Optional[float],
+        data: bytes,
+        start: int,
+        end: int,
+        first_line: int,
+        line_count: int,
+        parser: Optional[BasicGCodeParser] = None,
+    ):
+        self.index = index
+        self.z = z
+        self.height = height
+        self.start = start
+        self.end = end
+        self.first_line = first_line
+        self.line_count = line_count
+        self._data = data
+        self._parser = parser or BasicGCodeParser()
+
+    @property
+    def size(self) -> int:
+        """The size of the layer in bytes."""
+        return self.end - self.start
+
+    @cached_property
+    def move_count(self) -> int:
+        """The number of G0/G1/G2/G3 moves in the layer."""
+        return sum(1 for _ in _MOVE.finditer(self._data, self.start, self.end))
+
+    @cached_property
+    def extrusion_count(self) -> int:
+        """The number of moves in the layer that extrude while moving in X/Y."""
+        return sum(
+            1 for _ in _EXTRUDING_MOVE.finditer(self._data, self.start, self.end)
+        )
+
+    def text(self) -> str:
+        """Returns the G-code text of the layer."""
+        return self._data[self.start : self.end].decode("utf-8")
+
+    def __iter__(self) -> Iterator[GcodeCommand]:
+        """Parses and yields the commands in the layer."""
+        return self._parser.parse_stream(io.StringIO(self.text()))
+
+    def __str__(self) -> str:
+        return (
+            f"{self.__class__.__name__}("
+            f"index={self.index}, z={self.z}, "
+            f"lines={self.first_line}-{self.first_line + self.line_count - 1}, "
+            f"size={self.size} bytes"
+            ")"
+        )
+
+
+def scan_layers(
+    data: bytes, parser: Optional[BasicGCodeParser] = None, use_markers: bool = True
+) -> List[Layer]:
+    """
+    Finds the layers in G-code text, without parsing the commands.
+
+    Any G-code before the first layer (such as the start G-code) is not part of
+    a layer. The last layer extends to the end of the data.
+
+    Args:
+        data (bytes): The G-code text.
+        parser (BasicGCodeParser, optional): Used to parse each layer's commands when
+                                             it is iterated. Defaults to BasicGCodeParser().
+        use_markers (bool, optional): If True, layers start at the slicer's layer
+                                      change comments, if there are any. If False,
+                                      or there are none, they start where Z increases.
+
+    Returns:
+        List[Layer]: The layers, in file order.
+    """
+    starts = use_markers and _marker_starts(data) or _z_increase_starts(data)
+
+    layers = []
+    line = 1 + data.count(b"\n", 0, starts[0][0]) if starts else 1
+    previous_z = None
+    for index, (start, z) in enumerate(starts):
+        end = starts[index + 1][0] if index + 1 < len(starts) else len(data)
+        line_count = data.count(b"\n", start, end)
+        if end == len(data) and end > start and data[end - 1 : end] != b"\n":
+            # The last line has no trailing newline.
+            line_count += 1
+
+        height = None
+        if z is not None and previous_z is not None:
+            height = round(z - previous_z, 6)
+
+        layers.append(
+            Layer(index, z, height, data, start, end, line, line_count, parser)
+        )
+
+        line += line_count
+        if z is not None:
+            previous_z = z
+
+    return layers
+
+
+def has_layer_markers(data: bytes) -> bool:
+    """Returns True if G-code text has the slicer's layer change comments."""
+    return _LAYER_MARKER.search(data) is not None
+
+
+def _marker_starts(data: bytes) -> List[Tuple[int, Optional[float]]]:
+    """Returns the (offset, z) of each slicer layer marker."""
+    offsets = [match.start() for match in _LAYER_MARKER.finditer(data)]
+
+    starts = []
+    for index, offset in enumerate(offsets):
+        end = offsets[index + 1] if index + 1 < len(offsets) else len(data)
+        starts.append((offset, _marker_z(data, offset, end)))
+
+    return starts
+
+
+def _marker_z(data: bytes, start: int, end: int) -> Optional[float]:
+    """Returns the Z of the layer starting at a marker."""
+    # PrusaSlicer writes the Z on the line after the marker
+    next_line = data.find(b"\n", start, end) + 1
+    if next_line > 0:
+        match = _Z_MARKER.match(data, next_line, end)
+        if match:
+            return float(match.group(1))
+
+    # Otherwise, use the first move to a Z within the layer.
+    match = _Z_MOVE.search(data, start, end)
+    if match:
+        return float(match.group(1))
+
+    return None
+
+
+def _z_increase_starts(data: bytes) -> List[Tuple[int, Optional[float]]]:
+    """Returns the (offset, z) of each move up to a new Z that is followed by extrusion."""
+    moves = [(match.start(), float(match.group(1))) for match in _Z_MOVE.finditer(data)]
+
+    starts = []
+    current_z = None
+    for index, (offset, z) in enumerate(moves):
+        if current_z is not None and z <= current_z + _Z_EPSILON:
+            continue
+
+        # Only count the move if we print at this Z, before moving in Z again.
+        end = moves[index + 1][0] if index + 1 < len(moves) else len(data)
+        if _EXTRUDING_MOVE.search(data, offset, end):
+            starts.append((offset, z))
+            current_z = z
+
+    return starts
@@ -0,0 +1,443 @@
+"""Rewrite G-code with fewer bytes, but the same motion.
+
+Smaller G-code uploads faster, and takes less of a printer's serial bandwidth
+when it's streamed. The minifier:
+
+- strips comments, except the ones other tools need: layer and feature
+  markers (";LAYER_CHANGE", ";Z:0.2", ";TYPE:Perimeter"), slicer metadata
+  ("; key = value", which includes the slicer config) and thumbnails.
+- drops repeated modal words: a feedrate that's already set, and in absolute
+  mode, the axes of a G0/G1 that don't change.
+- rounds numbers to a fixed resolution. In relative mode the rounding error
+  is carried over to the next move, so it doesn't add up along a path.
+- removes moves that don't move, and blank lines. A move with only a
+  feedrate sets it for the next move instead.
+
+Arcs (G2/G3) keep their X and Y, because an arc without them is a full circle.
+After commands that might move the printer in ways the G-code doesn't say,
+such as homing, tool changes and filament changes, the position is unknown,
+so the next move has all its axes again.
+
+minify() works on parsed commands. minify_file() works on text G-code, and
+also keeps the original text of the commands it doesn't change, such as
+"M117 Printing..." whose message isn't parsed into fields::
+
+    with open("in.gcode", "rb") as source, open("out.gcode", "wb") as output:
+        report = minify_file(source, output)
+    print(report)
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional
+
+from gcode_file.gcode.basic_parser import BasicGCodeParser
+from gcode_file.gcode.command import GcodeCommand
+from gcode_file.gcode.state import AXES, MOVE_COMMANDS
+from gcode_file.gcode.writer import DEFAULT_FIELD_DECIMALS, GCodeWriter
+
+# The decimal places kept for each field. A micron is finer than printers
+# position, and feedrates don't need fractions of a mm/min.
+MINIFY_DECIMALS = {
+    "X": 3,
+    "Y": 3,
+    "Z": 3,
+    "E": 5,
+    "F": 0,
+    "I": 3,
+    "J": 3,
+    "R": 3,
+}
+
+# The starts of the comments that are kept, as other tools read them.
+KEEP_COMMENTS = (
+    "LAYER_CHANGE",
+    "LAYER:",
+    "Z:",
+    "HEIGHT:",
+    "TYPE:",
+    "generated by",
+)
+
+# Moves whose unchanged axes can be left out.
+LINE_COMMANDS = ("G0", "G1")
+# G commands that don't move the printer. Any other G command, such as G28 or
+# G29, might leave it somewhere the G-code doesn't say.
+_STILL_COMMANDS = ("G4", "G17", "G20", "G21", "G90", "G91", "G92")
+# M commands that move the print head, and put it back where it was.
+_PARKING_COMMANDS = ("M125", "M600", "M601", "M701", "M702")
+
+# The commands whose fields the minifier changes.
+_REWRITTEN_COMMANDS = MOVE_COMMANDS + ("G92",)
+
+_THUMBNAIL_BEGIN = re.compile(r"thumbnail(?:_\w+)?\s+begin\b")
+_THUMBNAIL_END = re.compile(r"thumbnail(?:_\w+)?\s+end\b")
+
+
+@dataclass
+class MinifyReport:
+    """
+    The size of G-code before and after minifying it.
+
+    Attributes:
+        bytes_before (int): The size of the input, in bytes.
+        bytes_after (int): The size of the output, in bytes.
+        lines_before (int): The number of lines in the input.
+        lines_after (int): The number of lines in the output.
+    """
+
+    bytes_before: int
+    bytes_after: int
+    lines_before: int
+    lines_after: int
+
+    @property
+    def saved(self) -> int:
+        """The number of bytes saved."""
+        return self.bytes_before - self.bytes_after
+
+    @property
+    def ratio(self) -> float:
+        """How many times smaller the output is."""
+        return self.bytes_before / self.bytes_after if self.bytes_after else 0.0
+
+    def __str__(self) -> str:
+        percent = 100 * self.saved / self.bytes_before if self.bytes_before else 0.0
+        return (
+            f"{self.bytes_before} -> {self.bytes_after} bytes ({percent:.1f}% smaller), "
+            f"{self.lines_before} -> {self.lines_after} lines"
+        )
+
+
+class Minifier:
+    """
+    Minifies commands one at a time, tracking the printer's modal state.
+
+    Attributes:
+        decimals (Dict[str, int]): The decimal places kept for each field.
+        keep_comments (Tuple[str, ...]): The starts of the comments that are kept.
+    """
+
+    def __init__(
+        self,
+        decimals: Optional[Dict[str, int]] = None,
+        keep_comments: Iterable[str] = KEEP_COMMENTS,
+    ):
+        """
+        Initialize the Minifier.
+
+        Args:
+            decimals (Dict[str, int], optional): The decimal places kept for
+                each field. Defaults to MINIFY_DECIMALS, and
+                DEFAULT_FIELD_DECIMALS for other fields.
+            keep_comments (Iterable[str], optional): The starts of the
+                comments that are kept. Slicer metadata and thumbnails are
+                always kept.
+
+        Raises:
+            ValueError: If a number of decimal places is negative.
+        """
+        decimals = dict(MINIFY_DECIMALS if decimals is None else decimals)
+        for name, places in decimals.items():
+            if not isinstance(places, int) or places < 0:
+                raise ValueError(f"Invalid decimal places for {name}: {places}")
+        self.decimals = decimals
+        self.keep_comments = tuple(keep_comments)
+
+        self._places = [decimals.get(axis, DEFAULT_FIELD_DECIMALS) for axis in AXES]
+        self._feedrate_places = decimals.get("F", DEFAULT_FIELD_DECIMALS)
+        self._absolute = True
+        self._absolute_e = True
+        # The position the printer has been sent, per axis, or None if unknown.
+        self._position: List[Optional[float]] = [None] * len(AXES)
+        # How far the G-code's relative moves are ahead of the rounded moves sent.
+        self._error = [0.0] * len(AXES)
+        # The feedrate the printer has been sent, and the one the G-code wants.
+        self._feedrate: Optional[float] = None
+        self._wanted_feedrate: Optional[float] = None
+        self._in_thumbnail = False
+
+    def minify(self, command: Any) -> Optional[Any]:
+        """
+        Minify a command.
+
+        Args:
+            command (Any): A command from a parser. Anything other than a
+                GcodeCommand, such as a ThumbnailCommand, is kept as it is.
+
+        Returns:
+            Any: The command to write, or None if it can be left out.
+        """
+        if not isinstance(command, GcodeCommand):
+            return command
+
+        code = command.command
+        if not code:
+            return command if self._keep_comment(command.comment) else None
+        if command.error:
+            # It's kept as it is, so whatever it does to the position and
+            # feedrate isn't tracked, and the next move has all its axes.
+            self._forget_position()
+            return command
+
+        if code in MOVE_COMMANDS:
+            return self._minify_move(command)
+
+        fields = command.fields
+        if code == "G92":
+            fields = self._round_fields(fields)
+            self._set_position(fields)
+        elif code in ("G90", "G91"):
+            self._absolute = self._absolute_e = code == "G90"
+        elif code in ("M82", "M83"):
+            self._absolute_e = code == "M82"
+        elif code[0] == "T" or code in _PARKING_COMMANDS:
+            self._forget_position()
+        elif code[0] == "G" and code not in _STILL_COMMANDS:
+            self._forget_position()
+
+        if fields is command.fields and command.comment is None:
+            return command
+        return GcodeCommand(code, fields)
+
+    def _minify_move(self, command: GcodeCommand) -> Optional[GcodeCommand]:
+        # Arcs need all their axes, so only lines leave unchanged ones out.
+        line = command.command in LINE_COMMANDS
+        position = self._position
+        error = self._error
+        fields: Dict[str, Any] = {}
+        moves = False
+        for key, value in command.fields.items():
+            index = _AXIS_INDEX.get(key)
+            if type(value) is bool or not isinstance(value, (int, float)):
+                fields[key] = value
+                if index is not None:
+                    position[index] = None
+                continue
+            if key == "F":
+                self._wanted_feedrate = round(value, self._feedrate_places)
+                continue
+            if index is None:
+                fields[key] = round(
+                    value, self.decimals.get(key, DEFAULT_FIELD_DECIMALS)
+                )
+                continue
+
+            places = self._places[index]
+            absolute = self._absolute_e if index == 3 else self._absolute
+            if absolute:
+                value = round(value, places)
+                error[index] = 0.0
+                if line and value == position[index]:
+                    continue
+                position[index] = value
+            else:
+                target = value + error[index]
+                value = round(target, places)
+                error[index] = target - value
+                if line and value == 0:
+                    continue
+                if position[index] is not None:
+                    position[index] = round(position[index] + value, places)
+            fields[key] = value
+            moves = True
+
+        if not moves and line and not fields:
+            # Nothing moves, so at most the feedrate changes, and the next move sets it.
+            return None
+        wanted = self._wanted_feedrate
+        if wanted is not None and wanted != self._feedrate:
+            fields["F"] = wanted
+            self._feedrate = wanted
+        return GcodeCommand(command.command, fields)
+
+    def _round_fields(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        decimals = self.decimals
+        return {
+            key: (
+                round(value, decimals.get(key, DEFAULT_FIELD_DECIMALS))
+                if type(value) is float
+                else value
+            )
+            for key, value in fields.items()
+        }
+
+    def _set_position(self, fields: Dict[str, Any]):
+        """Set the position from a G92, which sets all axes to 0 if it has none."""
+        axes = [axis for axis in AXES if axis in fields] if fields else AXES
+        for axis in axes:
+            index = _AXIS_INDEX[axis]
+            value = fields.get(axis, 0)
+            number = isinstance(value, (int, float)) and type(value) is not bool
+            self._position[index] = value if number else None
+            self._error[index] = 0.0
+
+    def _forget_position(self):
+        self._position = [None] * len(AXES)
+        self._feedrate = None
+
+    def _keep_comment(self, comment: Optional[str]) -> bool:
+        if comment is None:
+            return False
+        if self._in_thumbnail:
+            if _THUMBNAIL_END.match(comment):
+                self._in_thumbnail = False
+            return True
+        if _THUMBNAIL_BEGIN.match(comment):
+            self._in_thumbnail = True
+            return True
+        return comment.startswith(self.keep_comments) or " = " in comment
+
+
+_AXIS_INDEX = {axis: index for index, axis in enumerate(AXES)}
+
+
+def minify(
+    commands: Iterable[Any],
+    decimals: Optional[Dict[str, int]] = None,
+    keep_comments: Iterable[str] = KEEP_COMMENTS,
+) -> Iterator[Any]:
+    """
+    Minify commands.
+
+    The commands should be written with the same decimals, e.g with
+    GCodeWriter(stream, decimals=MINIFY_DECIMALS, trim_leading_zero=True).
+
+    Args:
+        commands (Iterable[Any]): The commands, e.g from GCodeParser.parse_stream().
+        decimals (Dict[str, int], optional): See Minifier.
+        keep_comments (Iterable[str], optional): See Minifier.
+
+    Yields:
+        Any: The commands that are kept, with their fields minified.
+    """
+    minify_command = Minifier(decimals, keep_comments).minify
+    for command in commands:
+        result = minify_command(command)
+        if result is not None:
+            yield result
+
+
+def minify_file(
+    source: BinaryIO,
+    output: BinaryIO,
+    decimals: Optional[Dict[str, int]] = None,
+    keep_comments: Iterable[str] = KEEP_COMMENTS,
+    batch_size: int = 4096,
+) -> MinifyReport:
+    """
+    Minify a text G-code file.
+
+    Kept comments, and commands that are only stripped of their comment, are
+    written as they were, so anything the parser doesn't understand is kept.
+
+    Args:
+        source (BinaryIO): The G-code to read.
+        output (BinaryIO): Where to write the minified G-code.
+        decimals (Dict[str, int], optional): See Minifier.
+        keep_comments (Iterable[str], optional): See Minifier.
+        batch_size (int, optional): The number of lines to collect before writing them.
+
+    Returns:
+        MinifyReport: The size of the input and output.
+
+    Raises:
+        ValueError: If a line can't be decoded as UTF-8, or isn't G-code.
+    """
+    minifier = Minifier(decimals, keep_comments)
+    writer = GCodeWriter(None, decimals=minifier.decimals, trim_leading_zero=True)
+    parse_line = BasicGCodeParser(strict_mode=False).parse_line
+
+    bytes_before = bytes_after = lines_before = lines_after = 0
+    lines: List[str] = []
+
+    def flush():
+        nonlocal bytes_after
+        data = "".join(lines).encode("utf-8")
+        output.write(data)
+        bytes_after += len(data)
+        lines.clear()
+
+    for line_number, raw in enumerate(source, start=1):
+        lines_before += 1
+        bytes_before += len(raw)
+        try:
+            text = raw.decode("utf-8")
+            command = parse_line(text)
+        except ValueError as e:
+            raise ValueError(f"Error on line {line_number}: {e}") from e
+        if command is None:
+            continue
+
+        result = minifier.minify(command)
+        if result is None:
+            continue
+        code = result.command
+        if not code:
+            lines.append(text.strip() + "\n")
+        elif code in _REWRITTEN_COMMANDS:
+            lines.append(writer.format_command(result))
+        else:
+            # Only its comment is removed, so the rest of the text is kept.
+            lines.append(text.split(";", 1)[0].strip() + "\n")
+        lines_after += 1
+        if len(lines) >= batch_size:
+            flush()
+    flush()
+
+    return MinifyReport(bytes_before, bytes_after, lines_before, lines_after)
+
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Minifies a text G-code file. "-" reads stdin or writes stdout.
+    """
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description="Rewrite G-code with fewer bytes but the same motion"
+    )
+    parser.add_argument("input", help='The file to minify, or "-" for stdin')
+    parser.add_argument("output", help='The file to write, or "-" for stdout')
+    parser.add_argument(
+        "--decimals",
+        type=int,
+        help="The decimal places of X, Y, Z and arc fields (E keeps 2 more)",
+    )
+    parser.add_argument(
+        "--strip-all-comments",
+        action="store_true",
+        help="Also remove layer and feature markers",
+    )
+    args = parser.parse_args(argv)
+
+    decimals = None
+    if args.decimals is not None:
+        decimals = dict(MINIFY_DECIMALS)
+        for name in ("X", "Y", "Z", "I", "J", "R"):
+            decimals[name] = args.decimals
+        decimals["E"] = args.decimals + 2
+
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        report = minify_file(
+            source,
+            output,
+            decimals=decimals,
+            keep_comments=() if args.strip_all_comments else KEEP_COMMENTS,
+        )
+    except ValueError as e:
+        print(f"Error minifying {args.input}: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        if output is not sys.stdout.buffer:
+            output.close()
+    print(report, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
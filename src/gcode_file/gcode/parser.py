@@ -1,12 +1,11 @@
-from typing import Iterator, TextIO
-import re
+import time
+from typing import Iterator, Optional, TextIO
 
 from gcode_file.gcode.basic_parser import BasicGCodeParser
-from gcode_file.gcode.command import (
-    GcodeCommand,
-    PrusaSlicerConfigCommand,
-    ThumbnailCommand,
-)
+from gcode_file.gcode.command import GcodeCommand
+from gcode_file.gcode.comment_handlers import default_comment_handlers
+from gcode_file.gcode.errors import ParseErrors
+from gcode_file.profiling import ParseStats
 
 
 class GCodeParser(BasicGCodeParser):
@@ -16,32 +15,79 @@ class GCodeParser(BasicGCodeParser):
     place into comments.
     """
 
-    def __init__(self, validator=None, strict_mode: bool = True):
-        super().__init__(validator=validator, strict_mode=strict_mode)
+    def __init__(
+        self,
+        validator=None,
+        strict_mode: bool = True,
+        comment_handlers=None,
+        strip_line_numbers: bool = True,
+        stats: Optional[ParseStats] = None,
+    ):
+        """
+        Initialize the GCodeParser.
+
+        Args:
+            validator (callable, optional): See BasicGCodeParser.
+            strict_mode (bool, optional): See BasicGCodeParser.
+            comment_handlers (CommentHandlerRegistry, optional): The handlers for special
+                comment blocks, such as thumbnails. Defaults to default_comment_handlers.
+            strip_line_numbers (bool, optional): See BasicGCodeParser.
+            stats (ParseStats, optional): See BasicGCodeParser. The time spent in the
+                comment handlers is added to its special_blocks stage too.
+        """
+        super().__init__(
+            validator=validator,
+            strict_mode=strict_mode,
+            strip_line_numbers=strip_line_numbers,
+            stats=stats,
+        )
+        self.comment_handlers = comment_handlers or default_comment_handlers
 
-    def parse_stream(self, stream: TextIO) -> Iterator[GcodeCommand]:
+    def parse_stream(
+        self, stream: TextIO, errors: Optional[ParseErrors] = None
+    ) -> Iterator[GcodeCommand]:
         """
         Parse a stream of G-code line by line and yield each command.
 
+        Comments that start a special block (such as "; thumbnail begin") are
+        passed to their registered handler, which consumes the block and returns
+        a single command in its place.
+
         Args:
             stream (TextIO): A text stream to parse line by line.
+            errors (ParseErrors, optional): See BasicGCodeParser.parse_stream().
 
         Yields:
             GcodeCommand: Processed G-code commands.
         """
-        commands = super().parse_stream(stream)
-        try:
-            while True:
-                command = next(commands)
-                # Match "; thumbnail_{format} begin" lines
-                if command.comment and re.match(
-                    r"thumbnail(?:_\w+)?\s+begin", command.comment
-                ):
-                    yield ThumbnailCommand.from_stream(command, commands)
-                elif command.comment == "; prusaslicer_config = begin":
-                    yield PrusaSlicerConfigCommand.from_stream(command, commands)
+        find_handler = self.comment_handlers.find_handler
+
+        commands = self._parse_lines(stream, errors)
+        for command in commands:
+            handler = find_handler(command.comment) if command.comment else None
+            if handler:
+                # The handler consumes the rest of the block from commands.
+                if self.stats is None:
+                    yield handler(command, commands)
                 else:
-                    yield command
+                    yield self._handle_profiled(handler, command, commands)
+            else:
+                yield command
+
+        if self.stats is not None:
+            self.stats.report()
 
-        except StopIteration:
-            pass
+    def _handle_profiled(
+        self, handler, command: GcodeCommand, commands: Iterator[GcodeCommand]
+    ):
+        """Runs a handler, adding the time spent to the special_blocks stage."""
+        stats = self.stats
+        # The block's lines are read, tokenized and validated as it's consumed,
+        # which are stages of their own.
+        before = stats.read.seconds + stats.tokenize.seconds + stats.validate.seconds
+        start = time.perf_counter()
+        result = handler(command, commands)
+        elapsed = time.perf_counter() - start
+        after = stats.read.seconds + stats.tokenize.seconds + stats.validate.seconds
+        stats.special_blocks.add(elapsed - (after - before), lines=1)
+        return result
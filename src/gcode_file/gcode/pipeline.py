@@ -0,0 +1,489 @@
+"""Post-process G-code in a single streaming pass.
+
+A Pipeline is a list of stages, each of which changes, removes or adds
+commands. Every command flows through all the stages before the next command
+is read, so any number of stages share one pass over the file, and only the
+commands a stage is currently working on are in memory::
+
+    pipeline = Pipeline()
+    pipeline.map(scale_feedrate(1.2))
+    pipeline.map(offset_z(0.05))
+    pipeline.expand(remove_objects([2]))
+    with open("out.gcode", "wb") as output:
+        pipeline.write_gcode(file.commands, output)
+
+The stages are:
+
+- map(function): replace each command with function(command).
+- filter(predicate): keep only the commands where predicate(command) is true.
+- insert(function, after=False): add the commands function(command) returns
+  before (or after) each command.
+- expand(function): replace each command with the commands function(command)
+  returns, which can be none, to remove it.
+
+Functions are given every object from the command stream, including
+ThumbnailCommands and anything else the parser's comment handlers return.
+The built in stages below only change GcodeCommands, and pass the rest through.
+
+Commands that go through every stage unchanged are written as they were
+read (see GcodeCommand.text), so an empty pipeline writes its input, less
+blank lines. A stage that changes a command must return a changed copy, as
+the built in stages do, not change the command it's given.
+
+The time spent in each stage is recorded in Pipeline.timings.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+)
+
+from gcode_file.bgcode.convert import lines_to_bgcode
+from gcode_file.bgcode.writer import BasicBGCodeWriter
+from gcode_file.gcode.command import GcodeCommand
+from gcode_file.gcode.state import MOVE_COMMANDS
+from gcode_file.gcode.writer import GCodeWriter
+
+# The commands whose T field is a tool, rather than e.g a travel acceleration.
+TOOL_FIELD_COMMANDS = ("M104", "M106", "M107", "M109", "M221", "M900")
+HOTEND_COMMANDS = ("M104", "M109")
+BED_COMMANDS = ("M140", "M190")
+
+
+@dataclass
+class StageTiming:
+    """
+    How long a stage took, and how many commands went through it.
+
+    Attributes:
+        name (str): The name of the stage.
+        seconds (float): The time spent in the stage's function.
+        commands_in (int): The number of commands given to the stage.
+        commands_out (int): The number of commands the stage passed on.
+    """
+
+    name: str
+    seconds: float = 0.0
+    commands_in: int = 0
+    commands_out: int = 0
+
+
+class _Stage:
+    """A stage, as a function from a command to the list of commands it becomes."""
+
+    def __init__(self, name: str, function: Callable[[Any], List[Any]]):
+        self.name = name
+        self.function = function
+        self.timing = StageTiming(name)
+
+
+class Pipeline:
+    """
+    A chain of stages that post-process a stream of commands in one pass.
+
+    Attributes:
+        timed (bool): Whether to time each stage. Timing costs about 0.1us per
+                      command per stage.
+    """
+
+    def __init__(self, timed: bool = True):
+        self.timed = timed
+        self._stages: List[_Stage] = []
+
+    def map(self, function: Callable[[Any], Any], name: Optional[str] = None):
+        """
+        Add a stage that replaces each command with function(command).
+
+        Args:
+            function (callable): Returns the new command.
+            name (str, optional): The stage's name in the timings. Defaults to
+                                  the function's name.
+
+        Returns:
+            Pipeline: This pipeline, so calls can be chained.
+        """
+        return self._add(name or _name(function), lambda command: [function(command)])
+
+    def filter(self, predicate: Callable[[Any], bool], name: Optional[str] = None):
+        """
+        Add a stage that keeps only the commands where predicate(command) is true.
+
+        Args:
+            predicate (callable): Returns whether to keep the command.
+            name (str, optional): The stage's name in the timings.
+
+        Returns:
+            Pipeline: This pipeline, so calls can be chained.
+        """
+        return self._add(
+            name or _name(predicate),
+            lambda command: [command] if predicate(command) else [],
+        )
+
+    def insert(
+        self,
+        function: Callable[[Any], Optional[Iterable[Any]]],
+        after: bool = False,
+        name: Optional[str] = None,
+    ):
+        """
+        Add a stage that adds commands before or after each command.
+
+        Args:
+            function (callable): Returns the commands to add, or None for none.
+            after (bool, optional): Add them after the command instead of before.
+            name (str, optional): The stage's name in the timings.
+
+        Returns:
+            Pipeline: This pipeline, so calls can be chained.
+        """
+
+        def stage(command: Any) -> List[Any]:
+            added = function(command)
+            if not added:
+                return [command]
+            return [command, *added] if after else [*added, command]
+
+        return self._add(name or _name(function), stage)
+
+    def expand(
+        self, function: Callable[[Any], Iterable[Any]], name: Optional[str] = None
+    ):
+        """
+        Add a stage that replaces each command with any number of commands.
+
+        Args:
+            function (callable): Returns the commands that replace the command.
+                                 Return an empty list to remove it.
+            name (str, optional): The stage's name in the timings.
+
+        Returns:
+            Pipeline: This pipeline, so calls can be chained.
+        """
+        return self._add(
+            name or _name(function), lambda command: list(function(command))
+        )
+
+    @property
+    def timings(self) -> List[StageTiming]:
+        """The timing of each stage, in order, over every run so far."""
+        return [stage.timing for stage in self._stages]
+
+    def run(self, commands: Iterable[Any]) -> Iterator[Any]:
+        """
+        Process commands through every stage.
+
+        Args:
+            commands (Iterable[Any]): The commands, e.g from GCodeParser.parse_stream()
+                                      or BGcodeFile.commands.
+
+        Yields:
+            Any: The processed commands.
+        """
+        stages = self._stages
+        timed = self.timed
+        clock = time.perf_counter
+
+        for command in commands:
+            batch = [command]
+            for stage in stages:
+                function = stage.function
+                timing = stage.timing
+                timing.commands_in += len(batch)
+                if len(batch) == 1:
+                    if timed:
+                        start = clock()
+                        batch = function(batch[0])
+                        timing.seconds += clock() - start
+                    else:
+                        batch = function(batch[0])
+                else:
+                    start = clock() if timed else 0.0
+                    batch = [result for item in batch for result in function(item)]
+                    if timed:
+                        timing.seconds += clock() - start
+                timing.commands_out += len(batch)
+                if not batch:
+                    break
+            yield from batch
+
+    def write_gcode(self, commands: Iterable[Any], stream: BinaryIO, **kwargs):
+        """
+        Process commands, and write them to a binary stream as text G-code.
+
+        Args:
+            commands (Iterable[Any]): The commands.
+            stream (BinaryIO): Where to write the G-code.
+            **kwargs: GCodeWriter options, such as decimals, for formatting
+                the commands that were changed.
+        """
+        kwargs.setdefault("keep_text", True)
+        GCodeWriter(stream, **kwargs).write_commands(self.run(commands))
+
+    def write_bgcode(
+        self,
+        commands: Iterable[Any],
+        stream: BinaryIO,
+        blocks: Optional[Iterable[Any]] = None,
+        gcode_options: Optional[Dict[str, Any]] = None,
+        **kwargs,
+    ):
+        """
+        Process commands, and write them to a binary stream as bgcode.
+
+        Args:
+            commands (Iterable[Any]): The commands.
+            stream (BinaryIO): Where to write the bgcode file.
+            blocks (Iterable[Block], optional): Metadata and thumbnail blocks to
+                write before the G-code, e.g the ones from the BGcodeFile the
+                commands are from. If not given, the commands are from text
+                G-code, so their thumbnails, slicer config and metadata
+                comments are written as blocks, as gcode_to_bgcode() does.
+            gcode_options (Dict[str, Any], optional): GCodeWriter options, such
+                as decimals, for formatting the commands that were changed.
+            **kwargs: BasicBGCodeWriter options, such as gcode_compression.
+
+        Raises:
+            ValueError: If blocks is not given, and a thumbnail or the
+                        prusaslicer_config block is malformed.
+        """
+        formatter = GCodeWriter(None, **{"keep_text": True, **(gcode_options or {})})
+        gcode = map(formatter.format_command, self.run(commands))
+        if blocks is None:
+            # Thumbnails and configs are formatted as several lines.
+            lines = (line for text in gcode for line in text.splitlines(True))
+            lines_to_bgcode(lines, stream, **kwargs)
+            return
+
+        writer = BasicBGCodeWriter(stream, **kwargs)
+        writer.write_blocks(blocks)
+        writer.write_gcode(gcode)
+
+    def _add(self, name: str, function: Callable[[Any], List[Any]]) -> "Pipeline":
+        self._stages.append(_Stage(name, function))
+        return self
+
+
+def _name(function: Callable) -> str:
+    return getattr(function, "__name__", None) or type(function).__name__
+
+
+def scale_feedrate(factor: float) -> Callable[[Any], Any]:
+    """
+    A map stage that multiplies the feedrate of every move.
+
+    Args:
+        factor (float): The factor, e.g 1.2 to print 20% faster.
+
+    Returns:
+        callable: The stage function.
+
+    Raises:
+        ValueError: If the factor is not positive.
+    """
+    if factor <= 0:
+        raise ValueError(f"factor must be positive, not {factor}")
+
+    def scale_feedrate(command: Any) -> Any:
+        if (
+            not isinstance(command, GcodeCommand)
+            or command.command not in MOVE_COMMANDS
+        ):
+            return command
+        feedrate = command.fields.get("F")
+        if not _is_number(feedrate):
+            return command
+        return _with_fields(command, F=feedrate * factor)
+
+    return scale_feedrate
+
+
+def offset_z(offset: float) -> Callable[[Any], Any]:
+    """
+    A map stage that moves everything up (or down) by an offset.
+
+    Z is offset in absolute moves and G92, but not in relative (G91) moves.
+
+    Args:
+        offset (float): The offset in mm.
+
+    Returns:
+        callable: The stage function.
+    """
+    absolute = True
+
+    def offset_z(command: Any) -> Any:
+        nonlocal absolute
+        if not isinstance(command, GcodeCommand):
+            return command
+        code = command.command
+        if code == "G90":
+            absolute = True
+        elif code == "G91":
+            absolute = False
+
+        z = command.fields.get("Z")
+        if not _is_number(z):
+            return command
+        if code == "G92" or (code in MOVE_COMMANDS and absolute):
+            return _with_fields(command, Z=z + offset)
+        return command
+
+    return offset_z
+
+
+def set_temperature(
+    hotend: Optional[float] = None, bed: Optional[float] = None
+) -> Callable[[Any], Any]:
+    """
+    A map stage that overrides the hotend and/or bed temperatures.
+
+    Commands that turn a heater off (S0) are left alone.
+
+    Args:
+        hotend (float, optional): The hotend temperature for M104 and M109.
+        bed (float, optional): The bed temperature for M140 and M190.
+
+    Returns:
+        callable: The stage function.
+    """
+
+    def set_temperature(command: Any) -> Any:
+        if not isinstance(command, GcodeCommand):
+            return command
+        if hotend is not None and command.command in HOTEND_COMMANDS:
+            temperature = hotend
+        elif bed is not None and command.command in BED_COMMANDS:
+            temperature = bed
+        else:
+            return command
+
+        # M109 R waits for the temperature whether heating or cooling.
+        changes = {
+            name: temperature
+            for name in ("S", "R")
+            if _is_number(command.fields.get(name)) and command.fields[name] != 0
+        }
+        return _with_fields(command, **changes) if changes else command
+
+    return set_temperature
+
+
+def remap_tools(mapping: Dict[int, int]) -> Callable[[Any], Any]:
+    """
+    A map stage that changes which tool (e.g MMU slot) is used for each tool.
+
+    Tool changes (T<n>), and the T field of commands such as M104 T1, are changed.
+
+    Args:
+        mapping (Dict[int, int]): The new tool for each tool. Tools not in the
+                                  mapping are left alone.
+
+    Returns:
+        callable: The stage function.
+    """
+
+    def remap_tools(command: Any) -> Any:
+        if not isinstance(command, GcodeCommand):
+            return command
+        code = command.command
+        if code[:1] == "T" and code[1:].isdigit():
+            tool = mapping.get(int(code[1:]))
+            if tool is None:
+                return command
+            return GcodeCommand(
+                f"T{tool}", dict(command.fields), command.comment, command.error
+            )
+        if code in TOOL_FIELD_COMMANDS:
+            tool = command.fields.get("T")
+            if type(tool) is int and tool in mapping:
+                return _with_fields(command, T=mapping[tool])
+        return command
+
+    return remap_tools
+
+
+def remove_objects(ids: Iterable[int]) -> Callable[[Any], List[Any]]:
+    """
+    An expand stage that stops objects being printed.
+
+    Objects are found by their M486 S<id> labels, as PrusaSlicer writes them.
+    Within a removed object, moves keep their position but don't extrude, so
+    the other objects print the same. When extrusion is absolute (M82), a G92
+    is added after the object, so the extruder continues from where it would
+    have been.
+
+    Args:
+        ids (Iterable[int]): The ids of the objects to remove.
+
+    Returns:
+        callable: The stage function.
+    """
+    removed = frozenset(ids)
+    current: Optional[int] = None
+    # The E position, as the G-code without the objects removed would have it.
+    absolute_e = True
+    e = 0.0
+
+    def remove_objects(command: Any) -> Sequence[Any]:
+        nonlocal current, absolute_e, e
+        if not isinstance(command, GcodeCommand):
+            return (command,)
+
+        code = command.command
+        was_removed = current in removed
+        if code == "M486" and type(command.fields.get("S")) is int:
+            label = command.fields["S"]
+            current = None if label < 0 else label
+        elif code in MOVE_COMMANDS:
+            value = command.fields.get("E")
+            if _is_number(value):
+                e = value if absolute_e else e + value
+        elif code == "G92":
+            value = command.fields.get("E")
+            if _is_number(value):
+                e = value
+            elif not command.fields:
+                e = 0.0
+        elif code in ("G90", "M82"):
+            absolute_e = True
+        elif code in ("G91", "M83"):
+            absolute_e = False
+
+        if was_removed and current not in removed:
+            if absolute_e:
+                return (command, GcodeCommand("G92", {"E": e}))
+            return (command,)
+
+        if current in removed and "E" in command.fields:
+            if command.command in MOVE_COMMANDS:
+                fields = {
+                    key: value for key, value in command.fields.items() if key != "E"
+                }
+                if not any(name in fields for name in "XYZ"):
+                    # A retraction or unretraction, which does nothing without E.
+                    return ()
+                return (GcodeCommand(command.command, fields, command.comment),)
+        return (command,)
+
+    return remove_objects
+
+
+def _with_fields(command: GcodeCommand, **changes: Any) -> GcodeCommand:
+    """A copy of the command, with some fields changed."""
+    return GcodeCommand(
+        command.command, {**command.fields, **changes}, command.comment, command.error
+    )
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
@@ -0,0 +1,154 @@
+import io
+from typing import BinaryIO, Dict
+
+from gcode_file.gcode.command import PrusaSlicerConfigCommand
+
+# PrusaSlicer writes its full configuration as the very last thing in a
+# G-code file, wrapped in these two comments.
+_CONFIG_BEGIN = b"; prusaslicer_config = begin"
+_CONFIG_END = b"; prusaslicer_config = end"
+
+_DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def read_prusaslicer_config(
+    stream: BinaryIO, chunk_size: int = _DEFAULT_CHUNK_SIZE
+) -> Dict[str, str]:
+    """
+    Read the prusaslicer_config block from the end of a G-code file.
+
+    The stream is read backwards in chunks until the start of the config block
+    is found, so the body of the file is never read or parsed. The stream's
+    position is restored before returning.
+
+    Args:
+        stream (BinaryIO): A seekable binary stream of a text G-code file.
+        chunk_size (int, optional): How many bytes to read per step while
+            searching backwards. Defaults to 64 KiB.
+
+    Returns:
+        Dict[str, str]: The config key/value pairs, or an empty dict if the file
+                        does not end with a prusaslicer_config block.
+
+    Raises:
+        ValueError: If the stream is not seekable, or the config block is malformed.
+    """
+    if not stream.seekable():
+        raise ValueError("stream must be seekable to read the slicer config")
+    if chunk_size < len(_CONFIG_BEGIN):
+        raise ValueError(f"chunk_size must be at least {len(_CONFIG_BEGIN)} bytes")
+
+    original_position = stream.tell()
+    try:
+        begin = _find_config_begin(stream, chunk_size)
+        if begin is None:
+            return {}
+
+        stream.seek(begin)
+        lines = stream.read().decode("utf-8").splitlines()
+    finally:
+        stream.seek(original_position)
+
+    config = {}
+    # Skip the "begin" line, and stop at the "end" line.
+    for line in lines[1:]:
+        line = line.strip()
+        if line == _CONFIG_END.decode("ascii"):
+            return config
+        if not line.startswith(";"):
+            raise ValueError(f"Invalid prusaslicer_config line: {line}")
+
+        key, value = PrusaSlicerConfigCommand.parse_config_line(line[1:])
+        config[key] = value
+
+    raise ValueError("Did not find end of prusaslicer_config block")
+
+
+def read_print_metadata(
+    stream: BinaryIO, chunk_size: int = _DEFAULT_CHUNK_SIZE
+) -> Dict[str, str]:
+    """
+    Read the print statistics PrusaSlicer writes just before its config block.
+
+    These are the "; key = value" comments such as
+    "; estimated printing time (normal mode) = 57s", the same values a binary
+    G-code file stores in its print metadata block. Only the end of the file is
+    read, and the stream's position is restored before returning.
+
+    Args:
+        stream (BinaryIO): A seekable binary stream of a text G-code file.
+        chunk_size (int, optional): How many bytes to read per step while
+            searching backwards. Defaults to 64 KiB.
+
+    Returns:
+        Dict[str, str]: The key/value pairs, in file order.
+
+    Raises:
+        ValueError: If the stream is not seekable.
+    """
+    if not stream.seekable():
+        raise ValueError("stream must be seekable to read the print metadata")
+
+    original_position = stream.tell()
+    try:
+        end = _find_config_begin(stream, chunk_size)
+        if end is None:
+            end = stream.seek(0, io.SEEK_END)
+
+        start = max(end - chunk_size, 0)
+        stream.seek(start)
+        lines = stream.read(end - start).decode("utf-8", errors="replace").splitlines()
+    finally:
+        stream.seek(original_position)
+
+    if start > 0:
+        # The first line is probably only part of a line.
+        lines = lines[1:]
+
+    metadata = []
+    for line in reversed(lines):
+        line = line.strip()
+        if not line:
+            if metadata:
+                break
+            continue
+        if not line.startswith(";") or " = " not in line:
+            break
+        metadata.append(PrusaSlicerConfigCommand.parse_config_line(line[1:]))
+
+    return dict(reversed(metadata))
+
+
+def _find_config_begin(stream: BinaryIO, chunk_size: int):
+    """
+    Search backwards through the stream for the prusaslicer_config begin marker.
+
+    Returns:
+        Optional[int]: The offset of the marker, or None if there isn't one.
+    """
+    end = stream.seek(0, io.SEEK_END)
+    position = end
+
+    # Bytes carried over from the start of the previous chunk, so markers that
+    # straddle a chunk boundary are still found.
+    overlap = b""
+
+    while position > 0:
+        read_size = min(chunk_size, position)
+        position -= read_size
+        stream.seek(position)
+        chunk = stream.read(read_size)
+
+        # The block is always last, so if the file doesn't end with the end
+        # marker we can give up without scanning the rest of the file.
+        if position + read_size == end and not chunk.rstrip().endswith(_CONFIG_END):
+            return None
+
+        window = chunk + overlap
+        index = window.rfind(_CONFIG_BEGIN)
+        if index >= 0:
+            return position + index
+
+        overlap = chunk[: len(_CONFIG_BEGIN) - 1]
+
+    return None
@@ -0,0 +1,577 @@
+"""Split G-code into several jobs, or merge several jobs into one.
+
+Splitting and merging don't need to parse the G-code, so they work on bytes:
+the layers and objects are found with regular expressions (see
+scan_layers()), and the untouched byte ranges are copied as they are. Only a
+few commands are written at each join, to put the printer in the state the
+G-code after it expects:
+
+- split_layers() cuts a job into ranges of layers. Each file has the start
+  G-code, the layers, and the end G-code.
+- split_objects() cuts a job into one file per object, using the M486 S<id>
+  labels PrusaSlicer writes around each object's moves.
+- merge_plates() joins jobs into one, printed one after another. Between
+  them, the extruder is reset as the printer powers on, and the objects are
+  renumbered so each plate's objects can be cancelled on their own.
+- merge_bgcode() does the same for bgcode files, copying the blocks without
+  decoding them.
+
+The state at a join is the positioning (G90/G91), extrusion mode (M82/M83),
+extruder position (G92), Z height, feedrate and tool that the G-code before it
+left the printer in. X and Y are not restored, as the first move after a join
+is a travel to where the next layer or object starts. As in scan_layers(), Z
+is only known with absolute positioning.
+
+From the command line::
+
+    python -m gcode_file.gcode.split layers file.gcode 0:10 10:20
+    python -m gcode_file.gcode.split objects file.gcode
+    python -m gcode_file.gcode.split merge merged.gcode a.gcode b.gcode
+"""
+
+import bisect
+import re
+from dataclasses import dataclass
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Pattern,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from gcode_file.bgcode.parser import BasicBGCodeParser, BlockType
+from gcode_file.bgcode.writer import BasicBGCodeWriter
+from gcode_file.gcode.command import GcodeCommand
+from gcode_file.gcode.layers import scan_layers
+from gcode_file.gcode.writer import GCodeWriter
+
+# Written between merged plates, so each plate's start G-code runs in the
+# state the printer powers on in: absolute moves and extrusion, at E0.
+PLATE_RESET = "G90\nM82\nG92 E0\n"
+
+# PrusaSlicer marks its custom G-code blocks, and the end G-code is the last.
+_CUSTOM_GCODE = re.compile(rb"^;TYPE:Custom", re.MULTILINE)
+# The slicer settings at the end of a file, which only the last plate keeps.
+_CONFIG = re.compile(rb"^; prusaslicer_config = begin", re.MULTILINE)
+
+_LABEL = re.compile(rb"^M486[ \t]*S(-?\d+)[^\n]*\n?", re.MULTILINE)
+_LABEL_ID = re.compile(rb"^(M486[ \t]*S)(\d+)", re.MULTILINE)
+
+# Commands that change the state rarely, which are indexed in one pass.
+_POSITIONING = re.compile(rb"^G9([01])(?![\d.])", re.MULTILINE)
+_EXTRUSION_MODE = re.compile(rb"^(?:G9([01])|M8([23]))(?![\d.])", re.MULTILINE)
+_TOOL = re.compile(rb"^T(\d+)(?![\d.])", re.MULTILINE)
+_SET_POSITION = re.compile(rb"^G92(?![\d.])([^;\n]*)", re.MULTILINE)
+_HOME = re.compile(rb"^G28(?![\d.])", re.MULTILINE)
+_AXIS = re.compile(rb"([EZ])[ \t]*([-+]?\d*\.?\d+)")
+# Moves are too common to index, so the last one before an offset is searched
+# for backwards. The G number must not be followed by another digit, as in G28.
+_Z_MOVE = re.compile(rb"^G[0-3](?![\d.])[^;\n]*?Z([-+]?\d*\.?\d+)", re.MULTILINE)
+_E_MOVE = re.compile(rb"^G[0-3](?![\d.])[^;\n]*?E([-+]?\d*\.?\d+)", re.MULTILINE)
+_F_MOVE = re.compile(rb"^G[0-3](?![\d.])[^;\n]*?F(\d*\.?\d+)", re.MULTILINE)
+
+# The size of the first window searched backwards, which grows each time.
+_SEARCH_WINDOW = 4096
+
+_WRITER = GCodeWriter(None)
+
+_T = TypeVar("_T")
+
+
+@dataclass(frozen=True)
+class _State:
+    """The state of the printer at an offset in the G-code, where it's known."""
+
+    relative: Optional[bool] = None
+    relative_e: Optional[bool] = None
+    e: Optional[float] = None
+    z: Optional[float] = None
+    feedrate: Optional[float] = None
+    tool: Optional[int] = None
+
+
+class _StateIndex:
+    """Finds the state of the printer at offsets in G-code text, without parsing it."""
+
+    def __init__(self, data: bytes):
+        self._data = data
+        self._positioning = _Index(
+            (match.start(), match.group(1) == b"1")
+            for match in _POSITIONING.finditer(data)
+        )
+        self._extrusion_mode = _Index(
+            (match.start(), match.group(1) == b"1" or match.group(2) == b"3")
+            for match in _EXTRUSION_MODE.finditer(data)
+        )
+        self._tools = _Index(
+            (match.start(), int(match.group(1))) for match in _TOOL.finditer(data)
+        )
+
+        e_positions = []
+        z_positions = []
+        for match in _SET_POSITION.finditer(data):
+            axes = dict(_AXIS.findall(match.group(1)))
+            if not match.group(1).strip(b" \t"):
+                # G92 on its own sets every axis to 0.
+                axes = {b"E": b"0", b"Z": b"0"}
+            if b"E" in axes:
+                e_positions.append((match.start(), float(axes[b"E"])))
+            if b"Z" in axes:
+                z_positions.append((match.start(), float(axes[b"Z"])))
+        # After homing, Z is only known once it is moved to.
+        z_positions.extend((match.start(), None) for match in _HOME.finditer(data))
+        self._e_positions = _Index(e_positions)
+        self._z_positions = _Index(sorted(z_positions, key=lambda item: item[0]))
+        self._cache: Dict[int, _State] = {}
+
+    def state_at(self, offset: int) -> _State:
+        """Returns the state after the G-code before the offset."""
+        state = self._cache.get(offset)
+        if state is None:
+            state = self._cache[offset] = self._find_state(offset)
+        return state
+
+    def _find_state(self, offset: int) -> _State:
+        data = self._data
+        # The printer powers on with absolute moves and extrusion.
+        positioning_offset, relative = self._positioning.last(offset, False)
+        mode_offset, relative_e = self._extrusion_mode.last(offset, False)
+
+        z = None
+        if not relative:
+            # Only the moves since positioning was set, or the position was.
+            set_offset, z = self._z_positions.last(offset, None)
+            start = max(set_offset, positioning_offset, 0)
+            match = _search_back(_Z_MOVE, data, start, offset)
+            if match:
+                z = float(match.group(1))
+            elif set_offset < positioning_offset:
+                z = None
+
+        e = None
+        if not relative_e:
+            set_offset, e = self._e_positions.last(offset, 0.0)
+            start = max(set_offset, mode_offset, 0)
+            match = _search_back(_E_MOVE, data, start, offset)
+            if match:
+                e = float(match.group(1))
+            elif set_offset < mode_offset:
+                # Extrusion became absolute at an unknown position.
+                e = None
+
+        match = _search_back(_F_MOVE, data, 0, offset)
+        return _State(
+            relative=relative,
+            relative_e=relative_e,
+            e=e,
+            z=z,
+            feedrate=float(match.group(1)) if match else None,
+            tool=self._tools.last(offset, None)[1],
+        )
+
+
+class _Index:
+    """The values set at offsets in the G-code, to find the last before an offset."""
+
+    def __init__(self, items: Iterable[Tuple[int, _T]]):
+        items = list(items)
+        self._offsets = [offset for offset, _ in items]
+        self._values = [value for _, value in items]
+
+    def last(self, offset: int, default: _T) -> Tuple[int, _T]:
+        """Returns the offset and value of the last item before the offset, or -1 and the default."""
+        index = bisect.bisect_left(self._offsets, offset) - 1
+        if index < 0:
+            return -1, default
+        return self._offsets[index], self._values[index]
+
+
+def _search_back(
+    pattern: Pattern[bytes], data: bytes, start: int, end: int
+) -> Optional["re.Match[bytes]"]:
+    """Returns the last match of a pattern that starts between start and end."""
+    size = _SEARCH_WINDOW
+    while True:
+        low = max(start, end - size)
+        match = None
+        for match in pattern.finditer(data, low, end):
+            pass
+        if match is not None or low == start:
+            return match
+        size *= 4
+
+
+def _fixup(before: _State, after: _State, move_z: bool = True) -> bytes:
+    """The G-code that changes the state from before to after, where it differs."""
+    commands = []
+    if after.tool is not None and after.tool != before.tool:
+        commands.append(GcodeCommand(f"T{after.tool}", {}))
+
+    relative, relative_e = before.relative, before.relative_e
+    if move_z and after.z is not None and after.z != before.z:
+        if relative is not False:
+            commands.append(GcodeCommand("G90", {}))
+            # G90 and G91 set the extrusion mode too.
+            relative = relative_e = False
+        commands.append(GcodeCommand("G1", {"Z": after.z}))
+    if after.relative is not None and after.relative != relative:
+        commands.append(GcodeCommand("G91" if after.relative else "G90", {}))
+        relative_e = after.relative
+    if after.relative_e is not None and after.relative_e != relative_e:
+        commands.append(GcodeCommand("M83" if after.relative_e else "M82", {}))
+    if after.relative_e is False and after.e is not None and after.e != before.e:
+        commands.append(GcodeCommand("G92", {"E": after.e}))
+    if after.feedrate is not None and after.feedrate != before.feedrate:
+        commands.append(GcodeCommand("G1", {"F": after.feedrate}))
+
+    return "".join(_WRITER.format_command(command) for command in commands).encode(
+        "utf-8"
+    )
+
+
+def split_layers(data: bytes, ranges: Iterable[Tuple[int, int]]) -> List[bytes]:
+    """
+    Splits G-code text into ranges of layers.
+
+    Each part has the start G-code, then the G-code that puts the printer in
+    the state the first layer of the range starts in (see the module docs),
+    the layers, and the end G-code. The end G-code starts at PrusaSlicer's
+    last ";TYPE:Custom" marker, and without one, it is only in the part with
+    the last layer.
+
+    Args:
+        data (bytes): The G-code text.
+        ranges (Iterable[Tuple[int, int]]): The start and stop index of the
+            layers in each part, as in range(). Layers are found with
+            scan_layers().
+
+    Returns:
+        List[bytes]: The G-code text of each part.
+
+    Raises:
+        ValueError: If the G-code has no layers, or a range is out of bounds.
+    """
+    layers = scan_layers(data)
+    if not layers:
+        raise ValueError("The G-code has no layers")
+
+    match = _search_back(_CUSTOM_GCODE, data, layers[-1].start, len(data))
+    end_gcode = match.start() if match else len(data)
+    states = _StateIndex(data)
+    start_gcode = data[: layers[0].start]
+    start_state = states.state_at(layers[0].start)
+    end_state = states.state_at(end_gcode)
+
+    parts = []
+    for start, stop in ranges:
+        if not 0 <= start < stop <= len(layers):
+            raise ValueError(
+                f"Invalid layer range {start}:{stop}, for {len(layers)} layers"
+            )
+        begin = layers[start].start
+        end = layers[stop].start if stop < len(layers) else end_gcode
+        parts.append(
+            b"".join(
+                (
+                    start_gcode,
+                    _fixup(start_state, states.state_at(begin)),
+                    data[begin:end],
+                    # The end G-code moves away from the print itself.
+                    _fixup(states.state_at(end), end_state, move_z=False),
+                    data[end_gcode:],
+                )
+            )
+        )
+    return parts
+
+
+def split_objects(data: bytes, ids: Optional[Iterable[int]] = None) -> Dict[int, bytes]:
+    """
+    Splits G-code text into one part for each object.
+
+    Each part is the G-code with the other objects' labelled moves removed.
+    After each removed run of moves, the printer is put in the state the
+    G-code after it expects (see the module docs). The objects' declarations
+    before the first layer are labelled too, so each part only declares its
+    own object.
+
+    Args:
+        data (bytes): The G-code text, with M486 S<id> labels.
+        ids (Iterable[int], optional): The objects to write parts for. Defaults
+            to all of them.
+
+    Returns:
+        Dict[int, bytes]: The G-code text of each object's part, by id.
+
+    Raises:
+        ValueError: If the G-code has no labels, or not one of the ids.
+    """
+    regions = _object_regions(data)
+    if not regions:
+        raise ValueError("The G-code has no M486 object labels")
+    found = sorted({label for label, _, _ in regions})
+    ids = found if ids is None else list(ids)
+    missing = sorted(set(ids) - set(found))
+    if missing:
+        raise ValueError(f"The G-code has no objects with ids {missing}")
+
+    states = _StateIndex(data)
+    parts = {}
+    for label in ids:
+        # The runs of other objects' regions, joined where they're next to each other.
+        removed: List[List[int]] = []
+        for other, start, end in regions:
+            if other == label:
+                continue
+            if removed and removed[-1][1] == start:
+                removed[-1][1] = end
+            else:
+                removed.append([start, end])
+
+        pieces = []
+        position = 0
+        for start, end in removed:
+            pieces.append(data[position:start])
+            pieces.append(_fixup(states.state_at(start), states.state_at(end)))
+            position = end
+        pieces.append(data[position:])
+        parts[label] = b"".join(pieces)
+    return parts
+
+
+def _object_regions(data: bytes) -> List[Tuple[int, int, int]]:
+    """The id, start and end offset of each labelled region, including its labels."""
+    regions = []
+    current = None
+    start = 0
+    for match in _LABEL.finditer(data):
+        label = int(match.group(1))
+        if current is not None:
+            # A region ends after S-1, or where the next object starts.
+            end = match.end() if label < 0 else match.start()
+            regions.append((current, start, end))
+            current = None
+        if label >= 0:
+            current, start = label, match.start()
+    if current is not None:
+        regions.append((current, start, len(data)))
+    return regions
+
+
+def merge_plates(plates: Sequence[bytes], renumber_objects: bool = True) -> bytes:
+    """
+    Merges G-code texts into one job, that prints them one after another.
+
+    PLATE_RESET is written between the plates, and the slicer settings are
+    only kept at the end of the last plate.
+
+    Args:
+        plates (Sequence[bytes]): The G-code text of each plate.
+        renumber_objects (bool, optional): Whether to renumber the M486
+            object labels of each plate, after the ids of the plates before.
+
+    Returns:
+        bytes: The merged G-code text.
+
+    Raises:
+        ValueError: If there are no plates.
+    """
+    if not plates:
+        raise ValueError("No plates to merge")
+
+    pieces = []
+    next_id = 0
+    for index, plate in enumerate(plates):
+        if index < len(plates) - 1:
+            match = _CONFIG.search(plate)
+            if match:
+                plate = plate[: match.start()]
+        if index:
+            if not pieces[-1].endswith(b"\n"):
+                pieces.append(b"\n")
+            pieces.append(PLATE_RESET.encode("utf-8"))
+        if renumber_objects:
+            plate, next_id = _renumber_objects(plate, next_id)
+        pieces.append(plate)
+    return b"".join(pieces)
+
+
+def merge_bgcode(
+    inputs: Sequence[BinaryIO], output: BinaryIO, renumber_objects: bool = True
+):
+    """
+    Merges bgcode files into one job, that prints them one after another.
+
+    The G-code blocks are copied without decoding them, and PLATE_RESET is
+    written in a block of its own between the plates, encoded and compressed
+    as the first plate's G-code is. The metadata and thumbnails of the first
+    file are kept, and the others' are left out.
+
+    Renumbering the objects needs the G-code of each block, so each block is
+    decoded. Only the blocks with object labels are encoded again, and the
+    others are still copied.
+
+    Args:
+        inputs (Sequence[BinaryIO]): The bgcode file of each plate.
+        output (BinaryIO): Where the merged bgcode is written.
+        renumber_objects (bool, optional): See merge_plates().
+
+    Raises:
+        ValueError: If there are no inputs, or one is not valid bgcode.
+    """
+    if not inputs:
+        raise ValueError("No plates to merge")
+
+    parser = BasicBGCodeParser()
+    writer = None
+    next_id = 0
+    for index, stream in enumerate(inputs):
+        first_id = next_id
+        first_block = True
+        for block in parser.parse_raw_stream(stream):
+            if writer is None:
+                writer = BasicBGCodeWriter(
+                    output, block.header.parent.checksum_type, processes=1
+                )
+            if block.type != BlockType.GCODE:
+                if index == 0:
+                    writer.write_raw_block(block)
+                continue
+
+            if first_block:
+                first_block = False
+                if index == 0:
+                    writer.gcode_compression = block.header.compression
+                    writer.gcode_encoding = block.parse().parameters.encoding
+                else:
+                    writer.write_gcode(PLATE_RESET)
+
+            if not renumber_objects:
+                writer.write_raw_block(block)
+                continue
+            text = block.parse().data().encode("utf-8")
+            renumbered, last_id = _renumber_objects(text, first_id)
+            next_id = max(next_id, last_id)
+            if renumbered is text:
+                writer.write_raw_block(block)
+            else:
+                writer.write_gcode(renumbered.decode("utf-8"))
+
+
+def _renumber_objects(data: bytes, first_id: int) -> Tuple[bytes, int]:
+    """
+    Adds first_id to the ids of the M486 labels, returning the G-code and the
+    id after the largest. The G-code is returned as it is if it has no labels.
+    """
+    ids = [int(match.group(2)) for match in _LABEL_ID.finditer(data)]
+    if not ids:
+        return data, first_id
+    if first_id:
+        data = _LABEL_ID.sub(
+            lambda match: match.group(1) + b"%d" % (int(match.group(2)) + first_id),
+            data,
+        )
+    return data, max(ids) + first_id + 1
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    """
+    Splits a G-code or bgcode file by layers or objects, or merges several
+    into one. The parts are written as text G-code next to the input file.
+    """
+    import argparse
+    import os
+    import sys
+
+    parser = argparse.ArgumentParser(
+        description="Split G-code by layers or objects, or merge plates into one job"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    layers_parser = commands.add_parser("layers", help="Split into ranges of layers")
+    layers_parser.add_argument("input", help="The file to split")
+    layers_parser.add_argument(
+        "ranges", nargs="+", help="The layers of each part, as START:STOP"
+    )
+    objects_parser = commands.add_parser("objects", help="Split into objects")
+    objects_parser.add_argument("input", help="The file to split")
+    objects_parser.add_argument(
+        "--ids", type=int, nargs="+", help="The objects to write, by M486 id"
+    )
+    merge_parser = commands.add_parser("merge", help="Merge plates into one job")
+    merge_parser.add_argument(
+        "output", help="The file to write, as bgcode if all inputs are"
+    )
+    merge_parser.add_argument("inputs", nargs="+", help="The plates, in order")
+    merge_parser.add_argument(
+        "--keep-object-ids",
+        action="store_true",
+        help="Don't renumber the objects of each plate",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "merge":
+            _merge_files(args.inputs, args.output, not args.keep_object_ids)
+            return
+
+        data = _read_gcode(args.input)
+        root, extension = os.path.splitext(args.input)
+        if args.command == "layers":
+            ranges = [_parse_range(text) for text in args.ranges]
+            parts = split_layers(data, ranges)
+            names = [f"{root}.layers_{start}-{stop - 1}" for start, stop in ranges]
+        else:
+            objects = split_objects(data, args.ids)
+            parts = list(objects.values())
+            names = [f"{root}.object_{label}" for label in objects]
+        for name, part in zip(names, parts):
+            path = name + (".gcode" if extension == ".bgcode" else extension)
+            with open(path, "wb") as output:
+                output.write(part)
+            print(path)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def _parse_range(text: str) -> Tuple[int, int]:
+    start, separator, stop = text.partition(":")
+    if not separator:
+        raise ValueError(f"Invalid layer range {text!r}, expected START:STOP")
+    return int(start), int(stop)
+
+
+def _read_gcode(path: str) -> bytes:
+    """The G-code text of a text or bgcode file."""
+    from gcode_file.file import open_file
+
+    if not path.endswith(".bgcode"):
+        with open(path, "rb") as file:
+            return file.read()
+    with open_file(path, strict_mode=False) as file:
+        return "".join(file.lines).encode("utf-8")
+
+
+def _merge_files(inputs: Sequence[str], output: str, renumber_objects: bool):
+    if all(path.endswith(".bgcode") for path in inputs):
+        streams = [open(path, "rb") for path in inputs]
+        try:
+            with open(output, "wb") as stream:
+                merge_bgcode(streams, stream, renumber_objects)
+        finally:
+            for stream in streams:
+                stream.close()
+        return
+
+    plates = [_read_gcode(path) for path in inputs]
+    with open(output, "wb") as stream:
+        stream.write(merge_plates(plates, renumber_objects))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+"""Track the modal state of a printer through G-code.
+
+Most G-code can't be understood one command at a time. Whether "G1 X10" moves
+to X=10 or by 10mm depends on an earlier G90/G91, E values depend on M82/M83,
+G92 redefines the current position, and the feedrate and active tool carry
+over from earlier commands. The tracker resolves all of this into absolute
+values for every command.
+
+There are two ways to track state:
+
+- track_state() is a generator over GcodeCommand objects, yielding each
+  command with the MachineState after it. It's suited to streaming through
+  files that are too large to hold in memory.
+- track_columns() works on CommandColumns, a columnar copy of the commands,
+  and computes the state of every command at once with NumPy.
+
+Both give the same results. The supported commands are G0-G3 (moves), G28
+(home, assumed to be at 0), G90/G91, M82/M83, G92 and T<n> tool changes.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from gcode_file.gcode.command import GcodeCommand
+
+# The axes, in the order used by all the per-axis tuples and arrays.
+AXES = ("X", "Y", "Z", "E")
+
+MOVE_COMMANDS = ("G0", "G1", "G2", "G3")
+
+# The fields stored by CommandColumns. These cover moves, arcs, dwells (G4 P/S)
+# and the motion limit commands (M201-M205).
+COLUMN_FIELDS = ("X", "Y", "Z", "E", "F", "I", "J", "R", "P", "S", "T")
+_COLUMN_INDEX = {name: index for index, name in enumerate(COLUMN_FIELDS)}
+
+# Commands where a field without a value (a flag) means the axis is set to 0.
+_FLAG_COMMANDS = ("G28", "G92")
+
+
+class MachineState(NamedTuple):
+    """
+    The state of the printer after a command.
+
+    Attributes:
+        x (float): The absolute X position, in mm.
+        y (float): The absolute Y position, in mm.
+        z (float): The absolute Z position, in mm.
+        e_abs (float): The absolute E position, in mm, as G92 defines it.
+        e_delta (float): How far the command moved the extruder, in mm.
+                         Always 0 for commands other than moves.
+        feedrate (float, optional): The feedrate in mm/min, or None if not yet set.
+        tool (int, optional): The active tool, or None if no tool has been selected.
+    """
+
+    x: float
+    y: float
+    z: float
+    e_abs: float
+    e_delta: float
+    feedrate: Optional[float]
+    tool: Optional[int]
+
+
+class StateTracker:
+    """
+    Tracks the state of the printer, one command at a time.
+
+    Attributes:
+        position (List[float]): The current X, Y, Z and E positions.
+        absolute (bool): True for absolute XYZ positioning (G90), False for relative (G91).
+        absolute_e (bool): True for absolute E positioning (M82), False for relative (M83).
+        feedrate (float, optional): The current feedrate in mm/min.
+        tool (int, optional): The active tool.
+    """
+
+    def __init__(self):
+        self.position = [0.0, 0.0, 0.0, 0.0]
+        self.absolute = True
+        self.absolute_e = True
+        self.feedrate: Optional[float] = None
+        self.tool: Optional[int] = None
+
+    @property
+    def state(self) -> MachineState:
+        """The current state, for a command that didn't move the extruder."""
+        return MachineState(*self.position, 0.0, self.feedrate, self.tool)
+
+    def update(self, command: GcodeCommand) -> MachineState:
+        """
+        Applies a command to the state.
+
+        Args:
+            command (GcodeCommand): The command.
+
+        Returns:
+            MachineState: The state after the command.
+        """
+        code = command.command
+        fields = command.fields
+        position = self.position
+
+        if code in MOVE_COMMANDS:
+            if _is_number(fields.get("F")):
+                self.feedrate = fields["F"]
+
+            e_start = position[3]
+            for axis, name in enumerate(AXES):
+                value = fields.get(name)
+                if not _is_number(value):
+                    continue
+                if self.absolute_e if axis == 3 else self.absolute:
+                    position[axis] = value
+                else:
+                    position[axis] += value
+
+            return MachineState(
+                *position, position[3] - e_start, self.feedrate, self.tool
+            )
+
+        if code == "G92":
+            values = _axis_values(fields)
+            if not values:
+                # A bare G92 sets every axis to 0.
+                values = dict.fromkeys(range(4), 0.0)
+            for axis, value in values.items():
+                position[axis] = value
+
+        elif code == "G28":
+            homed = [axis for axis, name in enumerate(AXES[:3]) if name in fields]
+            for axis in homed or range(3):
+                position[axis] = 0.0
+
+        elif code == "G90":
+            self.absolute = self.absolute_e = True
+        elif code == "G91":
+            self.absolute = self.absolute_e = False
+        elif code == "M82":
+            self.absolute_e = True
+        elif code == "M83":
+            self.absolute_e = False
+
+        elif code[:1] == "T" and code[1:].isdigit():
+            self.tool = int(code[1:])
+
+        return self.state
+
+
+def track_state(
+    commands: Iterable[Any],
+) -> Iterator[Tuple[GcodeCommand, MachineState]]:
+    """
+    Tracks the state of the printer through a stream of commands.
+
+    Args:
+        commands (Iterable): The commands, e.g from GCodeParser.parse_stream(). Anything
+                             that isn't a GcodeCommand (such as a ThumbnailCommand) is skipped.
+
+    Yields:
+        Tuple[GcodeCommand, MachineState]: Each command, with the state after it.
+    """
+    tracker = StateTracker()
+    for command in commands:
+        if isinstance(command, GcodeCommand):
+            yield command, tracker.update(command)
+
+
+@dataclass
+class CommandColumns:
+    """
+    Commands stored as columns, one row per command.
+
+    Attributes:
+        codes (np.ndarray): The command of each row, e.g "G1". Comment only lines
+                            have an empty command.
+        values (np.ndarray): The numeric fields of each row, with one column per
+                             name in COLUMN_FIELDS, and NaN where a field is missing.
+    """
+
+    codes: np.ndarray
+    values: np.ndarray
+
+    @staticmethod
+    def from_commands(commands: Iterable[Any]) -> "CommandColumns":
+        """
+        Copies commands into columns.
+
+        Args:
+            commands (Iterable): The commands. Anything that isn't a GcodeCommand is skipped.
+
+        Returns:
+            CommandColumns: The columns.
+        """
+        codes: List[str] = []
+        # Commands are grouped by their field names, so each field can be
+        # copied into its column for the whole group at once.
+        groups: Dict[Tuple[str, ...], Tuple[List[int], List[tuple]]] = {}
+
+        for command in commands:
+            if not isinstance(command, GcodeCommand):
+                continue
+            fields = command.fields
+            if fields:
+                names = tuple(fields)
+                group = groups.get(names)
+                if group is None:
+                    group = groups[names] = ([], [])
+                group[0].append(len(codes))
+                group[1].append(tuple(fields.values()))
+            codes.append(command.command)
+
+        table = np.full((len(codes), len(COLUMN_FIELDS)), np.nan)
+        for names, (rows, rows_values) in groups.items():
+            for position, name in enumerate(names):
+                column = _COLUMN_INDEX.get(name)
+                if column is None:
+                    continue
+                values = [row_values[position] for row_values in rows_values]
+                if set(map(type, values)) <= {int, float}:
+                    table[rows, column] = values
+                    continue
+
+                # Some values are flags or strings, so check each one.
+                for row, value in zip(rows, values):
+                    if _is_number(value):
+                        table[row, column] = value
+                    elif value is True and codes[row] in _FLAG_COMMANDS:
+                        # Flags such as "G28 X" still need to be seen, so store 0.
+                        table[row, column] = 0.0
+
+        return CommandColumns(np.array(codes, dtype=str), table)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def column(self, name: str) -> np.ndarray:
+        """Returns the values of a field, with NaN where it is missing."""
+        return self.values[:, _COLUMN_INDEX[name]]
+
+    def fields(self, row: int) -> Dict[str, float]:
+        """Returns the fields present in a row."""
+        return {
+            name: float(value)
+            for name, value in zip(COLUMN_FIELDS, self.values[row])
+            if not np.isnan(value)
+        }
+
+
+@dataclass
+class StateColumns:
+    """
+    The state of the printer after each command in a CommandColumns.
+
+    Attributes:
+        positions (np.ndarray): The absolute X, Y, Z and E position, one row per command.
+        e_delta (np.ndarray): How far each command moved the extruder.
+        feedrate (np.ndarray): The feedrate in mm/min, NaN until one is set.
+        tool (np.ndarray): The active tool, -1 until one is selected.
+        absolute (np.ndarray): Whether X, Y and Z are absolute (G90), rather than
+                               relative (G91).
+        absolute_e (np.ndarray): Whether E is absolute (M82, or G90), rather than
+                                 relative (M83, or G91).
+    """
+
+    positions: np.ndarray
+    e_delta: np.ndarray
+    feedrate: np.ndarray
+    tool: np.ndarray
+    absolute: np.ndarray
+    absolute_e: np.ndarray
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.positions[:, 0]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.positions[:, 1]
+
+    @property
+    def z(self) -> np.ndarray:
+        return self.positions[:, 2]
+
+    @property
+    def e_abs(self) -> np.ndarray:
+        return self.positions[:, 3]
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __getitem__(self, row: int) -> MachineState:
+        feedrate = float(self.feedrate[row])
+        tool = int(self.tool[row])
+        return MachineState(
+            *(float(value) for value in self.positions[row]),
+            float(self.e_delta[row]),
+            None if np.isnan(feedrate) else feedrate,
+            None if tool < 0 else tool,
+        )
+
+
+def track_columns(columns: CommandColumns) -> StateColumns:
+    """
+    Tracks the state of the printer through every command at once.
+
+    Each axis is solved with a cumulative sum of the relative moves, restarted
+    at every command that sets the axis to a known value (an absolute move, G92
+    or G28). The modal settings are forward filled from the last command that
+    changed them.
+
+    Args:
+        columns (CommandColumns): The commands.
+
+    Returns:
+        StateColumns: The state after each command.
+    """
+    codes = columns.codes
+    count = len(codes)
+    rows = np.arange(count)
+
+    is_move = np.isin(codes, MOVE_COMMANDS)
+    is_g92 = codes == "G92"
+    is_g28 = codes == "G28"
+    is_g90 = codes == "G90"
+
+    absolute = _forward_fill(is_g90, is_g90 | (codes == "G91"), True)
+    absolute_e = _forward_fill(
+        is_g90 | (codes == "M82"),
+        is_g90 | (codes == "G91") | (codes == "M82") | (codes == "M83"),
+        True,
+    )
+
+    axis_values = columns.values[:, : len(AXES)]
+    present = ~np.isnan(axis_values)
+    # A bare G92 sets every axis to 0, and a bare G28 homes X, Y and Z.
+    bare_g92 = is_g92 & ~present.any(axis=1)
+    bare_g28 = is_g28 & ~present[:, :3].any(axis=1)
+
+    positions = np.empty((count, len(AXES)))
+    for axis in range(len(AXES)):
+        mode = absolute_e if axis == 3 else absolute
+        moved = is_move & present[:, axis]
+        homed = (is_g28 & present[:, axis]) | bare_g28 if axis < 3 else False
+
+        is_set = (moved & mode) | (is_g92 & present[:, axis]) | bare_g92 | homed
+        set_values = np.where(bare_g92 | is_g28, 0.0, axis_values[:, axis])
+        offsets = np.cumsum(np.where(moved & ~mode, axis_values[:, axis], 0.0))
+
+        # Each position is the last value it was set to, plus the relative moves since.
+        last_set = np.maximum.accumulate(np.where(is_set, rows, -1))
+        known = np.maximum(last_set, 0)
+        base = np.where(last_set >= 0, set_values[known] - offsets[known], 0.0)
+        positions[:, axis] = base + offsets
+
+    e = positions[:, 3]
+    previous_e = np.concatenate(([0.0], e[:-1]))
+    e_delta = np.where(is_move, e - previous_e, 0.0)
+
+    feedrates = columns.column("F")
+    feedrate = _forward_fill(feedrates, is_move & ~np.isnan(feedrates), np.nan)
+
+    is_tool = np.char.startswith(codes, "T")
+    tool_numbers = np.full(count, -1)
+    for row in np.flatnonzero(is_tool):
+        if codes[row][1:].isdigit():
+            tool_numbers[row] = int(codes[row][1:])
+    tool = _forward_fill(tool_numbers, tool_numbers >= 0, -1)
+
+    return StateColumns(positions, e_delta, feedrate, tool, absolute, absolute_e)
+
+
+def _forward_fill(values: np.ndarray, is_set: np.ndarray, initial: Any) -> np.ndarray:
+    """Returns the value from the last row where is_set, or initial before any."""
+    rows = np.arange(len(values))
+    last_set = np.maximum.accumulate(np.where(is_set, rows, -1))
+    return np.where(last_set >= 0, values[np.maximum(last_set, 0)], initial)
+
+
+def _axis_values(fields: Dict[str, Any]) -> Dict[int, float]:
+    """Returns the X, Y, Z and E fields, keyed by axis index. Flags are 0."""
+    values = {}
+    for axis, name in enumerate(AXES):
+        value = fields.get(name)
+        if value is True:
+            values[axis] = 0.0
+        elif _is_number(value):
+            values[axis] = value
+    return values
+
+
+def _is_number(value: Any) -> bool:
+    """Returns True for int and float field values, but not flags or strings."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
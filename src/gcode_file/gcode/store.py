@@ -0,0 +1,399 @@
+"""A compact in-memory store for parsed G-code commands.
+
+A list of GcodeCommand objects takes several hundred bytes per command, which
+is too much to keep many jobs in memory at once. CommandStore packs commands
+into a few bytes each instead:
+
+- Numeric fields are stored as fixed point integers, e.g micrometres for X, Y
+  and Z, as the difference from the previous value of the same field, packed
+  as variable length integers. Consecutive moves usually differ by a few mm,
+  so most values take 2 or 3 bytes.
+- The command names, and the names and types of the fields of each command,
+  are stored once in tables, and referred to by index.
+- Line numbers, when commands have them, are stored as the difference from
+  the previous line number, so consecutive ones take a byte.
+- Commands are packed in chunks of a fixed number of commands. The differences
+  restart at 0 in each chunk, so any command can be read by decoding only its
+  chunk.
+
+Values that can't be stored exactly in fixed point, such as an E value with
+more decimal places than its scale, are stored as doubles, so the commands
+read back are always equal to the commands stored.
+"""
+
+import math
+import struct
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from gcode_file.gcode.command import GcodeCommand
+
+# The fixed point steps per mm of each field. PrusaSlicer writes E with up to
+# 5 decimal places, and the others with up to 3.
+DEFAULT_SCALES = {
+    "X": 1000,
+    "Y": 1000,
+    "Z": 1000,
+    "E": 100000,
+    "F": 1000,
+    "I": 1000,
+    "J": 1000,
+    "R": 1000,
+}
+# The scale of fields not in the scales.
+DEFAULT_SCALE = 1000
+DEFAULT_CHUNK_SIZE = 1024
+
+# The number of commands in a chunk, and the size of the rest of the chunk.
+_HEADER = struct.Struct("<HI")
+_DOUBLE = struct.Struct("<d")
+
+# How each field value is stored.
+_INT = 0  # A fixed point difference, read back as an int.
+_FIXED = 1  # A fixed point difference, read back as a float.
+_FLOAT = 2  # A double.
+_TRUE = 3  # A flag, with no value stored.
+_FALSE = 4
+_STRING = 5  # A length, then UTF-8.
+
+# The names and kinds of the fields of a command, and whether it has a comment,
+# an error and a line number.
+_Layout = Tuple[Tuple[Tuple[str, int], ...], bool, bool, bool]
+# A decoded command: the command, fields, comment, error and line number.
+_Decoded = Tuple[str, Dict[str, Any], Optional[str], Optional[str], Optional[int]]
+
+
+class CommandStore:
+    """
+    Stores G-code commands in compressed chunks, with random access.
+
+    Commands are added with append() or extend(), and read back as new
+    GcodeCommand objects by iterating or indexing the store. Anything that
+    isn't a GcodeCommand, such as a ThumbnailCommand, is skipped. The text
+    commands were read from isn't kept, only what was parsed from it.
+
+    Attributes:
+        chunk_size (int): The number of commands in each chunk.
+        scales (Dict[str, int]): The fixed point steps per mm of each field.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        scales: Optional[Dict[str, int]] = None,
+    ):
+        """
+        Creates an empty store.
+
+        Args:
+            chunk_size (int, optional): The number of commands in each chunk.
+                Smaller chunks make random access faster, but compress less.
+            scales (Dict[str, int], optional): The fixed point steps per mm of
+                each field. Defaults to DEFAULT_SCALES.
+
+        Raises:
+            ValueError: If the chunk size is not between 1 and 65535, or a
+                        scale is not a positive integer.
+        """
+        if not 1 <= chunk_size <= 0xFFFF:
+            raise ValueError(f"chunk_size must be from 1 to 65535, not {chunk_size}")
+        scales = dict(DEFAULT_SCALES if scales is None else scales)
+        for name, scale in scales.items():
+            if not isinstance(scale, int) or scale < 1:
+                raise ValueError(f"Invalid scale for {name}: {scale}")
+
+        self.chunk_size = chunk_size
+        self.scales = scales
+
+        self._codes: List[str] = []
+        self._code_indexes: Dict[str, int] = {}
+        self._layouts: List[_Layout] = []
+        self._layout_indexes: Dict[_Layout, int] = {}
+
+        # The finished chunks, one after another, and where each starts.
+        self._data = bytearray()
+        self._offsets = array("Q")
+        # The chunk being filled, with the last value of each field in it.
+        self._open = bytearray()
+        self._open_count = 0
+        self._previous: Dict[str, int] = {}
+        self._previous_line = 0
+        # The last chunk decoded by indexing.
+        self._cached: Tuple[int, List[_Decoded]] = (-1, [])
+
+    @staticmethod
+    def from_commands(
+        commands: Iterable[Any],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        scales: Optional[Dict[str, int]] = None,
+    ) -> "CommandStore":
+        """
+        Stores commands.
+
+        Args:
+            commands (Iterable): The commands, e.g from GCodeParser.parse_stream().
+            chunk_size (int, optional): The number of commands in each chunk.
+            scales (Dict[str, int], optional): The fixed point steps per mm of
+                each field. Defaults to DEFAULT_SCALES.
+
+        Returns:
+            CommandStore: The store.
+        """
+        store = CommandStore(chunk_size, scales)
+        store.extend(commands)
+        return store
+
+    def append(self, command: Any):
+        """
+        Adds a command to the end of the store.
+
+        Args:
+            command (Any): The command. Anything that isn't a GcodeCommand is skipped.
+
+        Raises:
+            TypeError: If a field has a value that isn't an int, float, bool or str.
+        """
+        if not isinstance(command, GcodeCommand):
+            return
+
+        fields = []
+        values: List[Any] = []
+        for name, value in command.fields.items():
+            if isinstance(value, bool):
+                kind = _TRUE if value else _FALSE
+            elif isinstance(value, int):
+                kind = _INT
+                value = value * self.scales.get(name, DEFAULT_SCALE)
+            elif isinstance(value, float):
+                fixed = _to_fixed(value, self.scales.get(name, DEFAULT_SCALE))
+                if fixed is None:
+                    kind = _FLOAT
+                else:
+                    kind, value = _FIXED, fixed
+            elif isinstance(value, str):
+                kind = _STRING
+            else:
+                raise TypeError(
+                    f"Unsupported field type: {type(value)} for key: {name}"
+                )
+            fields.append((name, kind))
+            values.append(value)
+
+        line_number = command.line_number
+        layout = (
+            tuple(fields),
+            command.comment is not None,
+            command.error is not None,
+            line_number is not None,
+        )
+        out = self._open
+        _write_varint(
+            out, _table_index(self._codes, self._code_indexes, command.command)
+        )
+        _write_varint(out, _table_index(self._layouts, self._layout_indexes, layout))
+
+        previous = self._previous
+        for (name, kind), value in zip(fields, values):
+            if kind <= _FIXED:
+                delta = value - previous.get(name, 0)
+                previous[name] = value
+                _write_varint(out, delta * 2 if delta >= 0 else -delta * 2 - 1)
+            elif kind == _FLOAT:
+                out += _DOUBLE.pack(value)
+            elif kind == _STRING:
+                _write_string(out, value)
+        if command.comment is not None:
+            _write_string(out, command.comment)
+        if command.error is not None:
+            _write_string(out, command.error)
+        if line_number is not None:
+            delta = line_number - self._previous_line
+            self._previous_line = line_number
+            _write_varint(out, delta * 2 if delta >= 0 else -delta * 2 - 1)
+
+        self._open_count += 1
+        if self._open_count == self.chunk_size:
+            self._offsets.append(len(self._data))
+            self._data += _HEADER.pack(self._open_count, len(out))
+            self._data += out
+            self._open = bytearray()
+            self._open_count = 0
+            self._previous = {}
+            self._previous_line = 0
+
+    def extend(self, commands: Iterable[Any]):
+        """
+        Adds commands to the end of the store.
+
+        Args:
+            commands (Iterable): The commands. Anything that isn't a GcodeCommand is skipped.
+        """
+        for command in commands:
+            self.append(command)
+
+    def __len__(self) -> int:
+        return len(self._offsets) * self.chunk_size + self._open_count
+
+    def __iter__(self) -> Iterator[GcodeCommand]:
+        for chunk in range(self.chunk_count):
+            for code, fields, comment, error, line_number in self._decode_chunk(chunk):
+                yield GcodeCommand(code, fields, comment, error, line_number)
+
+    def __getitem__(
+        self, index: Union[int, slice]
+    ) -> Union[GcodeCommand, List[GcodeCommand]]:
+        """
+        Reads a command, or a list of commands for a slice.
+
+        Only the chunk with the command is decoded. The last chunk decoded is
+        kept, so reading nearby commands one at a time is fast.
+
+        Raises:
+            IndexError: If the index is out of range.
+        """
+        if isinstance(index, slice):
+            return [self[row] for row in range(*index.indices(len(self)))]
+
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError("CommandStore index out of range")
+
+        chunk, row = divmod(index, self.chunk_size)
+        if self._cached[0] != chunk:
+            decoded = self._decode_chunk(chunk)
+            if chunk < len(self._offsets):
+                # The open chunk can still change, so only finished ones are kept.
+                self._cached = (chunk, decoded)
+        else:
+            decoded = self._cached[1]
+
+        code, fields, comment, error, line_number = decoded[row]
+        return GcodeCommand(code, dict(fields), comment, error, line_number)
+
+    @property
+    def chunk_count(self) -> int:
+        """The number of chunks, including a partly filled last chunk."""
+        return len(self._offsets) + (1 if self._open_count else 0)
+
+    @property
+    def nbytes(self) -> int:
+        """The size of the packed commands, not counting the tables, in bytes."""
+        return (
+            len(self._data)
+            + len(self._open)
+            + self._offsets.itemsize * len(self._offsets)
+        )
+
+    def _decode_chunk(self, chunk: int) -> List[_Decoded]:
+        """Decodes every command in a chunk."""
+        if chunk < len(self._offsets):
+            offset = self._offsets[chunk]
+            count, size = _HEADER.unpack_from(self._data, offset)
+            start = offset + _HEADER.size
+            data = bytes(self._data[start : start + size])
+        else:
+            count, data = self._open_count, bytes(self._open)
+
+        codes = self._codes
+        layouts = self._layouts
+        scales = self.scales
+        previous: Dict[str, int] = {}
+        previous_line = 0
+        decoded: List[_Decoded] = []
+        position = 0
+
+        for _ in range(count):
+            code, position = _read_varint(data, position)
+            layout, position = _read_varint(data, position)
+            field_kinds, has_comment, has_error, has_line_number = layouts[layout]
+
+            fields: Dict[str, Any] = {}
+            for name, kind in field_kinds:
+                if kind <= _FIXED:
+                    encoded, position = _read_varint(data, position)
+                    value = previous.get(name, 0) + _unzigzag(encoded)
+                    previous[name] = value
+                    scale = scales.get(name, DEFAULT_SCALE)
+                    fields[name] = value // scale if kind == _INT else value / scale
+                elif kind == _FLOAT:
+                    fields[name] = _DOUBLE.unpack_from(data, position)[0]
+                    position += _DOUBLE.size
+                elif kind == _STRING:
+                    fields[name], position = _read_string(data, position)
+                else:
+                    fields[name] = kind == _TRUE
+
+            comment = error = line_number = None
+            if has_comment:
+                comment, position = _read_string(data, position)
+            if has_error:
+                error, position = _read_string(data, position)
+            if has_line_number:
+                encoded, position = _read_varint(data, position)
+                line_number = previous_line = previous_line + _unzigzag(encoded)
+            decoded.append((codes[code], fields, comment, error, line_number))
+
+        return decoded
+
+
+def _to_fixed(value: float, scale: int) -> Optional[int]:
+    """Returns the value in fixed point, or None if it can't be stored exactly."""
+    if not math.isfinite(value):
+        return None
+    fixed = round(value * scale)
+    if fixed / scale != value or (fixed == 0 and math.copysign(1.0, value) < 0):
+        return None
+    return fixed
+
+
+def _table_index(table: List[Any], indexes: Dict[Any, int], value: Any) -> int:
+    """Returns the index of the value in the table, adding it if it isn't there."""
+    index = indexes.get(value)
+    if index is None:
+        index = indexes[value] = len(table)
+        table.append(value)
+    return index
+
+
+def _write_varint(out: bytearray, value: int):
+    """Writes a non-negative integer, 7 bits per byte, lowest first."""
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _unzigzag(encoded: int) -> int:
+    """Returns the signed difference written as delta * 2, or -delta * 2 - 1."""
+    return encoded >> 1 if not encoded & 1 else -((encoded + 1) >> 1)
+
+
+def _read_varint(data: bytes, position: int) -> Tuple[int, int]:
+    """Reads an integer written by _write_varint(), returning it and the next position."""
+    byte = data[position]
+    if byte < 0x80:
+        return byte, position + 1
+
+    value = byte & 0x7F
+    shift = 7
+    while True:
+        position += 1
+        byte = data[position]
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position + 1
+        shift += 7
+
+
+def _write_string(out: bytearray, value: str):
+    encoded = value.encode("utf-8")
+    _write_varint(out, len(encoded))
+    out += encoded
+
+
+def _read_string(data: bytes, position: int) -> Tuple[str, int]:
+    length, position = _read_varint(data, position)
+    end = position + length
+    return data[position:end].decode("utf-8"), end
@@ -1,4 +1,9 @@
+import time
+from typing import Optional
+
 from gcode_file.gcode.command import GcodeCommand
+from gcode_file.gcode.errors import Error, ErrorCode, format_error
+from gcode_file.profiling import ParseStats
 
 
 class GCodeValidator:
@@ -18,8 +23,16 @@ class GCodeValidator:
             self.fields = fields
             self.custom_rules = custom_rules or []
 
-    def __init__(self):
+    def __init__(self, stats: Optional[ParseStats] = None):
+        """
+        Initialize the GCodeValidator.
+
+        Args:
+            stats (ParseStats, optional): If given, the time spent validating,
+                and the number of commands, are added to its validate stage.
+        """
         self.rules = {}
+        self.stats = stats
 
     def register_rule(self, command: str, fields: dict, custom_rule=None):
         """
@@ -65,55 +78,91 @@ class GCodeValidator:
         Raises:
             ValueError: If validation fails.
         """
+        if self.stats is None:
+            return self._validate(command)
+        start = time.perf_counter()
+        try:
+            self._validate(command)
+        finally:
+            self.stats.validate.add(time.perf_counter() - start, lines=1)
+
+    def _validate(self, command: GcodeCommand):
         rule = self.rules.get(command.command)
-        if not rule:
-            raise ValueError(f"{command.command} is an unsupported command")
-
-        # Check fields and their types
-        for field, value in command.fields.items():
-            if field in rule.fields:
-                expected_type = rule.fields[field]
-                if not self._is_valid_type(value, expected_type):
-                    raise ValueError(
-                        f"{command.command} field {field} must be of type {self._type_name(expected_type)} found {value}"
-                    )
-
-            elif field not in rule.fields:
-                raise ValueError(f"{command.command} has unsupported field: {field}")
+        error = self._check_fields(command, rule)
+        if error is not None:
+            raise ValueError(format_error(*error))
 
         # Apply custom rules if provided
         for custom_rule in rule.custom_rules:
             custom_rule(command)
 
-    def _is_valid_type(self, value, expected_type):
+    def check(self, command: GcodeCommand) -> Optional[Error]:
         """
-        Checks if a value matches the expected type.
+        Validates a G-code command, returning the error rather than raising it.
 
         Args:
-            value: The value to check.
-            expected_type: The expected type or a tuple of expected types.
+            command (GcodeCommand): The G-code command to validate.
 
         Returns:
-            bool: True if the value matches the expected type, False otherwise.
+            Optional[Error]: The error's code and values (see format_error()),
+                             or None if the command is valid.
         """
-        return isinstance(value, expected_type)
+        if self.stats is None:
+            return self._check(command)
+        start = time.perf_counter()
+        error = self._check(command)
+        self.stats.validate.add(time.perf_counter() - start, lines=1)
+        return error
+
+    def _check(self, command: GcodeCommand) -> Optional[Error]:
+        rule = self.rules.get(command.command)
+        error = self._check_fields(command, rule)
+        if error is None and rule.custom_rules:
+            try:
+                for custom_rule in rule.custom_rules:
+                    custom_rule(command)
+            except Exception as e:
+                return ErrorCode.RULE, (e,)
+        return error
+
+    def _check_fields(self, command: GcodeCommand, rule) -> Optional[Error]:
+        """Checks the command is known, and its fields and their types."""
+        if not rule:
+            return ErrorCode.UNSUPPORTED_COMMAND, (command.command,)
+
+        rule_fields = rule.fields
+        for field, value in command.fields.items():
+            expected_type = rule_fields.get(field)
+            if expected_type is None:
+                return ErrorCode.UNSUPPORTED_FIELD, (command.command, field)
+            if not self._is_valid_type(value, expected_type):
+                return ErrorCode.FIELD_TYPE, (
+                    command.command,
+                    field,
+                    expected_type,
+                    value,
+                )
+        return None
 
-    def _type_name(self, expected_type):
+    def _is_valid_type(self, value, expected_type):
         """
-        Returns a human-readable name for the expected type.
+        Checks if a value matches the expected type.
 
         Args:
-            expected_type: The expected type or a tuple of types.
+            value: The value to check.
+            expected_type: The expected type or a tuple of expected types.
 
         Returns:
-            str: A human-readable name for the type.
+            bool: True if the value matches the expected type, False otherwise.
         """
-        if isinstance(expected_type, tuple):
-            return " or ".join(t.__name__ for t in expected_type)
-        return expected_type.__name__
+        return isinstance(value, expected_type)
 
 
 class NoValidator:
+    def check(self, command: GcodeCommand) -> Optional[Error]:
+        """A validator that allows all commands, so never returns an error."""
+        return None
+
     def validate(self, command: GcodeCommand):
         """
         A validator that allows all commands without any validation.
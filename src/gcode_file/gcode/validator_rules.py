@@ -142,9 +142,13 @@ validator.register_rule(
 validator.register_rule(
     "G2",
     {
+        "X": num,  # X coordinate of the end point (mm)
+        "Y": num,  # Y coordinate of the end point (mm)
         "Z": num,  # Z coordinate (mm)
         "E": num,  # Extruder position (mm)
         "F": num,  # Feedrate (mm/min)
+        "I": num,  # X offset of the center from the start point (mm)
+        "J": num,  # Y offset of the center from the start point (mm)
         "R": num,  # Radius (mm)
         "K": num,  # K parameter
     },
@@ -155,9 +159,13 @@ validator.register_rule(
 validator.register_rule(
     "G3",
     {
+        "X": num,  # X coordinate of the end point (mm)
+        "Y": num,  # Y coordinate of the end point (mm)
         "Z": num,  # Z coordinate (mm)
         "E": num,  # Extruder position (mm)
         "F": num,  # Feedrate (mm/min)
+        "I": num,  # X offset of the center from the start point (mm)
+        "J": num,  # Y offset of the center from the start point (mm)
         "R": num,  # Radius (mm)
         "K": num,  # K parameter
     },
@@ -246,6 +254,7 @@ validator.register_rule(
         "D": bool,  # Disable UBL
         "E": bool,  # Edit the mesh values
         "F": num,  # Fade Height
+        "G": bool,  # Absorb heat (Prusa)
         "H": num,  # Height Value
         "I": bool,  # Invalidate a mesh point
         "J": int,  # Grid Size
@@ -333,6 +342,9 @@ validator.register_rule("G80", {})
 # G90: Set to Absolute Positioning
 validator.register_rule("G90", {})
 
+# G91: Set to Relative Positioning
+validator.register_rule("G91", {})
+
 # G92: Set Position
 validator.register_rule(
     "G92",
@@ -364,8 +376,16 @@ validator.register_rule(
     },
 )
 
-# M18: Disable all stepper motors
-validator.register_rule("M18", {})
+# M18: Disable steppers, all of them or the ones given
+validator.register_rule(
+    "M18",
+    {
+        "X": bool,  # Disable X stepper
+        "Y": bool,  # Disable Y stepper
+        "Z": bool,  # Disable Z stepper
+        "E": bool,  # Disable E stepper
+    },
+)
 
 # M20: List SD card
 validator.register_rule("M20", {})
@@ -459,7 +479,16 @@ validator.register_rule("M82", {})
 validator.register_rule("M83", {})
 
 # M84: Stop Idle Hold
-validator.register_rule("M84", {"S": bool})  # Stop idle hold
+validator.register_rule(
+    "M84",
+    {
+        "S": bool,  # Stop idle hold
+        "X": bool,  # Disable X stepper
+        "Y": bool,  # Disable Y stepper
+        "Z": bool,  # Disable Z stepper
+        "E": bool,  # Disable E stepper
+    },
+)
 
 # M92: Set axis_steps_per_unit
 validator.register_rule(
@@ -614,7 +643,13 @@ validator.register_rule(
 
 # M220: Set speed factor override percentage
 validator.register_rule(
-    "M220", {"S": num}, custom_rule=validate_percentage("S")  # Feedrate Percentage
+    "M220",
+    {
+        "S": num,  # Feedrate Percentage
+        "B": bool,  # Back up the current factor
+        "R": bool,  # Restore the backed up factor
+    },
+    custom_rule=validate_percentage("S"),
 )
 
 # M221: Set extrusion percentage
@@ -741,7 +776,9 @@ validator.register_rule(
 )
 
 # M862.3: Check Model ID
-validator.register_rule("M862.3", {"P": num, "T": num})  # Model ID  # Tool number
+validator.register_rule(
+    "M862.3", {"P": (str, num), "T": num}  # Model ID, e.g "XL"  # Tool number
+)
 
 # M862.4: Check Firmware Version
 validator.register_rule(
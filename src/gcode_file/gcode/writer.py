@@ -0,0 +1,257 @@
+"""Writes G-code commands as text.
+
+GCodeWriter is the inverse of BasicGCodeParser. Commands are formatted the
+way slicers write them: floats are rounded to a fixed number of decimal places
+for each field, with trailing zeros removed (e.g "X10.5" not "X10.500"), and
+optionally the leading zero too ("E.05"). String fields are quoted. Commands
+with a line number are written with it and a checksum, as "N123 G1 X10*81".
+With keep_text, commands read from text are written as they were read (see
+GcodeCommand.text), so post-processing only changes the commands it replaces.
+
+Lines are collected and written in batches, as one write of UTF-8 bytes per
+batch, so writing millions of commands takes few system calls.
+"""
+
+import base64
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional
+
+from gcode_file.gcode.checksum import number_line
+from gcode_file.gcode.command import (
+    GcodeCommand,
+    PrusaSlicerConfigCommand,
+    ThumbnailCommand,
+)
+
+# The decimal places PrusaSlicer writes for each field.
+DEFAULT_DECIMALS = {
+    "X": 3,
+    "Y": 3,
+    "Z": 3,
+    "E": 5,
+    "F": 3,
+    "I": 3,
+    "J": 3,
+    "R": 3,
+}
+# The decimal places of fields not in the decimals.
+DEFAULT_FIELD_DECIMALS = 6
+DEFAULT_BATCH_SIZE = 4096
+
+# PrusaSlicer's base64 lines are this long, not counting the "; ".
+_THUMBNAIL_LINE_LENGTH = 78
+
+
+class GCodeWriter:
+    """
+    Writes commands to a binary stream, as lines of G-code.
+
+    Commands are buffered, so flush() must be called after the last one,
+    unless they're written with write_commands().
+
+    Attributes:
+        stream (BinaryIO, optional): Where the G-code is written.
+        decimals (Dict[str, int]): The decimal places of each field's floats.
+        trim_leading_zero (bool): Whether to write e.g ".5" instead of "0.5".
+        keep_text (bool): Whether to write commands as they were read, if they were.
+        batch_size (int): The number of lines to collect before writing them.
+    """
+
+    def __init__(
+        self,
+        stream: Optional[BinaryIO],
+        decimals: Optional[Dict[str, int]] = None,
+        trim_leading_zero: bool = False,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        keep_text: bool = False,
+    ):
+        """
+        Initialize the GCodeWriter.
+
+        Args:
+            stream (BinaryIO, optional): A binary stream to write to, or None
+                to only use format_command().
+            decimals (Dict[str, int], optional): The decimal places of each
+                field's floats. Defaults to DEFAULT_DECIMALS, and
+                DEFAULT_FIELD_DECIMALS for other fields.
+            trim_leading_zero (bool, optional): Whether to write e.g ".5" and
+                "-.5" instead of "0.5" and "-0.5", as PrusaSlicer does.
+            batch_size (int, optional): The number of lines to collect before
+                writing them.
+            keep_text (bool, optional): Whether to write commands that have
+                their text (see GcodeCommand.text) as it was read, rather than
+                formatting their fields. Only the commands without text, e.g
+                the ones a pipeline replaced, are then formatted.
+
+        Raises:
+            ValueError: If the batch size is not positive, or a number of
+                        decimal places is negative.
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be positive, not {batch_size}")
+        decimals = dict(DEFAULT_DECIMALS if decimals is None else decimals)
+        for name, places in decimals.items():
+            if not isinstance(places, int) or places < 0:
+                raise ValueError(f"Invalid decimal places for {name}: {places}")
+
+        self.stream = stream
+        self.decimals = decimals
+        self.trim_leading_zero = trim_leading_zero
+        self.batch_size = batch_size
+        self.keep_text = keep_text
+
+        self._lines: List[str] = []
+        # The format spec of each field's floats, e.g ".3f".
+        self._specs: Dict[str, str] = {}
+
+    def format_command(self, command: Any) -> str:
+        """
+        Format a command as G-code.
+
+        Args:
+            command (Any): A GcodeCommand, ThumbnailCommand or PrusaSlicerConfigCommand.
+
+        Returns:
+            str: The G-code, ending with a newline. Thumbnails and configs are
+                 several lines.
+
+        Raises:
+            TypeError: If the command, or one of its field values, is an unsupported type.
+            ValueError: If a string can't be written in G-code, e.g it has a newline.
+        """
+        if isinstance(command, GcodeCommand):
+            return self._format_gcode(command)
+        if isinstance(command, ThumbnailCommand):
+            return format_thumbnail(
+                command.format, command.width, command.height, command.content
+            )
+        if isinstance(command, PrusaSlicerConfigCommand):
+            return _format_config(command)
+        raise TypeError(f"Unsupported command type: {type(command)}")
+
+    def write(self, command: Any):
+        """
+        Write a command. It's buffered until the batch is full, or flush() is called.
+
+        Args:
+            command (Any): See format_command().
+        """
+        self._lines.append(self.format_command(command))
+        if len(self._lines) >= self.batch_size:
+            self.flush()
+
+    def write_commands(self, commands: Iterable[Any]):
+        """
+        Write commands, and flush them.
+
+        Args:
+            commands (Iterable[Any]): The commands, e.g from GCodeParser.parse_stream().
+        """
+        lines = self._lines
+        format_gcode = self._format_gcode
+        batch_size = self.batch_size
+        for command in commands:
+            if type(command) is GcodeCommand:
+                lines.append(format_gcode(command))
+            else:
+                lines.append(self.format_command(command))
+            if len(lines) >= batch_size:
+                self.flush()
+        self.flush()
+
+    def flush(self):
+        """Write the buffered lines to the stream."""
+        if self._lines:
+            self.stream.write("".join(self._lines).encode("utf-8"))
+            self._lines.clear()
+
+    def _format_gcode(self, command: GcodeCommand) -> str:
+        if self.keep_text and command.text is not None:
+            return command.text + "\n"
+        parts = [command.command] if command.command else []
+        specs = self._specs
+        trim_leading_zero = self.trim_leading_zero
+        for key, value in command.fields.items():
+            value_type = type(value)
+            if value_type is float:
+                spec = specs.get(key)
+                if spec is None:
+                    places = self.decimals.get(key, DEFAULT_FIELD_DECIMALS)
+                    spec = specs[key] = f".{places}f"
+                text = format(value, spec)
+                if "." in text:
+                    text = text.rstrip("0").rstrip(".")
+                if text == "-0":
+                    text = "0"
+                elif trim_leading_zero:
+                    if text.startswith("0."):
+                        text = text[1:]
+                    elif text.startswith("-0."):
+                        text = "-" + text[2:]
+                parts.append(key + text)
+            elif value_type is int:
+                parts.append(f"{key}{value}")
+            elif value_type is bool:
+                # A flag is just its letter, and a false flag is left out.
+                if value:
+                    parts.append(key)
+            elif value_type is str:
+                if '"' in value or "\n" in value or "\r" in value:
+                    raise ValueError(f"Can't write string field {key}: {value!r}")
+                parts.append(f'{key}"{value}"')
+            else:
+                raise TypeError(f"Unsupported field type: {type(value)} for key: {key}")
+
+        if command.line_number is not None:
+            # The checksum is of the line as it's written.
+            parts = [number_line(command.line_number, " ".join(parts))]
+        comment = command.comment
+        if comment is not None:
+            if "\n" in comment or "\r" in comment:
+                raise ValueError(f"Can't write comment: {comment!r}")
+            parts.append(";" + comment)
+        return " ".join(parts) + "\n"
+
+
+def write_commands(commands: Iterable[Any], stream: BinaryIO, **kwargs):
+    """
+    Write commands to a binary stream as G-code.
+
+    Args:
+        commands (Iterable[Any]): The commands, e.g from GCodeParser.parse_stream().
+        stream (BinaryIO): A binary stream to write to.
+        **kwargs: GCodeWriter options, such as decimals.
+    """
+    GCodeWriter(stream, **kwargs).write_commands(commands)
+
+
+def format_thumbnail(format: str, width: int, height: int, data: bytes) -> str:
+    """
+    Format a thumbnail as PrusaSlicer's comments, e.g "; thumbnail_QOI begin ...".
+
+    Args:
+        format (str): The image format, e.g "PNG" or "QOI".
+        width (int): The width of the image, in pixels.
+        height (int): The height of the image, in pixels.
+        data (bytes): The encoded image.
+
+    Returns:
+        str: The comment lines, each ending with a newline.
+    """
+    format = format.upper()
+    tag = "thumbnail" if format == "PNG" else f"thumbnail_{format}"
+    encoded = base64.b64encode(data).decode("ascii")
+    lines = "".join(
+        f"; {encoded[start : start + _THUMBNAIL_LINE_LENGTH]}\n"
+        for start in range(0, len(encoded), _THUMBNAIL_LINE_LENGTH)
+    )
+    return f"; {tag} begin {width}x{height} {len(encoded)}\n" f"{lines}; {tag} end\n"
+
+
+def _format_config(command: PrusaSlicerConfigCommand) -> str:
+    """Format a config as PrusaSlicer's prusaslicer_config block."""
+    # Empty values are written as PrusaSlicer does, as "; key =".
+    lines = "".join(
+        f"; {key} = {value}\n" if value else f"; {key} =\n"
+        for key, value in command.config.items()
+    )
+    return f"; prusaslicer_config = begin\n{lines}; prusaslicer_config = end\n"
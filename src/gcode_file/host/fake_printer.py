@@ -0,0 +1,190 @@
+"""A fake Marlin-style printer, to test and benchmark streaming G-code to.
+
+It runs in a thread, on one end of a socket pair, and replies to lines as
+Marlin does: it checks their line numbers and checksums, asks for them again
+when they're wrong, queues them, and replies "ok" as each is run. It unpacks
+MeatPacked lines too.
+"""
+
+import select
+import socket
+import threading
+import time
+from collections import deque
+from typing import Deque, Iterable, List, Optional, Tuple
+
+from gcode_file.bgcode.meatpack import MeatUnpacker
+from gcode_file.gcode.checksum import checksum
+from gcode_file.host.sender import SocketTransport
+
+
+class FakePrinter:
+    """
+    A fake printer, that runs the lines it receives.
+
+    Attributes:
+        commands (List[str]): The lines run, without their line numbers and
+                              checksums, in order.
+        errors (List[str]): The errors sent, in order.
+        transport (SocketTransport, optional): The connection to the printer,
+                                              once it's started.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = 4,
+        command_time: float = 0.0,
+        latency: float = 0.0,
+        corrupt: Iterable[int] = (),
+    ):
+        """
+        Initialize the FakePrinter.
+
+        Args:
+            queue_size (int, optional): The most lines queued to run. Further
+                lines wait in the receive buffer, as in Marlin.
+            command_time (float, optional): The seconds each line takes to run.
+            latency (float, optional): The seconds before each reply is sent,
+                as the round trip of a USB serial port.
+            corrupt (Iterable[int], optional): Line numbers to receive
+                corrupted, the first time they're sent.
+
+        Raises:
+            ValueError: If the queue size is not positive.
+        """
+        if queue_size < 1:
+            raise ValueError(f"queue_size must be positive, not {queue_size}")
+        self.queue_size = queue_size
+        self.command_time = command_time
+        self.latency = latency
+        self.corrupt = set(corrupt)
+        self.commands: List[str] = []
+        self.errors: List[str] = []
+        self.transport: Optional[SocketTransport] = None
+        self._socket: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._last_number = 0
+
+    def start(self) -> SocketTransport:
+        """
+        Starts the printer.
+
+        Returns:
+            SocketTransport: The connection to the printer.
+        """
+        host, self._socket = socket.socketpair()
+        self.transport = SocketTransport(host)
+        self._last_number = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self.transport
+
+    def stop(self):
+        """Stops the printer, once it has run the lines it has received."""
+        if self._thread is None:
+            return
+        self.transport.socket.shutdown(socket.SHUT_WR)
+        self._thread.join()
+        self._thread = None
+        self.transport.close()
+        self._socket.close()
+
+    def __enter__(self) -> "FakePrinter":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _run(self):
+        sock = self._socket
+        unpacker: Optional[MeatUnpacker] = None
+        # The text received but not yet read into the queue.
+        received = bytearray()
+        queue: Deque[str] = deque()
+        # The time the first queued line is done running.
+        done_at = None
+        # The replies to send, and when to send them.
+        replies: Deque[Tuple[float, bytes]] = deque()
+        closed = False
+
+        while not closed or queue or replies or b"\n" in received:
+            now = time.monotonic()
+            while len(queue) < self.queue_size:
+                end = received.find(b"\n")
+                if end < 0:
+                    break
+                line = received[:end].decode("utf-8", "replace").strip()
+                del received[: end + 1]
+                error = self._receive(line, queue)
+                if error is not None:
+                    # Each line received after it is then out of order, so
+                    # asks for this line again too.
+                    self.errors.append(error)
+                    last = self._last_number
+                    replies.append(
+                        (now, f"Error:{error}, Last Line: {last}\n".encode("utf-8"))
+                    )
+                    replies.append((now, f"Resend: {last + 1}\nok\n".encode("utf-8")))
+
+            if queue and done_at is None:
+                done_at = now + self.command_time
+            if done_at is not None and now >= done_at:
+                self.commands.append(queue.popleft())
+                replies.append((now + self.latency, b"ok\n"))
+                done_at = None
+                continue
+            while replies and replies[0][0] <= now:
+                sock.sendall(replies.popleft()[1])
+
+            # Wait for the next line, reply, or line to finish running.
+            deadlines = [] if done_at is None else [done_at]
+            if replies:
+                deadlines.append(replies[0][0])
+            timeout = max(0.0, min(deadlines) - now) if deadlines else None
+            if closed:
+                if timeout:
+                    time.sleep(timeout)
+                continue
+            if not select.select([sock], [], [], timeout)[0]:
+                continue
+            data = sock.recv(65536)
+            if not data:
+                closed = True
+                continue
+            if unpacker is None and b"\xff" in data:
+                unpacker = MeatUnpacker()
+            received += data if unpacker is None else unpacker.decompress(data)
+
+    def _receive(self, line: str, queue: Deque[str]) -> Optional[str]:
+        """Checks a received line, and queues it, or returns the error."""
+        if not line:
+            return None
+        star = line.rfind("*")
+        if not line.startswith("N"):
+            if star >= 0:
+                return "No Line Number with checksum"
+            queue.append(line)
+            return None
+        if star < 0:
+            return "No Checksum with line number"
+
+        number_end = 1
+        while number_end < len(line) and line[number_end].isdigit():
+            number_end += 1
+        number = int(line[1:number_end] or -1)
+        command = line[number_end:star].strip()
+        is_reset = command.startswith("M110")
+        if number != self._last_number + 1 and not is_reset:
+            return "Line Number is not Last Line Number+1"
+        if number in self.corrupt:
+            self.corrupt.discard(number)
+            return "checksum mismatch"
+        if not line[star + 1 :].isdigit() or int(line[star + 1 :]) != checksum(
+            line[:star]
+        ):
+            return "checksum mismatch"
+
+        self._last_number = number
+        queue.append(command)
+        return None
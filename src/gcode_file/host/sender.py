@@ -0,0 +1,480 @@
+"""Stream G-code to a printer, as a host such as OctoPrint does.
+
+Each line is sent with a line number and checksum (see number_line()), and
+Marlin-style firmware replies "ok" once it has run the line. Waiting for the
+"ok" before sending the next line leaves the printer idle for a round trip
+per line, which limits the speed of short moves. Instead, up to a window of
+lines are sent before their "ok"s, so the firmware's command queue stays
+full.
+
+When the firmware receives a corrupted line, it replies::
+
+    Error:checksum mismatch, Last Line: 122
+    Resend: 123
+    ok
+
+and drops the lines after it. The sender goes back, and sends them all again
+from line 123. Each of those dropped lines that the firmware had already
+received asks for line 123 again, so these repeated requests are ignored,
+until one of the lines sent again has been acknowledged.
+
+Lines can also be MeatPacked (see MeatPacker), which firmware with MeatPack
+support unpacks. Spaces are left out, so "E" can be packed too, and the
+checksum is of the line without them, as the firmware unpacks it.
+
+FakePrinter is a printer to send to, for tests and benchmarks::
+
+    with FakePrinter() as printer:
+        stats = Sender(printer.transport).send(commands)
+"""
+
+import select
+import socket
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from gcode_file.bgcode.meatpack import MeatPacker
+from gcode_file.gcode.checksum import checksum, number_line
+from gcode_file.gcode.command import GcodeCommand
+from gcode_file.gcode.writer import GCodeWriter
+
+# Marlin's command queue holds 4 lines (BUFSIZE).
+DEFAULT_WINDOW = 4
+# Marlin's serial receive buffer is 128 bytes (RX_BUFFER_SIZE).
+DEFAULT_BUFFER_SIZE = 128
+# Marlin reports it's busy every 2 seconds, while a command takes longer.
+DEFAULT_TIMEOUT = 10.0
+
+# The most times in a row a line is sent again, before giving up.
+MAX_RESENDS = 10
+
+# The errors that ask for lines to be sent again, rather than stopping.
+_RESEND_ERRORS = ("checksum", "line number", "last line")
+
+# The commands with text whose spaces matter, e.g the message of M117, or the
+# file name of M23.
+_TEXT_COMMANDS = ("M23", "M28", "M30", "M32", "M117", "M118", "M486")
+
+# Removes the spaces that MeatPack leaves out.
+_NO_SPACES = str.maketrans("", "", " \t")
+
+
+class Transport:
+    """A connection to a printer, that sends and receives bytes."""
+
+    def write(self, data: bytes):
+        """Sends bytes to the printer."""
+        raise NotImplementedError("This method should be implemented by subclasses.")
+
+    def readline(self, timeout: Optional[float]) -> Optional[bytes]:
+        """
+        Receives a line from the printer.
+
+        Args:
+            timeout (float, optional): The seconds to wait, or None to wait forever.
+
+        Returns:
+            bytes: The line, with its line end, or None if none was received in time.
+
+        Raises:
+            ConnectionError: If the connection was closed.
+        """
+        raise NotImplementedError("This method should be implemented by subclasses.")
+
+    def close(self):
+        """Closes the connection."""
+
+
+class SocketTransport(Transport):
+    """A transport over a socket, such as one end of a socket pair."""
+
+    def __init__(self, sock: socket.socket):
+        self.socket = sock
+        self._buffer = bytearray()
+
+    def write(self, data: bytes):
+        self.socket.sendall(data)
+
+    def readline(self, timeout: Optional[float]) -> Optional[bytes]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            end = self._buffer.find(b"\n")
+            if end >= 0:
+                line = bytes(self._buffer[: end + 1])
+                del self._buffer[: end + 1]
+                return line
+
+            remaining = None
+            if deadline is not None:
+                remaining = max(0.0, deadline - time.monotonic())
+            if not select.select([self.socket], [], [], remaining)[0]:
+                return None
+            data = self.socket.recv(65536)
+            if not data:
+                raise ConnectionError("The printer closed the connection")
+            self._buffer += data
+
+    def close(self):
+        self.socket.close()
+
+
+class SerialTransport(Transport):
+    """
+    A transport over a serial port, e.g a pyserial Serial. Anything with
+    write() and readline() methods, and a timeout attribute, will do.
+    """
+
+    def __init__(self, port: Any):
+        self.port = port
+        self._partial = b""
+
+    def write(self, data: bytes):
+        self.port.write(data)
+
+    def readline(self, timeout: Optional[float]) -> Optional[bytes]:
+        self.port.timeout = timeout
+        line = self._partial + self.port.readline()
+        if not line.endswith(b"\n"):
+            # Timed out part way through a line.
+            self._partial = line
+            return None
+        self._partial = b""
+        return line
+
+    def close(self):
+        self.port.close()
+
+
+@dataclass
+class SendStats:
+    """
+    Statistics about streaming G-code to a printer.
+
+    Attributes:
+        lines (int): The number of lines sent, not counting lines sent again.
+        bytes_sent (int): The number of bytes sent, including lines sent again.
+        resends (int): The number of times the printer asked for lines again.
+        errors (List[str]): The errors the printer reported.
+        seconds (float): How long it took, until the last line was acknowledged.
+    """
+
+    lines: int = 0
+    bytes_sent: int = 0
+    resends: int = 0
+    errors: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def lines_per_second(self) -> float:
+        return self.lines / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.lines} lines, {self.bytes_sent} bytes in {self.seconds:.2f}s "
+            f"({self.lines_per_second:.0f} lines/s), {self.resends} resends"
+        )
+
+
+class Sender:
+    """
+    Streams commands to a printer, with line numbers, checksums, and a window
+    of lines sent before they are acknowledged.
+
+    Attributes:
+        transport (Transport): The connection to the printer.
+        window (int): The most lines sent but not yet acknowledged.
+        buffer_size (int, optional): The most bytes sent but not yet acknowledged.
+        timeout (float): The seconds to wait for a reply from the printer.
+    """
+
+    def __init__(
+        self,
+        transport: Transport,
+        window: int = DEFAULT_WINDOW,
+        buffer_size: Optional[int] = DEFAULT_BUFFER_SIZE,
+        timeout: float = DEFAULT_TIMEOUT,
+        meatpack: bool = False,
+    ):
+        """
+        Initialize the Sender.
+
+        Args:
+            transport (Transport): The connection to the printer.
+            window (int, optional): The most lines sent but not yet
+                acknowledged. 1 waits for the "ok" of each line before sending
+                the next.
+            buffer_size (int, optional): The most bytes sent but not yet
+                acknowledged, so the printer's receive buffer doesn't overflow.
+                A longer line is still sent, once the others are acknowledged.
+                None for no limit.
+            timeout (float, optional): The seconds to wait for a reply from the
+                printer, while lines are not yet acknowledged.
+            meatpack (bool, optional): Whether to MeatPack the lines.
+
+        Raises:
+            ValueError: If the window, buffer size or timeout is not positive.
+        """
+        if window < 1:
+            raise ValueError(f"window must be positive, not {window}")
+        if buffer_size is not None and buffer_size < 1:
+            raise ValueError(f"buffer_size must be positive, not {buffer_size}")
+        if timeout <= 0:
+            raise ValueError(f"timeout must be positive, not {timeout}")
+
+        self.transport = transport
+        self.window = window
+        self.buffer_size = buffer_size
+        self.timeout = timeout
+        # Letters aren't made upper case, which would change the checksum.
+        self._packer = (
+            MeatPacker(omit_spaces=True, uppercase=False) if meatpack else None
+        )
+        self._writer = GCodeWriter(None)
+
+    def send(self, commands: Iterable[Any]) -> SendStats:
+        """
+        Streams commands to the printer, and waits for them all to be acknowledged.
+
+        The line numbers are reset with M110 first, and any line numbers the
+        commands had are replaced. Comments, and anything
+        that isn't a GcodeCommand such as a thumbnail, are not sent.
+
+        Args:
+            commands (Iterable[Any]): The commands, e.g from GCodeParser.parse_stream().
+
+        Returns:
+            SendStats: Statistics about sending the commands.
+
+        Raises:
+            TimeoutError: If the printer doesn't reply in time.
+            RuntimeError: If the printer reports an error, other than a
+                          corrupted line, or a line is corrupted too many times.
+        """
+        return _Stream(self, commands).run()
+
+    def _lines(self, commands: Iterable[Any]) -> Iterator[str]:
+        """The text of each command to send, without comments."""
+        format_command = self._writer.format_command
+        for command in commands:
+            if not isinstance(command, GcodeCommand) or not command.command:
+                continue
+            if command.text is not None:
+                # As it was read, as the fields don't keep everything, e.g the
+                # message of M117.
+                yield command.text.split(";", 1)[0].rstrip()
+                continue
+            if command.comment is not None or command.line_number is not None:
+                # The lines are numbered as they're sent.
+                command = GcodeCommand(command.command, command.fields)
+            yield format_command(command)[:-1]
+
+    def _encode(self, number: int, line: str) -> bytes:
+        """A line as it is sent, numbered and maybe packed."""
+        if self._packer is None:
+            return (number_line(number, line) + "\n").encode("utf-8")
+        if '"' in line or line.partition(" ")[0] in _TEXT_COMMANDS:
+            # Spaces are omitted from packed lines, so lines with strings or
+            # text, which need theirs, are sent unpacked.
+            return self._packer.unpacked(number_line(number, line) + "\n")
+        # The checksum is of the line the firmware unpacks, without spaces.
+        numbered = f"N{number}{line.translate(_NO_SPACES)}"
+        return self._packer.pack(f"{numbered}*{checksum(numbered)}\n")
+
+
+class _Stream:
+    """The state of sending one stream of commands."""
+
+    def __init__(self, sender: Sender, commands: Iterable[Any]):
+        self.sender = sender
+        self.stats = SendStats()
+        self._lines = sender._lines(commands)
+        # The encoded lines that aren't yet acknowledged, by line number.
+        self._history: Dict[int, bytes] = {}
+        # The lines sent but not yet acknowledged, in order, and their size.
+        self._in_flight: Deque[int] = deque()
+        self._in_flight_bytes = 0
+        # The lines to send (again) before any new lines.
+        self._pending: Deque[int] = deque()
+        self._last_number = -1
+        # The "ok"s that follow requests to resend, which acknowledge nothing.
+        self._extra_oks = 0
+        # The line last gone back to, and how many more requests for it to ignore.
+        self._resend_from = -1
+        self._ignore_resends = 0
+        self._tries = 0
+
+    def run(self) -> SendStats:
+        sender = self.sender
+        transport = sender.transport
+        start = time.perf_counter()
+        if sender._packer is not None:
+            transport.write(sender._packer.start())
+        self._add_line("M110 N0")
+        lines = self._lines
+
+        while True:
+            if not self._pending and lines is not None:
+                line = next(lines, None)
+                if line is None:
+                    lines = None
+                else:
+                    self._add_line(line)
+                    self.stats.lines += 1
+            if not self._pending:
+                if not self._in_flight:
+                    break
+                self._read_reply()
+                continue
+
+            number = self._pending[0]
+            data = self._history[number]
+            if self._can_send(len(data)):
+                self._pending.popleft()
+                transport.write(data)
+                self._in_flight.append(number)
+                self._in_flight_bytes += len(data)
+                self.stats.bytes_sent += len(data)
+            else:
+                self._read_reply()
+
+        if sender._packer is not None:
+            transport.write(sender._packer.end())
+        self.stats.seconds = time.perf_counter() - start
+        return self.stats
+
+    def _add_line(self, line: str):
+        self._last_number += 1
+        number = self._last_number
+        self._history[number] = self.sender._encode(number, line)
+        self._pending.append(number)
+
+    def _can_send(self, size: int) -> bool:
+        if not self._in_flight:
+            return True
+        if len(self._in_flight) >= self.sender.window:
+            return False
+        buffer_size = self.sender.buffer_size
+        return buffer_size is None or self._in_flight_bytes + size <= buffer_size
+
+    def _read_reply(self):
+        reply = self.sender.transport.readline(self.sender.timeout)
+        if reply is None:
+            raise TimeoutError(
+                f"The printer didn't reply for {self.sender.timeout}s, "
+                f"with {len(self._in_flight)} lines not acknowledged"
+            )
+        text = reply.decode("utf-8", "replace").strip()
+
+        if text.startswith("ok"):
+            if self._extra_oks:
+                self._extra_oks -= 1
+            elif self._in_flight:
+                self._acknowledge()
+        elif text.startswith("Resend:") or text.startswith("rs "):
+            self._extra_oks += 1
+            self._resend(int(text.split(":" if ":" in text else " ", 1)[1].strip()))
+        elif text.startswith("Error:"):
+            self.stats.errors.append(text)
+            if not any(error in text.lower() for error in _RESEND_ERRORS):
+                raise RuntimeError(f"The printer reported an error: {text}")
+        # Anything else, such as "echo:busy: processing" or temperatures, is
+        # only information.
+
+    def _acknowledge(self):
+        number = self._in_flight.popleft()
+        self._in_flight_bytes -= len(self._history[number])
+        del self._history[number]
+        if number >= self._resend_from:
+            # The printer has the line it asked for, so any later request for
+            # it is new.
+            self._ignore_resends = 0
+
+    def _resend(self, number: int):
+        if number == self._resend_from and self._ignore_resends:
+            # Another line dropped after the one that was corrupted.
+            self._ignore_resends -= 1
+            return
+        if number not in self._history:
+            raise RuntimeError(
+                f"The printer asked for line {number} again, which isn't "
+                "waiting to be acknowledged"
+            )
+
+        self._tries = self._tries + 1 if number == self._resend_from else 1
+        if self._tries > MAX_RESENDS:
+            raise RuntimeError(
+                f"The printer asked for line {number} again {self._tries} times"
+            )
+
+        # Every line from the number on was dropped, and is sent again.
+        dropped = sum(1 for sent in self._in_flight if sent >= number)
+        while self._in_flight and self._in_flight[-1] >= number:
+            self._in_flight_bytes -= len(self._history[self._in_flight.pop()])
+        self._pending = deque(range(number, self._last_number + 1))
+        self._resend_from = number
+        self._ignore_resends = max(0, dropped - 1)
+        self.stats.resends += 1
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    """
+    Streams a G-code or bgcode file to a printer on a serial port, or to a
+    fake printer to measure how fast it's sent.
+    """
+    import argparse
+    import sys
+
+    from gcode_file.file import open_file
+    from gcode_file.host.fake_printer import FakePrinter
+
+    parser = argparse.ArgumentParser(description="Stream G-code to a printer")
+    parser.add_argument("input", help="The file to print")
+    parser.add_argument(
+        "--port", help="The printer's serial port (needs pyserial), or a fake printer"
+    )
+    parser.add_argument("--baud", type=int, default=115200, help="The baud rate")
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=DEFAULT_WINDOW,
+        help="The most lines sent before they are acknowledged",
+    )
+    parser.add_argument("--meatpack", action="store_true", help="MeatPack the lines")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="The fake printer's reply latency, in seconds",
+    )
+    args = parser.parse_args(argv)
+
+    printer = None
+    if args.port:
+        try:
+            import serial  # type: ignore
+        except ImportError:
+            print("Error: Sending to a serial port needs pyserial", file=sys.stderr)
+            sys.exit(1)
+        transport: Transport = SerialTransport(serial.Serial(args.port, args.baud))
+    else:
+        printer = FakePrinter(latency=args.latency)
+        transport = printer.start()
+
+    try:
+        with open_file(args.input, strict_mode=False) as file:
+            sender = Sender(transport, window=args.window, meatpack=args.meatpack)
+            print(sender.send(file.commands))
+    except (ValueError, RuntimeError, TimeoutError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if printer is not None:
+            printer.stop()
+        else:
+            transport.close()
+
+
+if __name__ == "__main__":
+    main()
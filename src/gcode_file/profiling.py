@@ -0,0 +1,130 @@
+"""Time spent in each stage of reading a file, to find which is slow.
+
+Parsing a bgcode file goes through several stages, each of which can be the
+slow one for a given file:
+
+- read: reading the blocks' bytes from the stream.
+- decompress: inflating Deflate or Heatshrink blocks.
+- meatpack: unpacking MeatPacked G-code.
+- decode: decoding the G-code from UTF-8.
+- tokenize: splitting lines into commands and fields.
+- validate: checking the commands against the validator's rules.
+- special_blocks: the comment handlers, for thumbnails and configs.
+
+Profiling is opt-in. Pass a ParseStats to the parsers (and to MeatUnpacker or
+GCodeValidator, when using them directly), and it adds up the time, bytes and
+lines of every stage::
+
+    stats = ParseStats(callback=exporter.export)
+    parser = BasicBGCodeParser(stats=stats)
+    gcode_parser = GCodeParser(stats=stats)
+    for block in parser.parse_stream(stream):
+        if block.type == BlockType.GCODE:
+            for command in block.commands(gcode_parser):
+                ...
+    print(stats)
+
+The counters are updated as the stages run, and the callback is called with
+the ParseStats each time a stream or block has been parsed, for example to
+export them as metrics.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+
+@dataclass
+class StageStats:
+    """
+    The time spent in a stage, and how much it processed.
+
+    Attributes:
+        name (str): The name of the stage.
+        seconds (float): The time spent in the stage.
+        bytes (int): The number of bytes the stage was given.
+        lines (int): The number of lines the stage was given.
+    """
+
+    name: str
+    seconds: float = 0.0
+    bytes: int = 0
+    lines: int = 0
+
+    def add(self, seconds: float, bytes: int = 0, lines: int = 0):
+        """Adds the time and counts of one run of the stage."""
+        self.seconds += seconds
+        self.bytes += bytes
+        self.lines += lines
+
+
+class ParseStats:
+    """
+    The time spent in each stage of parsing, added up over everything parsed
+    with it.
+
+    Attributes:
+        read (StageStats): Reading blocks from the stream.
+        decompress (StageStats): Decompressing blocks.
+        meatpack (StageStats): Unpacking MeatPacked G-code.
+        decode (StageStats): Decoding G-code from UTF-8.
+        tokenize (StageStats): Parsing lines into commands.
+        validate (StageStats): Validating commands.
+        special_blocks (StageStats): Handling special comment blocks.
+        callback (callable, optional): Called with these stats when a stream
+                                       or block has been parsed.
+    """
+
+    def __init__(self, callback: Optional[Callable[["ParseStats"], None]] = None):
+        """
+        Initialize the ParseStats.
+
+        Args:
+            callback (callable, optional): Called with these stats each time a
+                stream or block has been parsed, e.g to export them as metrics.
+        """
+        self.callback = callback
+        self.reset()
+
+    def reset(self):
+        """Sets every stage's time and counts back to zero."""
+        self.read = StageStats("read")
+        self.decompress = StageStats("decompress")
+        self.meatpack = StageStats("meatpack")
+        self.decode = StageStats("decode")
+        self.tokenize = StageStats("tokenize")
+        self.validate = StageStats("validate")
+        self.special_blocks = StageStats("special_blocks")
+
+    @property
+    def stages(self) -> List[StageStats]:
+        """Every stage, in the order they run."""
+        return [
+            self.read,
+            self.decompress,
+            self.meatpack,
+            self.decode,
+            self.tokenize,
+            self.validate,
+            self.special_blocks,
+        ]
+
+    @property
+    def seconds(self) -> float:
+        """The time spent in all the stages."""
+        return sum(stage.seconds for stage in self.stages)
+
+    def report(self):
+        """Calls the callback, if any, with these stats."""
+        if self.callback is not None:
+            self.callback(self)
+
+    def __str__(self) -> str:
+        total = self.seconds
+        lines = [f"{'stage':<15} {'seconds':>9} {'%':>5} {'bytes':>12} {'lines':>10}"]
+        for stage in self.stages:
+            share = 100 * stage.seconds / total if total else 0.0
+            lines.append(
+                f"{stage.name:<15} {stage.seconds:>9.3f} {share:>5.1f} "
+                f"{stage.bytes:>12} {stage.lines:>10}"
+            )
+        return "\n".join(lines)
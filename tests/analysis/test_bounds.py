@@ -0,0 +1,236 @@
+import io
+import math
+import os
+import numpy as np
+import pytest  # type: ignore
+from gcode_file import BasicGCodeParser
+from gcode_file.analysis.bounds import (
+    PrintVolume,
+    check_bounds_columns,
+    check_bounds_lines,
+)
+from gcode_file.file import BGcodeFile, GcodeFile
+from gcode_file.gcode.state import CommandColumns
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+VOLUME = PrintVolume([(0, 0), (250, 0), (250, 210), (0, 210)], 220)
+
+
+def check(gcode: str, volume: PrintVolume = VOLUME, **kwargs):
+    return check_bounds_lines(io.StringIO(gcode), volume, **kwargs)
+
+
+def test_print_volume_from_settings():
+    volume = PrintVolume.from_settings(
+        {"bed_shape": "0x0,250x0,250x210,0x210", "max_print_height": "220"}
+    )
+    assert volume.bed_shape == [(0, 0), (250, 0), (250, 210), (0, 210)]
+    assert volume.max_height == 220
+
+    assert PrintVolume.from_settings({"bed_shape": "0x0,1x0,0x1"}).max_height == (
+        math.inf
+    )
+
+    for settings in ({}, {"bed_shape": "0x0,250x0"}, {"bed_shape": "0x0,ax1,2x2"}):
+        with pytest.raises(ValueError):
+            PrintVolume.from_settings(settings)
+
+
+def test_contains():
+    points = np.array([[0, 0, 0], [250, 210, 220], [125, 100, 221], [-1, 0, 1]])
+    assert VOLUME.contains(points).tolist() == [True, True, False, False]
+    assert VOLUME.contains_travel(points, 2).tolist() == [True, True, False, True]
+
+    # A round bed, as a polygon.
+    angles = np.radians(np.arange(0, 360, 10))
+    round_bed = PrintVolume(list(zip(100 * np.cos(angles), 100 * np.sin(angles))))
+    points = np.array([[0, 0, 0], [90, 0, 5], [80, 80, 5]])
+    assert round_bed.contains(points).tolist() == [True, True, False]
+
+
+def test_inside():
+    report = check("G28\nG1 Z0.2 F600\nG1 X10 Y10\nG1 X240 Y200 E5\nG1 Z10\n")
+    assert report.ok
+    assert report.extrusion.minimum == [10, 10, 0.2]
+    assert report.extrusion.maximum == [240, 200, 0.2]
+    assert report.travel.maximum == [240, 200, 10]
+    assert str(report.extrusion) == "X=10..240, Y=10..200, Z=0.2..0.2"
+
+
+def test_violation():
+    gcode = "G1 Z0.2\nG1 X10 Y10\n; comment\nG1 X260 E1 ; too far\nG1 X270 E2\n"
+    report = check(gcode)
+    assert not report.ok
+    assert report.violation.line == 4
+    assert report.violation.extruding
+    assert report.violation.position == (260, 10, 0.2)
+    assert "line 4" in str(report.violation)
+    # The extents include every move, not just those up to the violation.
+    assert report.extrusion.maximum[0] == 270
+
+
+def test_custom_ignored():
+    gcode = (
+        ";TYPE:Custom\n"
+        "G1 Y-4 Z0.2\n"
+        "G1 X60 E5\n"
+        "G1 X10 Y10\n"
+        ";TYPE:Perimeter\n"
+        "G1 X20 E6\n"
+    )
+    report = check(gcode)
+    assert report.ok
+    assert report.extrusion.minimum[1] == -4
+
+    assert check(gcode.replace("Custom", "Skirt")).violation.line == 2
+
+
+def test_travel_margin():
+    gcode = "G1 X-3 Y-3 Z5\n"
+    assert not check(gcode).ok
+    assert check(gcode, travel_margin=5).ok
+    # Extrusions have no margin.
+    assert not check("G1 X-3 Y-3 Z5 E1\n", travel_margin=5).ok
+    # Travel moves can't go above the maximum height either.
+    assert not check("G1 Z230\n", travel_margin=5).ok
+
+
+def test_arcs():
+    # The arc bulges past the edge of the bed, but both ends are on it.
+    gcode = "G1 X200 Y100 Z0.2\nG2 X240 Y100 I20 J0 E1\n"
+    assert check(gcode).ok
+    report = check(gcode.replace("X240", "X240 Y100").replace("I20", "I30"))
+    assert report.violation.line == 2
+    assert report.extrusion.maximum[0] > 250
+
+
+def test_modes():
+    gcode = (
+        "G1 X240 Y10 Z0.2\n"
+        "G91\n"
+        "G1 X5 E1\n"  # X245
+        "G90\n"
+        "M83\n"
+        "G1 X10 E1\n"  # Still extruding with relative E.
+        "G92 X0 E0\n"
+        "G1 X5 E1\n"  # X5 from the new origin.
+        "G92\n"
+        "G1 X-1 E-1\n"  # A retracting travel move.
+    )
+    report = check(gcode, travel_margin=2)
+    assert report.ok
+    assert report.extrusion.minimum == [0, 10, 0.2]
+    assert report.extrusion.maximum == [245, 10, 0.2]
+    assert report.travel.minimum[0] == -1
+
+    report = check(gcode.replace("G91\nG1 X5", "G91\nG1 X20"))
+    assert report.violation.line == 3
+    assert report.violation.position == (260, 10, 0.2)
+
+
+def test_meatpack_lines():
+    # MeatPacked G-code has no spaces, and numbers without a leading zero.
+    report = check("G1Z.2\nG1X10Y20E.5\nG1X-.5Y20E1\nG1 X 20 Y 30 E1.5\n")
+    assert report.violation.line == 3
+    assert report.violation.position == (-0.5, 20, 0.2)
+    assert report.extrusion.maximum == [20, 30, 0.2]
+
+
+def test_ignored_commands():
+    # Commands that aren't moves, and comments, don't affect the position.
+    gcode = (
+        "M104 S215 X500\n"
+        "G10 X500\n"
+        "G1.5 X500\n"
+        "G1 X10 Y10 Z0.2 ; G1 X500\n"
+        "  G1 X20 E1\n"
+        "M117 G1 X500\n"
+    )
+    report = check(gcode)
+    assert report.ok
+    assert report.extrusion.maximum == [20, 10, 0.2]
+
+
+def test_line_numbers():
+    # The command follows the line number, and the checksum isn't a field.
+    gcode = "N1 G1 X10 Y10 Z0.2*40\nN2G1X20E1*99\nN3 M104 S215 X500*12\nN4 G1 X260*7\n"
+    report = check(gcode)
+    assert report.violation.line == 4
+    assert report.violation.position == (260, 10, 0.2)
+    assert report.extrusion.maximum == [20, 10, 0.2]
+
+
+def test_lines_without_newlines():
+    lines = "G1 X10 Y10 Z0.2\nG1 X260 E1\n".splitlines()
+    assert check_bounds_lines(lines, VOLUME).violation.line == 2
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 1000])
+def test_chunks(chunk_size):
+    gcode = (
+        "G1 X10 Y10 Z0.2\n"
+        ";TYPE:Custom\n"
+        "G91\n"
+        "G1 Y-20\n"
+        "M83\n"
+        "G1 Y20 E1\n"
+        ";TYPE:Perimeter\n"
+        "G90\n"
+        "M83\n"
+        "G1 X100 E1\n"
+        "G1 X300 E1\n"
+    )
+    report = check(gcode, chunk_size=chunk_size)
+    assert report.extrusion.minimum == [10, -10, 0.2]
+    assert report.extrusion.maximum == [300, 10, 0.2]
+    assert report.violation.line == 11
+
+
+def test_columns():
+    gcode = "G1 Z0.2\nM106\nG1 X10 Y10\nG1 X260 E1\n"
+    commands = BasicGCodeParser().parse_stream(io.StringIO(gcode))
+    columns = CommandColumns.from_commands(commands)
+
+    report = check_bounds_columns(columns, VOLUME)
+    assert report.violation.index == 3
+    assert report.violation.line is None
+    assert "command 3" in str(report.violation)
+    assert report.extrusion.maximum == [260, 10, 0.2]
+
+    ignored = np.array([False, False, False, True])
+    assert check_bounds_columns(columns, VOLUME, ignored=ignored).ok
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "lines_0.4n_0.2mm_PETG_XLIS_57s.gcode",
+        "lines_0.4n_0.2mm_PETG_XLIS_57s.bgcode",
+        "BenchyRules_PLA_14m.bgcode",
+    ],
+)
+def test_files(fixtures_dir, name):
+    path = os.path.join(fixtures_dir, name)
+    if name.endswith(".bgcode"):
+        file = BGcodeFile(path, strict_mode=False)
+    else:
+        file = GcodeFile(path)
+
+    with file:
+        report = file.check_bounds()
+        # The same extents as when the commands are parsed.
+        columns = CommandColumns.from_commands(file.commands)
+        volume = PrintVolume.from_settings(file.slicer_settings)
+
+    assert report.ok
+    expected = check_bounds_columns(columns, volume)
+    assert report.extrusion == expected.extrusion
+    assert report.travel == expected.travel
+    # The purge line is in front of the bed.
+    assert report.extrusion.minimum[1] < 0
@@ -0,0 +1,138 @@
+import io
+import os
+import pytest  # type: ignore
+from gcode_file import CompressionType, GCodeEncoding, gcode_to_bgcode
+from gcode_file.analysis.diff import diff_files, diff_gcode, diff_settings, main
+from gcode_file.file import open_file, open_stream
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+LINES = "lines_0.4n_0.2mm_PETG_XLIS_57s"
+
+START = "M104 S215\nG28\n"
+
+
+def layer(z: float, x: int) -> str:
+    return f";LAYER_CHANGE\n;Z:{z}\nG1 Z{z}\nG1 X{x} Y0 E1\nG1 X{x} Y10 E1\n"
+
+
+def gcode(*layers: str) -> bytes:
+    return (START + "".join(layers)).encode("utf-8")
+
+
+LAYERS = [layer(0.2, 1), layer(0.4, 2), layer(0.6, 3), layer(0.8, 4)]
+
+
+def test_identical():
+    # Comments, whitespace and progress reports are ignored.
+    new = gcode(*LAYERS).replace(b"G28", b"G28 ; home").replace(b"X2 ", b"X2  ")
+    new = new.replace(b"G1 Z0.6\n", b"G1 Z0.6\nM73 P50 R10\n\n")
+    result = diff_gcode(gcode(*LAYERS), new)
+    assert result.identical
+    assert (result.old_layers, result.new_layers) == (4, 4)
+    assert str(result) == "Layers: 4 -> 4\nNo differences"
+
+
+def test_changed_layer():
+    layers = list(LAYERS)
+    layers[2] = layers[2].replace("Y10", "Y11")
+    result = diff_gcode(gcode(*LAYERS), gcode(*layers), context=1)
+
+    assert not result.identical
+    assert [(change.old_layer, change.new_layer) for change in result.changed] == [
+        (2, 2)
+    ]
+    change = result.changed[0]
+    assert change.z == 0.6
+    assert change.lines == [
+        "--- layer 2",
+        "+++ layer 2",
+        "@@ -2,2 +2,2 @@",
+        " G1X3Y0E1",
+        "-G1X3Y10E1",
+        "+G1X3Y11E1",
+    ]
+    assert result.added == result.removed == result.moved == []
+    assert "Changed layer 2 at Z=0.6:" in str(result)
+
+    # The start G-code is compared too.
+    result = diff_gcode(gcode(*LAYERS), gcode(*LAYERS).replace(b"S215", b"S220"))
+    assert [change.new_layer for change in result.changed] == [-1]
+    assert "Changed start G-code:" in str(result)
+
+
+def test_added_removed_and_moved_layers():
+    extra = layer(1.0, 5)
+    result = diff_gcode(gcode(*LAYERS), gcode(*LAYERS[:2], extra, *LAYERS[2:]))
+    assert result.added == [2]
+    assert result.changed == result.removed == result.moved == []
+
+    result = diff_gcode(gcode(*LAYERS), gcode(*LAYERS[:3]))
+    assert result.removed == [3]
+    assert "Removed layer 3" in str(result)
+
+    # The same layer, in a different place.
+    result = diff_gcode(gcode(*LAYERS), gcode(LAYERS[3], *LAYERS[:3]))
+    assert result.moved == [(3, 0)]
+    assert result.changed == result.added == result.removed == []
+    assert "Moved layer 3 to 0" in str(result)
+
+
+def test_diff_settings():
+    old = {"layer_height": "0.2", "infill": "15%", "brim": "0"}
+    new = {"layer_height": "0.3", "infill": "15%", "seam": "rear"}
+    assert diff_settings(old, new) == {
+        "brim": ("0", None),
+        "layer_height": ("0.2", "0.3"),
+        "seam": (None, "rear"),
+    }
+
+
+def test_text_and_bgcode(fixtures_dir):
+    with open_file(os.path.join(fixtures_dir, LINES + ".gcode")) as old:
+        with open_file(os.path.join(fixtures_dir, LINES + ".bgcode")) as new:
+            result = diff_files(old, new)
+
+    # The G-code is the same, and only the output format setting differs.
+    assert result.changed == result.added == result.removed == result.moved == []
+    assert result.settings == {"binary_gcode": ("0", "1")}
+
+
+def test_bgcode_without_comments(fixtures_dir):
+    # MEATPACK removes the layer change comments, so the layers are found
+    # where Z increases, in both files.
+    path = os.path.join(fixtures_dir, "Apple Chancery.gcode")
+    bgcode = io.BytesIO()
+    with open(path, "rb") as f:
+        gcode_to_bgcode(
+            f,
+            bgcode,
+            gcode_compression=CompressionType.DEFLATE,
+            gcode_encoding=GCodeEncoding.MEATPACK,
+            processes=1,
+        )
+    bgcode.seek(0)
+
+    with open_file(path, strict_mode=False) as old:
+        with open_stream(bgcode, strict_mode=False) as new:
+            result = diff_files(old, new)
+    assert result.old_layers == result.new_layers > 1
+    assert result.changed == result.added == result.removed == result.moved == []
+
+
+def test_main(fixtures_dir, capsys):
+    path = os.path.join(fixtures_dir, LINES + ".bgcode")
+    with pytest.raises(SystemExit) as exit:
+        main([path, path])
+    assert exit.value.code == 0
+    assert "No differences" in capsys.readouterr().out
+
+    with pytest.raises(SystemExit) as exit:
+        main([path, os.path.join(fixtures_dir, LINES + ".gcode")])
+    assert exit.value.code == 1
+    assert "Setting binary_gcode: '1' -> '0'" in capsys.readouterr().out
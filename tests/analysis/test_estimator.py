@@ -0,0 +1,203 @@
+import io
+import math
+import os
+from dataclasses import replace
+import pytest  # type: ignore
+from gcode_file import BasicGCodeParser
+from gcode_file.analysis.estimator import (
+    MachineLimits,
+    estimate_print_time,
+    estimate_print_time_columns,
+    estimate_print_time_lines,
+    format_duration,
+    parse_duration,
+)
+from gcode_file.file import BGcodeFile, GcodeFile
+from gcode_file.gcode.state import CommandColumns
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+# Limits that make the expected times easy to calculate: every move starts and
+# ends at rest, and accelerates at 1000 mm/s^2.
+LIMITS = MachineLimits(
+    max_feedrate=(1000.0, 1000.0, 1000.0, 1000.0),
+    max_acceleration=(10000.0, 10000.0, 10000.0, 10000.0),
+    acceleration=1000.0,
+    retract_acceleration=1000.0,
+    travel_acceleration=1000.0,
+    junction_deviation=0.0,
+)
+
+
+def estimate(gcode: str, limits=LIMITS, **kwargs):
+    """Estimates the G-code from commands and from lines, and checks they agree."""
+    commands = list(BasicGCodeParser().parse_stream(io.StringIO(gcode)))
+    result = estimate_print_time(commands, limits, **kwargs)
+    assert estimate_print_time_lines(io.StringIO(gcode), limits, **kwargs) == result
+    return result
+
+
+def test_trapezoid():
+    # Accelerate to 100 mm/s over 5 mm (0.1s), cruise 90 mm (0.9s), decelerate (0.1s)
+    result = estimate("G1 X100 F6000\n")
+    assert result.seconds == pytest.approx(1.1)
+    assert result.segment_count == 1
+
+
+def test_triangle():
+    # Too short to reach 100 mm/s, so accelerate for 1mm and decelerate for 1mm.
+    result = estimate("G1 X2 F6000\n")
+    assert result.seconds == pytest.approx(2 * math.sqrt(2 / 1000))
+
+
+def test_straight_junction():
+    """Moves in the same direction don't slow down between them."""
+    assert estimate("G91\nG1 X50 F6000\nG1 X50\n").seconds == pytest.approx(1.1)
+
+
+def test_corner_junction():
+    """With zero junction deviation, the printer stops at every corner."""
+    result = estimate("G1 X100 F6000\nG1 Y100\n")
+    assert result.seconds == pytest.approx(2.2)
+
+
+def test_jerk_junction():
+    """Jerk allows the corner to be taken without stopping."""
+    limits = MachineLimits(
+        max_feedrate=LIMITS.max_feedrate,
+        max_acceleration=LIMITS.max_acceleration,
+        max_jerk=(10.0, 10.0, 10.0, 10.0),
+        acceleration=1000.0,
+        travel_acceleration=1000.0,
+    )
+    result = estimate("G1 X100 F6000\nG1 Y100\n", limits)
+    assert 1.1 < result.seconds < 2.2
+
+
+def test_modal_state():
+    gcode = """G90
+M83
+G1 X10 E1 F6000
+G92 X0
+G1 X10 E1
+G91
+G1 X-20 E1
+M82
+G1 E2
+G4 P500
+G4 S1
+"""
+    result = estimate(gcode)
+
+    # Two 10mm moves to the right (without stopping between them), 20mm back to
+    # the left, and then a 1mm retraction.
+    assert result.segment_count == 4
+    assert result.dwell_seconds == pytest.approx(1.5)
+    assert result.move_seconds == pytest.approx(0.3 + 0.3 + 2 * math.sqrt(1 / 1000))
+
+
+def test_limits_commands():
+    """Limits set in the G-code apply to the moves after them."""
+    result = estimate("M204 P500\nG1 X100 E1 F6000\nM204 P1000\nG1 Y100 E1\n")
+    assert result.seconds == pytest.approx(1.2 + 1.1)
+
+    result = estimate("M203 X50\nG1 X100 F6000\n")
+    assert result.seconds == pytest.approx(2.05)
+
+    # M204 S sets the print and travel acceleration, unless P or T are given.
+    result = estimate("M204 S500\nG1 X100 F6000\nM204 T1000\nG1 Y100\n")
+    assert result.seconds == pytest.approx(1.2 + 1.1)
+    result = estimate("M204 S500 P1000\nG1 X100 E1 F6000\nG1 Y100\n")
+    assert result.seconds == pytest.approx(1.1 + 1.2)
+    result = estimate("M201 X500\nG1 X100 F6000\nM201 Y500\nG1 Y100\n")
+    assert result.seconds == pytest.approx(1.2 + 1.2)
+
+
+def test_arc():
+    # A half circle of radius 50, so 157mm long. The arc is split into short
+    # segments, with corners gentle enough not to slow down at.
+    limits = replace(LIMITS, junction_deviation=0.05)
+    result = estimate("G1 X0 Y0 F6000\nG2 X100 Y0 I50 J0 F6000\n", limits)
+    assert result.seconds == pytest.approx(0.2 + (50 * math.pi - 10) / 100, rel=1e-4)
+    assert result.segment_count > 50
+
+    coarse = estimate(
+        "G1 X0 Y0 F6000\nG2 X100 Y0 I50 J0 F6000\n", limits, arc_tolerance=1
+    )
+    assert coarse.segment_count < result.segment_count
+
+
+def test_tool_changes():
+    result = estimate("T0\nG1 X2\nT1\nT1\nT0\n", tool_change_seconds=10)
+    assert result.tool_changes == 2
+    assert result.tool_change_seconds == 20
+
+
+def test_columns():
+    gcode = "G1 X100 F6000\nG1 Y100\n"
+    commands = BasicGCodeParser().parse_stream(io.StringIO(gcode))
+    columns = CommandColumns.from_commands(commands)
+    assert estimate_print_time_columns(columns, LIMITS) == estimate(gcode)
+
+
+def test_empty():
+    result = estimate("M104 S200\n")
+    assert result.seconds == 0
+    assert result.segment_count == 0
+
+
+def test_from_settings():
+    settings = {
+        "machine_max_feedrate_x": "400,140",
+        "machine_max_acceleration_extruding": "4000,2500",
+        "machine_max_jerk_z": "2",
+    }
+    limits = MachineLimits.from_settings(settings)
+    assert limits.max_feedrate[0] == 400
+    assert limits.acceleration == 4000
+    assert limits.max_jerk[2] == 2
+
+    silent = MachineLimits.from_settings(settings, mode=1)
+    assert silent.max_feedrate[0] == 140
+    assert silent.max_jerk[2] == 2
+
+    default = MachineLimits()
+    assert silent.max_feedrate[1] == default.max_feedrate[1]
+
+
+def test_durations():
+    assert parse_duration("57s") == 57
+    assert parse_duration("2h 33m 40s") == 9220
+    assert parse_duration("1d 0h 0m 1s") == 86401
+    assert parse_duration("") is None
+    assert format_duration(9220) == "2h 33m 40s"
+    assert format_duration(57.4) == "57s"
+
+
+@pytest.mark.parametrize(
+    "filename",
+    [
+        "lines_0.4n_0.2mm_PETG_XLIS_57s.gcode",
+        "Apple Chancery.gcode",
+        "BonkersBenchy_PLA_8m.bgcode",
+    ],
+)
+def test_fixtures_match_slicer(fixtures_dir, filename):
+    file_path = os.path.join(fixtures_dir, filename)
+    file_class = BGcodeFile if filename.endswith(".bgcode") else GcodeFile
+
+    with file_class(file_path, strict_mode=False) as file:
+        result = file.estimate_print_time()
+        limits = MachineLimits.from_settings(file.slicer_settings)
+        parsed = estimate_print_time(file.commands, limits)
+
+    # The file's G-code is scanned rather than parsed, with the same result.
+    assert replace(result, slicer_seconds=None) == parsed
+
+    assert result.slicer_seconds is not None
+    assert result.seconds == pytest.approx(result.slicer_seconds, rel=0.05)
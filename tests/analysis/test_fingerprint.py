@@ -0,0 +1,126 @@
+import io
+import os
+import pytest  # type: ignore
+from gcode_file import BasicGCodeParser, CompressionType, GCodeEncoding
+from gcode_file.analysis.fingerprint import Fingerprint, fingerprint_commands
+from gcode_file.bgcode.convert import gcode_to_bgcode
+from gcode_file.file import BGcodeFile, GcodeFile
+from gcode_file.gcode.minify import minify_file
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+LINES = "lines_0.4n_0.2mm_PETG_XLIS_57s"
+
+GCODE = """\
+M104 S215
+M140 S60
+G28
+G1 Z0.2 F600
+G1 X10 Y10 E1 F1200
+G1 X20 Y10 E1.5
+G1 Z0.4
+G1 X10 Y10 E2
+"""
+
+
+def fingerprint(gcode: str) -> Fingerprint:
+    parser = BasicGCodeParser(strict_mode=False)
+    return fingerprint_commands(parser.parse_stream(io.StringIO(gcode)))
+
+
+def test_ignores_how_it_is_written():
+    expected = fingerprint(GCODE)
+    assert len(expected.layers) == 2
+    assert expected.records == 7
+
+    same = [
+        # Comments, spacing and messages.
+        "; generated on a different day\n"
+        + GCODE.replace("G28", "G28 ; home").replace("X20", "X20.000  ")
+        + "M117 Done\nM73 P100\n",
+        # Relative moves and extrusion, and redundant words.
+        """\
+M104 S215
+M140 S60.0
+G28
+G91
+M83
+G1 Z0.2 F600
+G1 F1200
+G1 X10 Y10 E1 F1200
+G1 X10 E0.5
+G1 Z0.2
+G1 X-10 E0.5
+""",
+    ]
+    for gcode in same:
+        assert fingerprint(gcode) == expected
+
+
+def test_changes_to_the_toolpath():
+    expected = fingerprint(GCODE)
+    different = [
+        GCODE.replace("M104 S215", "M104 S220"),
+        GCODE.replace("E1.5", "E1.6"),
+        GCODE.replace("X20", "X20.01"),
+        GCODE.replace("F1200", "F1500"),
+        GCODE + "T1\n",
+        GCODE.replace("G1 X20 Y10 E1.5", "G2 X20 Y10 I5 J0 E1.5"),
+    ]
+    for gcode in different:
+        assert fingerprint(gcode).digest != expected.digest
+
+
+def test_partial_matches():
+    expected = fingerprint(GCODE)
+    # A change to the second layer leaves the first layer the same.
+    changed = fingerprint(GCODE.replace("X10 Y10 E2", "X10 Y11 E2"))
+    assert changed.matching_layers(expected) == [0]
+    assert changed.similarity(expected) == 0.5
+    assert expected.similarity(expected) == 1.0
+
+    # An extra layer.
+    longer = fingerprint(GCODE + "G1 Z0.6\nG1 X20 Y10 E2.5\n")
+    assert longer.matching_layers(expected) == [0, 1]
+    assert longer.similarity(expected) == pytest.approx(2 / 3)
+
+    assert fingerprint("").similarity(fingerprint("M107\n")) == 1.0
+
+
+def test_text_and_bgcode_match(fixtures_dir):
+    with GcodeFile(os.path.join(fixtures_dir, LINES + ".gcode")) as file:
+        text = file.fingerprint()
+    with BGcodeFile(os.path.join(fixtures_dir, LINES + ".bgcode")) as file:
+        assert file.fingerprint() == text
+
+    # The compression and encoding make no difference.
+    with open(os.path.join(fixtures_dir, LINES + ".gcode"), "rb") as input:
+        for compression, encoding in (
+            (CompressionType.NONE, GCodeEncoding.NONE),
+            (CompressionType.DEFLATE, GCodeEncoding.MEATPACK),
+        ):
+            input.seek(0)
+            output = io.BytesIO()
+            gcode_to_bgcode(
+                input,
+                output,
+                gcode_compression=compression,
+                gcode_encoding=encoding,
+                processes=1,
+            )
+            output.seek(0)
+            with BGcodeFile(output) as file:
+                assert file.fingerprint() == text
+
+        # Nor does minifying the G-code.
+        input.seek(0)
+        output = io.BytesIO()
+        minify_file(input, output)
+        output.seek(0)
+        with GcodeFile(output) as file:
+            assert file.fingerprint() == text
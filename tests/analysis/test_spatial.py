@@ -0,0 +1,148 @@
+import io
+import os
+import numpy as np
+import pytest  # type: ignore
+from gcode_file import BasicGCodeParser
+from gcode_file.analysis.spatial import SpatialIndex
+from gcode_file.analysis.toolpath import extract_toolpath
+from gcode_file.file import GcodeFile
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+GCODE = "".join(
+    f";LAYER_CHANGE\nG1 Z{z}\nG1 X10 Y10\n"
+    "G1 X20 Y10 E1\nG1 X20 Y20 E2\nG1 X10 Y20 E3\nG1 X10 Y10 E4\n"
+    # A long travel move across the bed.
+    "G1 X200 Y150\n"
+    for z in (0.2, 0.4, 0.6)
+)
+
+
+def index(gcode: str = GCODE, **kwargs) -> SpatialIndex:
+    commands = BasicGCodeParser().parse_stream(io.StringIO(gcode))
+    return SpatialIndex.from_toolpath(extract_toolpath(commands), **kwargs)
+
+
+def brute_force(index: SpatialIndex, x_min, y_min, x_max, y_max, first, last):
+    """Finds the segments on the layers with any of 1001 points along them in the rectangle."""
+    rows = np.flatnonzero((index.layers >= first) & (index.layers <= last))
+    t = np.linspace(0, 1, 1001)[:, None]
+    found = []
+    for row in rows:
+        start, end = index.segments[row, 0:2], index.segments[row, 2:4]
+        points = start + t * (end - start)
+        if np.any(
+            (points[:, 0] >= x_min)
+            & (points[:, 0] <= x_max)
+            & (points[:, 1] >= y_min)
+            & (points[:, 1] <= y_max)
+        ):
+            found.append(row)
+    return found
+
+
+def test_query():
+    result = index()
+    assert result.layer_count == 3
+
+    # The right side of the square, on the second layer.
+    rows = result.query(19, 11, 21, 14, 1, 1)
+    assert len(rows) == 1
+    assert result.segments[rows[0]].tolist() == [20, 10, 20, 20]
+    assert result.layers[rows[0]] == 1
+    # The command the segment came from, counting comment lines.
+    assert result.commands[rows].tolist() == [12]
+
+    # Every layer, the square, and the travel moves to and from it.
+    rows = result.query(15, 15, 30, 30)
+    assert np.bincount(result.layers[rows]).tolist() == [3, 4, 4]
+    rows = result.query(15, 15, 30, 30, extruding_only=True)
+    assert len(rows) == 6 and result.extruding[rows].all()
+
+    # The travel moves pass near, but not through, this corner.
+    assert len(result.query(100, 40, 110, 50)) == 0
+    assert len(result.query(100, 80, 110, 90)) == 5
+    assert len(result.query(50, 50, 40, 40)) == 0
+
+
+@pytest.mark.parametrize("cell_size", [None, 1, 7, 1000])
+def test_query_matches_brute_force(cell_size):
+    result = index(cell_size=cell_size)
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        x, y = rng.uniform(0, 200, 2)
+        width, height = rng.uniform(0, 50, 2)
+        first = int(rng.integers(0, 3))
+        rows = result.query(x, y, x + width, y + height, first, first + 1)
+        assert rows.tolist() == brute_force(
+            result, x, y, x + width, y + height, first, first + 1
+        )
+
+
+def test_nearest():
+    result = index(cell_size=2)
+    row, distance = result.nearest(15, 25, 2)
+    assert result.segments[row].tolist() == [20, 20, 10, 20]
+    assert result.layers[row] == 2
+    assert distance == pytest.approx(5)
+
+    # The travel move is closer, unless only extrusions are wanted.
+    row, distance = result.nearest(150, 100, 0)
+    assert not result.extruding[row]
+    row, distance = result.nearest(150, 100, 0, extruding_only=True)
+    assert result.segments[row].tolist() == [20, 10, 20, 20]
+    assert distance == pytest.approx(np.hypot(130, 80))
+
+    # Outside the grid.
+    row, distance = result.nearest(-100, 15, 1)
+    assert distance == pytest.approx(110)
+
+    assert result.nearest(0, 0, 5) is None
+
+
+def test_empty():
+    result = index("")
+    assert len(result) == 0
+    assert len(result.query(0, 0, 10, 10)) == 0
+    assert result.nearest(0, 0, 0) is None
+
+    with pytest.raises(ValueError):
+        index(cell_size=0)
+
+
+def test_write_read(tmp_path):
+    result = index()
+    path = str(tmp_path / "index.npz")
+    result.write(path)
+    read = SpatialIndex.read(path)
+
+    assert read.shape == result.shape
+    assert read.cell_size == result.cell_size
+    assert read.query(15, 15, 30, 30).tolist() == result.query(15, 15, 30, 30).tolist()
+
+    stream = io.BytesIO()
+    result.write(stream)
+    stream.seek(0)
+    assert np.array_equal(SpatialIndex.read(stream).entries, result.entries)
+
+    with pytest.raises(ValueError):
+        SpatialIndex.read(io.BytesIO(b"not an index"))
+
+
+def test_file(fixtures_dir):
+    path = os.path.join(fixtures_dir, "lines_0.4n_0.2mm_PETG_XLIS_57s.gcode")
+    with GcodeFile(path) as file:
+        result = file.spatial_index()
+        commands = list(file.commands)
+
+    # The purge line is in front of the bed.
+    rows = result.query(-10, -10, 360, 360, extruding_only=True)
+    assert len(rows) == np.count_nonzero(result.extruding)
+    for command in result.commands[rows]:
+        assert commands[command].command in ("G0", "G1", "G2", "G3")
+        assert "E" in commands[command].fields
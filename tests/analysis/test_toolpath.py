@@ -0,0 +1,180 @@
+import io
+import math
+import os
+import numpy as np
+import pytest  # type: ignore
+from gcode_file import BasicGCodeParser
+from gcode_file.analysis.toolpath import FIELDS, Toolpath, extract_toolpath
+from gcode_file.file import GcodeFile
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+def toolpath(gcode: str, **kwargs) -> Toolpath:
+    commands = BasicGCodeParser().parse_stream(io.StringIO(gcode))
+    return extract_toolpath(commands, **kwargs)
+
+
+GCODE = """\
+G1 Z0.2 F600
+G1 X10 Y10
+;TYPE:Perimeter
+;WIDTH:0.45
+G1 X20 E1
+G1 Y20 E2
+;TYPE:Infill
+;WIDTH:0.5
+T1
+G1 X10 E3
+G1 Y10 E2.5 ; wipe while retracting
+G1 X12
+"""
+
+
+def test_segments():
+    result = toolpath(GCODE)
+
+    assert result.features == ["Travel", "Perimeter", "Infill"]
+    assert result.segments.dtype == np.float32
+    assert result.segments.flags["C_CONTIGUOUS"]
+    assert result.segments.shape == (7, len(FIELDS))
+    np.testing.assert_allclose(
+        result.segments,
+        [
+            [0, 0, 0, 0, 0, 0.2, 0, 0, 0],
+            [0, 0, 0.2, 10, 10, 0.2, 0, 0, 0],
+            [10, 10, 0.2, 20, 10, 0.2, 0.45, 0, 1],
+            [20, 10, 0.2, 20, 20, 0.2, 0.45, 0, 1],
+            [20, 20, 0.2, 10, 20, 0.2, 0.5, 1, 2],
+            [10, 20, 0.2, 10, 10, 0.2, 0, 1, 0],
+            [10, 10, 0.2, 12, 10, 0.2, 0, 1, 0],
+        ],
+        rtol=1e-6,
+    )
+    # The index of the command of each segment, counting comment lines.
+    assert result.commands.tolist() == [0, 1, 4, 5, 9, 10, 11]
+
+
+def test_unknown_feature():
+    result = toolpath("G1 X10 E1\n")
+    assert result.features == ["Travel", "Unknown"]
+    assert result.segments[0, 8] == 1
+
+
+def test_collinear_merge():
+    gcode = "G1 X1 E1\nG1 X2 E2\nG1 X3 E3\nG1 X2 E4\nG1 X2 Y1 E5\nG1 X2 Y2\n"
+    assert len(toolpath(gcode)) == 6
+
+    result = toolpath(gcode, tolerance=0)
+    assert result.commands.tolist() == [0, 3, 4, 5]
+    # Going back along the same line, a corner, or a travel move are not merged.
+    assert result.segments[:, [0, 1, 3, 4]].tolist() == [
+        [0, 0, 3, 0],
+        [3, 0, 2, 0],
+        [2, 0, 2, 1],
+        [2, 1, 2, 2],
+    ]
+
+
+def test_tolerance():
+    # A circle of radius 10, as 360 short extrusions.
+    points = [
+        (10 * math.cos(math.radians(angle)), 10 * math.sin(math.radians(angle)))
+        for angle in range(361)
+    ]
+    gcode = f"G0 X{points[0][0]} Y0\n" + "".join(
+        f"G1 X{x:.6f} Y{y:.6f} E{index}\n" for index, (x, y) in enumerate(points[1:], 1)
+    )
+
+    result = toolpath(gcode, tolerance=0.05)
+    extrusions = result.segments[result.segments[:, 8] > 0]
+    assert 20 < len(extrusions) < 100
+
+    # Every original point is within the tolerance of the merged path.
+    starts = extrusions[:, 0:2].astype(np.float64)
+    directions = extrusions[:, 3:5] - starts
+    for point in np.array(points):
+        t = np.clip(
+            np.sum((point - starts) * directions, axis=1)
+            / np.sum(directions * directions, axis=1),
+            0,
+            1,
+        )
+        closest = starts + t[:, None] * directions
+        assert np.min(np.linalg.norm(point - closest, axis=1)) <= 0.05 + 1e-6
+
+
+def test_layers():
+    gcode = "".join(
+        f";LAYER_CHANGE\n;Z:{z}\nG1 Z{z}\nG1 X{z} E{z}\n" for z in (0.2, 0.4, 0.6)
+    )
+    result = toolpath(gcode)
+    assert result.layer_count == 3
+    assert result.layer_starts.tolist() == [0, 2, 4]
+    assert result.layer(1)[:, 5].tolist() == pytest.approx([0.4, 0.4])
+
+    sampled = toolpath(gcode, layer_step=2)
+    assert sampled.layer_count == 2
+    assert sampled.segments[:, 5].tolist() == pytest.approx([0.2, 0.2, 0.6, 0.6])
+
+    with pytest.raises(ValueError):
+        toolpath(gcode, layer_step=0)
+
+
+def test_layers_without_markers():
+    # The Z-hop is part of the next layer, rather than a layer of its own.
+    gcode = "G1 Z0.2\nG1 X1 E1\nG1 Z1\nG1 Z0.4\nG1 X2 E2\nG1 Z1.4\n"
+    assert toolpath(gcode).layer_starts.tolist() == [0, 2]
+
+
+def test_empty():
+    for gcode in ("", "G1 Z1\nG1 X1\n"):
+        result = Toolpath.from_bytes(toolpath(gcode).to_bytes())
+        assert result.segments.shape[1] == len(FIELDS)
+
+
+def test_binary_format():
+    result = toolpath(GCODE)
+    data = result.to_bytes()
+
+    # The header and metadata are padded, so the floats can be mapped directly.
+    metadata_size = int.from_bytes(data[16:20], "little")
+    assert data[:4] == b"GCTP"
+    assert (20 + metadata_size) % 4 == 0
+    assert len(data) == 20 + metadata_size + 7 * 9 * 4 + 4
+
+    stream = io.BytesIO()
+    result.write(stream)
+    stream.seek(0)
+    read = Toolpath.read(stream)
+    assert np.array_equal(read.segments, result.segments)
+    assert read.layer_starts.tolist() == [0]
+    assert read.features == result.features
+
+    with pytest.raises(ValueError):
+        Toolpath.from_bytes(b"JUNK" + data[4:])
+
+
+def test_file(fixtures_dir):
+    path = os.path.join(fixtures_dir, "lines_0.4n_0.2mm_PETG_XLIS_57s.gcode")
+    with GcodeFile(path) as file:
+        result = file.toolpath()
+        merged = file.toolpath(tolerance=0.01)
+
+    assert len(result) == 70
+    assert result.layer_count == 1
+    assert "External perimeter" in result.features
+    assert len(merged) < len(result)
+
+
+def test_arcs():
+    gcode = "G1 X10 Y0\n;TYPE:Perimeter\nG3 X-10 Y0 I-10 J0 E5\n"
+    result = toolpath(gcode)
+    arc = result.segments[result.segments[:, 8] == 1]
+    assert len(arc) > 10
+    assert np.hypot(arc[:, 3], arc[:, 4]) == pytest.approx(10, rel=1e-6)
+    assert len(toolpath(gcode, arc_tolerance=1)) < len(result)
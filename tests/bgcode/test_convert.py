@@ -0,0 +1,174 @@
+import io
+import os
+import subprocess
+import sys
+import pytest  # type: ignore
+from gcode_file import CompressionType, GCodeEncoding
+from gcode_file.bgcode.parser import GCodeBlock
+from gcode_file.bgcode.convert import bgcode_to_gcode, gcode_blocks, gcode_to_bgcode
+from gcode_file.file import BGcodeFile, GcodeFile
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+LINES = "lines_0.4n_0.2mm_PETG_XLIS_57s"
+
+
+def to_gcode(data: bytes) -> bytes:
+    output = io.BytesIO()
+    bgcode_to_gcode(io.BytesIO(data), output)
+    return output.getvalue()
+
+
+def to_bgcode(data: bytes, **kwargs) -> bytes:
+    output = io.BytesIO()
+    gcode_to_bgcode(io.BytesIO(data), output, processes=1, **kwargs)
+    return output.getvalue()
+
+
+def read(fixtures_dir, name: str) -> bytes:
+    with open(os.path.join(fixtures_dir, name), "rb") as file:
+        return file.read()
+
+
+def test_bgcode_to_gcode(fixtures_dir):
+    text = to_gcode(read(fixtures_dir, LINES + ".bgcode"))
+    original = BGcodeFile(os.path.join(fixtures_dir, LINES + ".bgcode"))
+    converted = GcodeFile(io.BytesIO(text))
+
+    assert text.startswith(
+        b"; generated by PrusaSlicer 2.9.2 on 2025-05-03 at 20:49:19 UTC\n\n\n;\n"
+        b"; thumbnail_QOI begin 16x16 500\n"
+    )
+    assert converted.slicer_settings == original.slicer_settings
+    assert converted.print_metadata == {
+        "objects_info": original.printer_metadata["objects_info"],
+        **original.print_metadata,
+    }
+
+    # The thumbnails are written the same as PrusaSlicer does.
+    def thumbnails(text: bytes) -> bytes:
+        start = text.index(b"\n;\n; thumbnail")
+        end = text.rindex(b"; thumbnail end\n;\n")
+        return text[start:end]
+
+    assert thumbnails(text) == thumbnails(read(fixtures_dir, LINES + ".gcode"))
+
+
+def test_gcode_to_bgcode(fixtures_dir):
+    text = read(fixtures_dir, LINES + ".gcode")
+    converted = BGcodeFile(io.BytesIO(to_bgcode(text)))
+    original = BGcodeFile(os.path.join(fixtures_dir, LINES + ".bgcode"))
+
+    assert converted.file_metadata == {
+        "Producer": "PrusaSlicer 2.9.2",
+        "Produced on": "2025-05-03 at 20:49:01 UTC",
+    }
+    assert converted.printer_metadata == original.printer_metadata
+    assert converted.print_metadata == original.print_metadata
+    assert converted.slicer_settings == GcodeFile(io.BytesIO(text)).slicer_settings
+    assert [
+        (thumbnail.format, thumbnail.width, thumbnail.height, thumbnail.data)
+        for thumbnail in converted.thumbnails
+    ] == [
+        (thumbnail.format, thumbnail.width, thumbnail.height, thumbnail.data)
+        for thumbnail in original.thumbnails
+    ]
+
+    lines = list(converted.lines)
+    assert lines[0] == "; \n"
+    assert lines[-3:] == ["; max_layer_z = 0.2\n", "M73 P100 R0\n", "M73 Q100 S0\n"]
+    assert not any("objects_info" in line or "thumbnail" in line for line in lines)
+
+
+@pytest.mark.parametrize("name", [LINES + ".bgcode", "BonkersBenchy_PLA_8m.bgcode"])
+def test_round_trip(fixtures_dir, name):
+    data = read(fixtures_dir, name)
+    text = to_gcode(data)
+    converted = to_bgcode(text, block_size=10000)
+
+    original = BGcodeFile(io.BytesIO(data))
+    round_tripped = BGcodeFile(io.BytesIO(converted))
+    assert "".join(round_tripped.lines) == "".join(original.lines)
+    assert round_tripped.file_metadata == original.file_metadata
+    assert round_tripped.print_metadata == original.print_metadata
+    assert round_tripped.slicer_settings == original.slicer_settings
+    assert [thumbnail.data for thumbnail in round_tripped.thumbnails] == [
+        thumbnail.data for thumbnail in original.thumbnails
+    ]
+    assert to_gcode(converted) == text
+
+
+def test_round_trip_printer_metadata(fixtures_dir):
+    # The printer metadata is rebuilt from the config and print statistics,
+    # which is all of it for files from recent versions of PrusaSlicer.
+    data = read(fixtures_dir, LINES + ".bgcode")
+    converted = BGcodeFile(io.BytesIO(to_bgcode(to_gcode(data))))
+    assert converted.printer_metadata == BGcodeFile(io.BytesIO(data)).printer_metadata
+
+
+def test_gcode_without_metadata():
+    text = b"G28\n; a = b\n\nG1 X1 ; move\n; c = d\n"
+    converted = to_bgcode(
+        text,
+        gcode_compression=CompressionType.NONE,
+        gcode_encoding=GCodeEncoding.NONE,
+    )
+    file = BGcodeFile(io.BytesIO(converted))
+    assert file.file_metadata == {}
+    assert file.print_metadata == {}
+    assert file.slicer_settings == {}
+    assert "".join(file.lines) == text.decode("utf-8")
+    assert to_gcode(converted) == text
+
+
+def test_gcode_blocks(fixtures_dir):
+    """The blocks are the G-code blocks gcode_to_bgcode() writes."""
+    text = read(fixtures_dir, LINES + ".gcode")
+    lines = io.StringIO(text.decode("utf-8"), newline="")
+    blocks = list(gcode_blocks(lines, block_size=1000))
+    assert len(blocks) > 1
+    assert all(block.endswith("\n") for block in blocks)
+
+    converted = BGcodeFile(
+        io.BytesIO(to_bgcode(text, block_size=1000, gcode_encoding=GCodeEncoding.NONE))
+    )
+    assert blocks == [
+        block.data() for block in converted.blocks if isinstance(block, GCodeBlock)
+    ]
+    assert not any("thumbnail" in block for block in blocks)
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        to_gcode(b"G28\n")
+    with pytest.raises(ValueError):
+        to_bgcode(b"; thumbnail begin 16x16 4\n; AAAA\nG28\n")
+    with pytest.raises(ValueError):
+        to_bgcode(b"; prusaslicer_config = begin\n; a = b\n")
+
+
+def test_command_line(fixtures_dir, tmp_path):
+    path = os.path.join(fixtures_dir, LINES + ".bgcode")
+    output = tmp_path / "lines.gcode"
+    command = [sys.executable, "-m", "gcode_file.bgcode.convert"]
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.join(os.path.dirname(__file__), "..", "..", "src")
+
+    subprocess.run([*command, "to-gcode", path, str(output)], check=True, env=env)
+    assert output.read_bytes() == to_gcode(read(fixtures_dir, LINES + ".bgcode"))
+
+    # Pipes work too.
+    with open(output, "rb") as stdin:
+        result = subprocess.run(
+            [*command, "to-bgcode", "-", "-"],
+            stdin=stdin,
+            stdout=subprocess.PIPE,
+            check=True,
+            env=env,
+        )
+    assert result.stdout == to_bgcode(output.read_bytes())
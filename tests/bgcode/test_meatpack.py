@@ -10,7 +10,14 @@ functionality of the MeatPack algorithm. It tests:
 """
 
 import pytest  # type: ignore
-from gcode_file.bgcode.meatpack import MeatPacker, MeatUnpacker, compress, decompress
+from gcode_file.bgcode.meatpack import (
+    MeatPacker,
+    MeatUnpacker,
+    compress,
+    compress_block,
+    decompress,
+    decompress_block,
+)
 
 
 def test_basic_compression():
@@ -152,3 +159,76 @@ def test_multiple_operations():
     compressed1 = packer1.compress(gcode1)
     compressed2 = packer2.compress(gcode1)
     assert compressed1 != compressed2
+
+
+def test_incremental_packing():
+    """Test packing line by line, and unpacking data split anywhere."""
+    lines = ["N1G1X10.5Y20E.5*12\n", "M117 Hi\n", "N2G28*17\n"]
+    packer = MeatPacker(omit_spaces=True)
+    data = packer.start() + b"".join(packer.pack(line) for line in lines) + packer.end()
+    # Packed line by line, each line with an odd length is followed by a newline.
+    expected = b"N1G1X10.5Y20E.5*12\n\nM117Hi\n\nN2G28*17\n\n"
+    assert MeatUnpacker().decompress(data) == expected
+    assert (
+        packer.compress("G1 X1") == packer.start() + packer.pack("G1 X1") + packer.end()
+    )
+
+    for split in range(len(data) + 1):
+        unpacker = MeatUnpacker()
+        assert unpacker.decompress(data[:split]) + unpacker.decompress(
+            data[split:]
+        ) == (expected)
+    unpacker = MeatUnpacker()
+    assert b"".join(unpacker.decompress(data[i : i + 1]) for i in range(len(data))) == (
+        expected
+    )
+
+
+def test_compress_block():
+    """Test compressing G-code for a binary G-code block."""
+    gcode = (
+        "; a comment line\n"
+        "G1 X10.5 Y20 E.5 ; move\n"
+        'M862.3 P "MK4"\n'
+        "g1 x1\n"
+        "\n"
+        "G1 X1"
+    )
+
+    # Spaces are removed from G commands, and everything else is kept.
+    assert decompress(compress_block(gcode)).decode("ascii") == (
+        "; a comment line\n"
+        "G1X10.5Y20E.5; move\n"
+        'M862.3 P "MK4"\n'
+        "g1 x1\n"
+        "\n"
+        "G1X1"
+    )
+    assert decompress(compress_block(gcode, keep_comments=False)).decode("ascii") == (
+        "G1X10.5Y20E.5\n" 'M862.3 P "MK4"\n' "g1 x1\n" "\n" "G1X1"
+    )
+
+    # Comment lines aren't packed.
+    assert b"; a comment line\n" in compress_block(gcode)
+    assert compress_block("") == b"\xff\xff\xfb\xff\xff\xf7"
+    assert decompress(compress_block(";")) == b";"
+
+    with pytest.raises(TypeError):
+        compress_block(None)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"",
+        compress_block('G1 X10.5 Y20 E.5 ; move\nM862.3 P "MK4"\ng1 x1\n'),
+        compress_block("; comment\nG1 X1\n", keep_comments=False),
+        compress("G1 X10 Y20\nM104 S200\n"),
+        compress("G1 X10 Y20\nM104 S200\n", omit_spaces=True),
+        compress("G1 X10 Y20\nM104 S200\n")[:-3],
+        b"\xff\xff\xfbG1 X\xff\xff\xfa\x0f\xf0a\xff\xff",
+    ],
+)
+def test_decompress_block(data):
+    """Test that unpacking a whole block matches unpacking a byte at a time."""
+    assert decompress_block(data) == decompress(data)
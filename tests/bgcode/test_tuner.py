@@ -0,0 +1,144 @@
+import io
+import os
+import pytest  # type: ignore
+from gcode_file import BasicBGCodeParser, CompressionType, GCodeBlock, GCodeEncoding
+from gcode_file.bgcode.tuner import (
+    CodecBenchmark,
+    Objective,
+    apply_codec,
+    benchmark_codecs,
+    read_gcode_blocks,
+    recommend_codec,
+    sample_blocks,
+)
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+LINES = "lines_0.4n_0.2mm_PETG_XLIS_57s"
+
+GCODE = [
+    "".join(f"G1 X{x}.5 Y{block} E.05 ; move\n" for x in range(200))
+    for block in range(5)
+]
+
+
+def codec(compression, encoding, size, decode_seconds) -> CodecBenchmark:
+    return CodecBenchmark(compression, encoding, 1000, size, decode_seconds)
+
+
+RESULTS = [
+    codec(CompressionType.NONE, GCodeEncoding.NONE, 1000, 0.001),
+    codec(CompressionType.DEFLATE, GCodeEncoding.NONE, 300, 0.01),
+    codec(CompressionType.HEATSHRINK_12_4, GCodeEncoding.MEATPACK_COMMENTS, 250, 0.1),
+    codec(CompressionType.HEATSHRINK_12_4, GCodeEncoding.MEATPACK, 200, 0.1),
+]
+
+
+def test_benchmark_codecs():
+    results = benchmark_codecs(GCODE, repeat=1)
+    assert [(result.compression, result.encoding) for result in results] == [
+        (compression, encoding)
+        for compression in CompressionType
+        for encoding in GCodeEncoding
+    ]
+
+    gcode_size = sum(map(len, GCODE))
+    for result in results:
+        assert result.gcode_size == gcode_size
+        assert result.decode_seconds > 0
+        assert result.throughput > 0
+
+    sizes = {(result.compression, result.encoding): result.size for result in results}
+    # Each block has a header and checksum, as well as its data.
+    assert sizes[CompressionType.NONE, GCodeEncoding.NONE] == gcode_size + 5 * 14
+    assert sizes[CompressionType.DEFLATE, GCodeEncoding.NONE] < gcode_size / 3
+    # MeatPack without comments is smaller than with them.
+    assert (
+        sizes[CompressionType.NONE, GCodeEncoding.MEATPACK]
+        < sizes[CompressionType.NONE, GCodeEncoding.MEATPACK_COMMENTS]
+    )
+
+    results = benchmark_codecs(
+        GCODE, [CompressionType.DEFLATE], [GCodeEncoding.NONE], repeat=1
+    )
+    assert len(results) == 1
+    assert results[0].ratio > 3
+
+
+def test_recommend_codec():
+    assert recommend_codec(RESULTS, Objective.SIZE) is RESULTS[2]
+    assert recommend_codec(RESULTS, Objective.SIZE, keep_comments=False) is RESULTS[3]
+    assert recommend_codec(RESULTS, Objective.DECODE) is RESULTS[0]
+    assert recommend_codec(RESULTS, "size", min_throughput=50_000) is RESULTS[1]
+
+    # Slow uploads favour smaller files, and slow printers faster decoding.
+    assert (
+        recommend_codec(RESULTS, Objective.TIME, bandwidth=100, decode_factor=1)
+        is RESULTS[2]
+    )
+    assert (
+        recommend_codec(RESULTS, Objective.TIME, bandwidth=10_000, decode_factor=1)
+        is RESULTS[1]
+    )
+    assert (
+        recommend_codec(RESULTS, Objective.TIME, bandwidth=10_000, decode_factor=100)
+        is RESULTS[0]
+    )
+
+    with pytest.raises(ValueError):
+        recommend_codec(RESULTS, min_throughput=10**9)
+    with pytest.raises(ValueError):
+        recommend_codec(RESULTS, "smallest")
+
+
+def test_sample_blocks():
+    blocks = [str(index) for index in range(100)]
+    sample = sample_blocks(blocks, 10, seed=1)
+    assert len(sample) == 10
+    assert sample == sorted(sample, key=int)
+    assert sample == sample_blocks(iter(blocks), 10, seed=1)
+    assert sample_blocks(blocks[:3], 10) == blocks[:3]
+
+    with pytest.raises(ValueError):
+        sample_blocks(blocks, 0)
+
+
+def test_read_gcode_blocks(fixtures_dir):
+    with open(os.path.join(fixtures_dir, LINES + ".bgcode"), "rb") as file:
+        bgcode = list(read_gcode_blocks(file))
+    with open(os.path.join(fixtures_dir, LINES + ".gcode"), "rb") as file:
+        gcode = list(read_gcode_blocks(file, block_size=1000))
+
+    assert len(gcode) > 5
+    # The thumbnails and config of the text file are not G-code.
+    assert not any("thumbnail" in block for block in gcode)
+    assert "".join(gcode).endswith("M73 Q100 S0\n")
+    assert "".join(bgcode).endswith("M73 Q100 S0\n")
+
+
+@pytest.mark.parametrize("extension", [".bgcode", ".gcode"])
+def test_apply_codec(fixtures_dir, extension):
+    best = recommend_codec(RESULTS, Objective.SIZE)
+    output = io.BytesIO()
+    with open(os.path.join(fixtures_dir, LINES + extension), "rb") as file:
+        apply_codec(file, output, best, processes=1)
+        file.seek(0)
+        expected = "".join(read_gcode_blocks(file))
+
+    output.seek(0)
+    blocks = [
+        block
+        for block in BasicBGCodeParser().parse_stream(output)
+        if isinstance(block, GCodeBlock)
+    ]
+    assert blocks
+    for block in blocks:
+        assert block.header.compression == best.compression
+        assert block.parameters.encoding == best.encoding
+    if extension == ".bgcode":
+        assert "".join(block.data() for block in blocks) == expected
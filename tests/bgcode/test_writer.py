@@ -0,0 +1,194 @@
+import io
+import os
+import struct
+import zlib
+import pytest  # type: ignore
+from gcode_file import (
+    BasicBGCodeParser,
+    BasicBGCodeWriter,
+    BlockType,
+    ChecksumType,
+    CompressionType,
+    GCodeBlock,
+    GCodeEncoding,
+    MetadataBlock,
+    ThumbnailBlock,
+    ThumbnailFormat,
+    ThumbnailParameter,
+)
+from gcode_file.bgcode.writer import split_blocks
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+GCODE = "".join(
+    f";LAYER_CHANGE\nG1 Z{z / 5:.1f}\nM73 P{z} R5\nG1 X{z}.5 Y20 E.5 ; move {z}\n"
+    for z in range(1, 200)
+)
+
+
+def parse(data: bytes):
+    return list(BasicBGCodeParser().parse_stream(io.BytesIO(data)))
+
+
+def gcode_text(blocks) -> str:
+    return "".join(block.data() for block in blocks if isinstance(block, GCodeBlock))
+
+
+def write(**kwargs) -> bytes:
+    stream = io.BytesIO()
+    writer = BasicBGCodeWriter(stream, **kwargs)
+    writer.write_metadata(BlockType.FILE_METADATA, {"Producedby": "test"})
+    writer.write_metadata(BlockType.PRINTER_METADATA, {"printer_model": "MK4"})
+    writer.write_thumbnail(ThumbnailParameter(ThumbnailFormat.PNG, 16, 16), b"PNG")
+    writer.write_metadata(BlockType.SLICER_METADATA, {"layer_height": "0.2"})
+    writer.write_gcode(GCODE)
+    return stream.getvalue()
+
+
+@pytest.mark.parametrize("compression", list(CompressionType))
+@pytest.mark.parametrize("encoding", list(GCodeEncoding))
+def test_round_trip(compression, encoding):
+    blocks = parse(
+        write(
+            gcode_compression=compression,
+            gcode_encoding=encoding,
+            block_size=1000,
+            processes=1,
+        )
+    )
+
+    assert [block.type for block in blocks[:4]] == [
+        BlockType.FILE_METADATA,
+        BlockType.PRINTER_METADATA,
+        BlockType.THUMBNAIL,
+        BlockType.SLICER_METADATA,
+    ]
+    assert blocks[1].data == {"printer_model": "MK4"}
+    assert blocks[2].parameters == ThumbnailParameter(ThumbnailFormat.PNG, 16, 16)
+    assert blocks[2].data == b"PNG"
+    assert blocks[3].header.compression == CompressionType.DEFLATE
+
+    gcode_blocks = blocks[4:]
+    assert len(gcode_blocks) > 5
+    for block in gcode_blocks:
+        assert block.header.compression == compression
+        assert block.parameters.encoding == encoding
+        # Blocks end at the end of a line.
+        assert block.data().endswith("\n")
+
+    text = gcode_text(gcode_blocks)
+    if encoding == GCodeEncoding.NONE:
+        assert text == GCODE
+        return
+
+    # MeatPack removes the spaces in G commands, and MEATPACK the comments.
+    keep_comments = encoding == GCodeEncoding.MEATPACK_COMMENTS
+    assert text == "".join(
+        (";LAYER_CHANGE\n" if keep_comments else "")
+        + f"G1Z{z / 5:.1f}\nM73 P{z} R5\nG1X{z}.5Y20E.5"
+        + (f"; move {z}\n" if keep_comments else "\n")
+        for z in range(1, 200)
+    )
+
+
+@pytest.mark.parametrize("checksum_type", list(ChecksumType))
+def test_checksums(checksum_type):
+    data = write(checksum_type=checksum_type, block_size=1000, processes=1)
+    assert data[:10] == b"GCDE" + struct.pack("<IH", 1, checksum_type)
+
+    # Walk the blocks, checking each block's checksum covers its header,
+    # parameters and data.
+    position = 10
+    count = 0
+    while position < len(data):
+        block_type, compression, size = struct.unpack_from("<HHI", data, position)
+        header_size = 8
+        if compression != CompressionType.NONE:
+            size = struct.unpack_from("<I", data, position + 8)[0]
+            header_size = 12
+        parameters_size = 6 if block_type == BlockType.THUMBNAIL else 2
+        end = position + header_size + parameters_size + size
+
+        if checksum_type == ChecksumType.CRC32:
+            checksum = struct.unpack_from("<I", data, end)[0]
+            assert checksum == zlib.crc32(data[position:end])
+            end += 4
+        position = end
+        count += 1
+
+    assert position == len(data)
+    assert count == len(parse(data))
+
+
+def test_process_pool():
+    # The blocks are the same, and in the same order, however they're encoded.
+    assert write(block_size=500, processes=2) == write(block_size=500, processes=1)
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "lines_0.4n_0.2mm_PETG_XLIS_57s.bgcode",
+        "BonkersBenchy_PLA_8m.bgcode",
+    ],
+)
+def test_write_blocks(fixtures_dir, name):
+    with open(os.path.join(fixtures_dir, name), "rb") as file:
+        blocks = list(BasicBGCodeParser().parse_stream(file))
+
+    stream = io.BytesIO()
+    BasicBGCodeWriter(stream, processes=1).write_blocks(blocks)
+    written = parse(stream.getvalue())
+
+    assert gcode_text(written) == gcode_text(blocks)
+    others = [block for block in blocks if not isinstance(block, GCodeBlock)]
+    written_others = [block for block in written if not isinstance(block, GCodeBlock)]
+    assert len(written_others) == len(others)
+    for block, expected in zip(written_others, others):
+        assert type(block) is type(expected)
+        assert block.header == expected.header
+        if isinstance(block, MetadataBlock):
+            assert block.data == expected.data
+        elif isinstance(block, ThumbnailBlock):
+            assert block.parameters == expected.parameters
+            assert block.data == expected.data
+
+
+def test_split_blocks():
+    lines = ["G1 X1\n", "G1 X2\n", "G1 X3\n", "M117 " + "x" * 20 + "\n", "G1 X4"]
+    assert list(split_blocks(lines, 12)) == [
+        "G1 X1\nG1 X2\n",
+        "G1 X3\n",
+        lines[3],
+        "G1 X4",
+    ]
+    assert list(split_blocks("".join(lines), 1000)) == ["".join(lines)]
+    assert list(split_blocks([], 10)) == []
+
+
+def test_invalid():
+    stream = io.BytesIO()
+    with pytest.raises(ValueError):
+        BasicBGCodeWriter(stream, block_size=0)
+    with pytest.raises(ValueError):
+        BasicBGCodeWriter(stream, processes=0)
+
+    writer = BasicBGCodeWriter(stream)
+    for block_type, data in (
+        (BlockType.GCODE, {}),
+        (BlockType.FILE_METADATA, {"a=b": "c"}),
+        (BlockType.FILE_METADATA, {"a": "b\nc"}),
+    ):
+        with pytest.raises(ValueError):
+            writer.write_metadata(block_type, data)
+
+    writer.write_gcode("")
+    assert stream.getvalue() == b""
+    writer.write_file_header()
+    with pytest.raises(ValueError):
+        writer.write_file_header()
@@ -0,0 +1,259 @@
+import io
+import math
+import os
+import numpy as np
+import pytest  # type: ignore
+from gcode_file import BasicGCodeParser
+from gcode_file.file import BGcodeFile
+from gcode_file.gcode.arcs import Arcs, fit_arc_moves, fit_arcs, linearize_moves
+from gcode_file.gcode.command import GcodeCommand
+from gcode_file.gcode.state import CommandColumns, track_columns
+
+NAN = math.nan
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+def arcs(*rows) -> Arcs:
+    """Creates arcs from (start, end, i, j, r, clockwise) rows."""
+    start, end, i, j, r, clockwise = zip(*rows)
+    return Arcs.from_fields(
+        np.array(start, dtype=float),
+        np.array(end, dtype=float),
+        np.array(i),
+        np.array(j),
+        np.array(r),
+        np.array(clockwise),
+    )
+
+
+def test_centre_and_sweep():
+    result = arcs(
+        # Three quarters of a circle anticlockwise, with I/J.
+        ((0, 0, 0, 0), (1, 1, 0, 0), 1, 0, NAN, False),
+        # A quarter circle clockwise, with R.
+        ((0, 0, 0, 0), (1, 1, 0, 0), NAN, NAN, 1, True),
+        # The long way round, with a negative R.
+        ((0, 0, 0, 0), (1, 1, 0, 0), NAN, NAN, -1, True),
+        # A full circle.
+        ((0, 0, 0, 0), (0, 0, 0, 0), 5, 0, NAN, False),
+    )
+
+    np.testing.assert_allclose(
+        result.centre, [[1, 0], [1, 0], [0, 1], [5, 0]], atol=1e-12
+    )
+    assert result.radius.tolist() == pytest.approx([1, 1, 1, 5])
+    assert np.degrees(result.sweep).tolist() == pytest.approx([270, -90, -270, 360])
+    assert result.lengths().tolist() == pytest.approx(
+        [1.5 * math.pi, 0.5 * math.pi, 1.5 * math.pi, 10 * math.pi]
+    )
+
+
+def test_helix_and_straight():
+    result = arcs(
+        ((0, 0, 0, 0), (2, 0, 1, 3), 1, 0, NAN, False),
+        # The radius is too small to reach the end, so it's a straight line.
+        ((0, 0, 0, 0), (5, 0, 0, 0), NAN, NAN, 1, True),
+    )
+    assert result.straight.tolist() == [False, True]
+    assert result.lengths().tolist() == pytest.approx([math.hypot(math.pi, 1), 5])
+
+    points, counts = result.linearize(0.01)
+    assert counts[1] == 1
+    assert points[-1].tolist() == [5, 0, 0, 0]
+    # Z and E change linearly along the arc.
+    first = points[: counts[0]]
+    assert np.diff(first[:, 2]) == pytest.approx(1 / counts[0])
+    assert np.diff(first[:, 3]) == pytest.approx(3 / counts[0])
+
+
+@pytest.mark.parametrize("tolerance", [0.001, 0.01, 0.1])
+def test_chord_tolerance(tolerance):
+    result = arcs(
+        ((10, 0, 0, 0), (-10, 0, 0, 0), -10, 0, NAN, False),
+        ((0, 0, 0, 0), (0, 0, 0, 0), 0, 3, NAN, True),
+    )
+    points, counts = result.linearize(tolerance)
+    assert counts.tolist() == result.segment_counts(tolerance).tolist()
+
+    starts = [result.start[0], *points[: counts[0] - 1], result.start[1]]
+    starts += list(points[counts[0] : -1])
+    for arc, start, end in zip(np.repeat([0, 1], counts), starts, points):
+        centre, radius = result.centre[arc], result.radius[arc]
+        # Both ends are on the arc, and the middle is within the tolerance.
+        assert np.hypot(*(end[:2] - centre)) == pytest.approx(radius)
+        middle = np.hypot(*((start[:2] + end[:2]) / 2 - centre))
+        assert radius - middle <= tolerance + 1e-9
+
+    # Fewer segments would not be within the tolerance.
+    sagitta = result.radius * (1 - np.cos(np.abs(result.sweep) / (counts - 1) / 2))
+    assert np.all(sagitta > tolerance)
+
+    with pytest.raises(ValueError):
+        result.linearize(0)
+
+
+def test_linearize_moves():
+    gcode = "G1 X10 Y0 E1\nM106\nG2 X0 Y10 I-10 J0 E2\nG1 X0 Y0\n"
+    commands = BasicGCodeParser().parse_stream(io.StringIO(gcode))
+    columns = CommandColumns.from_commands(commands)
+    state = track_columns(columns)
+
+    points, rows = linearize_moves(columns, state.positions, 0.1)
+    counts = np.bincount(rows)
+    assert counts[[0, 1, 3]].tolist() == [1, 1, 1]
+    assert counts[2] > 5
+
+    arc = points[rows == 2]
+    assert np.hypot(arc[:, 0], arc[:, 1]) == pytest.approx(10)
+    assert arc[-1].tolist() == [0, 10, 0, 2]
+    assert points[rows != 2].tolist() == state.positions[[0, 1, 3]].tolist()
+
+
+def circle_points(centre, radius, start, stop, count):
+    """X, Y, Z and E of points along an arc, with no E."""
+    angles = np.linspace(start, stop, count)
+    x = centre[0] + radius * np.cos(angles)
+    y = centre[1] + radius * np.sin(angles)
+    return np.stack((x, y, np.zeros(count), np.zeros(count)), axis=1)
+
+
+def extrude(points, e_per_mm=0.05):
+    """Sets the E of the points, for an even extrusion along them."""
+    steps = np.hypot(*np.diff(points[:, :2], axis=0).T)
+    points[:, 3] = np.concatenate(([0.0], np.cumsum(steps))) * e_per_mm
+    return points
+
+
+def parse(gcode: str):
+    return list(BasicGCodeParser().parse_stream(io.StringIO(gcode)))
+
+
+def test_fit_arcs():
+    # Half a circle anticlockwise, then a quarter clockwise, then a straight line.
+    anticlockwise = circle_points((0, 0), 10, 0, math.pi, 60)
+    clockwise = circle_points((-15, 0), 5, 0, -math.pi / 2, 20)[1:]
+    line = clockwise[-1] + np.outer(np.arange(1, 5), [1, 0, 0, 0])
+    points = extrude(np.vstack((anticlockwise, clockwise, line)))
+
+    first, last, arcs = fit_arcs(points, tolerance=0.01)
+    assert first.tolist() == [0, 59]
+    assert last.tolist() == [59, 78]
+    np.testing.assert_allclose(arcs.centre, [[0, 0], [-15, 0]], atol=1e-9)
+    assert np.degrees(arcs.sweep).tolist() == pytest.approx([180, -90])
+    assert arcs.start.tolist() == points[[0, 59]].tolist()
+    assert arcs.end.tolist() == points[[59, 78]].tolist()
+
+    # Turning it back into segments stays within the tolerance of the circle.
+    segments, counts = arcs.linearize(0.001)
+    distances = np.hypot(*(segments[: counts[0], :2].T))
+    assert distances == pytest.approx(10, abs=0.01)
+
+    # Segments that can't be joined split the arcs.
+    joinable = np.ones(len(points) - 2, dtype=bool)
+    joinable[14] = False
+    first, _, _ = fit_arcs(points, joinable)
+    assert first.tolist() == [0, 15, 59]
+
+
+def test_fit_arcs_leaves_lines_and_corners():
+    square = np.array(
+        [[0, 0, 0, 0], [10, 0, 0, 0], [10, 10, 0, 0], [0, 10, 0, 0], [0, 0, 0, 0]],
+        dtype=float,
+    )
+    first, _, arcs = fit_arcs(square)
+    assert len(first) == 0 and len(arcs) == 0
+
+    # Too few segments, or too far from a circle.
+    points = circle_points((0, 0), 10, 0, 0.15, 4)
+    assert len(fit_arcs(points, min_segments=3)[0]) == 1
+    assert len(fit_arcs(points, min_segments=4)[0]) == 0
+    points[1, :2] *= 1.01
+    assert len(fit_arcs(points, tolerance=0.01)[0]) == 0
+    # Segments further from the arc than the tolerance.
+    points = circle_points((0, 0), 10, 0, math.pi, 20)
+    assert len(fit_arcs(points, tolerance=0.01)[0]) == 0
+
+    # Uneven extrusion isn't joined, as an arc extrudes evenly.
+    points = extrude(circle_points((0, 0), 10, 0, 0.5, 10))
+    points[5:, 3] *= 2
+    first, last, _ = fit_arcs(points)
+    assert (first.tolist(), last.tolist()) == ([0, 5], [4, 9])
+
+    with pytest.raises(ValueError):
+        fit_arcs(points, tolerance=0)
+    with pytest.raises(ValueError):
+        fit_arcs(points, min_segments=1)
+
+
+@pytest.mark.parametrize("absolute", [True, False])
+def test_fit_arc_moves(absolute):
+    points = extrude(circle_points((0, 0), 10, 0, math.pi, 60))
+    lines = ["G90", "M82" if absolute else "M83", "G1 X10 Y0 F600"]
+    for previous, point in zip(points, points[1:]):
+        e = point[3] if absolute else point[3] - previous[3]
+        lines.append(f"G1 X{point[0]:.6f} Y{point[1]:.6f} E{e:.6f}")
+    lines.append("M106 S255")
+    commands = parse("\n".join(lines) + "\n")
+
+    result = fit_arc_moves(commands)
+    assert [command.command for command in result] == [
+        "G90",
+        "M82" if absolute else "M83",
+        "G1",
+        "G3",
+        "M106",
+    ]
+    arc = result[3]
+    assert list(arc.fields) == ["X", "Y", "I", "J", "E"]
+    assert (arc.fields["X"], arc.fields["Y"]) == pytest.approx((-10, 0))
+    assert (arc.fields["I"], arc.fields["J"]) == pytest.approx((-10, 0), abs=1e-6)
+    # The arc extrudes as much as the moves it replaces.
+    before = track_columns(CommandColumns.from_commands(commands))
+    after = track_columns(CommandColumns.from_commands(result))
+    assert after.positions[-1] == pytest.approx(before.positions[-1])
+    assert after.e_delta.sum() == pytest.approx(before.e_delta.sum())
+
+
+def test_fit_arc_moves_breaks():
+    points = circle_points((0, 0), 1, 0, math.pi, 13)
+    moves = [
+        GcodeCommand("G1", {"X": float(x), "Y": float(y), "E": 0.1})
+        for x, y, _, _ in points
+    ]
+    moves[0].fields["F"] = 600
+    # A comment, a feedrate change and another command break up the arcs.
+    moves[3] = GcodeCommand("G1", moves[3].fields, "comment")
+    moves[6].fields["F"] = 1200
+    commands = moves[:9] + [GcodeCommand("M204", {"S": 1000})] + moves[9:]
+
+    result = fit_arc_moves(commands, min_segments=2)
+    codes = [command.command for command in result]
+    assert codes == ["G1", "G3", "G1", "G3", "G3", "M204", "G3"]
+    assert result[4].fields["F"] == 1200
+    assert "F" not in result[6].fields
+
+    assert fit_arc_moves([]) == []
+
+
+def test_fit_arc_moves_file(fixtures_dir):
+    path = os.path.join(fixtures_dir, "BenchyRules_PLA_14m.bgcode")
+    with BGcodeFile(path, strict_mode=False) as file:
+        commands = list(file.commands)
+
+    result = fit_arc_moves(commands)
+    added = len([command for command in result if command.command in ("G2", "G3")])
+    original = len([command for command in commands if command.command in ("G2", "G3")])
+    assert added > original
+    assert len(result) < len(commands)
+
+    before = track_columns(CommandColumns.from_commands(commands))
+    after = track_columns(CommandColumns.from_commands(result))
+    assert after.e_delta.sum() == pytest.approx(before.e_delta.sum())
+    # Every move still ends at one of the original positions.
+    ends = {tuple(row) for row in before.positions.round(6)}
+    assert all(tuple(row) in ends for row in after.positions.round(6))
@@ -2,7 +2,8 @@ import os
 from typing import TextIO
 import pytest  # type: ignore
 from io import StringIO
-from gcode_file import BasicGCodeParser
+from gcode_file import BasicGCodeParser, ErrorCode, GCodeParser, ParseErrors
+from gcode_file.gcode.checksum import number_line
 
 
 @pytest.fixture
@@ -107,6 +108,136 @@ def test_parse_line_non_strict_mode():
     assert "unsupported command" in result.error.lower()
 
 
+def test_parse_line_flags():
+    parser = BasicGCodeParser()
+    assert parser.parse_line("G28 X").fields == {"X": True}
+    assert parser.parse_line("G28 XY").fields == {"X": True, "Y": True}
+    assert parser.parse_line("G28 W").fields == {"W": True}
+    assert parser.parse_line('M862.3 P "XL"').fields == {"P": "XL"}
+    # Back up and restore the speed factor.
+    assert parser.parse_line("M220 B").fields == {"B": True}
+    assert parser.parse_line("M220 R").fields == {"R": True}
+    with pytest.raises(ValueError):
+        parser.parse_line("G28 XX")
+
+
+def test_parse_line_numbers():
+    parser = BasicGCodeParser()
+    result = parser.parse_line("N123 G1 X10*81 ; move")
+    assert result.command == "G1"
+    assert result.fields == {"X": 10}
+    assert result.comment == "move"
+    assert result.line_number is None
+    assert parser.parse_line("N0 M73 P0*87").fields == {"P": 0}
+    assert parser.parse_line("N7").command == ""
+
+    result = BasicGCodeParser(strip_line_numbers=False).parse_line("N123 G1 X10*81")
+    assert result.line_number == 123
+    assert (
+        BasicGCodeParser(strip_line_numbers=False).parse_line("G28").line_number is None
+    )
+
+    # Strings may contain a "*".
+    result = parser.parse_line('M862.6 P"Input*shaper"')
+    assert result.fields == {"P": "Input*shaper"}
+
+
+def test_parse_line_bad_checksum():
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        BasicGCodeParser().parse_line("N123 G1 X10*70")
+
+    result = BasicGCodeParser(strict_mode=False).parse_line("N123 G1 X11*81")
+    assert result.command == "G1"
+    assert result.fields == {"X": 11}
+    assert "Checksum mismatch" in result.error
+
+
+def test_parse_numbered_stream(fixtures_dir):
+    with open(os.path.join(fixtures_dir, "simple.gcode")) as file:
+        lines = [line.split(";")[0].strip() for line in file]
+    numbered = "".join(
+        number_line(number, line) + "\n" for number, line in enumerate(lines) if line
+    )
+
+    parser = BasicGCodeParser(strict_mode=False)
+    expected = [
+        (command.command, command.fields)
+        for command in parser.parse_stream(StringIO("\n".join(lines)))
+    ]
+    assert [
+        (command.command, command.fields)
+        for command in parser.parse_stream(StringIO(numbered))
+    ] == expected
+
+
+def test_parse_stream_recovering():
+    gcode = (
+        "G28\n"
+        "M9999 P1 ; vendor specific\n"
+        "garbage\n"
+        "G1 X1 X2\n"
+        "G1 X1 Q5\n"
+        "G1\n"
+        "N1 G1 X10*0\n"
+        "G1 X10\n"
+    )
+    # Without somewhere to record errors, the first bad line stops parsing.
+    with pytest.raises(ValueError, match="Error on line 3"):
+        list(BasicGCodeParser(strict_mode=False).parse_stream(StringIO(gcode)))
+
+    errors = ParseErrors()
+    commands = list(BasicGCodeParser().parse_stream(StringIO(gcode), errors))
+    # Lines that can't be parsed, or are corrupted, are skipped, and the rest
+    # kept, without errors.
+    assert [str(command) for command in commands] == [
+        "G28",
+        "M9999 P1 ;vendor specific",
+        "G1 X1 Q5",
+        "G1",
+        "G1 X10",
+    ]
+    assert all(command.error is None for command in commands)
+
+    assert list(errors.line_numbers) == [2, 3, 4, 5, 6, 7]
+    assert [error.code for error in errors] == [
+        ErrorCode.UNSUPPORTED_COMMAND,
+        ErrorCode.INVALID_COMMAND,
+        ErrorCode.DUPLICATE_FIELD,
+        ErrorCode.UNSUPPORTED_FIELD,
+        ErrorCode.RULE,
+        ErrorCode.CHECKSUM,
+    ]
+    assert errors.counts()[ErrorCode.UNSUPPORTED_COMMAND] == 1
+    assert list(errors.messages()) == [
+        "Error on line 2: M9999 is an unsupported command",
+        "Error on line 3: Invalid G-code command: garbage",
+        "Error on line 4: Duplicate field 'X'",
+        "Error on line 5: G1 has unsupported field: Q",
+        "Error on line 6: G1 requires at least one of the fields, but none were "
+        "provided.",
+        "Error on line 7: Checksum mismatch: *0, but it's 80",
+    ]
+
+    # The messages are the same as in non-strict mode.
+    parser = BasicGCodeParser(strict_mode=False)
+    assert errors[0].message == parser.parse_line("M9999 P1").error
+    assert errors[4].message == parser.parse_line("G1").error
+
+
+def test_parse_stream_recovering_fixtures(fixtures_dir):
+    for filename in os.listdir(fixtures_dir):
+        if filename.endswith(".gcode"):
+            with open(os.path.join(fixtures_dir, filename)) as file:
+                text = file.read()
+            errors = ParseErrors()
+            commands = list(GCodeParser().parse_stream(StringIO(text), errors))
+            expected = list(GCodeParser(strict_mode=False).parse_stream(StringIO(text)))
+            assert len(commands) == len(expected)
+            assert len(errors) == sum(
+                1 for command in expected if getattr(command, "error", None)
+            )
+
+
 def _test_single_file(parser: BasicGCodeParser, file_path: TextIO):
     try:
         found = 0
@@ -0,0 +1,16 @@
+from functools import reduce
+
+from gcode_file.gcode.checksum import checksum, number_line
+
+
+def test_checksum():
+    for length in range(100):
+        line = bytes(range(32, 32 + length))
+        assert checksum(line) == reduce(lambda a, b: a ^ b, line, 0)
+    assert checksum("") == 0
+    assert checksum("N1 G1 X10") == checksum(b"N1 G1 X10") == 80
+
+
+def test_number_line():
+    assert number_line(1, "G1 X10") == "N1 G1 X10*80"
+    assert number_line(0, "M110 N0") == "N0 M110 N0*125"
@@ -0,0 +1,82 @@
+import io
+import os
+import pytest  # type: ignore
+from gcode_file import GCodeParser, GcodeCommand
+from gcode_file.gcode.command import PrusaSlicerConfigCommand, ThumbnailCommand
+from gcode_file.gcode.comment_handlers import CommentHandlerRegistry
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+def test_find_handler():
+    registry = CommentHandlerRegistry()
+
+    def layer(start, stream):
+        return "layer"
+
+    def layer_change(start, stream):
+        return "layer_change"
+
+    registry.register_handler("LAYER", layer)
+    registry.register_handler("LAYER_CHANGE", layer_change)
+    registry.register_handler(
+        "TYPE:", layer, match=lambda comment: comment != "TYPE:Custom"
+    )
+
+    # Longer prefixes win
+    assert registry.find_handler("LAYER_CHANGE") is layer_change
+    assert registry.find_handler("LAYER:3") is layer
+    assert registry.find_handler("TYPE:Perimeter") is layer
+    assert registry.find_handler("TYPE:Custom") is None
+    assert registry.find_handler("thumbnail begin 16x16 500") is None
+    assert registry.find_handler("") is None
+
+
+def test_register_handler_invalid():
+    registry = CommentHandlerRegistry()
+    with pytest.raises(TypeError):
+        registry.register_handler("", lambda start, stream: None)
+    with pytest.raises(TypeError):
+        registry.register_handler("LAYER:", "not callable")
+
+
+def test_custom_handler():
+    """A custom registry replaces the built-in handlers."""
+    registry = CommentHandlerRegistry()
+    registry.register_handler(
+        "LAYER:", lambda start, stream: int(start.comment[len("LAYER:") :])
+    )
+    parser = GCodeParser(comment_handlers=registry)
+
+    stream = io.StringIO(";LAYER:0\nG1 X10\n;LAYER:1\n; thumbnail begin 1x1 4\n")
+    commands = list(parser.parse_stream(stream))
+
+    assert commands[0] == 0
+    assert commands[1].command == "G1"
+    assert commands[2] == 1
+    assert isinstance(commands[3], GcodeCommand)
+    assert commands[3].comment == "thumbnail begin 1x1 4"
+
+
+def test_prusaslicer_config(fixtures_dir):
+    parser = GCodeParser(strict_mode=False)
+    file_path = os.path.join(fixtures_dir, "lines_0.4n_0.2mm_PETG_XLIS_57s.gcode")
+    with open(file_path, "r") as file:
+        commands = list(parser.parse_stream(file))
+
+    thumbnails = [c for c in commands if isinstance(c, ThumbnailCommand)]
+    assert [(t.format, t.width, t.height) for t in thumbnails] == [
+        ("QOI", 16, 16),
+        ("QOI", 313, 173),
+        ("QOI", 480, 240),
+        ("PNG", 380, 285),
+    ]
+
+    config = commands[-1]
+    assert isinstance(config, PrusaSlicerConfigCommand)
+    assert config.config["arc_fitting"] == "emit_center"
+    assert config.config["bed_custom_model"] == ""
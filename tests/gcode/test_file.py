@@ -33,8 +33,8 @@ def test_bgcode_file_methods(fixtures_dir):
         assert file.commands is not None
 
 
-def test_gcode_file_methods():
-    file_path = "test.gcode"
+def test_gcode_file_methods(fixtures_dir):
+    file_path = os.path.join(fixtures_dir, "lines_0.4n_0.2mm_PETG_XLIS_57s.gcode")
     file_instance = GcodeFile(file_path)
 
     with pytest.raises(NotImplementedError):
@@ -46,11 +46,13 @@ def test_gcode_file_methods():
     with pytest.raises(NotImplementedError):
         _ = file_instance.thumbnails
 
-    with pytest.raises(NotImplementedError):
-        _ = file_instance.print_metadata
+    assert (
+        file_instance.print_metadata["estimated printing time (normal mode)"] == "57s"
+    )
+    assert file_instance.slicer_settings["arc_fitting"] == "emit_center"
 
-    with pytest.raises(NotImplementedError):
-        _ = file_instance.slicer_settings
+    commands = list(file_instance.commands)
+    assert commands[-1].config == file_instance.slicer_settings
 
-    with pytest.raises(NotImplementedError):
-        _ = file_instance.commands
+    # The file is still usable after the commands are iterated
+    assert len(list(file_instance.commands)) == len(commands)
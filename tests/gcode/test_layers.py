@@ -0,0 +1,104 @@
+import os
+import pytest  # type: ignore
+from gcode_file.file import BGcodeFile, GcodeFile
+from gcode_file.gcode.layers import scan_layers
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+MARKER_GCODE = b"""G28
+G1 Z5 F720
+;LAYER_CHANGE
+;Z:0.2
+G1 Z.2
+G1 X10 Y10 E.5
+G1 X20 Y10 E.5
+;LAYER_CHANGE
+;Z:0.4
+G1 Z.4
+G1X10Y10E.5
+"""
+
+# The same moves, without markers, and with a Z-hop during a travel move.
+NO_MARKER_GCODE = b"""G28
+G1 Z5 F720
+G1 Z.2
+G1 X10 Y10 E.5
+G1 Z.6
+G1 X20 Y20
+G1 Z.2
+G1 X20 Y10 E.5
+G1 Z.4
+G1X10Y10E.5"""
+
+
+def test_scan_markers():
+    layers = scan_layers(MARKER_GCODE)
+
+    assert [layer.z for layer in layers] == [0.2, 0.4]
+    assert [layer.height for layer in layers] == [None, 0.2]
+    assert [(layer.first_line, layer.line_count) for layer in layers] == [
+        (3, 5),
+        (8, 4),
+    ]
+    assert layers[0].move_count == 3
+    assert layers[0].extrusion_count == 2
+    assert layers[1].move_count == 2
+    assert layers[1].extrusion_count == 1
+    assert layers[0].text().startswith(";LAYER_CHANGE\n;Z:0.2\n")
+
+    commands = list(layers[1])
+    assert [c.command for c in commands] == ["", "", "G1", "G1"]
+    assert commands[3].fields == {"X": 10, "Y": 10, "E": 0.5}
+
+
+def test_scan_cura_markers():
+    layers = scan_layers(b";LAYER:0\nG0 X1 Y1 Z0.3\nG1 X2 E1\n;LAYER:1\nG0 Z0.5\n")
+    assert [layer.z for layer in layers] == [0.3, 0.5]
+
+
+def test_scan_z_increases():
+    layers = scan_layers(NO_MARKER_GCODE)
+
+    # The Z-hop to 0.6 is not a layer, as nothing is printed at that height.
+    assert [layer.z for layer in layers] == [0.2, 0.4]
+    assert [(layer.first_line, layer.line_count) for layer in layers] == [
+        (3, 6),
+        (9, 2),
+    ]
+    assert [c.command for c in layers[1]] == ["G1", "G1"]
+
+
+def test_scan_empty():
+    assert scan_layers(b"") == []
+    assert scan_layers(b"G28\nM104 S200\n") == []
+
+
+def test_gcode_file_layers(fixtures_dir):
+    file_path = os.path.join(fixtures_dir, "Apple Chancery.gcode")
+    with GcodeFile(file_path) as file:
+        layers = file.layers
+
+        assert len(layers) == 50
+        assert layers[0].z == 0.2
+        assert layers[-1].z == 10.0
+        assert all(layer.height == 0.2 for layer in layers[1:])
+
+        commands = list(layers[10])
+        assert commands[0].comment == "LAYER_CHANGE"
+        assert len(commands) == layers[10].line_count
+
+
+def test_bgcode_file_layers(fixtures_dir):
+    file_path = os.path.join(fixtures_dir, "BonkersBenchy_PLA_8m.bgcode")
+    with BGcodeFile(file_path) as file:
+        layers = file.layers
+
+        assert len(layers) == 171
+        assert layers[0].z == 0.3
+        assert layers[-1].z == float(file.printer_metadata["max_layer_z"])
+        assert layers[5].move_count > 0
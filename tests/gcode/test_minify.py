@@ -0,0 +1,173 @@
+import io
+import os
+import pytest  # type: ignore
+from gcode_file import BasicGCodeParser
+from gcode_file.gcode.command import ThumbnailCommand
+from gcode_file.gcode.minify import (
+    MINIFY_DECIMALS,
+    Minifier,
+    MinifyReport,
+    minify,
+    minify_file,
+)
+from gcode_file.gcode.state import MOVE_COMMANDS, track_state
+from gcode_file.gcode.writer import write_commands
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+def parse(gcode: str):
+    return list(BasicGCodeParser(strict_mode=False).parse_stream(io.StringIO(gcode)))
+
+
+def run(gcode: str, **kwargs) -> str:
+    stream = io.BytesIO()
+    write_commands(
+        minify(parse(gcode), **kwargs),
+        stream,
+        decimals=MINIFY_DECIMALS,
+        trim_leading_zero=True,
+    )
+    return stream.getvalue().decode("utf-8")
+
+
+def motion(gcode: str):
+    """The position and feedrate after each move that changes the position."""
+    moves = []
+    previous = None
+    for command, state in track_state(parse(gcode)):
+        position = (state.x, state.y, state.z, state.e_abs)
+        if command.command in MOVE_COMMANDS and position != previous:
+            moves.append((position, state.feedrate))
+        previous = position
+    return moves
+
+
+def test_minify():
+    gcode = """\
+; a comment
+
+G90
+M82
+G1 X10.0000 Y20.0004 F1200.0 ; move
+G1 X10 Y20 E0.5 F1200
+G1 X10 Y20
+G1 F600
+M106 S255 ; fan
+G1 Y25 E0.75
+G1 X12.00049 Z0.2 F600
+"""
+    assert run(gcode) == (
+        "G90\nM82\nG1 X10 Y20 F1200\nG1 E.5\nM106 S255\nG1 Y25 E.75 F600\n"
+        "G1 X12 Z.2\n"
+    )
+
+
+def test_relative_rounding():
+    # Each move rounds to 0.001, but the error is carried over, so the
+    # total is right.
+    gcode = "G91\nM83\n" + "G1 X0.0004 E0.0004\n" * 10
+    minified = run(gcode, decimals={"X": 3, "E": 3})
+    assert minified.count("G1") == 4
+    commands = parse(minified)
+    assert sum(command.fields.get("X", 0) for command in commands) == pytest.approx(
+        0.004
+    )
+    assert motion(minified)[-1][0][0] == pytest.approx(0.004)
+    assert motion(minified)[-1][0][3] == pytest.approx(0.004)
+
+
+def test_unknown_position():
+    gcode = "G1 X1 Y1 Z1 F100\nG28\nG1 X1 Y1 Z1\nT1\nG1 X1 Y1 Z1\nG4 S1\nG1 X1 Y1 Z1\n"
+    assert run(gcode) == (
+        "G1 X1 Y1 Z1 F100\nG28\nG1 X1 Y1 Z1 F100\nT1\nG1 X1 Y1 Z1 F100\nG4 S1\n"
+    )
+
+    # G92 sets the position.
+    assert run("G92 X5\nG1 X5 Y1\nG92\nG1 X5 Y1\n") == (
+        "G92 X5\nG1 Y1\nG92\nG1 X5 Y1\n"
+    )
+
+
+def test_invalid_moves():
+    # Moves with an error are kept as they are, so the printer is somewhere
+    # the minifier doesn't know, and the next move has all its axes.
+    for invalid in ("G2 X20 Y0 I5", "G1 X20 Y0 Q5"):
+        gcode = f"G90\nG1 X10 Y0\n{invalid}\nG1 X10 Y0\n"
+        assert parse(gcode)[2].error
+        assert run(gcode).splitlines() == ["G90", "G1 X10 Y0", invalid, "G1 X10 Y0"]
+
+
+def test_arcs_keep_their_end():
+    gcode = "G1 X10 Y10\nG2 X10 Y10 I5 J0.00001 F300\nG3 X10 Y10 R2\n"
+    assert run(gcode) == ("G1 X10 Y10\nG2 X10 Y10 I5 J0 F300\nG3 X10 Y10 R2\n")
+
+
+def test_comments():
+    gcode = """\
+;LAYER_CHANGE
+;Z:0.2
+;TYPE:Perimeter
+; printing object
+; filament used [mm] = 12.5
+; thumbnail begin 1x1 8
+; AAAAAAAA
+; thumbnail end
+"""
+    assert run(gcode) == (
+        ";LAYER_CHANGE\n;Z:0.2\n;TYPE:Perimeter\n;filament used [mm] = 12.5\n"
+        ";thumbnail begin 1x1 8\n;AAAAAAAA\n;thumbnail end\n"
+    )
+    assert run(gcode, keep_comments=()) == (
+        ";filament used [mm] = 12.5\n;thumbnail begin 1x1 8\n;AAAAAAAA\n"
+        ";thumbnail end\n"
+    )
+
+    thumbnail = ThumbnailCommand(b"", "PNG", 1, 1, 0)
+    assert list(minify([thumbnail])) == [thumbnail]
+
+
+def test_invalid_decimals():
+    with pytest.raises(ValueError):
+        Minifier(decimals={"X": -1})
+
+
+def test_minify_file(fixtures_dir):
+    path = os.path.join(fixtures_dir, "lines_0.4n_0.2mm_PETG_XLIS_57s.gcode")
+    with open(path, "rb") as file:
+        original = file.read()
+    output = io.BytesIO()
+    report = minify_file(io.BytesIO(original), output)
+    minified = output.getvalue()
+
+    assert report.bytes_before == len(original)
+    assert report.bytes_after == len(minified)
+    assert report.lines_before == original.count(b"\n")
+    assert report.lines_after == minified.count(b"\n")
+    assert report.saved > 0
+    assert report.ratio > 1
+    assert "smaller" in str(report)
+
+    text = minified.decode("utf-8")
+    # The metadata is kept as it was, and unparsed text such as names too.
+    assert "; thumbnail_QOI begin 16x16 500\n" in text
+    assert "; prusaslicer_config = begin\n" in text
+    assert "M486 AShape-Box\n" in text
+    assert "\nG0 Z5 F480\n" in text
+
+    moves = motion(original.decode("utf-8"))
+    minified_moves = motion(text)
+    assert len(minified_moves) == len(moves)
+    for (a, feedrate_a), (b, feedrate_b) in zip(moves, minified_moves):
+        assert a == pytest.approx(b, abs=1e-3)
+        assert feedrate_a == feedrate_b
+
+
+def test_report():
+    report = MinifyReport(100, 25, 10, 5)
+    assert (report.saved, report.ratio) == (75, 4)
+    assert str(report) == "100 -> 25 bytes (75.0% smaller), 10 -> 5 lines"
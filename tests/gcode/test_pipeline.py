@@ -0,0 +1,214 @@
+import io
+import os
+import pytest  # type: ignore
+from gcode_file import BasicBGCodeParser, BasicGCodeParser, BlockType, GCodeBlock
+from gcode_file import GCodeParser
+from gcode_file.file import BGcodeFile, open_file
+from gcode_file.gcode.command import GcodeCommand, ThumbnailCommand
+from gcode_file.gcode.pipeline import (
+    Pipeline,
+    offset_z,
+    remap_tools,
+    remove_objects,
+    scale_feedrate,
+    set_temperature,
+)
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+def parse(gcode: str):
+    return list(BasicGCodeParser(strict_mode=False).parse_stream(io.StringIO(gcode)))
+
+
+def run(pipeline: Pipeline, gcode: str) -> str:
+    stream = io.BytesIO()
+    pipeline.write_gcode(parse(gcode), stream)
+    return stream.getvalue().decode("utf-8")
+
+
+def test_stages():
+    pipeline = (
+        Pipeline()
+        .filter(lambda command: command.command != "M117", name="no_messages")
+        .map(lambda command: GcodeCommand(command.command.lower(), command.fields))
+        .insert(lambda command: parse("G4 P1\n") if command.command == "g28" else None)
+        .insert(
+            lambda command: parse("M400\n") if command.command == "g28" else None,
+            after=True,
+        )
+        .expand(lambda command: [command, command] if command.command == "g1" else [])
+    )
+    assert run(pipeline, "G28\nM117\nG1 X1\nM83\n") == "g1 X1\ng1 X1\n"
+
+    timings = pipeline.timings
+    assert [timing.name for timing in timings] == [
+        "no_messages",
+        "<lambda>",
+        "<lambda>",
+        "<lambda>",
+        "<lambda>",
+    ]
+    assert [(timing.commands_in, timing.commands_out) for timing in timings] == [
+        (4, 3),
+        (3, 3),
+        (3, 4),
+        (4, 5),
+        (5, 2),
+    ]
+    assert all(timing.seconds > 0 for timing in timings)
+
+
+def test_run_is_lazy():
+    seen = []
+
+    def source():
+        for command in parse("G1 X1\nG1 X2\nG1 X3\n"):
+            seen.append(command)
+            yield command
+
+    results = Pipeline(timed=False).map(scale_feedrate(2)).run(source())
+    next(results)
+    assert len(seen) == 1
+
+
+def test_scale_feedrate():
+    pipeline = Pipeline().map(scale_feedrate(1.5))
+    assert run(pipeline, "G1 X1 F1000\nM203 F1000\nG0 F200.5\n") == (
+        "G1 X1 F1500\nM203 F1000\nG0 F300.75\n"
+    )
+    with pytest.raises(ValueError):
+        scale_feedrate(0)
+
+
+def test_offset_z():
+    pipeline = Pipeline().map(offset_z(0.1))
+    gcode = "G1 Z0.2\nG91\nG1 Z1\nG90\nG92 Z5\nG0 X1 Z0.4\nM201 Z200\n"
+    assert run(pipeline, gcode) == (
+        "G1 Z0.3\nG91\nG1 Z1\nG90\nG92 Z5.1\nG0 X1 Z0.5\nM201 Z200\n"
+    )
+
+
+def test_set_temperature():
+    pipeline = Pipeline().map(set_temperature(hotend=250))
+    gcode = "M104 S215\nM109 R215\nM104 T1 S0\nM140 S60\n"
+    assert run(pipeline, gcode) == "M104 S250\nM109 R250\nM104 T1 S0\nM140 S60\n"
+
+    pipeline = Pipeline().map(set_temperature(bed=90))
+    assert run(pipeline, "M104 S215\nM190 S60\n") == "M104 S215\nM190 S90\n"
+
+
+def test_remap_tools():
+    pipeline = Pipeline().map(remap_tools({0: 2, 2: 0}))
+    gcode = "T0\nT1\nT2 ; change\nM104 T0 S215\nM204 T1000\n"
+    assert run(pipeline, gcode) == ("T2\nT1\nT0 ;change\nM104 T2 S215\nM204 T1000\n")
+
+
+def test_remove_objects():
+    gcode = """\
+M83
+M486 S0
+G1 X1 Y1 E1
+M486 S-1
+M486 S1
+G1 X2 Y2 E2
+G1 E-0.8
+G1 Z0.4
+M486 S-1
+G1 X3 E3
+"""
+    pipeline = Pipeline().expand(remove_objects([1]))
+    assert run(pipeline, gcode) == gcode.replace("G1 X2 Y2 E2", "G1 X2 Y2").replace(
+        "G1 E-0.8\n", ""
+    )
+
+    # With absolute extrusion, the E position is set again after the object.
+    absolute = gcode.replace("M83", "M82").replace("E-0.8", "E2.2")
+    assert run(pipeline, absolute) == (
+        "M82\nM486 S0\nG1 X1 Y1 E1\nM486 S-1\nM486 S1\nG1 X2 Y2\nG1 Z0.4\n"
+        "M486 S-1\nG92 E2.2\nG1 X3 E3\n"
+    )
+
+
+def test_other_commands_pass_through():
+    thumbnail = ThumbnailCommand(b"", "PNG", 1, 1, 0)
+    pipeline = (
+        Pipeline()
+        .map(scale_feedrate(2))
+        .map(offset_z(1))
+        .map(set_temperature(200, 60))
+        .map(remap_tools({0: 1}))
+        .expand(remove_objects([0]))
+    )
+    assert list(pipeline.run([thumbnail])) == [thumbnail]
+
+
+@pytest.mark.parametrize("extension", ["gcode", "bgcode"])
+def test_empty_pipeline(fixtures_dir, extension):
+    path = os.path.join(fixtures_dir, f"lines_0.4n_0.2mm_PETG_XLIS_57s.{extension}")
+    with open_file(path, strict_mode=False) as file:
+        # Everything but the blank lines.
+        expected = [line.strip() for line in file.lines if line.strip()]
+        stream = io.BytesIO()
+        Pipeline().write_gcode(file.commands, stream)
+
+    written = stream.getvalue().decode("utf-8").splitlines()
+    assert written == expected
+    # Text the fields don't keep, such as the version and object names.
+    assert "M115 U6.2.4+8909" in written
+    assert written.count("M486 AShape-Box") == 7
+
+
+def test_write_bgcode(fixtures_dir):
+    path = os.path.join(fixtures_dir, "lines_0.4n_0.2mm_PETG_XLIS_57s.bgcode")
+    with BGcodeFile(path, strict_mode=False) as file:
+        commands = list(file.commands)
+        others = [block for block in file.blocks if not isinstance(block, GCodeBlock)]
+
+    pipeline = Pipeline().map(offset_z(0.1))
+    stream = io.BytesIO()
+    pipeline.write_bgcode(commands, stream, others, processes=1)
+
+    stream.seek(0)
+    blocks = list(BasicBGCodeParser().parse_stream(stream))
+    assert len([block for block in blocks if not isinstance(block, GCodeBlock)]) == len(
+        others
+    )
+    text = "".join(block.data() for block in blocks if isinstance(block, GCodeBlock))
+    written = parse(text)
+    assert len(written) == len(commands)
+    z = [command.fields["Z"] for command in written if "Z" in command.fields]
+    expected = [command.fields["Z"] for command in commands if "Z" in command.fields]
+    assert z[-1] == pytest.approx(expected[-1] + 0.1)
+
+
+def test_write_bgcode_from_text(fixtures_dir):
+    path = os.path.join(fixtures_dir, "lines_0.4n_0.2mm_PETG_XLIS_57s")
+    with open(path + ".gcode") as f:
+        commands = GCodeParser(strict_mode=False).parse_stream(f)
+        stream = io.BytesIO()
+        Pipeline().write_bgcode(commands, stream, processes=1)
+
+    # The blocks are the same as the slicer's bgcode file.
+    stream.seek(0)
+    blocks = list(BasicBGCodeParser().parse_stream(stream))
+    with open(path + ".bgcode", "rb") as f:
+        expected = list(BasicBGCodeParser().parse_stream(f))
+    types = [block.type for block in blocks if block.type != BlockType.GCODE]
+    assert types == [block.type for block in expected if block.type != BlockType.GCODE]
+    assert BlockType.THUMBNAIL in types
+    assert BlockType.SLICER_METADATA in types
+
+    for block_type in (BlockType.PRINTER_METADATA, BlockType.PRINT_METADATA):
+        assert [b.data for b in blocks if b.type == block_type] == [
+            b.data for b in expected if b.type == block_type
+        ]
+    thumbnails = [b.data for b in blocks if b.type == BlockType.THUMBNAIL]
+    assert thumbnails == [b.data for b in expected if b.type == BlockType.THUMBNAIL]
+    text = "".join(block.data() for block in blocks if isinstance(block, GCodeBlock))
+    assert "thumbnail" not in text
+    assert "prusaslicer_config" not in text
@@ -0,0 +1,105 @@
+import io
+import os
+import pytest  # type: ignore
+from gcode_file import BasicBGCodeParser, BasicGCodeParser, BlockType, GCodeParser
+from gcode_file import GCodeValidator, ParseStats
+from gcode_file.bgcode.meatpack import MeatUnpacker
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+GCODE = "G28 ; home\nG1 X10 Y20\n; comment\nG1 X20 E0.5\n"
+
+
+def test_parse_stream():
+    reports = []
+    stats = ParseStats(callback=reports.append)
+    commands = list(BasicGCodeParser(stats=stats).parse_stream(io.StringIO(GCODE)))
+
+    assert len(commands) == 4
+    assert stats.read.lines == stats.tokenize.lines == 4
+    assert stats.read.bytes == stats.tokenize.bytes == len(GCODE)
+    assert stats.validate.lines == 3
+    assert stats.tokenize.seconds > 0
+    assert stats.validate.seconds > 0
+    assert reports == [stats]
+
+    stats.reset()
+    assert stats.seconds == 0
+    assert stats.tokenize.lines == 0
+
+
+def test_stats_do_not_change_results(fixtures_dir):
+    path = os.path.join(fixtures_dir, "lines_0.4n_0.2mm_PETG_XLIS_57s.gcode")
+    with open(path) as f:
+        text = f.read()
+    stats = ParseStats()
+    profiled = list(GCodeParser(stats=stats).parse_stream(io.StringIO(text)))
+    expected = GCodeParser().parse_stream(io.StringIO(text))
+    assert [(type(c), vars(c)) for c in profiled] == [
+        (type(c), vars(c)) for c in expected
+    ]
+    assert stats.tokenize.lines == len(text.splitlines())
+    # The four thumbnails and the slicer config.
+    assert stats.special_blocks.lines == 5
+    assert stats.special_blocks.seconds > 0
+
+
+def test_validator_stats():
+    stats = ParseStats()
+    validator = GCodeValidator(stats=stats)
+    validator.register_rule("G28", {})
+    validator.register_rule("G1", {"X": (float, int)})
+    list(
+        BasicGCodeParser(validator, stats=stats).parse_stream(
+            io.StringIO("G28\nG1 X10\n")
+        )
+    )
+    # The validator adds its own time, which isn't counted twice.
+    assert stats.validate.lines == 2
+
+    with pytest.raises(ValueError):
+        validator.validate(BasicGCodeParser(strict_mode=False).parse_line("G1 Q1"))
+    assert stats.validate.lines == 3
+
+
+def test_meatpack_stats():
+    stats = ParseStats()
+    data = b"\xff\xff\xfb" + b"\x45\x12"
+    unpacker = MeatUnpacker(stats=stats)
+    unpacker.decompress(data)
+    assert stats.meatpack.bytes == len(data)
+    assert stats.meatpack.seconds > 0
+
+
+def test_bgcode(fixtures_dir):
+    reports = []
+    stats = ParseStats(callback=reports.append)
+    parser = BasicBGCodeParser(stats=stats)
+    gcode_parser = GCodeParser(strict_mode=False, stats=stats)
+
+    path = os.path.join(fixtures_dir, "lines_0.4n_0.2mm_PETG_XLIS_57s.bgcode")
+    with open(path, "rb") as f:
+        blocks = list(parser.parse_stream(f))
+    # Only the blocks' data is counted, not their headers.
+    compressed = [block.header.compressed_size for block in blocks]
+    assert stats.read.bytes == sum(compressed)
+    assert stats.decompress.bytes < stats.read.bytes
+    assert stats.read.lines == 0
+
+    lines = 0
+    for block in blocks:
+        if block.type == BlockType.GCODE:
+            lines += len(list(block.commands(gcode_parser)))
+
+    for stage in stats.stages[:-1]:
+        assert stage.seconds > 0, stage.name
+    assert stats.meatpack.bytes > 0
+    assert stats.decode.bytes > stats.meatpack.bytes
+    assert stats.tokenize.lines == stats.read.lines
+    assert reports and all(report is stats for report in reports)
+    assert "special_blocks" in str(stats)
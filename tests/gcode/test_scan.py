@@ -0,0 +1,96 @@
+import io
+import os
+import numpy as np
+import pytest  # type: ignore
+from gcode_file import BasicGCodeParser
+from gcode_file.file import BGcodeFile, GcodeFile
+from gcode_file.gcode.scan import chunk_lines, scan_columns
+from gcode_file.gcode.state import CommandColumns
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+COMMANDS = ("G0", "G1", "G4", "G28", "G92", "M204", "T")
+
+
+def parsed_columns(gcode: str) -> CommandColumns:
+    """The columns of the commands in COMMANDS, from parsing the G-code."""
+    parser = BasicGCodeParser(strict_mode=False)
+    columns = CommandColumns.from_commands(parser.parse_stream(io.StringIO(gcode)))
+    found = np.isin(columns.codes, COMMANDS[:-1]) | np.char.startswith(
+        columns.codes, "T"
+    )
+    return CommandColumns(columns.codes[found], columns.values[found])
+
+
+def assert_same(scanned: CommandColumns, parsed: CommandColumns):
+    assert scanned.codes.tolist() == parsed.codes.tolist()
+    np.testing.assert_array_equal(scanned.values, parsed.values)
+
+
+def test_scan_columns():
+    gcode = (
+        "; G1 X500\n"
+        "G28 X\n"
+        "G1 X10.5 Y-20 F1200 ; move\n"
+        "G1X.5Y20E-.25\n"
+        "  G1   Z0.2  \n"
+        "M104 S215\n"
+        "G1.5 X500\n"
+        "G10 X500\n"
+        "N12 G1 X5*33\n"
+        "G92 E\n"
+        "M204 P1000 T1250\n"
+        "G4 S1\n"
+        "T1\n"
+        "\n"
+    )
+    lines, columns = scan_columns(gcode.encode(), COMMANDS)
+    assert lines.tolist() == [1, 2, 3, 4, 8, 9, 10, 11, 12]
+    assert columns.fields(1) == {"X": 10.5, "Y": -20, "F": 1200}
+    assert columns.fields(4) == {"X": 5}
+    assert columns.fields(5) == {"E": 0}
+    assert_same(columns, parsed_columns(gcode))
+
+
+def test_scan_nothing():
+    lines, columns = scan_columns(b"; comment\n\nM104 S215\n", COMMANDS)
+    assert len(lines) == 0
+    assert len(columns) == 0
+
+
+@pytest.mark.parametrize("command", ["1", "G1.5", "G1000", "g1", ""])
+def test_invalid_commands(command):
+    with pytest.raises(ValueError):
+        scan_columns(b"G1 X1\n", (command,))
+
+
+def test_chunk_lines():
+    lines = ["G1 X1\n", "G1 X2\n", "G1 X3\n"]
+    assert list(chunk_lines(lines, 2)) == [(2, b"G1 X1\nG1 X2\n"), (1, b"G1 X3\n")]
+    assert list(chunk_lines("G1 X1\r\nG1 X2".splitlines(), 5)) == [
+        (2, b"G1 X1\nG1 X2\n")
+    ]
+    assert list(chunk_lines([], 5)) == []
+
+
+@pytest.mark.parametrize(
+    "name",
+    [
+        "lines_0.4n_0.2mm_PETG_XLIS_57s.gcode",
+        "mmu3_pla_ 5colors_3dbenchy_0.4n_0.2mm__MK4IS3h24m.bgcode",
+    ],
+)
+def test_files(fixtures_dir, name):
+    """Scanning a file finds the same commands as parsing it."""
+    path = os.path.join(fixtures_dir, name)
+    file_class = BGcodeFile if name.endswith(".bgcode") else GcodeFile
+    with file_class(path, strict_mode=False) as file:
+        gcode = "".join(file.lines)
+
+    _, columns = scan_columns(gcode.encode(), COMMANDS)
+    assert_same(columns, parsed_columns(gcode))
@@ -0,0 +1,59 @@
+import io
+import os
+import pytest  # type: ignore
+from gcode_file.gcode.slicer_config import read_prusaslicer_config
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+CONFIG_GCODE = b"""G1 X10 Y20
+; estimated printing time (normal mode) = 57s
+
+; prusaslicer_config = begin
+; arc_fitting = emit_center
+; bed_custom_model = 
+; before_layer_gcode = ;BEFORE_LAYER_CHANGE\\nG92 E0.0\\n;[layer_z]\\n\\n
+; end_gcode = {if max_layer_z < max_print_height}G1 Z{z_offset+min(max_layer_z+1, max_print_height)}{endif}
+; prusaslicer_config = end
+"""
+
+
+def test_read_fixture(fixtures_dir):
+    file_path = os.path.join(fixtures_dir, "lines_0.4n_0.2mm_PETG_XLIS_57s.gcode")
+    with open(file_path, "rb") as stream:
+        config = read_prusaslicer_config(stream)
+        # The stream position should be left unchanged.
+        assert stream.tell() == 0
+
+    assert config["arc_fitting"] == "emit_center"
+    assert config["bed_shape"] == "0x0,360x0,360x360,0x360"
+    assert config["z_offset"] == "0"
+
+
+@pytest.mark.parametrize("chunk_size", [28, 29, 50, 64 * 1024])
+def test_read_chunk_boundaries(chunk_size):
+    """The begin marker should be found regardless of where the chunks split."""
+    config = read_prusaslicer_config(io.BytesIO(CONFIG_GCODE), chunk_size=chunk_size)
+
+    assert config == {
+        "arc_fitting": "emit_center",
+        "bed_custom_model": "",
+        "before_layer_gcode": ";BEFORE_LAYER_CHANGE\\nG92 E0.0\\n;[layer_z]\\n\\n",
+        "end_gcode": "{if max_layer_z < max_print_height}G1 Z{z_offset+min(max_layer_z+1, max_print_height)}{endif}",
+    }
+
+
+def test_read_without_config():
+    assert read_prusaslicer_config(io.BytesIO(b"G1 X10 Y20\nG1 Z30\n")) == {}
+    assert read_prusaslicer_config(io.BytesIO(b"")) == {}
+
+
+def test_read_missing_begin():
+    stream = io.BytesIO(
+        b"G1 X10\n; arc_fitting = emit_center\n; prusaslicer_config = end\n"
+    )
+    assert read_prusaslicer_config(stream) == {}
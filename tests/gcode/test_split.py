@@ -0,0 +1,218 @@
+import io
+import os
+import pytest  # type: ignore
+from gcode_file import BasicBGCodeParser, BasicGCodeParser, BlockType
+from gcode_file.file import BGcodeFile
+from gcode_file.gcode.split import (
+    PLATE_RESET,
+    main,
+    merge_bgcode,
+    merge_plates,
+    split_layers,
+    split_objects,
+)
+from gcode_file.gcode.state import MOVE_COMMANDS, track_state
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+LINES = "lines_0.4n_0.2mm_PETG_XLIS_57s"
+
+START = "M140 S60\nG28\nG90\nM82\nG92 E0\n"
+END = ";TYPE:Custom\nG1 Z10\nM104 S0\n"
+
+
+def layer(z: float, e: int) -> str:
+    return f";LAYER_CHANGE\n;Z:{z}\nG1 Z{z} F600\nG1 X10 Y10 F3000\nG1 X20 E{e}\n"
+
+
+LAYERS = [layer(0.2, 1), layer(0.4, 2), layer(0.6, 3)]
+GCODE = START + "".join(LAYERS) + END
+
+OBJECTS = (
+    START
+    + "M486 S0\nM486 AA\nM486 S1\nM486 AB\nM486 S-1\n"
+    + ";LAYER_CHANGE\nG1 Z0.2 F600\n"
+    + "M486 S0\nG1 X10 Y10 F3000\nG1 X20 E1\nM486 S-1\n"
+    + "M486 S1\nG1 X30 Y30 Z0.3\nG1 X40 E2 F1200\nG1 Z0.2\nM486 S-1\n"
+    + END
+)
+
+CONFIG = (
+    "; prusaslicer_config = begin\n; layer_height = 0.2\n; prusaslicer_config = end\n"
+)
+
+
+def test_split_layers():
+    first, rest = split_layers(GCODE.encode("utf-8"), [(0, 1), (1, 3)])
+    # The end G-code continues from where the whole print would have.
+    assert first.decode("utf-8") == START + LAYERS[0] + "G92 E3\n" + END
+    # The later layers start with the extruder and Z where they were.
+    assert rest.decode("utf-8") == (
+        START + "G1 Z0.2\nG92 E1\nG1 F3000\n" + LAYERS[1] + LAYERS[2] + END
+    )
+
+    # Relative extrusion doesn't need the extruder position.
+    relative = GCODE.replace("M82\nG92 E0\n", "M83\n").replace("E3", "E1")
+    (part,) = split_layers(relative.encode("utf-8"), [(2, 3)])
+    assert part.decode("utf-8") == (
+        START.replace("M82\nG92 E0\n", "M83\n")
+        + "G1 Z0.4\nG1 F3000\n"
+        + LAYERS[2][:-3]
+        + "E1\n"
+        + END
+    )
+
+    # All the layers are the original G-code.
+    assert split_layers(GCODE.encode("utf-8"), [(0, 3)]) == [GCODE.encode("utf-8")]
+
+
+def test_split_layers_errors():
+    with pytest.raises(ValueError):
+        split_layers(GCODE.encode("utf-8"), [(2, 4)])
+    with pytest.raises(ValueError):
+        split_layers(GCODE.encode("utf-8"), [(1, 1)])
+    with pytest.raises(ValueError):
+        split_layers(b"M104 S0\n", [(0, 1)])
+
+
+def test_split_objects():
+    parts = split_objects(OBJECTS.encode("utf-8"))
+    assert sorted(parts) == [0, 1]
+
+    # The other object is removed, and the state restored after it.
+    assert parts[0].decode("utf-8") == (
+        START
+        + "M486 S0\nM486 AA\n"
+        + ";LAYER_CHANGE\nG1 Z0.2 F600\n"
+        + "M486 S0\nG1 X10 Y10 F3000\nG1 X20 E1\nM486 S-1\n"
+        + "G92 E2\nG1 F1200\n"
+        + END
+    )
+    assert parts[1].decode("utf-8") == (
+        START
+        + "M486 S1\nM486 AB\nM486 S-1\n"
+        + ";LAYER_CHANGE\nG1 Z0.2 F600\n"
+        + "G92 E1\nG1 F3000\n"
+        + "M486 S1\nG1 X30 Y30 Z0.3\nG1 X40 E2 F1200\nG1 Z0.2\nM486 S-1\n"
+        + END
+    )
+
+    assert list(split_objects(OBJECTS.encode("utf-8"), [1])) == [1]
+    with pytest.raises(ValueError):
+        split_objects(OBJECTS.encode("utf-8"), [2])
+    with pytest.raises(ValueError):
+        split_objects(GCODE.encode("utf-8"))
+
+
+def object_moves(gcode: bytes, label: int):
+    """The state after each of the object's moves."""
+    commands = BasicGCodeParser(strict_mode=False).parse_stream(
+        io.StringIO(gcode.decode("utf-8"))
+    )
+    current = None
+    moves = []
+    for command, state in track_state(commands):
+        if command.command == "M486" and type(command.fields.get("S")) is int:
+            current = command.fields["S"]
+        elif command.command in MOVE_COMMANDS and current == label:
+            moves.append((state.x, state.y, state.z, state.e_delta, state.feedrate))
+    return moves
+
+
+def test_split_objects_file(fixtures_dir):
+    with open(os.path.join(fixtures_dir, LINES + ".gcode"), "rb") as file:
+        data = file.read()
+
+    parts = split_objects(data)
+    assert sorted(parts) == list(range(7))
+    for label, part in parts.items():
+        assert part.count(b"M486 S%d\n" % label) == 2
+        assert part.count(b"M486 S") == 4
+        # Each object is printed as it was, from the same position.
+        moves = object_moves(part, label)
+        expected = object_moves(data, label)
+        assert len(moves) == len(expected) > 0
+        for move, expected_move in zip(moves, expected):
+            assert move == pytest.approx(expected_move)
+        # The start and end G-code are kept.
+        assert part.startswith(data[: data.index(b"M486")])
+        assert part.endswith(data[data.rindex(b"M486 S-1") :].split(b"\n", 1)[1])
+
+
+def test_merge_plates():
+    plate = (OBJECTS + CONFIG).encode("utf-8")
+    merged = merge_plates([plate, plate]).decode("utf-8")
+
+    second = OBJECTS.replace("M486 S0", "M486 S2").replace("M486 S1", "M486 S3")
+    assert merged == OBJECTS + PLATE_RESET + second + CONFIG
+
+    merged = merge_plates([plate, plate], renumber_objects=False).decode("utf-8")
+    assert merged == OBJECTS + PLATE_RESET + OBJECTS + CONFIG
+
+    assert merge_plates([b"G28"]) == b"G28"
+    assert merge_plates([b"G28", b"G28"]) == b"G28\n" + PLATE_RESET.encode() + b"G28"
+    with pytest.raises(ValueError):
+        merge_plates([])
+
+
+def test_merge_bgcode(fixtures_dir):
+    path = os.path.join(fixtures_dir, LINES + ".bgcode")
+    with BGcodeFile(path) as file:
+        text = "".join(file.lines)
+    with open(path, "rb") as stream:
+        plate_blocks = list(BasicBGCodeParser().parse_raw_stream(stream))
+
+    with open(path, "rb") as first, open(path, "rb") as second:
+        output = io.BytesIO()
+        merge_bgcode([first, second], output)
+    output.seek(0)
+    with BGcodeFile(output) as merged:
+        expected = merge_plates([text.encode("utf-8")] * 2).decode("utf-8")
+        # MeatPack removes the spaces in G commands.
+        expected = expected.replace(PLATE_RESET, PLATE_RESET.replace(" ", ""))
+        assert "".join(merged.lines) == expected
+        assert merged.slicer_settings == file.slicer_settings
+
+    # Without renumbering, the second plate's blocks are copied as they are.
+    with open(path, "rb") as first, open(path, "rb") as second:
+        output = io.BytesIO()
+        merge_bgcode([first, second], output, renumber_objects=False)
+    output.seek(0)
+    blocks = [block.data for block in BasicBGCodeParser().parse_raw_stream(output)]
+    gcode_blocks = [
+        block.data for block in plate_blocks if block.type == BlockType.GCODE
+    ]
+    assert blocks[: len(plate_blocks)] == [block.data for block in plate_blocks]
+    assert blocks[len(plate_blocks) + 1 :] == gcode_blocks
+    assert len(blocks) == len(plate_blocks) + 1 + len(gcode_blocks)
+
+
+def test_main(fixtures_dir, tmp_path):
+    path = tmp_path / "plate.gcode"
+    path.write_bytes(GCODE.encode("utf-8"))
+    main(["layers", str(path), "0:1", "1:3"])
+    assert (tmp_path / "plate.layers_0-0.gcode").exists()
+    assert (tmp_path / "plate.layers_1-2.gcode").read_bytes() == split_layers(
+        GCODE.encode("utf-8"), [(1, 3)]
+    )[0]
+
+    objects = tmp_path / "objects.gcode"
+    objects.write_bytes(OBJECTS.encode("utf-8"))
+    main(["objects", str(objects), "--ids", "1"])
+    assert [name for name in os.listdir(tmp_path) if "object_" in name] == [
+        "objects.object_1.gcode"
+    ]
+
+    merged = tmp_path / "merged.gcode"
+    main(["merge", str(merged), str(path), str(objects)])
+    assert merged.read_bytes() == merge_plates(
+        [GCODE.encode("utf-8"), OBJECTS.encode("utf-8")]
+    )
+
+    with pytest.raises(SystemExit):
+        main(["layers", str(path), "0-1"])
@@ -0,0 +1,140 @@
+import io
+import os
+import numpy as np
+import pytest  # type: ignore
+from gcode_file import BasicGCodeParser
+from gcode_file.file import BGcodeFile, GcodeFile
+from gcode_file.gcode.command import GcodeCommand
+from gcode_file.gcode.state import (
+    CommandColumns,
+    MachineState,
+    track_columns,
+    track_state,
+)
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+def parse(gcode: str):
+    return list(BasicGCodeParser().parse_stream(io.StringIO(gcode)))
+
+
+def both(gcode: str):
+    """Tracks the G-code both ways, and checks they agree."""
+    commands = parse(gcode)
+    streamed = [state for _, state in track_state(commands)]
+    columns = track_columns(CommandColumns.from_commands(commands))
+    assert [columns[row] for row in range(len(columns))] == pytest.approx(streamed)
+    return streamed
+
+
+def test_absolute_and_relative():
+    states = both("G1 X10 Y20 F1200\nG91\nG1 X5 E1\nG1 Y-5 E1\nG90\nG1 X0\n")
+    assert states[0] == MachineState(10, 20, 0, 0, 0, 1200, None)
+    assert states[2] == MachineState(15, 20, 0, 1, 1, 1200, None)
+    assert states[3] == MachineState(15, 15, 0, 2, 1, 1200, None)
+    assert states[5] == MachineState(0, 15, 0, 2, 0, 1200, None)
+
+
+def test_extruder_mode():
+    states = both("M83\nG1 X1 E2\nG1 X2 E2\nM82\nG1 X3 E5\n")
+    assert [state.e_abs for state in states] == [0, 2, 4, 4, 5]
+    assert [state.e_delta for state in states] == [0, 2, 2, 0, 1]
+
+
+def test_mode_columns():
+    gcode = "G1 X1\nG91\nM82\nG1 X1\nG90\nM83\nG1 X1\n"
+    state = track_columns(CommandColumns.from_commands(parse(gcode)))
+    assert state.absolute.tolist() == [True, False, False, False, True, True, True]
+    assert state.absolute_e.tolist() == [True, False, True, True, True, False, False]
+
+
+def test_g92():
+    states = both("G1 X10 E5\nG92 E0\nG1 E1\nG92\nG1 X1\n")
+    assert states[1] == MachineState(10, 0, 0, 0, 0, None, None)
+    # Resetting E doesn't count as extrusion, but the next move does.
+    assert states[2].e_abs == 1 and states[2].e_delta == 1
+    assert states[3][:4] == (0, 0, 0, 0)
+    assert states[4].x == 1
+
+
+def test_g28():
+    states = both("G1 X10 Y10 Z10\nG28 X0\nG28\n")
+    assert states[1][:3] == (0, 10, 10)
+    assert states[2][:3] == (0, 0, 0)
+
+
+def test_g28_axes():
+    states = both("G1 X10 Y10 Z5\nG28 X\nG1 X10\nG28 XY\nG28 Z\n")
+    assert states[1][:3] == (0, 10, 5)
+    assert states[3][:3] == (0, 0, 5)
+    assert states[4][:3] == (0, 0, 0)
+
+
+def test_flags():
+    commands = [
+        GcodeCommand("G1", {"X": 10, "E": 3}),
+        GcodeCommand("G92", {"E": True}),
+        GcodeCommand("G1", {"X": True}),
+    ]
+    streamed = [state for _, state in track_state(commands)]
+    columns = track_columns(CommandColumns.from_commands(commands))
+    assert [columns[row] for row in range(3)] == streamed
+    assert streamed[1].e_abs == 0
+    assert streamed[2].x == 10
+
+
+def test_tool_and_feedrate():
+    states = both("G1 X1\nT1\nG0 X2 F3000\nT0\nM104 S200\n")
+    assert [state.tool for state in states] == [None, 1, 1, 0, 0]
+    assert [state.feedrate for state in states] == [None, None, 3000, 3000, 3000]
+
+
+def test_columns():
+    commands = parse("G1 X1 F600 ; move\n; comment\nM204 P1000 T2000\n")
+    commands.insert(1, object())
+    columns = CommandColumns.from_commands(commands)
+
+    assert list(columns.codes) == ["G1", "", "M204"]
+    assert columns.fields(0) == {"X": 1.0, "F": 600.0}
+    assert columns.fields(1) == {}
+    assert columns.fields(2) == {"P": 1000.0, "T": 2000.0}
+    assert np.isnan(columns.column("Y")).all()
+
+    state = track_columns(columns)
+    assert list(state.x) == [1, 1, 1]
+    assert list(state.tool) == [-1, -1, -1]
+
+
+def test_empty():
+    state = track_columns(CommandColumns.from_commands([]))
+    assert len(state) == 0
+    assert state.positions.shape == (0, 4)
+
+
+@pytest.mark.parametrize(
+    "filename, cls, tools",
+    [
+        ("lines_0.4n_0.2mm_PETG_XLIS_57s.gcode", GcodeFile, 1),
+        ("mmu3_pla_ 5colors_3dbenchy_0.4n_0.2mm__MK4IS3h24m.bgcode", BGcodeFile, 5),
+    ],
+)
+def test_fixtures_agree(fixtures_dir, filename, cls, tools):
+    """Streaming and vectorized tracking give the same state for real files."""
+    with cls(os.path.join(fixtures_dir, filename), strict_mode=False) as file:
+        commands = list(file.commands)
+
+    streamed = [state for _, state in track_state(commands)]
+    columns = track_columns(CommandColumns.from_commands(commands))
+
+    assert len(columns) == len(streamed)
+    assert np.allclose(columns.positions, [state[:4] for state in streamed])
+    assert np.allclose(columns.e_delta, [state.e_delta for state in streamed])
+    assert list(columns.tool) == [
+        -1 if state.tool is None else state.tool for state in streamed
+    ]
+    assert max(columns.tool) == tools - 1
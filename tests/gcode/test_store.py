@@ -0,0 +1,129 @@
+import io
+import os
+import pytest  # type: ignore
+from gcode_file import BasicGCodeParser
+from gcode_file.file import BGcodeFile
+from gcode_file.gcode.command import GcodeCommand, ThumbnailCommand
+from gcode_file.gcode.store import CommandStore
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+def parse(gcode: str):
+    return list(BasicGCodeParser().parse_stream(io.StringIO(gcode)))
+
+
+def assert_same(read, expected):
+    assert len(read) == len(expected)
+    for a, b in zip(read, expected):
+        assert isinstance(a, GcodeCommand)
+        assert (a.command, a.fields, a.comment, a.error, a.line_number) == (
+            b.command,
+            b.fields,
+            b.comment,
+            b.error,
+            b.line_number,
+        )
+        # Ints stay ints, and floats stay floats.
+        assert list(map(type, a.fields.values())) == list(map(type, b.fields.values()))
+
+
+GCODE = """\
+; generated by hand
+G28 W
+G1 X10 Y10.5 Z0.2 F1200
+G1 X12.345 E0.03724 ; extrude
+G1 X-0.001 Y0 E-.8
+M104 S215
+M862.3 P "MK4S"
+T1
+G1 E0.123456789
+"""
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 1024])
+def test_round_trip(chunk_size):
+    commands = parse(GCODE)
+    store = CommandStore.from_commands(commands, chunk_size)
+    assert len(store) == len(commands)
+    assert store.chunk_count == -(-len(commands) // chunk_size)
+    assert_same(list(store), commands)
+    assert_same([store[row] for row in range(len(store))], commands)
+
+
+def test_values_stored_as_doubles():
+    # Too many decimal places for the fixed point scale, or not finite.
+    commands = [
+        GcodeCommand("G1", {"X": 0.1 + 0.2, "E": 1e-9}),
+        GcodeCommand("G1", {"X": -0.0, "Y": float("inf")}, error="bad"),
+        GcodeCommand("M1", {"A": False, "B": True, "C": 10**30}),
+    ]
+    store = CommandStore.from_commands(commands, scales={"X": 10})
+    assert_same(list(store), commands)
+    assert str(store[1].fields["X"]) == "-0.0"
+
+    with pytest.raises(TypeError):
+        store.append(GcodeCommand("G1", {"X": [1]}))
+
+
+def test_indexing():
+    commands = parse("".join(f"G1 X{x / 10} E{x}\n" for x in range(100)))
+    store = CommandStore.from_commands(commands, chunk_size=16)
+
+    assert store[37].fields == {"X": 3.7, "E": 37}
+    assert store[-1].fields == {"X": 9.9, "E": 99}
+    assert [command.fields["E"] for command in store[10:20:3]] == [10, 13, 16, 19]
+    with pytest.raises(IndexError):
+        store[100]
+
+    # Changing a command that was read doesn't change the store.
+    store[37].fields["X"] = 0
+    assert store[37].fields["X"] == 3.7
+
+    # Commands can be added after reading.
+    store.append(GcodeCommand("G1", {"X": 1.5}))
+    assert store[-1].fields == {"X": 1.5}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 1024])
+def test_line_numbers(chunk_size):
+    parser = BasicGCodeParser(strip_line_numbers=False)
+    commands = list(
+        parser.parse_stream(io.StringIO("N10 G28\nN11 G1 X1\nG1 X2\nN5 G1 X3\n"))
+    )
+    store = CommandStore.from_commands(commands, chunk_size)
+    assert [command.line_number for command in store] == [10, 11, None, 5]
+    assert store[3].line_number == 5
+    assert_same(list(store), commands)
+
+
+def test_skips_other_commands():
+    thumbnail = ThumbnailCommand(b"", "PNG", 16, 16, 0)
+    store = CommandStore.from_commands([thumbnail, *parse("G1 X1\n")])
+    assert len(store) == 1
+
+
+def test_invalid_arguments():
+    for chunk_size in (0, 65536):
+        with pytest.raises(ValueError):
+            CommandStore(chunk_size)
+    with pytest.raises(ValueError):
+        CommandStore(scales={"X": 0.5})
+
+
+def test_file(fixtures_dir):
+    path = os.path.join(fixtures_dir, "BenchyRules_PLA_14m.bgcode")
+    with BGcodeFile(path, strict_mode=False) as file:
+        commands = [
+            command for command in file.commands if isinstance(command, GcodeCommand)
+        ]
+
+    store = CommandStore.from_commands(commands)
+    assert_same(list(store), commands)
+    assert store[50000].fields == commands[50000].fields
+    # Much smaller than the MeatPacked file, even with the comments.
+    assert store.nbytes < 12 * len(commands)
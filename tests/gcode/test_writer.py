@@ -0,0 +1,154 @@
+import io
+import os
+import pytest  # type: ignore
+from gcode_file import BasicGCodeParser, GCodeParser
+from gcode_file.file import BGcodeFile
+from gcode_file.gcode.command import (
+    GcodeCommand,
+    PrusaSlicerConfigCommand,
+    ThumbnailCommand,
+)
+from gcode_file.gcode.writer import GCodeWriter, write_commands
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+def write(commands, **kwargs) -> str:
+    stream = io.BytesIO()
+    write_commands(commands, stream, **kwargs)
+    return stream.getvalue().decode("utf-8")
+
+
+def test_format_command():
+    writer = GCodeWriter(io.BytesIO())
+    assert (
+        writer.format_command(
+            GcodeCommand("G1", {"X": 10.0, "Y": 0.1 + 0.2, "E": 0.0123456, "F": 1200})
+        )
+        == "G1 X10 Y0.3 E0.01235 F1200\n"
+    )
+    assert writer.format_command(GcodeCommand("G1", {"Z": -0.0001})) == "G1 Z0\n"
+    assert writer.format_command(GcodeCommand("G1", {"A": 1 / 3})) == "G1 A0.333333\n"
+    assert (
+        writer.format_command(GcodeCommand("G28", {"W": True, "X": False})) == "G28 W\n"
+    )
+    assert (
+        writer.format_command(GcodeCommand("M862.3", {"P": "MK4S"}, "check"))
+        == 'M862.3 P"MK4S" ;check\n'
+    )
+    assert writer.format_command(GcodeCommand("", {}, "LAYER_CHANGE")) == (
+        ";LAYER_CHANGE\n"
+    )
+    assert writer.format_command(GcodeCommand("", {})) == "\n"
+
+
+def test_line_numbers():
+    writer = GCodeWriter(None)
+    command = GcodeCommand("G1", {"X": 10}, "move", line_number=123)
+    assert writer.format_command(command) == "N123 G1 X10*81 ;move\n"
+
+    # The line number is kept through a round trip, with a new checksum.
+    parser = BasicGCodeParser(strip_line_numbers=False)
+    command = parser.parse_line("N124 G1 X10.000  *72")
+    assert writer.format_command(command) == "N124 G1 X10*86\n"
+    assert parser.parse_line(writer.format_command(command)).line_number == 124
+
+
+def test_decimals():
+    command = GcodeCommand("G1", {"X": 0.5, "Y": -0.25, "E": 0.05})
+    assert write([command], trim_leading_zero=True) == "G1 X.5 Y-.25 E.05\n"
+    assert write([command], decimals={"X": 0, "Y": 1}) == "G1 X0 Y-0.2 E0.05\n"
+
+
+def test_other_commands():
+    thumbnail = ThumbnailCommand(bytes(range(100)), "QOI", 16, 16, 136)
+    config = PrusaSlicerConfigCommand({"layer_height": "0.2", "gcode": "G28\\nG1"})
+    text = write([thumbnail, config])
+    lines = text.splitlines()
+    assert lines[0] == "; thumbnail_QOI begin 16x16 136"
+    assert [len(line) for line in lines[1:3]] == [80, 60]
+    assert lines[3] == "; thumbnail_QOI end"
+    assert lines[4:] == [
+        "; prusaslicer_config = begin",
+        "; layer_height = 0.2",
+        "; gcode = G28\\nG1",
+        "; prusaslicer_config = end",
+    ]
+
+    parsed = list(GCodeParser(strict_mode=False).parse_stream(io.StringIO(text)))
+    assert isinstance(parsed[0], ThumbnailCommand)
+    assert (parsed[0].format, parsed[0].width, parsed[0].height) == ("QOI", 16, 16)
+    assert parsed[1].config == config.config
+
+
+def test_batches():
+    commands = [GcodeCommand("G1", {"X": float(x)}) for x in range(10)]
+    stream = io.BytesIO()
+    writer = GCodeWriter(stream, batch_size=4)
+
+    for command in commands[:3]:
+        writer.write(command)
+    assert stream.getvalue() == b""
+    writer.write(commands[3])
+    assert stream.getvalue() == b"G1 X0\nG1 X1\nG1 X2\nG1 X3\n"
+
+    writer.write_commands(commands[4:])
+    assert stream.getvalue() == "".join(f"G1 X{x}\n" for x in range(10)).encode()
+
+
+def test_invalid():
+    writer = GCodeWriter(io.BytesIO())
+    for command in (
+        GcodeCommand("M117", {"A": 'say "hi"'}),
+        GcodeCommand("M117", {"A": "two\nlines"}),
+        GcodeCommand("G1", {}, "two\nlines"),
+    ):
+        with pytest.raises(ValueError):
+            writer.format_command(command)
+    with pytest.raises(TypeError):
+        writer.format_command(GcodeCommand("G1", {"X": [1]}))
+    with pytest.raises(TypeError):
+        writer.format_command(1)
+
+    with pytest.raises(ValueError):
+        GCodeWriter(io.BytesIO(), batch_size=0)
+    with pytest.raises(ValueError):
+        GCodeWriter(io.BytesIO(), decimals={"X": -1})
+
+
+def test_round_trip(fixtures_dir):
+    path = os.path.join(fixtures_dir, "BenchyRules_PLA_14m.bgcode")
+    with BGcodeFile(path, strict_mode=False) as file:
+        commands = list(file.commands)
+
+    # Enough decimal places for every value in the file.
+    text = write(commands, decimals={})
+    parser = BasicGCodeParser(strict_mode=False)
+    parsed = list(parser.parse_stream(io.StringIO(text)))
+    assert len(parsed) == len(commands)
+    for a, b in zip(parsed, commands):
+        assert (a.command, a.fields, a.comment) == (b.command, b.fields, b.comment)
+
+
+def test_thumbnail_round_trip(fixtures_dir):
+    path = os.path.join(fixtures_dir, "lines_0.4n_0.2mm_PETG_XLIS_57s.gcode")
+    with open(path) as f:
+        original = f.read()
+    commands = list(GCodeParser(strict_mode=False).parse_stream(io.StringIO(original)))
+    thumbnails = [c for c in commands if isinstance(c, ThumbnailCommand)]
+    assert [len(t.content) for t in thumbnails] == [373, 39017, 66838, 46734]
+
+    # The thumbnails are written as they were in the file.
+    text = write(thumbnails)
+    start = original.index("; thumbnail_QOI begin 16x16")
+    end = original.index("; thumbnail end") + len("; thumbnail end\n")
+    # Without the blank lines around them.
+    expected = [line for line in original[start:end].splitlines() if line.strip(";")]
+    assert text.splitlines() == expected
+
+    parsed = list(GCodeParser().parse_stream(io.StringIO(text)))
+    assert [t.content for t in parsed] == [t.content for t in thumbnails]
@@ -0,0 +1,157 @@
+import io
+import os
+import pytest  # type: ignore
+from typing import List, Optional
+from gcode_file import BasicGCodeParser
+from gcode_file.file import open_file
+from gcode_file.gcode.checksum import number_line
+from gcode_file.host.fake_printer import FakePrinter
+from gcode_file.host.sender import Sender, Transport
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "..", "fixtures")
+
+
+GCODE = "".join(f"G1 X{i} Y{i % 7} E0.5 ; move {i}\n" for i in range(50))
+LINES = [f"G1 X{i} Y{i % 7} E0.5" for i in range(50)]
+
+
+def parse(text: str):
+    return list(BasicGCodeParser().parse_stream(io.StringIO(text)))
+
+
+class ScriptedTransport(Transport):
+    """Acknowledges each line when it's read, and records how many were waiting."""
+
+    def __init__(self, replies: Optional[List[bytes]] = None):
+        self.lines: List[bytes] = []
+        self.replies = replies
+        self.waiting: List[int] = []
+        self._acknowledged = 0
+
+    def write(self, data: bytes):
+        self.lines.append(data)
+
+    def readline(self, timeout: Optional[float]) -> Optional[bytes]:
+        if self.replies is not None:
+            return self.replies.pop(0) if self.replies else None
+        self.waiting.append(len(self.lines) - self._acknowledged)
+        self._acknowledged += 1
+        return b"ok\n"
+
+
+def test_send():
+    with FakePrinter() as printer:
+        stats = Sender(printer.transport).send(parse(GCODE))
+    assert printer.commands == ["M110 N0"] + LINES
+    assert printer.errors == []
+    assert stats.lines == 50
+    assert stats.resends == 0
+    assert stats.bytes_sent == sum(
+        len(number_line(number, line)) + 1
+        for number, line in enumerate(["M110 N0"] + LINES)
+    )
+
+
+def test_send_numbers_lines():
+    transport = ScriptedTransport()
+    Sender(transport).send(parse("G28 ; home\nG1 X10\n"))
+    assert transport.lines == [b"N0 M110 N0*125\n", b"N1 G28*18\n", b"N2 G1 X10*83\n"]
+
+
+def test_window():
+    for window in (1, 4, 8):
+        transport = ScriptedTransport()
+        Sender(transport, window=window, buffer_size=None).send(parse(GCODE))
+        assert max(transport.waiting) == window
+        assert len(transport.lines) == 51
+
+    # Lines aren't sent past the printer's receive buffer.
+    transport = ScriptedTransport()
+    Sender(transport, window=8, buffer_size=64).send(parse(GCODE))
+    assert max(transport.waiting) == 3
+
+    with pytest.raises(ValueError):
+        Sender(transport, window=0)
+    with pytest.raises(ValueError):
+        Sender(transport, buffer_size=0)
+
+
+@pytest.mark.parametrize("meatpack", [False, True])
+@pytest.mark.parametrize("window", [1, 4])
+def test_resend(window, meatpack):
+    corrupt = [1, 5, 6, 20, 50]
+    with FakePrinter(corrupt=corrupt) as printer:
+        stats = Sender(printer.transport, window=window, meatpack=meatpack).send(
+            parse(GCODE)
+        )
+
+    # Each line is run once, in order, despite being sent again.
+    expected = ["M110 N0"] + LINES
+    if meatpack:
+        expected = [line.replace(" ", "") for line in expected]
+    assert printer.commands == expected
+    assert stats.resends == len(corrupt)
+    assert stats.errors[0] == "Error:checksum mismatch, Last Line: 0"
+    assert sum("checksum" in error for error in stats.errors) == len(corrupt)
+
+
+def test_meatpack():
+    gcode = GCODE + 'M862.6 P"Input shaper"\nG1 X1\n'
+    with FakePrinter() as printer:
+        plain = Sender(printer.transport).send(parse(gcode))
+    with FakePrinter() as printer:
+        packed = Sender(printer.transport, meatpack=True).send(parse(gcode))
+    assert packed.bytes_sent < plain.bytes_sent * 0.7
+    # Strings keep their spaces, and the lines after them are packed.
+    assert printer.commands[-2:] == ['M862.6 P"Input shaper"', "G1X1"]
+    assert printer.errors == []
+
+
+@pytest.mark.parametrize("meatpack", [False, True])
+def test_send_text(meatpack):
+    # The fields don't keep everything, so lines are sent as they were read.
+    lines = ["M115 U6.2.4+8909", "M486 AShape-Box", "M23 print 1.gcode"]
+    gcode = "".join(f"{line} ; comment\n" for line in lines)
+    with FakePrinter() as printer:
+        Sender(printer.transport, meatpack=meatpack).send(parse(gcode))
+    if meatpack:
+        # Only the text's spaces are kept.
+        lines[0] = "M115U6.2.4+8909"
+    assert printer.commands == ["M110 N0" if not meatpack else "M110N0"] + lines
+    assert printer.errors == []
+
+
+def test_errors():
+    transport = ScriptedTransport([b"echo:busy: processing\n"])
+    with pytest.raises(TimeoutError):
+        Sender(transport, timeout=0.1).send(parse("G28\n"))
+
+    transport = ScriptedTransport([b"Error:Printer halted. kill() called!\n"])
+    with pytest.raises(RuntimeError):
+        Sender(transport).send(parse("G28\n"))
+
+    # A line that is always corrupted is given up on.
+    transport = ScriptedTransport(
+        [b"Error:checksum mismatch, Last Line: 0\n", b"Resend: 1\n", b"ok\n"] * 20
+    )
+    transport.replies.insert(0, b"ok\n")
+    with pytest.raises(RuntimeError):
+        Sender(transport, window=1).send(parse("G28\n"))
+
+    # A line that isn't waiting to be acknowledged can't be sent again.
+    transport = ScriptedTransport([b"ok\n", b"Resend: 5\n"])
+    with pytest.raises(RuntimeError):
+        Sender(transport, window=1).send(parse("G28\n"))
+
+
+def test_send_file(fixtures_dir):
+    path = os.path.join(fixtures_dir, "lines_0.4n_0.2mm_PETG_XLIS_57s.bgcode")
+    with open_file(path, strict_mode=False) as file:
+        with FakePrinter() as printer:
+            stats = Sender(printer.transport, meatpack=True).send(file.commands)
+    assert stats.lines == len(printer.commands) - 1 == 270
+    assert printer.errors == []
@@ -0,0 +1,112 @@
+import json
+import os
+import pytest  # type: ignore
+from gcode_file.benchmark import (
+    BenchmarkResult,
+    benchmark_file,
+    compare_results,
+    find_files,
+    load_results,
+    main,
+    save_results,
+)
+
+
+@pytest.fixture
+def fixtures_dir() -> str:
+    """Return the path to the fixtures directory."""
+    return os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+BENCHMARKS = [
+    "open",
+    "commands",
+    "parse_lines",
+    "validate",
+    "meatpack_encode",
+    "meatpack_decode",
+    "deflate",
+    "heatshrink_11_4",
+    "heatshrink_12_4",
+    "peak_memory",
+]
+
+
+def test_find_files(fixtures_dir):
+    files = [os.path.basename(path) for path in find_files([fixtures_dir])]
+    assert "lines_0.4n_0.2mm_PETG_XLIS_57s.gcode" in files
+    assert "lines_0.4n_0.2mm_PETG_XLIS_57s.bgcode" in files
+    assert "lines.3mf" not in files
+    assert find_files(["a.gcode"]) == ["a.gcode"]
+
+
+@pytest.mark.parametrize("extension", ["gcode", "bgcode"])
+def test_benchmark_file(fixtures_dir, extension):
+    path = os.path.join(fixtures_dir, f"lines_0.4n_0.2mm_PETG_XLIS_57s.{extension}")
+    results = benchmark_file(path, repeat=1)
+    assert [result.benchmark for result in results] == BENCHMARKS
+    for result in results:
+        assert result.file == os.path.basename(path)
+        assert result.value > 0, result.benchmark
+    assert not results[BENCHMARKS.index("peak_memory")].higher_is_better
+
+    with pytest.raises(ValueError):
+        benchmark_file(path, repeat=0)
+
+
+def test_compare_results():
+    baseline = [
+        BenchmarkResult("parse_lines", "a.gcode", 100.0, "lines/s"),
+        BenchmarkResult("peak_memory", "a.gcode", 10.0, "MB", False),
+    ]
+
+    # Within the tolerance.
+    results = [
+        BenchmarkResult("parse_lines", "a.gcode", 95.0, "lines/s"),
+        BenchmarkResult("peak_memory", "a.gcode", 10.5, "MB", False),
+        BenchmarkResult("parse_lines", "b.gcode", 1.0, "lines/s"),
+    ]
+    assert compare_results(results, baseline, tolerance=0.1) == []
+
+    # Slower, and more memory.
+    results = [
+        BenchmarkResult("parse_lines", "a.gcode", 80.0, "lines/s"),
+        BenchmarkResult("peak_memory", "a.gcode", 12.0, "MB", False),
+    ]
+    regressions = compare_results(results, baseline, tolerance=0.1)
+    assert [r.result for r in regressions] == results
+    assert regressions[0].change == pytest.approx(-0.2)
+    assert str(regressions[1]) == "a.gcode:peak_memory 10.000 -> 12.000 MB (+20.0%)"
+
+    with pytest.raises(ValueError):
+        compare_results(results, baseline, tolerance=-1)
+
+
+def test_save_results(tmp_path):
+    results = [BenchmarkResult("peak_memory", "a.gcode", 10.0, "MB", False)]
+    path = str(tmp_path / "results.json")
+    save_results(results, path)
+    assert load_results(path) == results
+
+    with open(path, "w") as f:
+        json.dump({"results": [{"value": 1}]}, f)
+    with pytest.raises(ValueError):
+        load_results(path)
+
+
+def test_main(fixtures_dir, tmp_path, capsys):
+    path = os.path.join(fixtures_dir, "simple.gcode")
+    output = str(tmp_path / "results.json")
+    main([path, "--repeat", "1", "--output", output])
+    results = load_results(output)
+    assert [result.benchmark for result in results] == BENCHMARKS
+
+    # Much faster than this is a regression.
+    baseline = str(tmp_path / "baseline.json")
+    for result in results:
+        result.value *= 100 if result.higher_is_better else 0.01
+    save_results(results, baseline)
+    with pytest.raises(SystemExit) as e:
+        main([path, "--repeat", "1", "--baseline", baseline])
+    assert e.value.code == 1
+    assert "parse_lines" in capsys.readouterr().out
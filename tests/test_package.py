@@ -0,0 +1,8 @@
+import gcode_file
+
+
+def test_import_star():
+    namespace = {}
+    exec("from gcode_file import *", namespace)
+    for name in gcode_file.__all__:
+        assert name in namespace, name